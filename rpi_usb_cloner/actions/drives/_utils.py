@@ -179,3 +179,130 @@ def ensure_root() -> bool:
         time.sleep(1)
         return False
     return True
+
+
+def select_target_devices(
+    title: str,
+    target_devices: list[dict],
+    target: dict,
+    *,
+    status_line: str | None = None,
+) -> list[dict] | None:
+    """Let the user tick several target devices for a batch operation.
+
+    The current target starts ticked and the cursor starts on CONTINUE, so a
+    single-drive job costs one extra press. With only one candidate the step
+    is skipped.
+
+    Returns the chosen devices in list order, or None if cancelled.
+    """
+    if len(target_devices) <= 1:
+        return [target]
+    chosen = {target.get("name")}
+    selected_index = len(target_devices)
+    while True:
+        items = [
+            f"[{'x' if device.get('name') in chosen else ' '}] "
+            f"{format_device_label(device)}"
+            for device in target_devices
+        ]
+        items.append(f"CONTINUE ({len(chosen)})")
+        index = menus.select_menu_screen_list(
+            title,
+            items,
+            screen_id="drives",
+            status_line=status_line,
+            selected_index=selected_index,
+        )
+        if index is None:
+            return None
+        if index == len(target_devices):
+            if chosen:
+                return [d for d in target_devices if d.get("name") in chosen]
+            continue
+        chosen ^= {target_devices[index].get("name")}
+        selected_index = index
+        log_menu.debug(f"Batch selection: {sorted(chosen)}")
+
+
+def run_batch_with_progress(
+    title: str,
+    devices: list[dict],
+    run_batch: Callable[[Callable[[str, list[str], float | None], None]], list],
+    *,
+    title_icon: str | None = None,
+) -> list:
+    """Run a parallel device job while rendering one status row per device.
+
+    ``run_batch`` receives a callback(device_name, lines, ratio) and returns
+    the per-device results. The progress bar shows the mean of all devices.
+    """
+    import threading
+    import time
+
+    names = [device.get("name") for device in devices]
+    progress_lock = threading.Lock()
+    ratios: dict[str, float] = dict.fromkeys(names, 0.0)
+    statuses: dict[str, str] = dict.fromkeys(names, "Waiting...")
+    done = threading.Event()
+    result_holder: dict[str, list] = {}
+    error_holder: dict[str, Exception] = {}
+
+    def update_progress(name: str, lines: list[str], ratio: float | None) -> None:
+        with progress_lock:
+            if ratio is not None:
+                ratios[name] = max(0.0, min(1.0, float(ratio)))
+            statuses[name] = lines[0] if lines else ""
+
+    def current_progress() -> tuple[list[str], float]:
+        with progress_lock:
+            lines = []
+            for name in names:
+                status = statuses[name]
+                if status in ("Done", "Failed"):
+                    lines.append(f"{name} {status}")
+                else:
+                    lines.append(f"{name} {int(ratios[name] * 100)}%")
+            return lines, sum(ratios.values()) / len(names)
+
+    def worker() -> None:
+        try:
+            result_holder["results"] = run_batch(update_progress)
+        except Exception as exc:
+            error_holder["error"] = exc
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    while not done.is_set():
+        lines, ratio = current_progress()
+        screens.render_progress_screen(
+            title, lines, progress_ratio=ratio, animate=False, title_icon=title_icon
+        )
+        time.sleep(0.1)
+    thread.join()
+
+    if "error" in error_holder:
+        raise error_holder["error"]
+    return result_holder.get("results", [])
+
+
+def render_batch_result(title: str, results: list) -> None:
+    """Show the batch outcome and log per-device failures."""
+    failed = [result for result in results if not result.success]
+    for result in failed:
+        log_menu.warning(
+            f"{title} failed on {result.device}: {result.error}",
+            device=result.device,
+        )
+    if failed:
+        screens.render_status_template(
+            title,
+            f"{len(results) - len(failed)}/{len(results)} OK",
+            progress_line=f"Failed: {', '.join(r.device for r in failed)}",
+        )
+    else:
+        screens.render_status_template(
+            title, "Done", progress_line=f"{len(results)} drives complete."
+        )
@@ -13,7 +13,7 @@ from uuid import uuid4
 from rpi_usb_cloner.app import state as app_state
 from rpi_usb_cloner.logging import LoggerFactory, get_logger
 from rpi_usb_cloner.services import drives
-from rpi_usb_cloner.storage.clone import erase_device
+from rpi_usb_cloner.storage.clone import erase_device, erase_devices
 from rpi_usb_cloner.storage.devices import (
     get_human_device_label,
     list_usb_disks,
@@ -25,7 +25,10 @@ from ._utils import (
     build_status_line,
     confirm_destructive_action,
     ensure_root,
+    render_batch_result,
+    run_batch_with_progress,
     select_target_device,
+    select_target_devices,
 )
 
 
@@ -37,7 +40,7 @@ def erase_drive(
     state: app_state.AppState,
     get_selected_usb_name: Callable[[], str | None],
 ) -> None:
-    """Erase a USB drive with selected mode (quick/full)."""
+    """Erase one or more USB drives with selected mode (quick/full)."""
     repo_devices = drives._get_repo_device_names()
     target_devices = [
         device for device in list_usb_disks() if device.get("name") not in repo_devices
@@ -56,15 +59,26 @@ def erase_drive(
         time.sleep(1)
         return
 
-    target_name = target.get("name")
     status_line = build_status_line(target_devices, target, selected_name)
 
+    targets = select_target_devices(
+        "ERASE DRIVES", target_devices, target, status_line=status_line
+    )
+    if not targets:
+        return
+
     mode = menus.select_erase_mode(status_line=status_line)
     if not mode:
         return
 
-    target_label = get_human_device_label(target)
-    prompt_lines = [f"ERASE {target_label}", f"MODE {mode.upper()}"]
+    if len(targets) > 1:
+        prompt_lines = [f"ERASE {len(targets)} DRIVES", f"MODE {mode.upper()}"]
+    else:
+        target = targets[0]
+        prompt_lines = [
+            f"ERASE {get_human_device_label(target)}",
+            f"MODE {mode.upper()}",
+        ]
 
     if not confirm_destructive_action(state=state, prompt_lines=prompt_lines):
         return
@@ -72,6 +86,24 @@ def erase_drive(
     if not ensure_root():
         return
 
+    if len(targets) > 1:
+        log_operation.info(
+            f"Starting batch erase of {len(targets)} drives (mode {mode})",
+            devices=[device.get("name") for device in targets],
+            mode=mode,
+        )
+        results = run_batch_with_progress(
+            "ERASE",
+            targets,
+            lambda progress: erase_devices(targets, mode, progress_callback=progress),
+            title_icon=ALERT_ICON,
+        )
+        render_batch_result("ERASE", results)
+        time.sleep(1)
+        return
+
+    target_name = target.get("name")
+
     # Threading pattern for progress screen
     job_id = f"erase-{uuid4().hex}"
     op_log = get_logger(job_id=job_id, tags=["erase"], source="erase")
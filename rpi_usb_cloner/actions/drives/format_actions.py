@@ -26,7 +26,10 @@ from ._utils import (
     confirm_destructive_action,
     ensure_root,
     handle_screenshot,
+    render_batch_result,
+    run_batch_with_progress,
     select_target_device,
+    select_target_devices,
 )
 
 
@@ -39,8 +42,8 @@ def format_drive(
     state: app_state.AppState,
     get_selected_usb_name: Callable[[], str | None],
 ) -> None:
-    """Format a USB drive with user-selected filesystem."""
-    from rpi_usb_cloner.storage.format import format_device
+    """Format one or more USB drives with user-selected filesystem."""
+    from rpi_usb_cloner.storage.format import format_device, format_devices
 
     # Get target device
     repo_devices = drives._get_repo_device_names()
@@ -61,10 +64,18 @@ def format_drive(
         time.sleep(1)
         return
 
-    target_name = target.get("name")
-    target_size = target.get("size", 0)
     status_line = build_status_line(target_devices, target, selected_name)
 
+    targets = select_target_devices(
+        "FORMAT DRIVES", target_devices, target, status_line=status_line
+    )
+    if not targets:
+        return
+    target = targets[0]
+    target_name = target.get("name")
+    # Size-based filesystem default follows the smallest selected drive
+    target_size = min(device.get("size", 0) or 0 for device in targets)
+
     # Select filesystem type (size-based default)
     filesystem = menus.select_filesystem_type(target_size, status_line=status_line)
     if not filesystem:
@@ -85,7 +96,10 @@ def format_drive(
     label = _prompt_for_label(state)
 
     # Final confirmation with details
-    target_label = get_human_device_label(target)
+    if len(targets) > 1:
+        target_label = f"{len(targets)} DRIVES"
+    else:
+        target_label = get_human_device_label(target)
     prompt_lines = [
         f"FORMAT {target_label}",
         f"{filesystem.upper()} {format_type.upper()}",
@@ -96,6 +110,30 @@ def format_drive(
     if not ensure_root():
         return
 
+    if len(targets) > 1:
+        log_operation.info(
+            f"Starting batch format of {len(targets)} drives",
+            devices=[device.get("name") for device in targets],
+            filesystem=filesystem,
+            mode=format_type,
+            label=label,
+        )
+        results = run_batch_with_progress(
+            "FORMAT",
+            targets,
+            lambda progress: format_devices(
+                targets,
+                filesystem,
+                format_type,
+                label=label,
+                progress_callback=progress,
+            ),
+            title_icon=SPARKLES_ICON,
+        )
+        render_batch_result("FORMAT", results)
+        time.sleep(1)
+        return
+
     # Threading pattern for progress screen
     done = threading.Event()
     result_holder: dict[str, bool] = {}
@@ -11,8 +11,20 @@ from rpi_usb_cloner.app.context import AppContext
 from rpi_usb_cloner.config import settings
 from rpi_usb_cloner.hardware import gpio
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.storage import clone, clonezilla, devices, image_repo, imageusb, iso
+from rpi_usb_cloner.storage import (
+    clone,
+    clonezilla,
+    compressed_image,
+    devices,
+    image_digest,
+    image_repo,
+    imageusb,
+    iso,
+    repo_catalog,
+    transfer_scheduler,
+)
 from rpi_usb_cloner.storage.clonezilla.backup import check_tool_available
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
 from rpi_usb_cloner.ui import display, menus, screens
 from rpi_usb_cloner.ui.icons import (
     ALERT_ICON,
@@ -116,7 +128,7 @@ def backup_image(
         return
 
     # Find repos to filter them out as source candidates
-    repos = image_repo.find_image_repos(image_repo.REPO_FLAG_FILENAME)
+    repos = repo_catalog.list_image_repos()
     source_candidates = _filter_non_repo_devices(usb_devices, repos)
     if not source_candidates:
         display.display_lines(["NO SOURCE", "AVAILABLE"])
@@ -366,14 +378,20 @@ def backup_image(
 
     def worker() -> None:
         try:
-            result = clonezilla.create_clonezilla_backup(
-                source_device=source_name,
-                output_dir=image_dir,
-                partitions=selected_partition_names,
-                compression=compression_type,
-                split_size_mb=4096,  # 4GB default
-                progress_callback=update_progress,
-            )
+            with transfer_scheduler.job(
+                f"backup {source_name}",
+                Priority.INTERACTIVE,
+                devices=[source_name],
+                paths=[image_dir],
+            ):
+                result = clonezilla.create_clonezilla_backup(
+                    source_device=source_name,
+                    output_dir=image_dir,
+                    partitions=selected_partition_names,
+                    compression=compression_type,
+                    split_size_mb=4096,  # 4GB default
+                    progress_callback=update_progress,
+                )
             result_holder["result"] = result
         except Exception as exc:
             error_holder["error"] = exc
@@ -499,7 +517,7 @@ def write_image(
     *, app_context: AppContext, log_debug: Optional[Callable[[str], None]] = None
 ) -> None:
     write_title_icon = WRITE_IMAGE_ICON
-    repos = image_repo.find_image_repos(image_repo.REPO_FLAG_FILENAME)
+    repos = repo_catalog.list_image_repos()
     if not repos:
         display.display_lines(["IMAGE REPO", "NOT FOUND"])
         time.sleep(1)
@@ -516,7 +534,7 @@ def write_image(
         repo_path = repos[selected_repo].path
     else:
         repo_path = repos[0].path
-    images = image_repo.list_clonezilla_images(repo_path)
+    images = repo_catalog.list_repo_images(repo_path)
     if not images:
         display.display_lines(["NO IMAGES", "FOUND"])
         time.sleep(1)
@@ -532,14 +550,40 @@ def write_image(
     )
     if selected_index is None:
         return
-    selected_image = images[selected_index]
+    _write_selected_image(
+        images[selected_index],
+        repos,
+        repo_path,
+        app_context=app_context,
+        log_debug=log_debug,
+    )
+
+
+def _write_selected_image(
+    selected_image: image_repo.DiskImage,
+    repos: list[image_repo.ImageRepo],
+    repo_path: Optional[Path],
+    *,
+    app_context: AppContext,
+    log_debug: Optional[Callable[[str], None]] = None,
+    allow_verify: bool = True,
+) -> None:
+    """Write a chosen image to a USB drive picked by the user.
+
+    ``repo_path`` is the repo holding the image, or None for an image staged
+    from a network repo. Drives holding any of ``repos`` are never offered
+    as targets. With ``allow_verify`` False the summary is shown without
+    the Verify button.
+    """
+    write_title_icon = WRITE_IMAGE_ICON
 
-    # Check if the selected image is an ISO or ImageUSB file
+    # Check if the selected image is an ISO, ImageUSB or compressed raw file
     is_iso = selected_image.is_iso
     is_imageusb = selected_image.is_imageusb
+    is_compressed_raw = selected_image.is_compressed_raw
 
     # For Clonezilla images, prompt for partition mode
-    if not is_iso and not is_imageusb:
+    if not is_iso and not is_imageusb and not is_compressed_raw:
         partition_selection = _prompt_restore_partition_mode(
             title_icon=write_title_icon
         )
@@ -547,7 +591,7 @@ def write_image(
             return
         partition_mode, partition_label = partition_selection
     else:
-        # ISOs and ImageUSB files don't need partition mode selection
+        # Raw images (ISO, ImageUSB, compressed) don't need partition mode selection
         partition_mode = None
         partition_label = None
     usb_devices = devices.list_usb_disks()
@@ -583,7 +627,7 @@ def write_image(
             break
     if refreshed_target is not None:
         target = refreshed_target
-    if _is_repo_drive(target, repo_path):
+    if repo_path is not None and _is_repo_drive(target, repo_path):
         display.display_lines(["TARGET IS", "REPO DRIVE"])
         time.sleep(1)
         return
@@ -597,6 +641,7 @@ def write_image(
             target,
             log_debug=log_debug,
             title_icon=write_title_icon,
+            allow_verify=allow_verify,
         )
         return
 
@@ -612,6 +657,18 @@ def write_image(
         )
         return
 
+    # Handle compressed raw images (.img.xz, .img.gz, .img.zst, .zip)
+    if is_compressed_raw:
+        if not _confirm_destructive_action(log_debug=log_debug):
+            return
+        _write_compressed_image(
+            selected_image.path,
+            target,
+            log_debug=log_debug,
+            title_icon=write_title_icon,
+        )
+        return
+
     # Continue with Clonezilla image flow
     try:
         plan = clonezilla.parse_clonezilla_image(selected_image.path)
@@ -686,12 +743,18 @@ def write_image(
 
     def worker() -> None:
         try:
-            clonezilla.restore_clonezilla_image(
-                plan,
-                target_name,
-                partition_mode=partition_mode,
-                progress_callback=update_progress,
-            )
+            with transfer_scheduler.job(
+                f"restore {target_name}",
+                Priority.INTERACTIVE,
+                devices=[target_name],
+                paths=[plan.image_dir],
+            ):
+                clonezilla.restore_clonezilla_image(
+                    plan,
+                    target_name,
+                    partition_mode=partition_mode,
+                    progress_callback=update_progress,
+                )
             result_holder["result"] = None
         except Exception as exc:
             error_holder["error"] = exc
@@ -739,15 +802,39 @@ def write_image(
         ratio=progress_ratio_snapshot,
     )
 
+    if not allow_verify:
+        screens.wait_for_paginated_input(
+            "WRITE", summary_lines, title_icon=write_title_icon
+        )
+        return
+
     # Show confirmation screen with Verify and Finish buttons
+    _prompt_verify_or_finish(
+        "WRITE",
+        summary_lines,
+        lambda: _verify_restore(plan, target, log_debug, title_icon=write_title_icon),
+        log_debug=log_debug,
+        title_icon=write_title_icon,
+    )
+
+
+def _prompt_verify_or_finish(
+    title: str,
+    summary_lines: list[str],
+    on_verify: Callable[[], None],
+    *,
+    log_debug: Optional[Callable[[str], None]] = None,
+    title_icon: Optional[str] = None,
+) -> None:
+    """Show a summary with Verify and Finish buttons and run on_verify if chosen."""
     selection = [1]  # Default to FINISH (right button)
 
     def render_screen():
         screens.render_verify_finish_buttons_screen(
-            "WRITE",
+            title,
             summary_lines,
             selected_index=selection[0],
-            title_icon=write_title_icon,
+            title_icon=title_icon,
         )
 
     render_screen()
@@ -772,7 +859,7 @@ def write_image(
         if selection[0] == 0:
             # VERIFY selected
             _log_debug(log_debug, "Starting verification")
-            _verify_restore(plan, target, log_debug, title_icon=write_title_icon)
+            on_verify()
         return True
 
     gpio.poll_button_events(
@@ -937,7 +1024,48 @@ def _verify_restore(
     """Verify the restored image against the target disk."""
     target_name = target.get("name", "")
     _log_debug(log_debug, f"Verifying restore to {target_name}")
+    _run_image_verification(
+        lambda progress_callback: clonezilla.verify_restored_image(
+            plan,
+            target_name,
+            progress_callback=progress_callback,
+        ),
+        log_debug,
+        title_icon=title_icon,
+    )
+
 
+def _verify_raw_image(
+    image_path: Path,
+    target: dict,
+    log_debug: Optional[Callable[[str], None]],
+    *,
+    offset: int = 0,
+    title_icon: Optional[str] = None,
+) -> None:
+    """Verify a raw image (ISO/ImageUSB) write using the cached image digest."""
+    target_name = target.get("name", "")
+    _log_debug(log_debug, f"Verifying {image_path.name} on {target_name}")
+    target_node = clone.resolve_device_node(target_name)
+    _run_image_verification(
+        lambda progress_callback: image_digest.verify_image_write(
+            image_path,
+            target_node,
+            offset,
+            progress_callback=progress_callback,
+        ),
+        log_debug,
+        title_icon=title_icon,
+    )
+
+
+def _run_image_verification(
+    verify: Callable[[Callable[[list[str], Optional[float]], None]], bool],
+    log_debug: Optional[Callable[[str], None]],
+    *,
+    title_icon: Optional[str] = None,
+) -> None:
+    """Run an image verification in a worker thread with a progress screen."""
     # Show progress screen during verification
     done = threading.Event()
     result_holder: dict[str, bool] = {}
@@ -958,11 +1086,7 @@ def _verify_restore(
 
     def worker() -> None:
         try:
-            success = clonezilla.verify_restored_image(
-                plan,
-                target_name,
-                progress_callback=update_progress,
-            )
+            success = verify(update_progress)
             result_holder["success"] = success
         except Exception as exc:
             _log_debug(log_debug, f"Verification error: {exc}")
@@ -1297,6 +1421,7 @@ def _write_iso_image(
     *,
     log_debug: Optional[Callable[[str], None]] = None,
     title_icon: Optional[str] = None,
+    allow_verify: bool = True,
 ) -> None:
     """Write an ISO file directly to a USB device."""
     done = threading.Event()
@@ -1333,12 +1458,19 @@ def _write_iso_image(
             return list(progress_lines), progress_ratio
 
     def worker() -> None:
+        target_name = target.get("name") or ""
         try:
-            iso.restore_iso_image(
-                iso_path,
-                target.get("name") or "",
-                progress_callback=update_progress,
-            )
+            with transfer_scheduler.job(
+                f"restore {target_name}",
+                Priority.INTERACTIVE,
+                devices=[target_name],
+                paths=[iso_path],
+            ):
+                iso.restore_iso_image(
+                    iso_path,
+                    target_name,
+                    progress_callback=update_progress,
+                )
         except Exception as exc:
             error_holder["error"] = exc
         finally:
@@ -1391,13 +1523,24 @@ def _write_iso_image(
     elif progress_ratio_snapshot is not None:
         summary_lines.append(f"Wrote {progress_ratio_snapshot * 100:.1f}%")
 
-    screens.render_status_template(
+    if not allow_verify:
+        screens.wait_for_paginated_input(
+            "WRITE ISO", summary_lines, title_icon=title_icon
+        )
+        return
+
+    _prompt_verify_or_finish(
         "WRITE ISO",
-        "SUCCESS",
-        extra_lines=summary_lines,
+        summary_lines,
+        lambda: _verify_raw_image(
+            iso_path,
+            target,
+            log_debug,
+            title_icon=title_icon,
+        ),
+        log_debug=log_debug,
         title_icon=title_icon,
     )
-    screens.wait_for_ack()
 
 
 def verify_clone(
@@ -1406,7 +1549,7 @@ def verify_clone(
     """Verify a previously created backup image against a device."""
     verify_title_icon = VERIFY_CLONE_ICON
     # Step 1: Find image repositories
-    repos = image_repo.find_image_repos(image_repo.REPO_FLAG_FILENAME)
+    repos = repo_catalog.list_image_repos()
     if not repos:
         display.display_lines(["IMAGE REPO", "NOT FOUND"])
         time.sleep(1)
@@ -1427,7 +1570,7 @@ def verify_clone(
         repo_path = repos[0].path
 
     # Step 3: List images in repository
-    images = image_repo.list_clonezilla_images(repo_path)
+    images = repo_catalog.list_repo_images(repo_path)
     if not images:
         display.display_lines(["NO IMAGES", "FOUND"])
         time.sleep(1)
@@ -1448,20 +1591,23 @@ def verify_clone(
 
     selected_image = images[selected_index]
 
-    # Skip ISOs and ImageUSB - they don't have verification support
-    if selected_image.is_iso or selected_image.is_imageusb:
+    # Compressed raw images have no verification support
+    if selected_image.is_compressed_raw:
         display.display_lines(["VERIFY NOT", "SUPPORTED"])
         time.sleep(1)
         return
 
-    # Step 5: Parse the Clonezilla image
-    try:
-        plan = clonezilla.parse_clonezilla_image(selected_image.path)
-    except RuntimeError as error:
-        _log_debug(log_debug, f"Image load failed: {error}")
-        display.display_lines(["IMAGE", "INVALID"])
-        time.sleep(1)
-        return
+    # Step 5: Parse the Clonezilla image (ISO/ImageUSB verify by digest)
+    is_raw_image = selected_image.is_iso or selected_image.is_imageusb
+    plan = None
+    if not is_raw_image:
+        try:
+            plan = clonezilla.parse_clonezilla_image(selected_image.path)
+        except RuntimeError as error:
+            _log_debug(log_debug, f"Image load failed: {error}")
+            display.display_lines(["IMAGE", "INVALID"])
+            time.sleep(1)
+            return
 
     # Step 6: Select device to verify against
     usb_devices = devices.list_usb_disks()
@@ -1498,6 +1644,15 @@ def verify_clone(
     _log_debug(log_debug, f"Verifying {selected_image.name} against {target_name}")
 
     # Step 7: Run verification
+    if plan is None:
+        _verify_raw_image(
+            selected_image.path,
+            target,
+            log_debug,
+            offset=imageusb.IMAGEUSB_HEADER_SIZE if selected_image.is_imageusb else 0,
+            title_icon=verify_title_icon,
+        )
+        return
     _verify_restore(plan, target, log_debug, title_icon=verify_title_icon)
 
 
@@ -1543,12 +1698,19 @@ def _write_imageusb_image(
             return list(progress_lines), progress_ratio
 
     def worker() -> None:
+        target_name = target.get("name") or ""
         try:
-            imageusb.restore_imageusb_file(
-                bin_path,
-                target.get("name") or "",
-                progress_callback=update_progress,
-            )
+            with transfer_scheduler.job(
+                f"restore {target_name}",
+                Priority.INTERACTIVE,
+                devices=[target_name],
+                paths=[bin_path],
+            ):
+                imageusb.restore_imageusb_file(
+                    bin_path,
+                    target_name,
+                    progress_callback=update_progress,
+                )
         except Exception as exc:
             error_holder["error"] = exc
         finally:
@@ -1601,8 +1763,130 @@ def _write_imageusb_image(
     elif progress_ratio_snapshot is not None:
         summary_lines.append(f"Wrote {progress_ratio_snapshot * 100:.1f}%")
 
-    screens.render_status_template(
+    _prompt_verify_or_finish(
         "WRITE BIN",
+        summary_lines,
+        lambda: _verify_raw_image(
+            bin_path,
+            target,
+            log_debug,
+            offset=imageusb.IMAGEUSB_HEADER_SIZE,
+            title_icon=title_icon,
+        ),
+        log_debug=log_debug,
+        title_icon=title_icon,
+    )
+
+
+def _write_compressed_image(
+    image_path,
+    target: dict,
+    *,
+    log_debug: Optional[Callable[[str], None]] = None,
+    title_icon: Optional[str] = None,
+) -> None:
+    """Stream-decompress a compressed raw image directly to a USB device."""
+    done = threading.Event()
+    error_holder: dict[str, Exception] = {}
+    progress_lock = threading.Lock()
+    progress_lines = ["Preparing..."]
+    progress_ratio: Optional[float] = 0.0
+    progress_written_bytes: Optional[str] = None
+    progress_written_percent: Optional[str] = None
+    progress_ratio_snapshot: Optional[float] = 0.0
+    start_time = time.monotonic()
+
+    def update_progress(lines: list[str], ratio: Optional[float]) -> None:
+        nonlocal progress_lines, progress_ratio, progress_written_bytes, progress_written_percent, progress_ratio_snapshot
+        clamped = None
+        if ratio is not None:
+            clamped = max(0.0, min(1.0, float(ratio)))
+        with progress_lock:
+            progress_lines = lines
+            if clamped is not None:
+                progress_ratio = clamped
+                progress_ratio_snapshot = clamped
+            wrote_line = next(
+                (line for line in lines if line.startswith("Wrote ")), None
+            )
+            if wrote_line:
+                match = re.match(r"^Wrote\s+(\S+)(?:\s+(\S+%))?", wrote_line)
+                if match:
+                    progress_written_bytes = match.group(1)
+                    progress_written_percent = match.group(2)
+
+    def current_progress() -> tuple[list[str], Optional[float]]:
+        with progress_lock:
+            return list(progress_lines), progress_ratio
+
+    def worker() -> None:
+        target_name = target.get("name") or ""
+        try:
+            with transfer_scheduler.job(
+                f"restore {target_name}",
+                Priority.INTERACTIVE,
+                devices=[target_name],
+                paths=[image_path],
+            ):
+                compressed_image.restore_compressed_image(
+                    image_path,
+                    target_name,
+                    progress_callback=update_progress,
+                )
+        except Exception as exc:
+            error_holder["error"] = exc
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    while not done.is_set():
+        lines, ratio = current_progress()
+        screens.render_progress_screen(
+            "WRITE IMG",
+            lines,
+            progress_ratio=ratio,
+            animate=False,
+            title_icon=title_icon,
+        )
+        time.sleep(0.1)
+    thread.join()
+    lines, ratio = current_progress()
+    screens.render_progress_screen(
+        "WRITE IMG",
+        lines,
+        progress_ratio=ratio,
+        animate=False,
+        title_icon=title_icon,
+    )
+    if "error" in error_holder:
+        error = error_holder["error"]
+        _log_debug(log_debug, f"Compressed image write failed: {error}")
+        screens.wait_for_paginated_input(
+            "WRITE IMG",
+            ["FAILED", str(error)],
+            title_icon=title_icon,
+        )
+        return
+    elapsed_seconds = time.monotonic() - start_time
+    target_label = devices.format_device_label(target)
+    summary_lines = [
+        "SUCCESS",
+        f"Image {image_path.name}",
+        f"Target {target_label}",
+        f"Elapsed {_format_elapsed_duration(elapsed_seconds)}",
+    ]
+    if progress_written_bytes and progress_written_percent:
+        summary_lines.append(
+            f"Wrote {progress_written_bytes} {progress_written_percent}"
+        )
+    elif progress_written_bytes:
+        summary_lines.append(f"Wrote {progress_written_bytes}")
+    elif progress_ratio_snapshot is not None:
+        summary_lines.append(f"Wrote {progress_ratio_snapshot * 100:.1f}%")
+
+    screens.render_status_template(
+        "WRITE IMG",
         "SUCCESS",
         extra_lines=summary_lines,
         title_icon=title_icon,
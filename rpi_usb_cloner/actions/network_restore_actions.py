@@ -0,0 +1,135 @@
+"""Restore images straight from another device's repo over the network.
+
+The image is streamed from the peer's transfer server into the target drive
+while it downloads (see storage.remote_repo), so it never has to fit on a
+local repo drive first.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Callable
+
+from rpi_usb_cloner.app.context import AppContext
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.services import peer_transfer_client
+from rpi_usb_cloner.storage import remote_repo, repo_catalog
+from rpi_usb_cloner.ui import menus, screens
+from rpi_usb_cloner.ui.icons import ALERT_ICON, WIFI_ICON, WRITE_IMAGE_ICON
+
+from .image_actions import _write_selected_image
+from .network_transfer_actions import _enter_pin, _select_peer
+
+
+log = get_logger(source=__name__)
+
+TITLE = "NETWORK IMAGE"
+
+
+def write_image_network(
+    *, app_context: AppContext, log_debug: Callable[[str], None] | None = None
+) -> None:
+    """Network restore flow.
+
+    Flow:
+    1. Discover and select a peer
+    2. Enter PIN
+    3. List the peer's repo and select an image
+    4. Select the target drive and write the image while it streams in
+    """
+    peer = _select_peer(TITLE)
+    if peer is None:
+        return
+
+    pin = _enter_pin()
+    if pin is None:
+        return
+
+    done = threading.Event()
+    found: list[tuple[remote_repo.RemoteRepo, list[remote_repo.RemoteImage]]] = []
+    error_message = [""]
+
+    def worker():
+        """Background thread for authentication and listing."""
+        try:
+            client = peer_transfer_client.TransferClient(peer)
+            token = asyncio.run(client.authenticate(pin))
+            repo = remote_repo.RemoteRepo(f"{client.base_url}/repo", token)
+            images = [
+                image
+                for image in repo.list_images()
+                if image.image_type in remote_repo.STREAMABLE_TYPES
+            ]
+            found.append((repo, images))
+        except (
+            peer_transfer_client.AuthenticationError,
+            remote_repo.RemoteRepoError,
+        ) as e:
+            log.error(f"Network repo listing failed: {e}")
+            error_message[0] = str(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    while not done.is_set():
+        screens.render_progress_screen(
+            TITLE,
+            ["Connecting..."],
+            progress_ratio=0.0,
+            animate=True,
+            title_icon=WIFI_ICON,
+        )
+        time.sleep(0.1)
+    thread.join()
+
+    if not found or not found[0][1]:
+        screens.render_error_screen(
+            TITLE,
+            message=error_message[0][:40] or "No images found",
+            title_icon=WIFI_ICON,
+            message_icon=ALERT_ICON,
+            message_icon_size=24,
+        )
+        time.sleep(2)
+        return
+    repo, images = found[0]
+
+    selected_index = menus.select_list(
+        "CHOOSE IMAGE",
+        [image.name for image in images],
+        screen_id="images",
+        enable_horizontal_scroll=True,
+        scroll_start_delay=1.5,
+        title_icon=WRITE_IMAGE_ICON,
+        transition_direction="forward",
+    )
+    if selected_index is None:
+        return
+    image = images[selected_index]
+
+    screens.render_status_template(TITLE, "Loading image...", title_icon=WIFI_ICON)
+    try:
+        with remote_repo.staged_image(repo, image) as staged:
+            # Local repo drives are still never offered as targets. Verify
+            # would read the empty placeholders, so it is not offered.
+            _write_selected_image(
+                staged,
+                repo_catalog.list_image_repos(),
+                None,
+                app_context=app_context,
+                log_debug=log_debug,
+                allow_verify=False,
+            )
+    except remote_repo.RemoteRepoError as e:
+        log.error(f"Network image {image.name} failed: {e}")
+        screens.render_error_screen(
+            TITLE,
+            message=str(e)[:40],
+            title_icon=WIFI_ICON,
+            message_icon=ALERT_ICON,
+            message_icon_size=24,
+        )
+        time.sleep(2)
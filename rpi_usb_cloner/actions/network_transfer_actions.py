@@ -14,7 +14,14 @@ from rpi_usb_cloner.app.context import AppContext
 from rpi_usb_cloner.domain import DiskImage
 from rpi_usb_cloner.hardware import gpio
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.services import discovery, peer_transfer_client
+from rpi_usb_cloner.services import (
+    chain_replication,
+    discovery,
+    link_benchmark,
+    peer_registry,
+    peer_transfer_client,
+    transfer,
+)
 from rpi_usb_cloner.storage import image_repo
 from rpi_usb_cloner.ui import display, menus, screens
 from rpi_usb_cloner.ui.icons import ALERT_ICON, FOLDER_ICON, WIFI_ICON
@@ -24,6 +31,10 @@ from .transfer_actions import _select_images_checklist
 
 log = get_logger(source=__name__)
 
+DISCOVERY_SECONDS = 5.0
+# Link test stages, in the order TransferClient.benchmark_link() runs them
+BENCH_STAGES = ["download", "upload", "upload path", "disk"]
+
 
 def copy_images_network(*, app_context: AppContext) -> None:
     """Network image transfer flow (sender).
@@ -36,19 +47,82 @@ def copy_images_network(*, app_context: AppContext) -> None:
     5. Send images with progress
     6. Show success/failure summary
     """
-    # Step 1: Find source repo
+    # Steps 1-2: Find source repo and select images
+    selected_images = _select_source_images("NETWORK TRANSFER")
+
+    if selected_images is None:
+        return
+
+    # Step 3-4: Discover and select peer, offering one with room first
+    peer = _select_peer(
+        "NETWORK TRANSFER",
+        min_free_bytes=transfer.estimate_transfer_size(selected_images),
+    )
+
+    if peer is None:
+        return
+
+    # Step 5: Enter PIN
+    pin = _enter_pin()
+
+    if pin is None:
+        return
+
+    # Step 6: Send images
+    _execute_network_transfer(selected_images, peer, pin)
+
+
+def replicate_images_network(*, app_context: AppContext) -> None:
+    """Fleet transfer flow: send images to several peers at once.
+
+    The peers are chained (see services.chain_replication), so the images
+    leave this device once and every peer forwards them to the next.
+
+    Flow:
+    1. Find source repo and select images
+    2. Discover peers and select the ones to send to
+    3. Enter the PIN shown on each peer
+    4. Replicate with progress
+    5. Show how many peers received every image
+    """
+    selected_images = _select_source_images("FLEET TRANSFER")
+
+    if selected_images is None:
+        return
+
+    peers = _select_peers("FLEET TRANSFER")
+
+    if not peers:
+        return
+
+    pins = {}
+    for peer in peers:
+        pin = _enter_pin(peer.hostname)
+        if pin is None:
+            return
+        pins[peer.device_id] = pin
+
+    _execute_replication(selected_images, peers, pins)
+
+
+def _select_source_images(title: str) -> list[DiskImage] | None:
+    """Pick a source repo and images from it.
+
+    Returns:
+        The selected images, or None if there were none or the user cancelled
+    """
     source_repos = image_repo.find_image_repos()
 
     if not source_repos:
         screens.render_error_screen(
-            "NETWORK TRANSFER",
+            title,
             message="No image repo found",
             title_icon=WIFI_ICON,
             message_icon=ALERT_ICON,
             message_icon_size=24,
         )
         time.sleep(1.5)
-        return
+        return None
 
     # Select source if multiple
     if len(source_repos) > 1:
@@ -59,7 +133,7 @@ def copy_images_network(*, app_context: AppContext) -> None:
             transition_direction="forward",
         )
         if source_index is None:
-            return
+            return None
         source_repo = source_repos[source_index]
     else:
         source_repo = source_repos[0]
@@ -69,49 +143,156 @@ def copy_images_network(*, app_context: AppContext) -> None:
 
     if not all_images:
         screens.render_error_screen(
-            "NETWORK TRANSFER",
+            title,
             message="No images found\\nin source repo",
             title_icon=WIFI_ICON,
             message_icon=ALERT_ICON,
             message_icon_size=24,
         )
         time.sleep(1.5)
-        return
+        return None
 
     # Step 2: Multi-select images
     selected_flags = _select_images_checklist([img.name for img in all_images])
 
     if selected_flags is None:
-        return
+        return None
 
     selected_images = [img for i, img in enumerate(all_images) if selected_flags[i]]
 
     if not selected_images:
         screens.render_error_screen(
-            "NETWORK TRANSFER",
+            title,
             message="No images selected",
             title_icon=WIFI_ICON,
             message_icon=ALERT_ICON,
             message_icon_size=24,
         )
         time.sleep(1.5)
+        return None
+
+    return selected_images
+
+
+def benchmark_peer(*, app_context: AppContext) -> None:
+    """Link test flow: find out what limits transfers to a peer.
+
+    Flow:
+    1. Discover and select a peer
+    2. Enter PIN
+    3. Measure raw link, upload path and disk write speed with progress
+    4. Show each speed and the bottleneck
+    """
+    peer = _select_peer("LINK TEST")
+    if peer is None:
         return
 
-    # Step 3: Discover peers
-    peers = _discover_peers()
+    pin = _enter_pin()
+    if pin is None:
+        return
+
+    done = threading.Event()
+    stage = ["Authenticating..."]
+    result: list[link_benchmark.LinkBenchmark | None] = [None]
+    error_message = [""]
+
+    def on_stage(name: str) -> None:
+        stage[0] = name
+
+    def worker():
+        """Background thread for the async benchmark."""
+
+        async def run() -> None:
+            client = peer_transfer_client.TransferClient(peer)
+            await client.authenticate(pin)
+            result[0] = await client.benchmark_link(on_stage=on_stage)
+
+        try:
+            asyncio.run(run())
+        except (
+            peer_transfer_client.AuthenticationError,
+            peer_transfer_client.TransferError,
+        ) as e:
+            log.error(f"Link test failed: {e}")
+            error_message[0] = str(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    while not done.is_set():
+        current = stage[0]
+        screens.render_progress_screen(
+            "LINK TEST",
+            [current.upper() if current in BENCH_STAGES else current],
+            progress_ratio=(
+                BENCH_STAGES.index(current) / len(BENCH_STAGES)
+                if current in BENCH_STAGES
+                else 0.0
+            ),
+            animate=True,
+            title_icon=WIFI_ICON,
+        )
+        time.sleep(0.1)
+    thread.join()
+
+    benchmark = result[0]
+    if benchmark is None:
+        screens.render_error_screen(
+            "LINK TEST",
+            message=error_message[0][:40] or "Link test failed",
+            title_icon=WIFI_ICON,
+            message_icon=ALERT_ICON,
+            message_icon_size=24,
+        )
+        time.sleep(3)
+        return
+
+    link_benchmark.record_result(benchmark)
+    screens.render_status_template(
+        "LINK TEST",
+        f"LIMIT: {benchmark.bottleneck.upper()}",
+        extra_lines=[
+            f"Link up: {_format_speed(benchmark.upload_bytes_per_second)}",
+            f"Link down: {_format_speed(benchmark.download_bytes_per_second)}",
+            f"Upload: {_format_speed(benchmark.upload_path_bytes_per_second)}",
+            f"Disk: {_format_speed(benchmark.disk_write_bytes_per_second)}",
+            "Press A/B to continue.",
+        ],
+        title_icon=WIFI_ICON,
+    )
+    screens.wait_for_ack()
+
+
+def _format_speed(bytes_per_second: float) -> str:
+    return f"{bytes_per_second / 1e6:.1f} MB/s"
+
+
+def _select_peer(title: str, min_free_bytes: int = 0) -> discovery.PeerDevice | None:
+    """Discover peers and let the user pick one.
+
+    Args:
+        title: Title of the error screen shown when no peer is found
+        min_free_bytes: Space the transfer needs; the best peer with that
+            much room is listed first
+
+    Returns:
+        The chosen peer, or None if none was found or the user cancelled
+    """
+    peers = _discover_peers(min_free_bytes)
 
     if not peers:
         screens.render_error_screen(
-            "NETWORK TRANSFER",
+            title,
             message="No peers found\\nCheck network cable",
             title_icon=WIFI_ICON,
             message_icon=ALERT_ICON,
             message_icon_size=24,
         )
         time.sleep(2)
-        return
+        return None
 
-    # Step 4: Select peer
     peer_index = menus.select_list(
         "SELECT DEVICE",
         [f"{p.hostname}\\n{p.address}" for p in peers],
@@ -120,79 +301,95 @@ def copy_images_network(*, app_context: AppContext) -> None:
     )
 
     if peer_index is None:
-        return
-
-    peer = peers[peer_index]
+        return None
 
-    # Step 5: Enter PIN
-    pin = _enter_pin()
+    return peers[peer_index]
 
-    if pin is None:
-        return
-
-    # Step 6: Send images
-    _execute_network_transfer(selected_images, peer, pin)
 
+def _select_peers(title: str) -> list[discovery.PeerDevice]:
+    """Discover peers and let the user tick the ones to send to.
 
-def _discover_peers() -> list[discovery.PeerDevice]:
-    """Discover peer devices with progress display."""
-
-    # Create discovery service
-    disc = discovery.DiscoveryService()
+    Returns:
+        The chosen peers; empty if none was found or the user cancelled
+    """
+    peers = _discover_peers()
 
-    # Display scanning screen
-    def show_scanning():
-        screens.render_progress_screen(
-            "DISCOVERING",
-            ["Scanning network..."],
-            progress_ratio=0,
-            animate=True,
+    if not peers:
+        screens.render_error_screen(
+            title,
+            message="No peers found\\nCheck network cable",
             title_icon=WIFI_ICON,
+            message_icon=ALERT_ICON,
+            message_icon_size=24,
         )
+        time.sleep(2)
+        return []
+
+    selected_flags = _select_images_checklist(
+        [p.hostname for p in peers], title="SELECT DEVICES", hint="L/R:Toggle B:Send"
+    )
 
-    found_peers = []
+    if selected_flags is None:
+        return []
 
-    def on_peer_update(peers):
-        """Called when peers list changes."""
-        nonlocal found_peers
-        found_peers = peers
+    return [peer for i, peer in enumerate(peers) if selected_flags[i]]
 
-    # Run discovery in thread
-    def discover_worker():
-        nonlocal found_peers
-        found_peers = disc.browse_peers(timeout_seconds=5.0, on_update=on_peer_update)
 
-    thread = threading.Thread(target=discover_worker, daemon=True)
-    thread.start()
+def _discover_peers(min_free_bytes: int = 0) -> list[discovery.PeerDevice]:
+    """Discover peer devices with progress display.
+
+    Peers come from the shared peer registry, which keeps browsing in the
+    background: once it knows some peers they are returned at once, idle
+    and fast peers first, led by the one ``PeerRegistry.pick()`` chooses
+    for ``min_free_bytes``. Only the first call scans for a few seconds.
+    """
+    registry = peer_registry.start_peer_registry()
+    if registry.peers():
+        return _ranked_peers(registry, min_free_bytes)
 
-    # Show progress while discovering
     start_time = time.time()
-    while thread.is_alive():
+    generation = registry.generation
+    while time.time() - start_time < DISCOVERY_SECONDS:
         elapsed = time.time() - start_time
-        progress = min(1.0, elapsed / 5.0)
-
-        if found_peers:
-            screens.render_progress_screen(
-                "DISCOVERING",
-                [f"Found {len(found_peers)} device(s)"],
-                progress_ratio=progress,
-                animate=False,
-                title_icon=WIFI_ICON,
-            )
-        else:
-            show_scanning()
+        found = len(registry.peers())
+        screens.render_progress_screen(
+            "DISCOVERING",
+            [f"Found {found} device(s)" if found else "Scanning network..."],
+            progress_ratio=min(1.0, elapsed / DISCOVERY_SECONDS),
+            animate=not found,
+            title_icon=WIFI_ICON,
+        )
+        generation = registry.wait_for_change(generation, timeout=0.1)
 
-        time.sleep(0.1)
+    return _ranked_peers(registry, min_free_bytes)
 
-    thread.join()
-    disc.shutdown()
 
-    return found_peers
+def _ranked_peers(
+    registry: peer_registry.PeerRegistry, min_free_bytes: int
+) -> list[discovery.PeerDevice]:
+    peers = [entry.peer for entry in registry.peers()]
+    best = registry.pick(min_free_bytes)
+    if best is None:
+        return peers
+    return [
+        best.peer,
+        *(peer for peer in peers if peer.device_id != best.peer.device_id),
+    ]
+
 
+def _refresh_peer_registry() -> None:
+    """Re-probe peers after sending, as their free space and load changed."""
+    registry = peer_registry.get_peer_registry()
+    if registry is not None:
+        registry.probe_now()
 
-def _enter_pin() -> str | None:
+
+def _enter_pin(hostname: str | None = None) -> str | None:
     """Show PIN entry UI.
 
+    Args:
+        hostname: Peer whose PIN is asked for, when sending to several
+
     Returns:
         4-digit PIN string, or None if cancelled
     """
@@ -206,7 +403,7 @@ def _enter_pin() -> str | None:
         # Highlight current digit
         lines = [
             "ENTER PIN",
-            "From destination",
+            f"From {hostname}" if hostname else "From destination",
             "",
             f"  {formatted}",
             f"  {'  ' * cursor_pos}^",
@@ -336,6 +533,7 @@ def _execute_network_transfer(
         time.sleep(0.1)
 
     thread.join()
+    _refresh_peer_registry()
 
     # Show final result
     success = success_count[0]
@@ -411,3 +609,121 @@ async def _async_transfer(
     except peer_transfer_client.TransferError as e:
         log.error(f"Transfer error: {e}")
         error_message[0] = f"Transfer failed: {str(e)}"
+
+
+def _execute_replication(
+    images: list[DiskImage],
+    peers: list[discovery.PeerDevice],
+    pins: dict[str, str],
+) -> None:
+    """Replicate images to peers with progress display."""
+
+    done = threading.Event()
+    progress_lock = threading.Lock()
+    # Progress ratio per device id
+    progress: dict[str, float] = {}
+    result: dict[str, bool] = {}
+    error_message = [""]
+
+    def progress_callback(peer: discovery.PeerDevice, ratio: float) -> None:
+        """Called by the replicator to report progress per peer."""
+        with progress_lock:
+            progress[peer.device_id] = ratio
+
+    def worker():
+        """Background thread for async replication."""
+        try:
+            result.update(
+                asyncio.run(_async_replicate(images, peers, pins, progress_callback))
+            )
+        except Exception as e:
+            log.error(f"Fleet transfer failed: {e}")
+            with progress_lock:
+                error_message[0] = str(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    while not done.is_set():
+        with progress_lock:
+            finished = sum(1 for ratio in progress.values() if ratio >= 1.0)
+            ratio = sum(progress.values()) / len(peers)
+            err = error_message[0]
+
+        if err:
+            screens.render_error_screen(
+                "FLEET TRANSFER",
+                message=err[:40],
+                title_icon=WIFI_ICON,
+                message_icon=ALERT_ICON,
+                message_icon_size=24,
+            )
+            time.sleep(3)
+            return
+
+        screens.render_progress_screen(
+            "SENDING",
+            [f"{finished}/{len(peers)} devices done" if progress else "Connecting..."],
+            progress_ratio=ratio,
+            animate=not progress,
+            title_icon=WIFI_ICON,
+        )
+        time.sleep(0.1)
+
+    thread.join()
+    _refresh_peer_registry()
+
+    if error_message[0]:
+        screens.render_error_screen(
+            "FLEET TRANSFER",
+            message=error_message[0][:40],
+            title_icon=WIFI_ICON,
+            message_icon=ALERT_ICON,
+            message_icon_size=24,
+        )
+        time.sleep(3)
+        return
+
+    complete = sum(1 for peer in peers if result.get(peer.device_id))
+    failed = [peer.hostname for peer in peers if not result.get(peer.device_id)]
+
+    if not failed:
+        status = "SUCCESS"
+    elif complete == 0:
+        status = "FAILED"
+    else:
+        status = "PARTIAL"
+    extra_lines = [
+        f"Sent {len(images)} image(s)",
+        f"to {complete}/{len(peers)} devices",
+    ]
+    if failed:
+        extra_lines.append(f"Failed: {', '.join(failed)}"[:40])
+    extra_lines.append("Press A/B to continue.")
+    screens.render_status_template(
+        "FLEET TRANSFER", status, extra_lines=extra_lines, title_icon=WIFI_ICON
+    )
+    screens.wait_for_ack()
+
+
+async def _async_replicate(
+    images: list[DiskImage],
+    peers: list[discovery.PeerDevice],
+    pins: dict[str, str],
+    progress_callback,
+) -> dict[str, bool]:
+    """Authenticate with every peer, then replicate to the ones that accepted.
+
+    Returns:
+        Whether each peer (by device id) ended up with every image
+    """
+    replicator = chain_replication.ChainReplicator(peers)
+    rejected = await replicator.authenticate(pins)
+    for peer in rejected:
+        log.error(f"Auth failed for {peer.hostname}, leaving it out")
+
+    result = await replicator.replicate(images, progress_callback)
+    result.update({peer.device_id: False for peer in rejected})
+    return result
@@ -151,11 +151,17 @@ def copy_images_to_usb(*, app_context: AppContext) -> None:
     _execute_copy(selected_images, dest_repo)
 
 
-def _select_images_checklist(image_names: list[str]) -> list[bool] | None:
+def _select_images_checklist(
+    image_names: list[str],
+    title: str = "SELECT IMAGES",
+    hint: str = "L/R:Toggle B:Copy",
+) -> list[bool] | None:
     """Show a checklist for image selection.
 
     Args:
         image_names: List of image name strings
+        title: Screen title
+        hint: Button hint shown below the title
 
     Returns:
         List of booleans (True if selected), or None if cancelled
@@ -176,7 +182,7 @@ def _select_images_checklist(image_names: list[str]) -> list[bool] | None:
         visible_start = max(0, cursor_index - 1)
         visible_lines = lines[visible_start : visible_start + 4]
 
-        display.display_lines(["SELECT IMAGES", "L/R:Toggle B:Copy", *visible_lines])
+        display.display_lines([title, hint, *visible_lines])
 
     render_screen()
     menus.wait_for_buttons_release(
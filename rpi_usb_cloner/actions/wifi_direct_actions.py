@@ -130,9 +130,19 @@ def wifi_direct_host(*, app_context: AppContext) -> None:
         server_thread.start()
 
         try:
-            disc.start_publishing(lambda: pin)
+            # Advertise free space so senders can pick a peer before probing
+            disc.start_publishing(
+                lambda: pin,
+                {"free_bytes": str(image_repo.get_repo_free_bytes(dest_repo))},
+            )
             start_future = asyncio.run_coroutine_threadsafe(
-                server.start(pin_callback=lambda: pin),
+                server.start(
+                    pin_callback=lambda: pin,
+                    # Keep the advertised free space current as images arrive
+                    on_free_space=lambda free: disc.update_properties(
+                        {"free_bytes": str(free)}
+                    ),
+                ),
                 server_loop,
             )
             start_future.result()
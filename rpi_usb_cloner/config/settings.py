@@ -31,10 +31,16 @@ DEFAULT_SETTINGS: dict[str, Any] = {
     "transition_frame_delay": DEFAULT_TRANSITION_FRAME_DELAY,
     "verify_image_hash_timeout_seconds": None,
     "verify_partition_hash_timeout_seconds": None,
+    "secure_erase_zero_pass": False,
+    "secure_erase_full_verify": False,
     "screenshots_enabled": False,
     "screenshots_dir": "/home/pi/oled_screenshots",
     "web_server_enabled": False,
     "menu_icon_preview_enabled": False,
+    # Bandwidth caps in MB/s for every drive and peer link (see
+    # storage.transfer_scheduler); None is uncapped
+    "transfer_device_cap_mbps": None,
+    "transfer_link_cap_mbps": None,
     # Status bar icon visibility settings
     "status_bar_enabled": True,
     "status_bar_wifi_enabled": True,
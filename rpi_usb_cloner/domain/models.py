@@ -129,14 +129,14 @@ class ImageRepo:
 
 @dataclass(frozen=True)
 class DiskImage:
-    """A Clonezilla-compatible disk image or ISO file.
+    """A Clonezilla-compatible disk image, ISO, ImageUSB or compressed raw file.
 
     Replaces Path objects with a domain type that carries metadata.
     """
 
     name: str  # Image name (directory or file name)
     path: Path  # Full path to image directory or ISO
-    image_type: ImageType  # CLONEZILLA_DIR or ISO
+    image_type: ImageType  # CLONEZILLA_DIR, ISO, IMAGEUSB_BIN or COMPRESSED_RAW
     size_bytes: int | None = None  # Total size if calculable
 
     @property
@@ -149,6 +149,11 @@ class DiskImage:
         """Check if this is an ImageUSB .BIN file."""
         return self.image_type == ImageType.IMAGEUSB_BIN
 
+    @property
+    def is_compressed_raw(self) -> bool:
+        """Check if this is a compressed raw image (.img.xz, .zip, ...)."""
+        return self.image_type == ImageType.COMPRESSED_RAW
+
 
 class ImageType(Enum):
     """Type of disk image."""
@@ -156,6 +161,7 @@ class ImageType(Enum):
     CLONEZILLA_DIR = "clonezilla"  # Directory with Clonezilla image files
     ISO = "iso"  # ISO file
     IMAGEUSB_BIN = "imageusb"  # ImageUSB .BIN file
+    COMPRESSED_RAW = "compressed"  # .img.xz / .img.gz / .img.zst / .zip raw image
 
 
 # ==============================================================================
@@ -11,7 +11,7 @@ Architecture Overview:
     The application follows an event-driven architecture with a main polling loop that:
 
     1. Polls GPIO buttons for user input (every INPUT_POLL_INTERVAL)
-    2. Checks for USB device changes (every USB_REFRESH_INTERVAL)
+    2. Checks for USB device changes (when the hotplug device table changes)
     3. Handles screensaver activation after idle timeout
     4. Dispatches actions based on menu selections
     5. Updates OLED display with current state
@@ -53,7 +53,9 @@ State Management:
     - Settings: Persistent configuration (screensaver, WiFi, etc.)
 
 Device Monitoring:
-    USB devices are polled every 2 seconds (USB_REFRESH_INTERVAL). When devices
+    A hotplug monitor (storage.hotplug) keeps a live device table from netlink
+    uevents; the loop compares its generation counter each pass and falls back
+    to polling every 2 seconds (USB_REFRESH_INTERVAL) without it. When devices
     change:
     - Menu items are rebuilt to reflect current drives
     - Active drive selection is preserved if still present
@@ -124,9 +126,9 @@ from rpi_usb_cloner.logging import get_logger, setup_logging
 from rpi_usb_cloner.menu import actions as menu_actions
 from rpi_usb_cloner.menu import definitions, navigator
 from rpi_usb_cloner.menu.model import get_screen_icon
-from rpi_usb_cloner.services import drives, wifi
+from rpi_usb_cloner.services import drives, peer_registry, wifi
 from rpi_usb_cloner.services.drives import list_usb_disks_filtered
-from rpi_usb_cloner.storage import devices
+from rpi_usb_cloner.storage import devices, hotplug
 from rpi_usb_cloner.storage.format import configure_format_helpers
 from rpi_usb_cloner.ui import (
     display,
@@ -288,6 +290,10 @@ def main(argv: Optional[list[str]] = None) -> None:
     devices.configure_device_helpers(
         log_debug=usb_log_debug, error_handler=display.display_lines
     )
+    # Hotplug monitor keeps the device table current; the loop reacts to its
+    # generation counter instead of polling lsblk
+    device_table = hotplug.start_hotplug_monitor()
+    last_device_generation = device_table.generation if device_table else None
     configure_format_helpers(
         log_debug=get_logger(tags=["format"], source="format").debug
     )
@@ -752,7 +758,15 @@ def main(argv: Optional[list[str]] = None) -> None:
             # If transition just completed, force a render to update state
             if transition_just_completed:
                 force_render = True
-            if time.time() - state.last_usb_check >= app_state.USB_REFRESH_INTERVAL:
+            if device_table is not None:
+                usb_check_due = device_table.generation != last_device_generation
+            else:
+                usb_check_due = (
+                    time.time() - state.last_usb_check >= app_state.USB_REFRESH_INTERVAL
+                )
+            if usb_check_due:
+                if device_table is not None:
+                    last_device_generation = device_table.generation
                 # Use batched snapshot for efficiency (single lsblk call)
                 # First pass: get raw/mount info to detect changes
                 usb_snapshot = get_batched_usb_snapshot()
@@ -1011,6 +1025,8 @@ def main(argv: Optional[list[str]] = None) -> None:
         )
         context.disp.display(context.image)
     finally:
+        hotplug.stop_hotplug_monitor()
+        peer_registry.stop_peer_registry()
         cleanup_display(clear_display=not error_displayed)
 
 
@@ -48,6 +48,7 @@ from .images import (  # noqa: E402
     images_coming_soon,
     verify_clone,
     write_image,
+    write_image_network,
 )
 from .settings import (  # noqa: E402
     demo_confirmation_screen,
@@ -86,6 +87,8 @@ from .tools import file_browser, system_info, tools_coming_soon, view_logs  # no
 from .transfer import (  # noqa: E402
     copy_images_network,
     copy_images_usb,
+    fleet_transfer,
+    link_test,
     wifi_direct_host,
     wifi_direct_join,
 )
@@ -105,6 +108,8 @@ __all__ = [
     "copy_drive",
     "copy_images_usb",
     "copy_images_network",
+    "fleet_transfer",
+    "link_test",
     "wifi_direct_host",
     "wifi_direct_join",
     "create_repo_drive",
@@ -115,6 +120,7 @@ __all__ = [
     # Clone/Image actions
     "backup_image",
     "write_image",
+    "write_image_network",
     "verify_clone",
     "images_coming_soon",
     # Tool actions
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from rpi_usb_cloner.actions import image_actions
+from rpi_usb_cloner.actions import image_actions, network_restore_actions
 
 from . import get_action_context
 
@@ -40,6 +40,16 @@ def write_image() -> None:
     )
 
 
+def write_image_network() -> None:
+    """Restore an image streamed from a peer's repo."""
+    context = get_action_context()
+    _run_operation(
+        lambda: network_restore_actions.write_image_network(
+            app_context=context.app_context, log_debug=context.log_debug
+        )
+    )
+
+
 def verify_clone() -> None:
     """Verify a clone/restore by comparing image hashes against target device."""
     context = get_action_context()
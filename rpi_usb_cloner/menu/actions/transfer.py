@@ -23,6 +23,18 @@ def copy_images_network() -> None:
     network_transfer_actions.copy_images_network(app_context=context.app_context)
 
 
+def fleet_transfer() -> None:
+    """Menu action for ETHERNET FLEET transfer."""
+    context = get_action_context()
+    network_transfer_actions.replicate_images_network(app_context=context.app_context)
+
+
+def link_test() -> None:
+    """Menu action for LINK TEST."""
+    context = get_action_context()
+    network_transfer_actions.benchmark_peer(app_context=context.app_context)
+
+
 def wifi_direct_host() -> None:
     """Menu action for WIFI HOST."""
     context = get_action_context()
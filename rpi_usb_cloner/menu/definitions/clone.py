@@ -15,6 +15,7 @@ CLONE_MENU: MenuScreen = MenuScreen(
         menu_entry("DRIVE TO DRIVE", action=menu_actions.copy_drive),
         menu_entry("DRIVE TO IMAGE", action=menu_actions.backup_image),
         menu_entry("IMAGE TO DRIVE", action=menu_actions.write_image),
+        menu_entry("NETWORK TO DRIVE", action=menu_actions.write_image_network),
         menu_entry("VERIFY CLONE", action=menu_actions.verify_clone),
     ],
 )
@@ -19,8 +19,10 @@ COPY_IMAGES_MENU: MenuScreen = MenuScreen(
     items=[
         menu_entry("USB TO USB", action=menu_actions.copy_images_usb),
         menu_entry("ETHERNET", action=menu_actions.copy_images_network),
+        menu_entry("ETHERNET FLEET", action=menu_actions.fleet_transfer),
         menu_entry("WIFI HOST", action=menu_actions.wifi_direct_host),
         menu_entry("WIFI JOIN", action=menu_actions.wifi_direct_join),
+        menu_entry("LINK TEST", action=menu_actions.link_test),
     ],
 )
 
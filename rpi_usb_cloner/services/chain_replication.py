@@ -0,0 +1,657 @@
+"""Chain replication of images to many peers at once.
+
+Sending images to a fleet one peer at a time makes the source's upload link
+the bottleneck. Instead, the peers found by ``DiscoveryService.browse_peers``
+are arranged in a chain (or, with ``fanout`` above one, a tree): the source
+uploads to the first peer only, and every peer forwards each range it
+receives to the next hops while it is still writing it to its own repo. The
+whole fleet then takes about as long as one transfer plus a short delay per
+hop.
+
+The relay tree is sent along with ``POST /transfer``: each hop is described
+by its URL, a session token obtained by the source, and its own subtree.
+A peer that has a relay (see ``Relay``) passes every step of the upload
+protocol on to its hops:
+
+- transfer init: files count as present only if every hop has them, and
+  compression is only used if every hop accepts the codec
+- upload state: only blocks held by every hop are reported, so the sender
+  resends blocks a later hop is missing
+- ranges: the received bytes are forwarded as they arrive, still compressed
+- commit: after the local commit, the hops commit too
+- end: when the sender ends the transfer, the hops end theirs
+
+Every hop starts a transfer of its own, so the requests passed on carry the
+hop's transfer id rather than this peer's.
+
+A hop that fails is dropped from the relay for the rest of the transfer,
+and everything behind it is simply not reported as replicated. Rather than
+trusting what the chain reported, the source asks every peer afterwards
+which files it holds and runs another round for the peers that are still
+missing some, with the peers that failed before moved to the end of the
+chain. Thanks to resumable uploads and dedup, such a round only sends what
+is really missing.
+
+Peer sessions expire when left idle (see services.peer_transfer_server),
+and a round can leave a peer idle for a while, e.g. while it waits to be
+checked. The source keeps the PINs it authenticated with and gets fresh
+tokens before a round and before checking the peers once the tokens it
+holds are older than ``TOKEN_REFRESH_SECONDS``; the relay tree of a round
+carries the tokens current when it starts.
+
+Replication runs as a background job (see storage.transfer_scheduler) on
+the source and on every relaying peer, so it yields to clones, restores
+and copies that share a drive or link with it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Mapping
+
+import aiohttp
+
+from rpi_usb_cloner.domain import DiskImage
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.services import peer_transfer_client
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.storage import image_repo, transfer_scheduler
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
+
+
+log = get_logger(source=__name__)
+
+REPLICATION_ROUNDS = 3
+# Chunks queued per hop before a relayed upload waits for that hop
+RELAY_QUEUE_CHUNKS = 8
+RELAY_CONNECT_SECONDS = 10
+RELAY_READ_SECONDS = 300
+# A relay unused for this long belongs to a sender that went away
+RELAY_IDLE_SECONDS = 900
+# Tokens older than this are renewed before they are handed out again,
+# well within the peers' session timeout
+TOKEN_REFRESH_SECONDS = 300
+
+# Request headers passed on to the next hop with a forwarded upload
+FORWARDED_HEADERS = (
+    "Content-Type",
+    "X-Image-Type",
+    "X-Upload-File",
+    "X-Upload-Size",
+    "X-Upload-Source",
+    "X-Upload-Offset",
+    "X-Upload-End",
+    "X-Upload-Encoding",
+)
+
+
+@dataclass
+class ReplicaNode:
+    """A peer in a replication tree and the peers it forwards to."""
+
+    peer: PeerDevice
+    children: list[ReplicaNode] = field(default_factory=list)
+
+
+def plan_chain(
+    peers: Iterable[PeerDevice],
+    fanout: int = 1,
+    failures: Mapping[str, int] | None = None,
+) -> ReplicaNode | None:
+    """Arrange peers in a replication tree; ``fanout=1`` gives a chain.
+
+    Peers are placed breadth first, each forwarding to at most ``fanout``
+    others. Peers with more ``failures`` (by device id) go last, so a flaky
+    peer does not hold up the ones behind it.
+    """
+    failures = failures or {}
+    ordered = sorted(
+        peers,
+        key=lambda peer: (
+            failures.get(peer.device_id, 0),
+            peer.hostname,
+            peer.device_id,
+        ),
+    )
+    if not ordered:
+        return None
+    fanout = max(1, fanout)
+    nodes = [ReplicaNode(peer) for peer in ordered]
+    for position, node in enumerate(nodes[1:], start=1):
+        nodes[(position - 1) // fanout].children.append(node)
+    return nodes[0]
+
+
+def _spec_names(spec: Mapping[str, Any]) -> list[str]:
+    """Names of a hop and every hop behind it."""
+    names = [str(spec.get("name", ""))]
+    for child in spec.get("relay") or []:
+        names.extend(_spec_names(child))
+    return names
+
+
+class _Hop:
+    """A peer this device forwards uploads to."""
+
+    def __init__(self, spec: Mapping[str, Any]) -> None:
+        self.name = str(spec["name"])
+        self.url = str(spec["url"]).rstrip("/")
+        self.token = str(spec["token"])
+        self.relay = list(spec.get("relay") or [])
+        self.failed = False
+        # The hop's own id for the transfer, once it is started
+        self.transfer_id: str | None = None
+
+    def headers(self, request_headers: Mapping[str, str] | None = None) -> dict:
+        headers = {
+            name: request_headers[name]
+            for name in FORWARDED_HEADERS
+            if request_headers is not None and name in request_headers
+        }
+        headers["Authorization"] = f"Bearer {self.token}"
+        if self.transfer_id is not None:
+            headers["X-Transfer-Id"] = self.transfer_id
+        return headers
+
+
+class Relay:
+    """Forward an upload received by this peer to the next hops.
+
+    Used by the transfer server. Hops are dropped after their first failure;
+    the upload to this peer always goes on.
+    """
+
+    def __init__(self, hops: Iterable[Mapping[str, Any]]) -> None:
+        """Initialize a relay.
+
+        Args:
+            hops: ``{"name", "url", "token", "relay": [...]}`` for each hop
+
+        Raises:
+            KeyError: If a hop is missing its URL, token or name
+        """
+        self._hops = [_Hop(spec) for spec in hops]
+        # Hops behind the direct ones that were reported as failed
+        self._reported_failed: list[str] = []
+        self._session: aiohttp.ClientSession | None = None
+        self._used_at = time.monotonic()
+        self._job: transfer_scheduler.Job | None = None
+
+    def touch(self) -> None:
+        """Note that the transfer is still going."""
+        self._used_at = time.monotonic()
+
+    @property
+    def idle(self) -> bool:
+        return time.monotonic() - self._used_at >= RELAY_IDLE_SECONDS
+
+    @property
+    def live(self) -> list[_Hop]:
+        return [hop for hop in self._hops if not hop.failed]
+
+    @property
+    def failed_names(self) -> list[str]:
+        """Names of every hop behind this peer that is not being replicated to."""
+        names = list(self._reported_failed)
+        for hop in self._hops:
+            if hop.failed:
+                names.extend(_spec_names({"name": hop.name, "relay": hop.relay}))
+        return names
+
+    def _fail(self, hop: _Hop, error: Any) -> None:
+        if not hop.failed:
+            hop.failed = True
+            log.warning(f"Relay to {hop.name} failed, dropping it: {error}")
+
+    def _scheduled_job(self) -> transfer_scheduler.Job:
+        """The scheduler job forwarded ranges are paced by, registered once."""
+        if self._job is None:
+            names = [hop.name for hop in self._hops]
+            self._job = transfer_scheduler.get_scheduler().register(
+                f"relay to {', '.join(names)}", Priority.BACKGROUND, links=names
+            )
+        return self._job
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=RELAY_CONNECT_SECONDS,
+                    sock_read=RELAY_READ_SECONDS,
+                )
+            )
+        return self._session
+
+    async def _request(
+        self, hop: _Hop, method: str, path: str, **kwargs: Any
+    ) -> dict | None:
+        """Make a request to a hop; its JSON reply, or None if the hop failed."""
+        try:
+            async with self._client().request(
+                method, f"{hop.url}{path}", **kwargs
+            ) as resp:
+                data = await resp.json()
+                if resp.status != 200:
+                    self._fail(hop, data.get("error", f"status {resp.status}"))
+                    return None
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self._fail(hop, e)
+            return None
+
+    async def init(
+        self,
+        images: list[dict],
+        codec: str | None,
+        present: dict[str, list[str]],
+    ) -> tuple[dict[str, list[str]], str | None]:
+        """Start the transfer on every hop.
+
+        Args:
+            images: Image list from the transfer init, including file digests
+            codec: Compression codec this peer accepted
+            present: Files this peer already holds, by image
+
+        Returns:
+            (files every hop holds too, codec every hop accepts)
+        """
+        hops = self.live
+        replies = await asyncio.gather(
+            *(
+                self._request(
+                    hop,
+                    "POST",
+                    "/transfer",
+                    json={
+                        "images": images,
+                        "compression": [codec] if codec else [],
+                        "relay": hop.relay,
+                    },
+                    headers=hop.headers(),
+                )
+                for hop in hops
+            )
+        )
+        for hop, data in zip(hops, replies):
+            if data is None:
+                continue
+            hop.transfer_id = data.get("transfer_id")
+            if hop.relay and "relay_failed" not in data:
+                # The hop does not support relaying
+                self._reported_failed.extend(
+                    name for spec in hop.relay for name in _spec_names(spec)
+                )
+            self._reported_failed.extend(data.get("relay_failed") or [])
+            if data.get("compression") != codec:
+                codec = None
+            hop_present = data.get("present") or {}
+            present = {
+                image: kept
+                for image, files in present.items()
+                if (
+                    kept := [
+                        name
+                        for name in files
+                        if name in set(hop_present.get(image) or ())
+                    ]
+                )
+            }
+        return present, codec
+
+    async def common_blocks(
+        self,
+        image_name: str,
+        request_headers: Mapping[str, str],
+        query: Mapping[str, str],
+        block_bytes: int,
+        blocks: dict[int, str],
+    ) -> dict[int, str]:
+        """Keep only the received blocks that every hop has as well."""
+        hops = self.live
+        replies = await asyncio.gather(
+            *(
+                self._request(
+                    hop,
+                    "GET",
+                    f"/upload/{image_name}/state",
+                    params=dict(query),
+                    headers=hop.headers(request_headers),
+                )
+                for hop in hops
+            )
+        )
+        for hop, data in zip(hops, replies):
+            if data is None:
+                continue
+            if data.get("block_bytes") != block_bytes:
+                self._fail(hop, f"block size {data.get('block_bytes')}")
+                continue
+            theirs = data.get("blocks") or {}
+            blocks = {
+                index: digest
+                for index, digest in blocks.items()
+                if theirs.get(str(index)) == digest
+            }
+        return blocks
+
+    def forward(
+        self, image_name: str, request_headers: Mapping[str, str]
+    ) -> RelayedUpload | None:
+        """Start forwarding an upload range; None if there are no live hops."""
+        hops = self.live
+        if not hops:
+            return None
+        return RelayedUpload(self, image_name, request_headers, hops)
+
+    async def commit(
+        self,
+        image_name: str,
+        request_headers: Mapping[str, str],
+        body: Mapping[str, Any],
+    ) -> list[str]:
+        """Commit a file on every hop; returns the names of the hops that did."""
+        hops = self.live
+        replies = await asyncio.gather(
+            *(
+                self._request(
+                    hop,
+                    "POST",
+                    f"/upload/{image_name}/commit",
+                    json=dict(body),
+                    headers=hop.headers(request_headers),
+                )
+                for hop in hops
+            )
+        )
+        replicas: list[str] = []
+        for hop, data in zip(hops, replies):
+            if data is not None:
+                replicas.append(hop.name)
+                replicas.extend(data.get("replicas") or [])
+        return replicas
+
+    async def _end(self, hop: _Hop) -> None:
+        try:
+            async with self._client().delete(
+                f"{hop.url}/transfer/{hop.transfer_id}", headers=hop.headers()
+            ):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.debug(f"Unable to end transfer on {hop.name}: {e}")
+
+    async def close(self) -> None:
+        """End the transfer on the hops that relay it further.
+
+        Failed hops are told too, as they may still be relaying.
+        """
+        hops = [hop for hop in self._hops if hop.relay and hop.transfer_id]
+        await asyncio.gather(*(self._end(hop) for hop in hops))
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._job is not None:
+            self._job.scheduler.release(self._job)
+            self._job = None
+
+
+class RelayedUpload:
+    """One upload range being forwarded to the live hops of a relay."""
+
+    def __init__(
+        self,
+        relay: Relay,
+        image_name: str,
+        request_headers: Mapping[str, str],
+        hops: list[_Hop],
+    ) -> None:
+        self._relay = relay
+        self._job = relay._scheduled_job()
+        self._streams: list[tuple[_Hop, asyncio.Queue, asyncio.Task]] = []
+        for hop in hops:
+            queue: asyncio.Queue = asyncio.Queue(RELAY_QUEUE_CHUNKS)
+            task = asyncio.ensure_future(
+                self._send(hop, image_name, hop.headers(request_headers), queue)
+            )
+            self._streams.append((hop, queue, task))
+
+    async def _send(
+        self, hop: _Hop, image_name: str, headers: dict, queue: asyncio.Queue
+    ) -> list[str]:
+        async def body():
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        async with self._relay._client().post(
+            f"{hop.url}/upload/{image_name}", data=body(), headers=headers
+        ) as resp:
+            data = await resp.json()
+            if resp.status != 200 or data.get("status") != "received":
+                raise peer_transfer_client.TransferError(
+                    data.get("error") or f"received {data.get('received_bytes')} bytes"
+                )
+            return [hop.name, *(data.get("replicas") or [])]
+
+    async def _put(self, chunk: bytes | None) -> None:
+        for hop, queue, task in self._streams:
+            if hop.failed or task.done():
+                continue
+            if not queue.full():
+                queue.put_nowait(chunk)
+                continue
+            # Wait for the hop to catch up, unless its upload ends first
+            put = asyncio.ensure_future(queue.put(chunk))
+            await asyncio.wait({put, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+
+    async def write(self, chunk: bytes) -> None:
+        """Queue a received chunk for every hop, at the relay's share."""
+        await self._put(chunk)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._job.consume, len(chunk))
+
+    async def finish(self) -> list[str]:
+        """End the range; returns the hops that received all of it."""
+        await self._put(None)
+        results = await asyncio.gather(
+            *(task for _hop, _queue, task in self._streams), return_exceptions=True
+        )
+        replicas: list[str] = []
+        for (hop, _queue, _task), result in zip(self._streams, results):
+            if isinstance(result, BaseException):
+                self._relay._fail(hop, result)
+            elif not hop.failed:
+                replicas.extend(result)
+        return replicas
+
+    async def abort(self) -> None:
+        """Stop forwarding; the hops keep what they received so far."""
+        for _hop, _queue, task in self._streams:
+            task.cancel()
+        await asyncio.gather(
+            *(task for _hop, _queue, task in self._streams), return_exceptions=True
+        )
+
+
+class ChainReplicator:
+    """Send images to many peers through a relay chain."""
+
+    def __init__(
+        self,
+        peers: Iterable[PeerDevice],
+        fanout: int = 1,
+        timeout_seconds: int = 300,
+        priority: Priority = Priority.BACKGROUND,
+    ):
+        """Initialize a replicator.
+
+        Args:
+            peers: Peers to replicate to, as found by browse_peers()
+            fanout: Peers each peer forwards to (1 for a chain)
+            timeout_seconds: HTTP request timeout
+            priority: Scheduler priority of the uploads from this device
+        """
+        self.peers = list(peers)
+        self.fanout = fanout
+        self.timeout_seconds = timeout_seconds
+        self.priority = priority
+        # Session token per device id
+        self.tokens: dict[str, str] = {}
+        # PIN and token age per device id, to renew tokens during a long run
+        self._pins: dict[str, str] = {}
+        self._authenticated_at: dict[str, float] = {}
+
+    def _client(self, peer: PeerDevice) -> peer_transfer_client.TransferClient:
+        client = peer_transfer_client.TransferClient(
+            peer, self.timeout_seconds, priority=self.priority
+        )
+        client.session_token = self.tokens.get(peer.device_id)
+        return client
+
+    async def authenticate(self, pins: Mapping[str, str]) -> list[PeerDevice]:
+        """Authenticate with every peer.
+
+        Args:
+            pins: PIN shown on each peer, by device id
+
+        Returns:
+            Peers that could not be authenticated; they are left out
+        """
+        self._pins.update(pins)
+        return await self._authenticate(self.peers)
+
+    async def _authenticate(self, peers: list[PeerDevice]) -> list[PeerDevice]:
+        async def authenticate(peer: PeerDevice) -> bool:
+            client = self._client(peer)
+            try:
+                token = await client.authenticate(self._pins.get(peer.device_id, ""))
+            except peer_transfer_client.AuthenticationError as e:
+                log.warning(f"Unable to authenticate with {peer.hostname}: {e}")
+                return False
+            self.tokens[peer.device_id] = token
+            self._authenticated_at[peer.device_id] = time.monotonic()
+            return True
+
+        results = await asyncio.gather(*(authenticate(peer) for peer in peers))
+        return [peer for peer, ok in zip(peers, results) if not ok]
+
+    async def _refresh_tokens(self, peers: list[PeerDevice]) -> None:
+        """Renew the tokens of peers that may have expired by now.
+
+        Only tokens obtained by authenticate() can be renewed. A peer that
+        refuses keeps its old token and fails like any unreachable peer.
+        """
+        now = time.monotonic()
+        stale = [
+            peer
+            for peer in peers
+            if peer.device_id in self._authenticated_at
+            and now - self._authenticated_at[peer.device_id] >= TOKEN_REFRESH_SECONDS
+        ]
+        if stale:
+            log.debug(f"Renewing session tokens of {len(stale)} peer(s)")
+            await self._authenticate(stale)
+
+    def _relay_spec(self, node: ReplicaNode) -> dict[str, Any]:
+        peer = node.peer
+        return {
+            "name": peer.device_id,
+            "url": f"http://{peer.address}:{peer.port}",
+            "token": self.tokens[peer.device_id],
+            "relay": [self._relay_spec(child) for child in node.children],
+        }
+
+    async def _is_complete(self, peer: PeerDevice, images: list[DiskImage]) -> bool:
+        try:
+            missing = await self._client(peer).missing_files(images)
+        except (
+            peer_transfer_client.TransferError,
+            peer_transfer_client.AuthenticationError,
+        ) as e:
+            log.warning(f"Unable to check {peer.hostname}: {e}")
+            return False
+        return not missing
+
+    async def replicate(
+        self,
+        images: list[DiskImage],
+        progress_callback: Callable[[PeerDevice, float], None] | None = None,
+    ) -> dict[str, bool]:
+        """Send images to every authenticated peer.
+
+        Args:
+            images: Images to send
+            progress_callback: Optional callback(peer, progress_ratio) per hop
+
+        Returns:
+            Whether each peer (by device id) ended up with every image
+        """
+        pending = [peer for peer in self.peers if peer.device_id in self.tokens]
+        by_id = {peer.device_id: peer for peer in pending}
+        total_bytes = sum(image_repo.get_image_size_bytes(img) or 0 for img in images)
+        failures: dict[str, int] = {}
+        done: dict[str, int] = {}
+        complete = {peer.device_id: False for peer in pending}
+
+        def report(peer: PeerDevice, ratio: float) -> None:
+            if progress_callback:
+                progress_callback(peer, ratio)
+
+        for round_number in range(1, REPLICATION_ROUNDS + 1):
+            root = plan_chain(pending, self.fanout, failures)
+            if root is None:
+                break
+            # Every hop of the relay tree gets a token that is still good
+            await self._refresh_tokens(pending)
+            log.info(
+                f"Replication round {round_number}: {len(pending)} peer(s), "
+                f"starting at {root.peer.hostname}"
+            )
+            client = self._client(root.peer)
+
+            def on_replicated(replicas: list[str], sent: int, head=root.peer) -> None:
+                for device_id in (head.device_id, *replicas):
+                    peer = by_id.get(device_id)
+                    if peer is None or total_bytes <= 0:
+                        continue
+                    done[device_id] = done.get(device_id, 0) + sent
+                    report(peer, min(done[device_id] / total_bytes, 1.0))
+
+            client.replica_callback = on_replicated
+            try:
+                await client.send_images(
+                    images,
+                    relay=[self._relay_spec(child) for child in root.children],
+                )
+            except (
+                peer_transfer_client.TransferError,
+                peer_transfer_client.AuthenticationError,
+            ) as e:
+                log.warning(f"Replication round {round_number} failed: {e}")
+                # Nothing got past the first peer, so move it back
+                failures[root.peer.device_id] = failures.get(root.peer.device_id, 0) + 1
+
+            # Ask every peer what it has rather than trusting the relay
+            await self._refresh_tokens(pending)
+            results = await asyncio.gather(
+                *(self._is_complete(peer, images) for peer in pending)
+            )
+            still_pending = []
+            for peer, ok in zip(pending, results):
+                if ok:
+                    complete[peer.device_id] = True
+                    report(peer, 1.0)
+                else:
+                    failures[peer.device_id] = failures.get(peer.device_id, 0) + 1
+                    still_pending.append(peer)
+            pending = still_pending
+
+        for peer in pending:
+            log.error(f"Replication to {peer.hostname} incomplete")
+        return complete
@@ -50,16 +50,21 @@ class DiscoveryService:
         self._discovered_peers: dict[str, PeerDevice] = {}
         self._browser: ServiceBrowser | None = None
 
-    def start_publishing(self, pin_callback: Callable[[], str]) -> None:
+    def start_publishing(
+        self,
+        pin_callback: Callable[[], str],
+        properties: dict[str, str] | None = None,
+    ) -> None:
         """Publish this device as available for transfers.
 
         Args:
             pin_callback: Function to generate fresh PIN on demand
+            properties: Extra TXT records, e.g. free_bytes of the repo
 
         Publishes service with:
             - Service name: hostname
             - Service type: _rpi-cloner._tcp.local.
-            - TXT records: device_id, version, hostname
+            - TXT records: device_id, version, hostname, plus ``properties``
         """
         if self.zeroconf is not None:
             log.warning("Discovery already publishing")
@@ -80,6 +85,7 @@ class DiscoveryService:
             "version": "1.0",
             "hostname": hostname,
         }
+        txt_records.update(properties or {})
 
         self.service_info = ServiceInfo(
             SERVICE_TYPE,
@@ -99,6 +105,27 @@ class DiscoveryService:
             f"(device_id: {self.device_id})"
         )
 
+    def update_properties(self, properties: dict[str, str]) -> None:
+        """Update extra TXT records of the published service."""
+        if self.zeroconf is None or self.service_info is None:
+            return
+        txt_records = {
+            key.decode("utf-8") if isinstance(key, bytes) else str(key): (
+                value.decode("utf-8") if isinstance(value, bytes) else value
+            )
+            for key, value in self.service_info.properties.items()
+        }
+        txt_records.update(properties)
+        self.service_info = ServiceInfo(
+            SERVICE_TYPE,
+            self.service_info.name,
+            addresses=self.service_info.addresses,
+            port=self.service_info.port,
+            properties=txt_records,
+            server=self.service_info.server,
+        )
+        self.zeroconf.update_service(self.service_info)
+
     def stop_publishing(self) -> None:
         """Stop advertising this device."""
         if self.zeroconf and self.service_info:
@@ -175,6 +202,47 @@ class DiscoveryService:
         log.info(f"Discovery complete. Found {len(peers)} peer(s)")
         return peers
 
+    def start_browsing(
+        self,
+        on_added: Callable[[str, PeerDevice], None],
+        on_removed: Callable[[str], None],
+    ) -> None:
+        """Watch for peers in the background until stop_browsing().
+
+        ``on_added`` gets the service name and peer whenever a peer appears
+        or changes its TXT records; ``on_removed`` gets the service name of
+        a peer that went away. Both are called on Zeroconf's thread.
+        """
+        if self._browser is not None:
+            log.warning("Discovery already browsing")
+            return
+        if self.zeroconf is None:
+            self.zeroconf = Zeroconf()
+
+        def on_service_state_change(
+            zeroconf: Zeroconf,
+            service_type: str,
+            name: str,
+            state_change: ServiceStateChange,
+        ) -> None:
+            if state_change in (ServiceStateChange.Added, ServiceStateChange.Updated):
+                info = zeroconf.get_service_info(service_type, name)
+                peer = self._parse_service_info(info) if info else None
+                if peer and peer.device_id != self.device_id:
+                    on_added(name, peer)
+            elif state_change == ServiceStateChange.Removed:
+                on_removed(name)
+
+        self._browser = ServiceBrowser(
+            self.zeroconf, SERVICE_TYPE, handlers=[on_service_state_change]
+        )
+
+    def stop_browsing(self) -> None:
+        """Stop watching for peers."""
+        if self._browser:
+            self._browser.cancel()
+            self._browser = None
+
     def shutdown(self) -> None:
         """Clean up all resources."""
         self.stop_publishing()
@@ -58,7 +58,8 @@ Implementation Notes:
     - Delegates device detection to storage.devices and storage.mount
     - Does not cache results; queries devices on each call
     - Thread-safe if underlying device queries are thread-safe
-    - Performance: Each call executes lsblk command
+    - Performance: Device data comes from the hotplug device table when the
+      monitor runs, otherwise from lsblk (1-second cache)
 
 See Also:
     - rpi_usb_cloner.storage.devices: Low-level device detection
@@ -74,7 +75,7 @@ from rpi_usb_cloner.domain import Drive
 from rpi_usb_cloner.logging import get_logger
 from rpi_usb_cloner.storage import devices as storage_devices
 from rpi_usb_cloner.storage.devices import format_device_label, list_usb_disks
-from rpi_usb_cloner.storage.image_repo import find_image_repos
+from rpi_usb_cloner.storage.repo_catalog import list_image_repos
 
 
 log = get_logger(source=__name__)
@@ -250,7 +251,7 @@ def _get_repo_device_names() -> set[str]:
 
     # Scan for repo devices (expensive operation)
     log.debug("Scanning for repo devices...")
-    repos = find_image_repos()
+    repos = list_image_repos()
     log.debug(f"Found {len(repos)} repo path(s): {repos}")
 
     if not repos:
@@ -0,0 +1,153 @@
+"""Peer link benchmark: find out what holds a slow transfer back.
+
+A peer transfer can be limited by the network link, by the upload path
+(block hashing, the writer thread, Python itself) or by the receiving
+drive. The transfer server has authenticated benchmark endpoints that sink
+or source data without touching disk, and one that times a write to the
+drive of its destination repo. ``TransferClient.benchmark_link`` runs them
+one after the other and returns a ``LinkBenchmark`` that gives each speed
+separately:
+
+- raw link: bytes sent to and from memory on both ends
+- upload path: the same bytes hashed block by block on both ends and
+  passed through the server's writer thread, as a real upload would be,
+  but dropped instead of written
+- disk write: a test file written and synced to the destination repo
+
+Each test stops after ``BENCH_SECONDS`` or ``BENCH_BYTES``, whichever comes
+first, so a full run takes well under a minute even on a slow link.
+
+The latest result is kept here for the OLED and the web UI.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from rpi_usb_cloner.logging import get_logger
+
+
+log = get_logger(source=__name__)
+
+# Each test sends at most this much, and stops early after BENCH_SECONDS
+BENCH_BYTES = 256 * 1024 * 1024
+BENCH_SECONDS = 5.0
+# The server never sends, receives or writes more than this per test
+MAX_BENCH_BYTES = 1024 * 1024 * 1024
+BENCH_CHUNK_BYTES = 1024 * 1024
+DISK_BENCH_FILENAME = ".rpi-usb-cloner-bench"
+# An upload path this much slower than the raw upload is the bottleneck
+PATH_LOSS_RATIO = 0.8
+
+
+@dataclass(frozen=True)
+class LinkBenchmark:
+    """Speeds measured against one peer, in bytes per second."""
+
+    peer: str
+    rtt_seconds: float
+    download_bytes_per_second: float
+    upload_bytes_per_second: float
+    upload_path_bytes_per_second: float
+    disk_write_bytes_per_second: float
+    finished_at: float
+
+    @property
+    def bottleneck(self) -> str:
+        """What limits transfers to the peer: "link", "upload path" or "disk"."""
+        if self.disk_write_bytes_per_second < self.upload_path_bytes_per_second:
+            return "disk"
+        if (
+            self.upload_path_bytes_per_second
+            < PATH_LOSS_RATIO * self.upload_bytes_per_second
+        ):
+            return "upload path"
+        return "link"
+
+    def as_dict(self) -> dict[str, object]:
+        return {**asdict(self), "bottleneck": self.bottleneck}
+
+
+class HashingSink:
+    """Hash a stream block by block like a partial file writer, then drop it."""
+
+    def __init__(self, block_bytes: int) -> None:
+        self.block_bytes = block_bytes
+        self.received = 0
+        self.blocks = 0
+        self._hash = hashlib.sha256()
+        self._in_block = 0
+
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            piece = view[: self.block_bytes - self._in_block]
+            self._hash.update(piece)
+            self._in_block += len(piece)
+            self.received += len(piece)
+            view = view[len(piece) :]
+            if self._in_block == self.block_bytes:
+                # Finish the digest as the block journal would
+                self._hash.hexdigest()
+                self.blocks += 1
+                self._hash = hashlib.sha256()
+                self._in_block = 0
+
+    def close(self) -> None:
+        pass
+
+
+def write_test_file(
+    directory: Path,
+    max_bytes: int,
+    max_seconds: float = BENCH_SECONDS,
+) -> tuple[int, float]:
+    """Time writing and syncing a test file in ``directory``, then delete it.
+
+    Returns:
+        Bytes written and the seconds taken, including the final sync
+    """
+    chunk = os.urandom(BENCH_CHUNK_BYTES)
+    path = directory / DISK_BENCH_FILENAME
+    written = 0
+    started = time.monotonic()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while written < max_bytes and time.monotonic() - started < max_seconds:
+            written += os.write(fd, chunk[: max_bytes - written])
+        os.fsync(fd)
+        elapsed = time.monotonic() - started
+    finally:
+        os.close(fd)
+        path.unlink(missing_ok=True)
+    return written, elapsed
+
+
+_last_result: LinkBenchmark | None = None
+_last_result_lock = threading.Lock()
+
+
+def record_result(result: LinkBenchmark) -> None:
+    """Keep ``result`` as the latest benchmark."""
+    global _last_result
+    with _last_result_lock:
+        _last_result = result
+    log.info(
+        f"Link benchmark with {result.peer}: "
+        f"link {result.upload_bytes_per_second / 1e6:.1f} MB/s up, "
+        f"{result.download_bytes_per_second / 1e6:.1f} MB/s down; "
+        f"upload path {result.upload_path_bytes_per_second / 1e6:.1f} MB/s; "
+        f"disk {result.disk_write_bytes_per_second / 1e6:.1f} MB/s "
+        f"(limited by {result.bottleneck})"
+    )
+
+
+def get_last_result() -> LinkBenchmark | None:
+    """Return the latest benchmark, or None if none has run."""
+    with _last_result_lock:
+        return _last_result
@@ -0,0 +1,325 @@
+"""Live table of peers on the network, with measured link speeds.
+
+``DiscoveryService.browse_peers()`` scans for a few seconds on every call
+and forgets everything afterwards. The registry instead keeps one Zeroconf
+browser running in the background and updates its table from the add,
+update and remove events, so the current peers are always at hand.
+
+Each entry records when the peer was last seen, what it advertises in its
+TXT records (such as ``free_bytes``), and the result of a short probe
+against the peer's transfer server (see ``TransferClient.probe_link``):
+round trip time, throughput, free space and uploads in progress. A probe
+thread probes new peers right away and refreshes every entry every minute,
+so callers can route a transfer to the fastest or least loaded peer without
+waiting.
+
+Like the hotplug device table, every change bumps a generation counter and
+notifies subscribers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable
+
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.services import peer_transfer_client
+from rpi_usb_cloner.services.discovery import DiscoveryService, PeerDevice
+
+
+log = get_logger(source=__name__)
+
+PROBE_INTERVAL_SECONDS = 60.0
+PROBE_TIMEOUT_SECONDS = 10
+# Peers that failed a probe are tried again sooner
+RETRY_PROBE_SECONDS = 15.0
+
+
+@dataclass(frozen=True)
+class PeerEntry:
+    """What is known about one peer."""
+
+    peer: PeerDevice
+    last_seen: float
+    rtt_seconds: float | None = None
+    bytes_per_second: float | None = None
+    free_bytes: int | None = None
+    active_uploads: int = 0
+    probed_at: float | None = None
+    probe_failed: bool = False
+
+    @property
+    def advertised_free_bytes(self) -> int | None:
+        """Free space from the peer's TXT records, if it advertises it."""
+        try:
+            return int(self.peer.txt_records["free_bytes"])
+        except (KeyError, ValueError):
+            return None
+
+    @property
+    def known_free_bytes(self) -> int | None:
+        """Free space from the latest probe, else as advertised."""
+        if self.free_bytes is not None:
+            return self.free_bytes
+        return self.advertised_free_bytes
+
+
+Prober = Callable[[PeerDevice], peer_transfer_client.LinkProbe]
+
+
+def probe_peer(peer: PeerDevice) -> peer_transfer_client.LinkProbe:
+    """Probe a peer's link from a worker thread.
+
+    Raises:
+        TransferError: The peer could not be reached
+    """
+    client = peer_transfer_client.TransferClient(peer, PROBE_TIMEOUT_SECONDS)
+    return asyncio.run(client.probe_link())
+
+
+def _rank(entry: PeerEntry) -> tuple:
+    # Idle peers first, then the fastest; unprobed peers after probed ones
+    return (
+        entry.active_uploads,
+        entry.bytes_per_second is None,
+        -(entry.bytes_per_second or 0.0),
+        entry.peer.hostname,
+    )
+
+
+class PeerRegistry:
+    """Peers currently on the network, kept current in the background."""
+
+    def __init__(
+        self,
+        discovery: DiscoveryService | None = None,
+        *,
+        prober: Prober | None = None,
+        probe_interval: float = PROBE_INTERVAL_SECONDS,
+    ) -> None:
+        self.discovery = discovery or DiscoveryService()
+        self.probe_interval = probe_interval
+        self._prober = prober or probe_peer
+        # Service name -> entry
+        self._entries: dict[str, PeerEntry] = {}
+        self._generation = 0
+        self._changed = threading.Condition()
+        self._subscribers: list[Callable[[int], None]] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def start(self) -> None:
+        """Start browsing and probing."""
+        self._stop.clear()
+        self.discovery.start_browsing(self._on_added, self._on_removed)
+        self._thread = threading.Thread(
+            target=self._run, name="peer-prober", daemon=True
+        )
+        self._thread.start()
+        log.info("Peer registry started")
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        self.discovery.stop_browsing()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def peers(self) -> list[PeerEntry]:
+        """Current peers, idle and fast ones first."""
+        with self._changed:
+            entries = list(self._entries.values())
+        return sorted(entries, key=_rank)
+
+    def get(self, device_id: str) -> PeerEntry | None:
+        with self._changed:
+            for entry in self._entries.values():
+                if entry.peer.device_id == device_id:
+                    return entry
+        return None
+
+    def pick(self, min_free_bytes: int = 0) -> PeerEntry | None:
+        """The best peer to send to: idle, fast and with enough free space.
+
+        Peers whose free space is unknown are only picked if no peer is
+        known to have enough.
+        """
+        candidates = [
+            entry
+            for entry in self.peers()
+            if not entry.probe_failed
+            and (entry.known_free_bytes or 0) >= min_free_bytes
+        ]
+        if not candidates and min_free_bytes > 0:
+            candidates = [
+                entry
+                for entry in self.peers()
+                if not entry.probe_failed and entry.known_free_bytes is None
+            ]
+        return candidates[0] if candidates else None
+
+    def probe_now(self) -> None:
+        """Re-probe every peer without waiting for the interval."""
+        with self._changed:
+            self._entries = {
+                name: replace(entry, probed_at=None)
+                for name, entry in self._entries.items()
+            }
+        self._wake.set()
+
+    def subscribe(self, callback: Callable[[int], None]) -> Callable[[], None]:
+        """Call ``callback(generation)`` after each change.
+
+        Callbacks run on Zeroconf's or the probe thread and must not block.
+
+        Returns:
+            A function that removes the subscription
+        """
+        with self._changed:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._changed, contextlib.suppress(ValueError):
+                self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def wait_for_change(self, generation: int, timeout: float | None = None) -> int:
+        """Block until the generation differs from ``generation``.
+
+        Returns:
+            The current generation (unchanged if the timeout expired)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._generation != generation, timeout)
+            return self._generation
+
+    def _update(self, change: Callable[[dict[str, PeerEntry]], bool]) -> None:
+        with self._changed:
+            if not change(self._entries):
+                return
+            self._generation += 1
+            generation = self._generation
+            subscribers = list(self._subscribers)
+            self._changed.notify_all()
+        for callback in subscribers:
+            try:
+                callback(generation)
+            except Exception as error:
+                log.warning(f"Peer registry subscriber failed: {error}")
+
+    def _on_added(self, name: str, peer: PeerDevice) -> None:
+        def change(entries: dict[str, PeerEntry]) -> bool:
+            entry = entries.get(name)
+            if entry is None or entry.peer.device_id != peer.device_id:
+                # New peer, or the peer restarted: probe it from scratch
+                entries[name] = PeerEntry(peer=peer, last_seen=time.time())
+                log.info(f"Peer registry: {peer.hostname} at {peer.address}")
+            else:
+                entries[name] = replace(entry, peer=peer, last_seen=time.time())
+            return True
+
+        self._update(change)
+        self._wake.set()
+
+    def _on_removed(self, name: str) -> None:
+        def change(entries: dict[str, PeerEntry]) -> bool:
+            entry = entries.pop(name, None)
+            if entry is not None:
+                log.info(f"Peer registry: {entry.peer.hostname} left")
+            return entry is not None
+
+        self._update(change)
+
+    def _due(self, now: float) -> list[tuple[str, PeerEntry]]:
+        with self._changed:
+            entries = list(self._entries.items())
+        due = []
+        for name, entry in entries:
+            interval = (
+                RETRY_PROBE_SECONDS if entry.probe_failed else self.probe_interval
+            )
+            if entry.probed_at is None or now - entry.probed_at >= interval:
+                due.append((name, entry))
+        return due
+
+    def _probe(self, name: str, entry: PeerEntry) -> None:
+        try:
+            probe = self._prober(entry.peer)
+        except peer_transfer_client.TransferError as error:
+            log.debug(f"Probe of {entry.peer.hostname} failed: {error}")
+            result = {"probed_at": time.time(), "probe_failed": True}
+        else:
+            log.debug(
+                f"Probed {entry.peer.hostname}: "
+                f"{probe.bytes_per_second / 1e6:.1f} MB/s, "
+                f"{probe.rtt_seconds * 1000:.1f} ms"
+            )
+            result = {
+                "probed_at": time.time(),
+                "probe_failed": False,
+                "rtt_seconds": probe.rtt_seconds,
+                "bytes_per_second": probe.bytes_per_second,
+                "free_bytes": probe.free_bytes,
+                "active_uploads": probe.active_uploads,
+            }
+
+        def change(entries: dict[str, PeerEntry]) -> bool:
+            current = entries.get(name)
+            # Skip results for a peer that left or restarted meanwhile
+            if current is None or current.peer.device_id != entry.peer.device_id:
+                return False
+            entries[name] = replace(current, **result)
+            return True
+
+        self._update(change)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for name, entry in self._due(time.time()):
+                if self._stop.is_set():
+                    return
+                self._probe(name, entry)
+            self._wake.wait(min(self.probe_interval, RETRY_PROBE_SECONDS))
+            self._wake.clear()
+
+
+_registry: PeerRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def start_peer_registry() -> PeerRegistry:
+    """Start the shared registry (once) and return it."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = PeerRegistry()
+            registry.start()
+            _registry = registry
+        return _registry
+
+
+def stop_peer_registry() -> None:
+    """Stop the shared registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            return
+        _registry.stop()
+        _registry.discovery.shutdown()
+        _registry = None
+
+
+def get_peer_registry() -> PeerRegistry | None:
+    """Return the shared registry, or None when it is not running."""
+    return _registry
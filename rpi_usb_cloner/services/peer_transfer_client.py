@@ -1,22 +1,68 @@
 """HTTP client for sending image transfers to peer devices.
 
-Provides authentication and file upload capabilities.
+Provides authentication and file upload capabilities. Files are sent
+resumably: the client asks the peer which blocks it already holds, sends the
+rest and has the peer verify the whole-file digest (see
+services.resumable_transfer). An interrupted file is resumed automatically a
+few times before the image is reported as failed.
+
+Uploads use several HTTP streams at once: the files of a Clonezilla image
+are sent concurrently, and large files are split into byte ranges that are
+sent in parallel. Blocks are read and hashed on worker threads, with the
+next block read while the current one is on the wire, so the event loop only
+moves data between the disk reads and the sockets.
+
+If the peer accepts a compression codec, each range of a file that is not
+compressed already is sampled and compressed at the level that suits the
+measured link speed (see services.wire_compression).
+
+Every file is announced at ``POST /transfer`` with the digests of its
+blocks, taken from the sending repo's block index (see
+storage.block_index). Files the peer already holds are skipped, and blocks
+the peer finds elsewhere in its own repo are left out of the upload.
+
+``benchmark_link()`` measures raw link, upload path and disk write speed
+separately against the peer's benchmark endpoints (see
+services.link_benchmark).
 """
 
 from __future__ import annotations
 
-from typing import Callable
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable
 
 import aiohttp
 
 from rpi_usb_cloner.domain import DiskImage, ImageType
 from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.services import (
+    link_benchmark,
+    resumable_transfer,
+    wire_compression,
+)
 from rpi_usb_cloner.services.discovery import PeerDevice
-from rpi_usb_cloner.storage import image_repo
+from rpi_usb_cloner.storage import image_repo, transfer_scheduler
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
 
 
 log = get_logger(source=__name__)
 
+UPLOAD_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 2.0
+# Concurrent upload streams per image
+UPLOAD_STREAMS = 4
+# Files are only split into ranges of at least this size
+MIN_RANGE_BYTES = 64 * 1024 * 1024
+
+# Link probes: status requests timed for the round trip, then a download
+PROBE_PINGS = 3
+PROBE_BYTES = 2 * 1024 * 1024
+
 
 class AuthenticationError(Exception):
     """Raised when authentication fails."""
@@ -26,20 +72,221 @@ class TransferError(Exception):
     """Raised when transfer fails."""
 
 
+class _UploadInterruptedError(Exception):
+    """The peer has only part of a file; the upload can be resumed."""
+
+
+@dataclass
+class LinkProbe:
+    """Result of probing a peer's link and status."""
+
+    rtt_seconds: float
+    bytes_per_second: float
+    free_bytes: int | None
+    active_uploads: int
+
+
+def _image_files(image: DiskImage) -> list[tuple[Path, str]]:
+    """Files of an image with their names on the receiver.
+
+    A single-file image has the name ``""``; files of a directory image are
+    named by their path within it.
+    """
+    if image.image_type != ImageType.CLONEZILLA_DIR:
+        return [(image.path, "")]
+    files = []
+    for file_path in sorted(image.path.rglob("*")):
+        if file_path.name.endswith(
+            (resumable_transfer.PART_SUFFIX, resumable_transfer.JOURNAL_SUFFIX)
+        ):
+            continue
+        if file_path.is_file():
+            # Relative path keeps the file hierarchy on the receiver
+            files.append((file_path, file_path.relative_to(image.path).as_posix()))
+    return files
+
+
+def _file_manifest(image: DiskImage) -> list[dict[str, Any]]:
+    """Block digests of every file of an image, for dedup on the receiver.
+
+    Digests come from the repo's block index, so only files that changed
+    since they were last sent are read.
+    """
+    index = image_repo.get_image_block_index(image)
+    block_bytes = resumable_transfer.BLOCK_BYTES
+    manifest = []
+    try:
+        for path, name in _image_files(image):
+            blocks = index.file_blocks(path, block_bytes)
+            manifest.append(
+                {
+                    "file": name,
+                    "size": path.stat().st_size,
+                    "source": resumable_transfer.source_id(path),
+                    "block_bytes": block_bytes,
+                    "digest": resumable_transfer.digest_of_blocks(blocks),
+                    "blocks": blocks,
+                }
+            )
+    finally:
+        index.save()
+    return manifest
+
+
+def _pread(path: Path, offset: int, length: int) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, length, offset)
+    finally:
+        os.close(fd)
+
+
+def _read_block(
+    path: Path,
+    offset: int,
+    length: int,
+    encoder: Any = None,
+    pace: Callable[[int], None] | None = None,
+) -> tuple[bytes, str, bytes]:
+    """Read a block; return it, its digest and the bytes to put on the wire.
+
+    ``pace`` is called with the block's length and may block to slow the
+    upload down (see storage.transfer_scheduler).
+    """
+    data = _pread(path, offset, length)
+    if pace is not None and data:
+        pace(len(data))
+    payload = encoder.compress(data) if encoder is not None else data
+    return data, hashlib.sha256(data).hexdigest(), payload
+
+
+async def _iter_blocks(
+    path: Path,
+    first_block: int,
+    end_block: int,
+    block_bytes: int,
+    digests: dict[int, str],
+    on_block: Callable[[int, int], None],
+    encoder: Any = None,
+    meter: wire_compression.LinkMeter | None = None,
+    pace: Callable[[int], None] | None = None,
+):
+    """Stream blocks ``first_block`` up to ``end_block`` of ``path``.
+
+    Each block's digest is recorded in ``digests``. The next block is read
+    (and compressed with ``encoder``, if given, and paced with ``pace``) on
+    a worker thread while the current one is being sent. ``meter`` counts
+    the bytes put on the wire.
+    """
+    loop = asyncio.get_running_loop()
+
+    def read(index: int):
+        return loop.run_in_executor(
+            None, _read_block, path, index * block_bytes, block_bytes, encoder, pace
+        )
+
+    def sent(payload: bytes) -> bytes:
+        if meter is not None:
+            meter.add(len(payload))
+        return payload
+
+    # Each read is only started once the previous one finished, so the
+    # encoder is never used from two threads at once
+    pending = read(first_block) if first_block < end_block else None
+    for index in range(first_block, end_block):
+        block, digest, payload = await pending
+        pending = read(index + 1) if index + 1 < end_block else None
+        if not block:
+            break
+        digests[index] = digest
+        if payload:
+            yield sent(payload)
+        on_block(index, len(block))
+    if encoder is not None:
+        tail = encoder.flush()
+        if tail:
+            yield sent(tail)
+
+
+def _plan_ranges(
+    missing: list[int], streams: int, min_blocks: int
+) -> list[tuple[int, int]]:
+    """Group missing block indexes into ``(first, end)`` ranges to send.
+
+    The blocks are spread over about ``streams`` ranges of at least
+    ``min_blocks`` blocks each, so small files still go as one request.
+    """
+    span = max(min_blocks, -(-len(missing) // streams), 1)
+    ranges: list[tuple[int, int]] = []
+    for index in missing:
+        if ranges and ranges[-1][1] == index and index - ranges[-1][0] < span:
+            ranges[-1] = (ranges[-1][0], index + 1)
+        else:
+            ranges.append((index, index + 1))
+    return ranges
+
+
+async def _bench_reply(resp: aiohttp.ClientResponse) -> dict:
+    """JSON reply of a benchmark endpoint; raises TransferError on failure."""
+    if resp.status != 200:
+        try:
+            error = (await resp.json()).get("error", "Unknown error")
+        except (aiohttp.ContentTypeError, ValueError):
+            error = f"status {resp.status}"
+        raise TransferError(f"Benchmark failed: {error}")
+    return await resp.json()
+
+
+def _bench_speed(reply: dict) -> float:
+    """Bytes per second from a benchmark endpoint's {"bytes", "seconds"}."""
+    return int(reply["bytes"]) / max(float(reply["seconds"]), 1e-6)
+
+
+async def _run_all(coros: Iterable[Awaitable[None]]) -> None:
+    """Run coroutines concurrently; on the first failure cancel the rest."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 class TransferClient:
     """HTTP client for sending images to peer devices."""
 
-    def __init__(self, peer: PeerDevice, timeout_seconds: int = 300):
+    def __init__(
+        self,
+        peer: PeerDevice,
+        timeout_seconds: int = 300,
+        streams: int | None = None,
+        priority: Priority = Priority.TRANSFER,
+    ):
         """Initialize transfer client.
 
         Args:
             peer: Peer device to connect to
             timeout_seconds: HTTP request timeout
+            streams: Concurrent upload streams per image (default UPLOAD_STREAMS)
+            priority: Scheduler priority of uploads (see
+                storage.transfer_scheduler)
         """
         self.peer = peer
         self.base_url = f"http://{peer.address}:{peer.port}"
         self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
         self.session_token: str | None = None
+        self.streams = max(1, streams or UPLOAD_STREAMS)
+        self.priority = priority
+        # Scheduler pacing of the running send_images() call
+        self._pace: Callable[[int], None] | None = None
+        # Wire compression codec accepted by the peer for the current transfer
+        self.codec: str | None = None
+        self._link_meter = wire_compression.LinkMeter()
+        # Optional callback(replicas, bytes) for each range the peer stored,
+        # with the hops it was relayed to (see services.chain_replication)
+        self.replica_callback: Callable[[list[str], int], None] | None = None
 
     async def authenticate(self, pin: str) -> str:
         """Authenticate with 4-digit PIN.
@@ -87,12 +334,15 @@ class TransferClient:
         self,
         images: list[DiskImage],
         progress_callback: Callable[[str, float], None] | None = None,
+        relay: list[dict] | None = None,
     ) -> tuple[int, int]:
         """Send images to peer device.
 
         Args:
             images: List of DiskImage objects to send
             progress_callback: Optional callback(image_name, progress_ratio)
+            relay: Optional hops the peer forwards the images to (see
+                services.chain_replication)
 
         Returns:
             (success_count, failure_count)
@@ -104,68 +354,177 @@ class TransferClient:
         if not self.session_token:
             raise AuthenticationError("Not authenticated. Call authenticate() first.")
 
-        # Build images metadata for transfer init
-        images_meta = []
-        for img in images:
-            size_bytes = image_repo.get_image_size_bytes(img) or 0
-            images_meta.append(
-                {
-                    "name": img.name,
-                    "type": img.image_type.name.lower(),
-                    "size_bytes": size_bytes,
-                }
-            )
-
-        # Initialize transfer
         headers = {"Authorization": f"Bearer {self.session_token}"}
+        images_meta = await self._images_meta(images)
+
+        job = transfer_scheduler.job(
+            f"send to {self.peer.hostname}",
+            self.priority,
+            paths=[img.path for img in images],
+            links=[self.peer.hostname],
+        )
+        with job as scheduled:
+            self._pace = scheduled.consume
+            try:
+                return await self._send_images(
+                    images, headers, images_meta, progress_callback, relay
+                )
+            finally:
+                self._pace = None
 
+    async def _send_images(
+        self,
+        images: list[DiskImage],
+        headers: dict,
+        images_meta: list[dict[str, Any]],
+        progress_callback: Callable[[str, float], None] | None,
+        relay: list[dict] | None,
+    ) -> tuple[int, int]:
         async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            data = await self._init_transfer(session, headers, images_meta, relay)
+            # Peers without compression support leave this out
+            self.codec = wire_compression.negotiate([data.get("compression") or ""])
+            self._link_meter = wire_compression.LinkMeter()
+            # Files the peer already holds, by image (older peers leave this out)
+            present = data.get("present") or {}
+            log.info(
+                f"Transfer initialized: {data['transfer_id']} "
+                f"(compression: {self.codec or 'none'})"
+            )
+            if data.get("relay_failed"):
+                log.warning(f"Peer could not relay to: {data['relay_failed']}")
+            # Tells the peer which transfer, and so which relay, uploads are for
+            transfer_id = data["transfer_id"]
+            headers = dict(headers, **{"X-Transfer-Id": transfer_id})
+
+            # Upload each image
+            success_count = 0
+            failure_count = 0
+
             try:
-                # POST /transfer to initialize
-                async with session.post(
-                    f"{self.base_url}/transfer",
-                    json={"images": images_meta},
-                    headers=headers,
-                ) as resp:
-                    if resp.status == 507:
-                        data = await resp.json()
-                        raise TransferError(
-                            f"Insufficient space on destination: "
-                            f"need {data.get('required', 0)}, "
-                            f"have {data.get('available', 0)} bytes"
+                for img in images:
+                    try:
+                        await self._upload_single_image(
+                            session,
+                            img,
+                            headers,
+                            progress_callback,
+                            set(present.get(img.name) or ()),
                         )
+                        success_count += 1
+                        log.info(f"Successfully sent image: {img.name}")
 
-                    if resp.status != 200:
-                        error_data = await resp.json()
-                        raise TransferError(
-                            f"Transfer init failed: {error_data.get('error', 'Unknown error')}"
-                        )
+                    except Exception as e:
+                        failure_count += 1
+                        log.error(f"Failed to send image {img.name}: {e}")
+            finally:
+                if relay:
+                    await self._end_transfer(session, headers, transfer_id)
 
-                    data = await resp.json()
-                    transfer_id = data["transfer_id"]
-                    log.info(f"Transfer initialized: {transfer_id}")
+            return success_count, failure_count
 
-            except aiohttp.ClientError as e:
-                log.error(f"Network error during transfer init: {e}")
-                raise TransferError(f"Network error: {e}") from e
+    async def _end_transfer(
+        self, session: aiohttp.ClientSession, headers: dict, transfer_id: str
+    ) -> None:
+        """DELETE /transfer/{id}, so the peer stops relaying it."""
+        try:
+            async with session.delete(
+                f"{self.base_url}/transfer/{transfer_id}", headers=headers
+            ) as resp:
+                if resp.status != 200:
+                    log.debug(f"Peer did not end transfer {transfer_id}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # The peer drops the relay itself once it has been idle a while
+            log.debug(f"Unable to end transfer {transfer_id}: {e}")
+
+    async def missing_files(self, images: list[DiskImage]) -> dict[str, list[str]]:
+        """Ask the peer which files of the images it does not hold yet.
 
-            # Upload each image
-            success_count = 0
-            failure_count = 0
+        Returns:
+            Names of the missing files by image ("" for a single-file image);
+            images the peer holds completely are left out
+
+        Raises:
+            AuthenticationError: Not authenticated
+            TransferError: The peer could not be asked
+        """
+        if not self.session_token:
+            raise AuthenticationError("Not authenticated. Call authenticate() first.")
+
+        headers = {"Authorization": f"Bearer {self.session_token}"}
+        images_meta = await self._images_meta(images)
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            data = await self._init_transfer(session, headers, images_meta)
+        present = data.get("present") or {}
+        missing = {}
+        for meta in images_meta:
+            held = set(present.get(meta["name"]) or ())
+            names = [entry["file"] for entry in meta.get("files") or [{"file": ""}]]
+            names = [name for name in names if name not in held]
+            if names:
+                missing[meta["name"]] = names
+        return missing
+
+    async def _images_meta(self, images: list[DiskImage]) -> list[dict[str, Any]]:
+        """Describe images for transfer init, with the digests of their files."""
+        loop = asyncio.get_running_loop()
+        images_meta = []
+        for img in images:
+            size_bytes = image_repo.get_image_size_bytes(img) or 0
+            meta: dict[str, Any] = {
+                "name": img.name,
+                "type": img.image_type.name.lower(),
+                "size_bytes": size_bytes,
+            }
+            try:
+                meta["files"] = await loop.run_in_executor(None, _file_manifest, img)
+            except OSError as e:
+                # The peer then simply receives every file
+                log.warning(f"Unable to hash {img.name} for dedup: {e}")
+            images_meta.append(meta)
+        return images_meta
+
+    async def _init_transfer(
+        self,
+        session: aiohttp.ClientSession,
+        headers: dict,
+        images_meta: list[dict[str, Any]],
+        relay: list[dict] | None = None,
+    ) -> dict[str, Any]:
+        """POST /transfer; returns the peer's reply.
 
-            for img in images:
-                try:
-                    await self._upload_single_image(
-                        session, img, headers, progress_callback
+        Raises:
+            TransferError: The peer refused the transfer or was unreachable
+        """
+        body: dict[str, Any] = {
+            "images": images_meta,
+            "compression": list(wire_compression.CODECS),
+        }
+        if relay:
+            body["relay"] = relay
+        try:
+            async with session.post(
+                f"{self.base_url}/transfer", json=body, headers=headers
+            ) as resp:
+                if resp.status == 507:
+                    data = await resp.json()
+                    raise TransferError(
+                        f"Insufficient space on destination: "
+                        f"need {data.get('required', 0)}, "
+                        f"have {data.get('available', 0)} bytes"
                     )
-                    success_count += 1
-                    log.info(f"Successfully sent image: {img.name}")
 
-                except Exception as e:
-                    failure_count += 1
-                    log.error(f"Failed to send image {img.name}: {e}")
+                if resp.status != 200:
+                    error_data = await resp.json()
+                    raise TransferError(
+                        f"Transfer init failed: {error_data.get('error', 'Unknown error')}"
+                    )
 
-            return success_count, failure_count
+                return await resp.json()
+
+        except aiohttp.ClientError as e:
+            log.error(f"Network error during transfer init: {e}")
+            raise TransferError(f"Network error: {e}") from e
 
     async def _upload_single_image(
         self,
@@ -173,6 +532,7 @@ class TransferClient:
         image: DiskImage,
         headers: dict,
         progress_callback: Callable[[str, float], None] | None,
+        present: set[str] | None = None,
     ) -> None:
         """Upload a single image.
 
@@ -181,6 +541,7 @@ class TransferClient:
             image: DiskImage to upload
             headers: HTTP headers (including auth)
             progress_callback: Optional progress callback
+            present: Names of files of the image the peer already holds
         """
         if progress_callback:
             progress_callback(image.name, 0.0)
@@ -190,15 +551,21 @@ class TransferClient:
         upload_headers["X-Image-Type"] = image.image_type.name.lower()
 
         url = f"{self.base_url}/upload/{image.name}"
+        # Shared by all files of the image, so it never exceeds self.streams
+        slots = asyncio.Semaphore(self.streams)
+
+        present = present or set()
 
         # Choose upload method based on image type
         if image.image_type == ImageType.CLONEZILLA_DIR:
             await self._upload_directory(
-                session, url, image, upload_headers, progress_callback
+                session, url, image, upload_headers, progress_callback, slots, present
             )
+        elif "" in present:
+            log.info(f"Peer already has {image.name}, skipping")
         else:
             await self._upload_file(
-                session, url, image, upload_headers, progress_callback
+                session, url, image, upload_headers, progress_callback, slots
             )
 
         if progress_callback:
@@ -211,6 +578,7 @@ class TransferClient:
         image: DiskImage,
         headers: dict,
         progress_callback: Callable[[str, float], None] | None,
+        slots: asyncio.Semaphore,
     ) -> None:
         """Upload a single file (ISO or .BIN).
 
@@ -220,35 +588,17 @@ class TransferClient:
             image: DiskImage
             headers: HTTP headers
             progress_callback: Optional progress callback
+            slots: Upload streams available to this image
         """
         file_size = image.path.stat().st_size
 
-        async def file_sender():
-            """Generator for chunked file upload."""
-            bytes_sent = 0
-            chunk_size = 1024 * 1024  # 1MB chunks
-
-            with open(image.path, "rb") as f:
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
+        def on_progress(file_bytes: int) -> None:
+            if progress_callback and file_size > 0:
+                progress_callback(image.name, file_bytes / file_size)
 
-                    yield chunk
-                    bytes_sent += len(chunk)
-
-                    if progress_callback and file_size > 0:
-                        progress = bytes_sent / file_size
-                        progress_callback(image.name, progress)
-
-        headers["Content-Type"] = "application/octet-stream"
-
-        async with session.post(url, data=file_sender(), headers=headers) as resp:
-            if resp.status != 200:
-                error_data = await resp.json()
-                raise TransferError(
-                    f"Upload failed: {error_data.get('error', 'Unknown error')}"
-                )
+        await self._send_resumable(
+            session, url, image.path, "", headers, on_progress, slots
+        )
 
     async def _upload_directory(
         self,
@@ -257,8 +607,10 @@ class TransferClient:
         image: DiskImage,
         headers: dict,
         progress_callback: Callable[[str, float], None] | None,
+        slots: asyncio.Semaphore,
+        present: set[str] | None = None,
     ) -> None:
-        """Upload a Clonezilla directory using multipart/form-data.
+        """Upload a Clonezilla directory, several resumable files at a time.
 
         Args:
             session: aiohttp session
@@ -266,61 +618,266 @@ class TransferClient:
             image: DiskImage (directory)
             headers: HTTP headers
             progress_callback: Optional progress callback
+            slots: Upload streams available to this image
+            present: Files of the directory the peer already holds
         """
-        # Collect all files in directory
-        all_files = []
-        total_size = 0
-
-        for file_path in image.path.rglob("*"):
-            if file_path.is_file():
-                size = file_path.stat().st_size
-                all_files.append((file_path, size))
-                total_size += size
+        all_files = [
+            (file_path, rel_path, file_path.stat().st_size)
+            for file_path, rel_path in _image_files(image)
+        ]
+        total_size = sum(size for _file_path, _rel_path, size in all_files)
 
         if total_size == 0:
             raise TransferError(f"Directory {image.name} is empty")
 
-        # Create multipart form data
-        bytes_sent = 0
-
-        with aiohttp.MultipartWriter("form-data") as mpwriter:
-            for file_path, file_size in all_files:
-                # Calculate relative path for file hierarchy
-                rel_path = file_path.relative_to(image.path)
-
-                async def file_sender(path=file_path, size=file_size):
-                    """Generator for streaming file content."""
-                    nonlocal bytes_sent
-                    chunk_size = 1024 * 1024  # 1MB chunks
+        present = present or set()
+        # Files the peer already holds count as sent
+        file_bytes: dict[Path, int] = {
+            file_path: size
+            for file_path, rel_path, size in all_files
+            if rel_path in present
+        }
+        if file_bytes:
+            log.info(f"Peer already has {len(file_bytes)} file(s) of {image.name}")
+        files_in_flight = asyncio.Semaphore(self.streams)
+
+        async def send(file_path: Path, rel_path: str) -> None:
+            def on_progress(sent: int) -> None:
+                file_bytes[file_path] = sent
+                if progress_callback:
+                    progress_callback(image.name, sum(file_bytes.values()) / total_size)
+
+            async with files_in_flight:
+                await self._send_resumable(
+                    session, url, file_path, rel_path, headers, on_progress, slots
+                )
 
-                    with open(path, "rb") as f:
-                        while True:
-                            chunk = f.read(chunk_size)
-                            if not chunk:
-                                break
+        await _run_all(
+            send(file_path, rel_path)
+            for file_path, rel_path, _size in all_files
+            if rel_path not in present
+        )
 
-                            bytes_sent += len(chunk)
+    async def _send_resumable(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        path: Path,
+        file_name: str,
+        headers: dict,
+        on_progress: Callable[[int], None],
+        slots: asyncio.Semaphore,
+    ) -> None:
+        """Send one file, resuming after interruptions, and verify it.
 
-                            if progress_callback and total_size > 0:
-                                progress = bytes_sent / total_size
-                                progress_callback(image.name, progress)
+        ``on_progress`` gets the number of bytes of the file sent so far.
 
-                            yield chunk
+        Raises:
+            AuthenticationError: The session expired
+            TransferError: The file could not be sent or did not verify
+        """
+        counted: set[int] = set()
+        sent_bytes = 0
+
+        def on_block(index: int, length: int) -> None:
+            nonlocal sent_bytes
+            # A block sent again after an interruption is only counted once
+            if index not in counted:
+                counted.add(index)
+                sent_bytes += length
+                on_progress(sent_bytes)
+
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            try:
+                await self._send_file_once(
+                    session, url, path, file_name, headers, on_block, slots
+                )
+                return
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                ConnectionError,
+                _UploadInterruptedError,
+            ) as e:
+                if attempt == UPLOAD_ATTEMPTS:
+                    raise TransferError(f"Upload of {path.name} failed: {e}") from e
+                log.warning(
+                    f"Upload of {path.name} interrupted ({e}), resuming "
+                    f"(attempt {attempt + 1}/{UPLOAD_ATTEMPTS})"
+                )
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
 
-                # Add to multipart with streaming payload
-                part = mpwriter.append(file_sender())
-                part.set_content_disposition(
-                    "form-data", name="file", filename=str(rel_path)
+    async def _send_file_once(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        path: Path,
+        file_name: str,
+        headers: dict,
+        on_block: Callable[[int, int], None],
+        slots: asyncio.Semaphore,
+    ) -> None:
+        size = path.stat().st_size
+        params = {
+            "file": file_name,
+            "size": str(size),
+            "source": resumable_transfer.source_id(path),
+        }
+
+        # Ask what already arrived and check it against the local file
+        async with session.get(f"{url}/state", params=params, headers=headers) as resp:
+            if resp.status == 401:
+                raise AuthenticationError("Session expired, authenticate again")
+            if resp.status != 200:
+                raise TransferError(
+                    f"Peer does not accept resumable uploads (status {resp.status})"
                 )
+            state = await resp.json()
+        block_bytes = int(state["block_bytes"])
+        remote = {int(index): digest for index, digest in state["blocks"].items()}
+        loop = asyncio.get_running_loop()
+        local = await loop.run_in_executor(
+            None,
+            resumable_transfer.read_block_digests,
+            path,
+            sorted(remote),
+            block_bytes,
+        )
+        digests = {
+            index: digest
+            for index, digest in local.items()
+            if remote.get(index) == digest
+        }
+        for index in sorted(digests):
+            start = index * block_bytes
+            on_block(index, min(start + block_bytes, size) - start)
+
+        block_count = -(-size // block_bytes)
+        missing = [index for index in range(block_count) if index not in digests]
+        ranges = _plan_ranges(
+            missing, self.streams, max(1, MIN_RANGE_BYTES // block_bytes)
+        )
+        if ranges:
+            if digests:
+                log.info(
+                    f"Resuming {path.name}: {len(missing)}/{block_count} blocks left"
+                )
+            await _run_all(
+                self._send_range(
+                    session,
+                    url,
+                    path,
+                    params,
+                    headers,
+                    block_bytes,
+                    first_block,
+                    end_block,
+                    digests,
+                    on_block,
+                    slots,
+                )
+                for first_block, end_block in ranges
+            )
 
-        # Send multipart request
-        async with session.post(url, data=mpwriter, headers=headers) as resp:
+        commit = dict(
+            params,
+            digest=resumable_transfer.digest_of_blocks(
+                digests[index] for index in range(block_count)
+            ),
+        )
+        async with session.post(f"{url}/commit", json=commit, headers=headers) as resp:
+            if resp.status == 409:
+                raise _UploadInterruptedError("Peer has not received the whole file")
+            if resp.status == 422:
+                raise TransferError(f"Checksum mismatch for {path.name}")
             if resp.status != 200:
                 error_data = await resp.json()
                 raise TransferError(
-                    f"Upload failed: {error_data.get('error', 'Unknown error')}"
+                    f"Commit failed: {error_data.get('error', 'Unknown error')}"
                 )
 
+    async def _send_range(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        path: Path,
+        params: dict,
+        headers: dict,
+        block_bytes: int,
+        first_block: int,
+        end_block: int,
+        digests: dict[int, str],
+        on_block: Callable[[int, int], None],
+        slots: asyncio.Semaphore,
+    ) -> None:
+        """Send blocks ``first_block`` up to ``end_block`` as one request."""
+        size = int(params["size"])
+        upload_headers = dict(headers)
+        upload_headers.update(
+            {
+                "Content-Type": "application/octet-stream",
+                "X-Upload-File": params["file"],
+                "X-Upload-Size": params["size"],
+                "X-Upload-Source": params["source"],
+                "X-Upload-Offset": str(first_block * block_bytes),
+                "X-Upload-End": str(min(end_block * block_bytes, size)),
+            }
+        )
+        async with slots:
+            encoder = await self._range_encoder(path, first_block * block_bytes)
+            if encoder is not None:
+                upload_headers["X-Upload-Encoding"] = self.codec
+            sender = _iter_blocks(
+                path,
+                first_block,
+                end_block,
+                block_bytes,
+                digests,
+                on_block,
+                encoder,
+                self._link_meter,
+                self._pace,
+            )
+            async with session.post(url, data=sender, headers=upload_headers) as resp:
+                if resp.status == 409:
+                    raise _UploadInterruptedError("Peer lost its partial file")
+                if resp.status != 200:
+                    error_data = await resp.json()
+                    raise TransferError(
+                        f"Upload failed: {error_data.get('error', 'Unknown error')}"
+                    )
+                data = await resp.json()
+                if data.get("status") != "received":
+                    raise _UploadInterruptedError(
+                        f"Peer received {data.get('received_bytes')}/{size} bytes"
+                    )
+        if self.replica_callback:
+            self.replica_callback(
+                list(data.get("replicas") or []),
+                min(end_block * block_bytes, size) - first_block * block_bytes,
+            )
+
+    async def _range_encoder(self, path: Path, offset: int) -> Any:
+        """Compressor for the range of ``path`` at ``offset``, or None for raw."""
+        if self.codec is None or wire_compression.is_precompressed(path.name):
+            return None
+        loop = asyncio.get_running_loop()
+        sample = await loop.run_in_executor(
+            None, _pread, path, offset, wire_compression.SAMPLE_BYTES
+        )
+        level = await loop.run_in_executor(
+            None,
+            wire_compression.choose_level,
+            self.codec,
+            sample,
+            self._link_meter.bytes_per_second,
+            min(self.streams, os.cpu_count() or 1),
+        )
+        if level is None:
+            return None
+        log.debug(f"Compressing {path.name} from byte {offset} at level {level}")
+        return wire_compression.compressor(self.codec, level)
+
     async def check_status(self) -> dict:
         """Check server status.
 
@@ -337,3 +894,182 @@ class TransferClient:
             except aiohttp.ClientError as e:
                 log.error(f"Status check error: {e}")
                 return {"status": "unreachable", "error": str(e)}
+
+    async def probe_link(self, probe_bytes: int = PROBE_BYTES) -> LinkProbe:
+        """Measure round trip time and throughput to the peer.
+
+        The round trip is the fastest of a few status requests, which also
+        report the peer's free space and load. Throughput is timed on a
+        download from ``GET /probe``, which the peer serves from memory.
+
+        Raises:
+            TransferError: The peer could not be reached
+        """
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            try:
+                rtt = float("inf")
+                status: dict = {}
+                for _ in range(PROBE_PINGS):
+                    started = time.monotonic()
+                    async with session.get(f"{self.base_url}/status") as resp:
+                        status = await resp.json()
+                    rtt = min(rtt, time.monotonic() - started)
+
+                started = time.monotonic()
+                received = 0
+                async with session.get(
+                    f"{self.base_url}/probe", params={"bytes": str(probe_bytes)}
+                ) as resp:
+                    if resp.status != 200:
+                        raise TransferError(f"Probe failed with status {resp.status}")
+                    async for chunk in resp.content.iter_any():
+                        received += len(chunk)
+                # The first round trip carries no data
+                elapsed = max(time.monotonic() - started - rtt, 1e-6)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                raise TransferError(f"Probe of {self.peer.hostname} failed: {e}") from e
+
+        free_bytes = status.get("free_bytes")
+        return LinkProbe(
+            rtt_seconds=rtt,
+            bytes_per_second=received / elapsed,
+            free_bytes=int(free_bytes) if free_bytes is not None else None,
+            active_uploads=int(status.get("active_uploads") or 0),
+        )
+
+    async def benchmark_link(
+        self,
+        bench_bytes: int = link_benchmark.BENCH_BYTES,
+        seconds: float = link_benchmark.BENCH_SECONDS,
+        on_stage: Callable[[str], None] | None = None,
+    ) -> link_benchmark.LinkBenchmark:
+        """Measure link, upload path and disk write speed to the peer.
+
+        Each test moves at most ``bench_bytes`` and stops after ``seconds``.
+        Requires a session (see ``authenticate()``).
+
+        Args:
+            bench_bytes: Most bytes per test
+            seconds: Longest time per test
+            on_stage: Optional callback(stage) as each test starts:
+                "download", "upload", "upload path" or "disk"
+
+        Raises:
+            TransferError: A test failed or the peer could not be reached
+        """
+        if not self.session_token:
+            raise TransferError("Not authenticated")
+        headers = {"Authorization": f"Bearer {self.session_token}"}
+
+        def stage(name: str) -> None:
+            log.debug(f"Benchmarking {name} with {self.peer.hostname}")
+            if on_stage:
+                on_stage(name)
+
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            try:
+                rtt = float("inf")
+                for _ in range(PROBE_PINGS):
+                    started = time.monotonic()
+                    async with session.get(f"{self.base_url}/status") as resp:
+                        await resp.read()
+                    rtt = min(rtt, time.monotonic() - started)
+
+                stage("download")
+                download = await self._bench_download(
+                    session, headers, bench_bytes, seconds
+                )
+                stage("upload")
+                upload = await self._bench_upload(
+                    session, headers, "raw", bench_bytes, seconds
+                )
+                stage("upload path")
+                upload_path = await self._bench_upload(
+                    session, headers, "upload", bench_bytes, seconds
+                )
+                stage("disk")
+                async with session.post(
+                    f"{self.base_url}/bench/disk",
+                    params={"bytes": str(bench_bytes)},
+                    headers=headers,
+                ) as resp:
+                    disk = _bench_speed(await _bench_reply(resp))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                raise TransferError(
+                    f"Benchmark with {self.peer.hostname} failed: {e}"
+                ) from e
+
+        return link_benchmark.LinkBenchmark(
+            peer=self.peer.hostname,
+            rtt_seconds=rtt,
+            download_bytes_per_second=download,
+            upload_bytes_per_second=upload,
+            upload_path_bytes_per_second=upload_path,
+            disk_write_bytes_per_second=disk,
+            finished_at=time.time(),
+        )
+
+    async def _bench_download(
+        self,
+        session: aiohttp.ClientSession,
+        headers: dict,
+        bench_bytes: int,
+        seconds: float,
+    ) -> float:
+        """Download from memory until done or out of time; bytes per second."""
+        received = 0
+        async with session.get(
+            f"{self.base_url}/bench/source",
+            params={"bytes": str(bench_bytes)},
+            headers=headers,
+        ) as resp:
+            if resp.status != 200:
+                await _bench_reply(resp)
+            started = time.monotonic()
+            async for chunk in resp.content.iter_any():
+                received += len(chunk)
+                if time.monotonic() - started >= seconds:
+                    # Stop the peer sending the rest
+                    resp.close()
+                    break
+            elapsed = time.monotonic() - started
+        return received / max(elapsed, 1e-6)
+
+    async def _bench_upload(
+        self,
+        session: aiohttp.ClientSession,
+        headers: dict,
+        path: str,
+        bench_bytes: int,
+        seconds: float,
+    ) -> float:
+        """Upload from memory until done or out of time; bytes per second.
+
+        For the upload path each block is hashed on a worker thread before
+        it is sent, as ``_iter_blocks`` does.
+        """
+        if path == "upload":
+            block = bytes(resumable_transfer.BLOCK_BYTES)
+            hasher = link_benchmark.HashingSink(len(block))
+        else:
+            block = bytes(link_benchmark.BENCH_CHUNK_BYTES)
+            hasher = None
+        loop = asyncio.get_running_loop()
+
+        async def sender():
+            sent = 0
+            started = time.monotonic()
+            while sent < bench_bytes and time.monotonic() - started < seconds:
+                chunk = block[: bench_bytes - sent]
+                if hasher is not None:
+                    await loop.run_in_executor(None, hasher.write, chunk)
+                yield chunk
+                sent += len(chunk)
+
+        async with session.post(
+            f"{self.base_url}/bench/sink",
+            params={"path": path},
+            data=sender(),
+            headers={**headers, "Content-Type": "application/octet-stream"},
+        ) as resp:
+            return _bench_speed(await _bench_reply(resp))
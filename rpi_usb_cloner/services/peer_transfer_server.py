@@ -1,27 +1,86 @@
 """HTTP server for receiving image transfers from peer devices.
 
 Provides endpoints for PIN authentication and chunked file uploads.
+
+Uploads that carry ``X-Upload-Size`` are resumable (see
+services.resumable_transfer): each file is written to a ``.part`` file with a
+block journal, ``GET /upload/{image}/state`` tells the sender how much has
+arrived intact, uploads continue from ``X-Upload-Offset`` and
+``POST /upload/{image}/commit`` verifies the whole-file digest before the
+file is moved into place. Each upload request carries one byte range
+(``X-Upload-Offset`` up to ``X-Upload-End``), so a sender can fill several
+ranges of a file, and several files, over parallel connections.
+
+Received data is never written on the event loop. Each upload hands its
+chunks to a writer thread through a bounded queue, so the loop keeps reading
+every open stream while the drive catches up, and a slow drive pushes back
+on the senders through TCP flow control once the queue is full.
+
+A transfer can negotiate wire compression at ``POST /transfer`` (see
+services.wire_compression). Ranges sent compressed carry
+``X-Upload-Encoding`` and are decompressed on the writer thread.
+
+Senders may also list every file of each image with its block digests at
+``POST /transfer``. Files this repo already holds with the same name and
+digest are reported as present and are not sent. For the others, blocks
+with the same digest anywhere in the repo (see storage.block_index) are
+copied locally into the partial file when its state is first requested, so
+the sender only sends what is really missing.
+
+A transfer may name further peers to relay to (see
+services.chain_replication). The server then passes every step on to them,
+forwarding each received range while it is still being written here.
+Uploads name their transfer in ``X-Transfer-Id``, so several relayed
+transfers can run at once; ``DELETE /transfer/{id}`` ends one.
+
+Authenticated senders can benchmark the link (see services.link_benchmark):
+``GET /bench/source`` and ``POST /bench/sink`` move data from and to memory,
+with ``?path=upload`` running it through the upload path without writing it,
+and ``POST /bench/disk`` times a write to the destination repo's drive.
+
+The destination repo can also be read over the network (see
+storage.remote_repo): ``GET /repo/index.json`` lists its images and
+``GET /repo/{path}`` serves their files, with ``Range`` support so a
+client can restore while streaming and resume a dropped download.
+
+Sessions expire after ``SESSION_TIMEOUT`` without requests. Every request
+keeps its session alive while it runs and counts as use when it ends, so
+a long upload or restore that drops and resumes does not outlive its
+token.
 """
 
 from __future__ import annotations
 
+import asyncio
 import random
 import secrets
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable
+from typing import Any, Callable
 
 from aiohttp import web
 
 from rpi_usb_cloner.domain import ImageRepo, ImageType
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.storage import image_repo
+from rpi_usb_cloner.services import (
+    chain_replication,
+    link_benchmark,
+    resumable_transfer,
+    transfer_engine,
+    wire_compression,
+)
+from rpi_usb_cloner.storage import image_repo, remote_repo
 
 
 log = get_logger(source=__name__)
 
 # Session management
-_active_sessions: dict[str, dict] = {}  # token -> {created_at, pin, peer_ip}
+# token -> {created_at, last_used, in_flight, pin, peer_ip}
+_active_sessions: dict[str, dict] = {}
+# Sessions expire after this long without a request, so a long transfer
+# that keeps resuming stays authenticated
 SESSION_TIMEOUT = 600  # 10 minutes
 
 # PIN authentication
@@ -30,6 +89,89 @@ _failed_attempts: dict[str, list[float]] = {}  # ip -> [timestamp, ...]
 MAX_FAILED_ATTEMPTS = 3
 RATE_LIMIT_WINDOW = 30  # seconds
 
+# Upload streaming
+RECEIVE_CHUNK_BYTES = 1024 * 1024
+WRITE_QUEUE_CHUNKS = 8  # chunks queued for the writer thread per upload
+
+# Link probing (GET /probe): at most this much is sent without a session,
+# and only a few times per window to each address
+MAX_PROBE_BYTES = 4 * 1024 * 1024
+PROBE_CHUNK = bytes(64 * 1024)
+MAX_PROBES = 6
+PROBE_WINDOW = 60  # seconds
+
+# Free space changes are reported once they settle for this long
+FREE_SPACE_REPORT_DELAY = 2.0
+
+
+def _check_relative_name(name: str) -> None:
+    """Reject names that would escape the destination repo."""
+    path = Path(name)
+    if not name or path.is_absolute() or ".." in path.parts:
+        raise ValueError(f"Invalid name: {name}")
+
+
+def _bench_bytes(request: web.Request) -> int:
+    """Benchmark size from ``?bytes=``, capped at MAX_BENCH_BYTES."""
+    size = int(request.query.get("bytes", str(link_benchmark.BENCH_BYTES)))
+    return max(0, min(size, link_benchmark.MAX_BENCH_BYTES))
+
+
+class _QueuedWriter:
+    """Run a blocking writer's ``write()`` calls on its own thread.
+
+    Up to ``depth`` chunks are queued; ``write()`` only waits when the queue
+    is full. After a failed write the remaining queued chunks are dropped,
+    so nothing is written at the wrong offset.
+    """
+
+    def __init__(self, writer: Any, depth: int | None = None) -> None:
+        self._writer = writer
+        self._depth = WRITE_QUEUE_CHUNKS if depth is None else depth
+        self._pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="upload-writer"
+        )
+        self._pending: deque[asyncio.Future] = deque()
+        self._failed = False
+        self._closed = False
+
+    def _write(self, data: bytes) -> None:
+        if self._failed:
+            return
+        try:
+            self._writer.write(data)
+        except BaseException:
+            self._failed = True
+            raise
+
+    async def write(self, data: bytes) -> None:
+        """Queue ``data``; raises the error of any earlier failed write."""
+        loop = asyncio.get_running_loop()
+        self._pending.append(loop.run_in_executor(self._pool, self._write, data))
+        while self._pending and (
+            len(self._pending) > self._depth or self._pending[0].done()
+        ):
+            await self._pending.popleft()
+
+    async def close(self) -> None:
+        """Wait for queued writes, then close the writer on its thread."""
+        if self._closed:
+            return
+        self._closed = True
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                await self._pending.popleft()
+        finally:
+            # Let the rest of the queue drain before the writer is closed
+            for future in self._pending:
+                await asyncio.wait([future])
+            self._pending.clear()
+            try:
+                await loop.run_in_executor(self._pool, self._writer.close)
+            finally:
+                self._pool.shutdown(wait=False)
+
 
 class TransferServer:
     """HTTP server for receiving image transfers."""
@@ -48,17 +190,30 @@ class TransferServer:
         self.site: web.TCPSite | None = None
         self._transfer_progress: dict[str, float] = {}  # image_name -> progress
         self._on_progress_callback: Callable[[str, float], None] | None = None
+        self._on_free_space_callback: Callable[[int], None] | None = None
+        self._free_space_report: asyncio.TimerHandle | None = None
+        # Recent probes by client address: ip -> [timestamp, ...]
+        self._probes: dict[str, list[float]] = {}
+        # Partial files shared by the uploads writing them: path -> (file, users)
+        self._partials: dict[Path, tuple[resumable_transfer.PartialFile, int]] = {}
+        # Announced block digests of files still to be received, by destination
+        self._block_plans: dict[Path, dict[str, Any]] = {}
+        # Peers each relayed transfer is forwarded to, by transfer id
+        self._relays: dict[str, chain_replication.Relay] = {}
 
     async def start(
         self,
         pin_callback: Callable[[], str] | None = None,
         on_progress: Callable[[str, float], None] | None = None,
+        on_free_space: Callable[[int], None] | None = None,
     ) -> None:
         """Start HTTP server.
 
         Args:
             pin_callback: Optional callback to get current PIN (for display)
             on_progress: Optional callback for transfer progress updates
+            on_free_space: Optional callback(free_bytes) after files were
+                stored or removed, e.g. to update the advertised free space
         """
         global _current_pin
 
@@ -66,13 +221,9 @@ class TransferServer:
         _current_pin = pin_callback() if pin_callback else self._generate_pin()
 
         self._on_progress_callback = on_progress
+        self._on_free_space_callback = on_free_space
 
-        # Create aiohttp app
-        self.app = web.Application()
-        self.app.router.add_post("/auth", self._handle_auth)
-        self.app.router.add_post("/transfer", self._handle_transfer_init)
-        self.app.router.add_post("/upload/{image_name}", self._handle_upload)
-        self.app.router.add_get("/status", self._handle_status)
+        self.app = self._build_app()
 
         # Start server
         self.runner = web.AppRunner(self.app)
@@ -82,6 +233,51 @@ class TransferServer:
 
         log.info(f"Transfer server started on port {self.port}, PIN: {_current_pin}")
 
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._session_middleware])
+        app.router.add_post("/auth", self._handle_auth)
+        app.router.add_post("/transfer", self._handle_transfer_init)
+        app.router.add_delete("/transfer/{transfer_id}", self._handle_transfer_end)
+        app.router.add_post("/upload/{image_name}", self._handle_upload)
+        app.router.add_get("/upload/{image_name}/state", self._handle_upload_state)
+        app.router.add_post("/upload/{image_name}/commit", self._handle_upload_commit)
+        app.router.add_get("/status", self._handle_status)
+        app.router.add_get("/probe", self._handle_probe)
+        app.router.add_get("/bench/source", self._handle_bench_source)
+        app.router.add_post("/bench/sink", self._handle_bench_sink)
+        app.router.add_post("/bench/disk", self._handle_bench_disk)
+        app.router.add_get("/repo/{path:.+}", self._handle_repo_file)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    @web.middleware
+    async def _session_middleware(
+        self, request: web.Request, handler: Callable
+    ) -> web.StreamResponse:
+        """Keep a session alive for as long as its requests are served.
+
+        A single upload range or repo read may take longer than the
+        timeout, and a client may resume before the server notices the
+        old request dropped, so sessions with requests in flight do not
+        expire and the session counts as used again when a request ends.
+        """
+        session = (
+            _active_sessions.get(request.headers["Authorization"][7:])
+            if self._verify_token(request)
+            else None
+        )
+        if session is None:
+            return await handler(request)
+        session["in_flight"] = session.get("in_flight", 0) + 1
+        try:
+            return await handler(request)
+        finally:
+            session["in_flight"] -= 1
+            session["last_used"] = time.time()
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        await self._close_relays()
+
     async def stop(self) -> None:
         """Gracefully shutdown server."""
         global _current_pin, _active_sessions
@@ -91,6 +287,10 @@ class TransferServer:
         if self.runner:
             await self.runner.cleanup()
 
+        await self._close_relays()
+        if self._free_space_report is not None:
+            self._free_space_report.cancel()
+            self._free_space_report = None
         _current_pin = None
         _active_sessions.clear()
         log.info("Transfer server stopped")
@@ -132,8 +332,10 @@ class TransferServer:
             if submitted_pin == _current_pin:
                 # Generate session token
                 token = secrets.token_urlsafe(32)
+                now = time.time()
                 _active_sessions[token] = {
-                    "created_at": time.time(),
+                    "created_at": now,
+                    "last_used": now,
                     "pin": submitted_pin,
                     "peer_ip": client_ip,
                 }
@@ -160,10 +362,19 @@ class TransferServer:
           "images": [
             {"name": "test.iso", "type": "iso", "size_bytes": 1000000},
             ...
-          ]
+          ],
+          "compression": ["deflate"]  (optional, codecs the sender supports)
+          "relay": [{"name": "...", "url": "http://...", "token": "...",
+                     "relay": [...]}]  (optional, peers to forward to)
         }
 
-        Response: {"transfer_id": "xyz", "accepted": true}
+        Each image may also carry "files": [{"file": "", "size": n,
+        "source": "...", "block_bytes": n, "digest": "...", "blocks": [...]}],
+        one entry per file ("file" is the path within a directory image).
+
+        Response: {"transfer_id": "xyz", "accepted": true, "compression": codec,
+                   "present": {"<image>": ["<file>", ...]},
+                   "relay_failed": ["<name>", ...]}
         """
         # Verify session token
         if not self._verify_token(request):
@@ -176,8 +387,15 @@ class TransferServer:
             if not images:
                 return web.json_response({"error": "No images specified"}, status=400)
 
+            loop = asyncio.get_running_loop()
+            present, present_bytes, plans = await loop.run_in_executor(
+                None, self._plan_block_reuse, images
+            )
+            self._block_plans.update(plans)
+
             # Calculate required space
             total_size = sum(img.get("size_bytes", 0) for img in images)
+            total_size = max(total_size - present_bytes, 0)
 
             # Check available space
             usage = image_repo.get_repo_usage(self.destination_repo)
@@ -194,13 +412,31 @@ class TransferServer:
                     status=507,
                 )
 
+            codec = wire_compression.negotiate(data.get("compression") or [])
             # Generate transfer ID
             transfer_id = secrets.token_hex(16)
 
+            # Relays of senders that went away without ending their transfer
+            await self._close_relays(idle_only=True)
+            relay_failed: list[str] = []
+            if data.get("relay"):
+                relay = chain_replication.Relay(data["relay"])
+                self._relays[transfer_id] = relay
+                present, codec = await relay.init(images, codec, present)
+                relay_failed = relay.failed_names
+
             log.info(
                 f"Transfer initialized: {len(images)} images, {total_size} bytes (ID: {transfer_id})"
             )
-            return web.json_response({"transfer_id": transfer_id, "accepted": True})
+            return web.json_response(
+                {
+                    "transfer_id": transfer_id,
+                    "accepted": True,
+                    "compression": codec,
+                    "present": present,
+                    "relay_failed": relay_failed,
+                }
+            )
 
         except Exception as e:
             log.error(f"Transfer init error: {e}")
@@ -221,21 +457,12 @@ class TransferServer:
             return web.json_response({"error": "Unauthorized"}, status=401)
 
         image_name = request.match_info["image_name"]
-        image_type_str = request.headers.get("X-Image-Type", "iso")
 
         try:
-            # Parse image type
-            image_type = ImageType[
-                image_type_str.upper().replace("CLONEZILLA_DIR", "CLONEZILLA_DIR")
-            ]
+            if "X-Upload-Size" in request.headers:
+                return await self._handle_resumable_upload(request, image_name)
 
-            # Determine destination path
-            if image_type == ImageType.CLONEZILLA_DIR:
-                dest_base = self.destination_repo.path / "clonezilla"
-                dest_base.mkdir(exist_ok=True)
-                dest_path = dest_base / image_name
-            else:
-                dest_path = self.destination_repo.path / image_name
+            dest_path = self._image_dest_path(request, image_name)
 
             # Handle multipart (for directories) vs binary stream
             content_type = request.headers.get("Content-Type", "")
@@ -250,6 +477,7 @@ class TransferServer:
                 )
 
             log.info(f"Upload complete: {image_name} ({received_bytes} bytes)")
+            self._free_space_changed()
 
             return web.json_response(
                 {"received_bytes": received_bytes, "status": "complete"}
@@ -259,23 +487,405 @@ class TransferServer:
             log.error(f"Upload error for {image_name}: {e}")
             return web.json_response({"error": str(e)}, status=500)
 
+    async def _handle_transfer_end(self, request: web.Request) -> web.Response:
+        """Handle DELETE /transfer/{transfer_id} - The sender is done.
+
+        Stops relaying the transfer to its hops, if it was relayed.
+
+        Response: {"status": "ended"}, 404 if no relay is kept for it
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+
+        relay = self._relays.pop(request.match_info["transfer_id"], None)
+        if relay is None:
+            return web.json_response({"error": "Unknown transfer"}, status=404)
+        await relay.close()
+        return web.json_response({"status": "ended"})
+
+    def _free_space_changed(self) -> None:
+        """Report the repo's free space once a burst of changes is over."""
+        if self._on_free_space_callback is None or self._free_space_report is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._free_space_report = loop.call_later(
+            FREE_SPACE_REPORT_DELAY,
+            lambda: asyncio.ensure_future(self._report_free_space()),
+        )
+
+    async def _report_free_space(self) -> None:
+        self._free_space_report = None
+        callback = self._on_free_space_callback
+        if callback is None:
+            return
+
+        def report() -> None:
+            callback(image_repo.get_repo_free_bytes(self.destination_repo))
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, report)
+        except Exception as e:
+            log.warning(f"Unable to report free space: {e}")
+
+    def _relay_for(self, request: web.Request) -> chain_replication.Relay | None:
+        """The relay of the transfer a request belongs to (X-Transfer-Id)."""
+        relay = self._relays.get(request.headers.get("X-Transfer-Id", ""))
+        if relay is not None:
+            relay.touch()
+        return relay
+
+    async def _close_relays(self, idle_only: bool = False) -> None:
+        for transfer_id, relay in list(self._relays.items()):
+            if idle_only and not relay.idle:
+                continue
+            del self._relays[transfer_id]
+            if idle_only:
+                log.info(f"Dropping relay of abandoned transfer {transfer_id}")
+            await relay.close()
+
+    def _image_dest_path(self, request: web.Request, image_name: str) -> Path:
+        """Destination of an image, from its name and X-Image-Type header."""
+        return self._dest_path_for(
+            request.headers.get("X-Image-Type", "iso"), image_name
+        )
+
+    def _dest_path_for(self, image_type_str: str, image_name: str) -> Path:
+        image_type = ImageType[image_type_str.upper()]
+        _check_relative_name(image_name)
+        if image_type == ImageType.CLONEZILLA_DIR:
+            dest_base = self.destination_repo.path / "clonezilla"
+            dest_base.mkdir(exist_ok=True)
+            return dest_base / image_name
+        return self.destination_repo.path / image_name
+
+    def _upload_file_path(
+        self, request: web.Request, image_name: str, file_name: str
+    ) -> Path:
+        """Destination of one file of an upload (a directory image's member)."""
+        dest_path = self._image_dest_path(request, image_name)
+        if not file_name:
+            return dest_path
+        _check_relative_name(file_name)
+        return dest_path / file_name
+
+    def _plan_block_reuse(
+        self, images: list[dict]
+    ) -> tuple[dict[str, list[str]], int, dict[Path, dict[str, Any]]]:
+        """Compare announced files with this repo (runs on a worker thread).
+
+        Returns:
+            (present files by image, bytes present, block plans by destination)
+        """
+        index = image_repo.get_repo_block_index(self.destination_repo.path)
+        present: dict[str, list[str]] = {}
+        present_bytes = 0
+        plans: dict[Path, dict[str, Any]] = {}
+        for image in images:
+            for entry in image.get("files") or []:
+                try:
+                    name = str(image["name"])
+                    file_name = str(entry.get("file", ""))
+                    dest = self._dest_path_for(str(image.get("type", "iso")), name)
+                    if file_name:
+                        _check_relative_name(file_name)
+                        dest = dest / file_name
+                    plan = {
+                        "size": int(entry["size"]),
+                        "source": str(entry["source"]),
+                        "block_bytes": int(entry["block_bytes"]),
+                        "digest": str(entry["digest"]),
+                        "blocks": [str(digest) for digest in entry["blocks"]],
+                    }
+                except (KeyError, TypeError, ValueError) as e:
+                    log.debug(f"Ignoring file entry of {image.get('name')}: {e}")
+                    continue
+                try:
+                    if dest.is_file() and dest.stat().st_size == plan["size"]:
+                        blocks = index.file_blocks(dest, plan["block_bytes"])
+                        if (
+                            resumable_transfer.digest_of_blocks(blocks)
+                            == plan["digest"]
+                        ):
+                            present.setdefault(name, []).append(file_name)
+                            present_bytes += plan["size"]
+                            continue
+                except OSError as e:
+                    log.debug(f"Unable to check {dest}: {e}")
+                plans[dest] = plan
+        index.save()
+        if present:
+            count = sum(len(files) for files in present.values())
+            log.info(f"{count} file(s), {present_bytes} bytes already present")
+        return present, present_bytes, plans
+
+    async def _reuse_local_blocks(
+        self, partial: resumable_transfer.PartialFile
+    ) -> None:
+        """Fill a partial file from identical blocks already in this repo."""
+        plan = self._block_plans.get(partial.dest)
+        if plan is None:
+            return
+        if (plan["size"], plan["source"], plan["block_bytes"]) != (
+            partial.size,
+            partial.source,
+            partial.block_bytes,
+        ):
+            return
+        del self._block_plans[partial.dest]
+        index = image_repo.get_repo_block_index(self.destination_repo.path)
+        loop = asyncio.get_running_loop()
+        filled = await loop.run_in_executor(
+            None,
+            resumable_transfer.fill_from_local,
+            partial,
+            plan["blocks"],
+            lambda digest: index.locate(digest, partial.block_bytes),
+        )
+        if filled:
+            log.info(f"Reused {filled} local block(s) for {partial.dest.name}")
+
+    def _acquire_partial(
+        self, request: web.Request, image_name: str, params
+    ) -> resumable_transfer.PartialFile:
+        """Open a partial file, sharing it with uploads already writing it.
+
+        Every call must be paired with ``_release_partial()``.
+        """
+        file_path = self._upload_file_path(request, image_name, params.get("file", ""))
+        size = int(params["size"])
+        if size < 0:
+            raise ValueError("Negative upload size")
+        source = str(params["source"])
+        entry = self._partials.get(file_path)
+        if entry is not None:
+            partial, users = entry
+            if (partial.size, partial.source) != (size, source):
+                raise ValueError(f"{file_path.name} is being written by another upload")
+        else:
+            partial = resumable_transfer.PartialFile.open(file_path, size, source)
+            users = 0
+        self._partials[file_path] = (partial, users + 1)
+        return partial
+
+    def _release_partial(self, partial: resumable_transfer.PartialFile) -> None:
+        _partial, users = self._partials[partial.dest]
+        if users > 1:
+            self._partials[partial.dest] = (partial, users - 1)
+        else:
+            del self._partials[partial.dest]
+            partial.close()
+
+    async def _handle_upload_state(self, request: web.Request) -> web.Response:
+        """Handle GET /upload/{image_name}/state - Blocks already received.
+
+        Query: file (relative path within a directory image), size, source
+
+        Response: {"received": bytes, "block_bytes": n,
+                   "blocks": {"<index>": sha256, ...}}
+
+        With a relay, only blocks every hop holds as well are listed.
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+
+        image_name = request.match_info["image_name"]
+        try:
+            partial = self._acquire_partial(request, image_name, request.query)
+        except (KeyError, ValueError) as e:
+            return web.json_response({"error": f"Bad request: {e}"}, status=400)
+        try:
+            await self._reuse_local_blocks(partial)
+            blocks = partial.received_blocks()
+            relay = self._relay_for(request)
+            if relay is not None:
+                blocks = await relay.common_blocks(
+                    image_name,
+                    request.headers,
+                    request.query,
+                    partial.block_bytes,
+                    blocks,
+                )
+            return web.json_response(
+                {
+                    "received": partial.received_bytes,
+                    "block_bytes": partial.block_bytes,
+                    "blocks": {str(index): digest for index, digest in blocks.items()},
+                }
+            )
+        finally:
+            self._release_partial(partial)
+
+    async def _handle_resumable_upload(
+        self, request: web.Request, image_name: str
+    ) -> web.Response:
+        """Write a binary stream to bytes X-Upload-Offset..X-Upload-End of a file.
+
+        With a relay, the stream is forwarded to the hops as it arrives; the
+        response lists the hops that received all of it as "replicas".
+        """
+        params = {
+            "file": request.headers.get("X-Upload-File", ""),
+            "size": request.headers["X-Upload-Size"],
+            "source": request.headers.get("X-Upload-Source", ""),
+        }
+        partial = self._acquire_partial(request, image_name, params)
+        try:
+            block_bytes = partial.block_bytes
+            offset = int(request.headers.get("X-Upload-Offset", "0"))
+            end = int(request.headers.get("X-Upload-End", str(partial.size)))
+            if (
+                offset % block_bytes
+                or not offset <= end <= partial.size
+                or (end % block_bytes and end != partial.size)
+            ):
+                return web.json_response(
+                    {"error": "Range not resumable", "block_bytes": block_bytes},
+                    status=409,
+                )
+            first_block = offset // block_bytes
+            end_block = -(-end // block_bytes)
+            encoding = request.headers.get("X-Upload-Encoding")
+            if encoding is not None and encoding not in wire_compression.CODECS:
+                return web.json_response(
+                    {"error": f"Unsupported encoding: {encoding}"}, status=415
+                )
+            # Blocks sent again replace what was received before
+            partial.forget(range(first_block, end_block))
+
+            writer = partial.writer(first_block, end_block)
+            if encoding is not None:
+                writer = wire_compression.DecodingWriter(writer, encoding)
+            sink = _QueuedWriter(writer)
+            relay = self._relay_for(request)
+            relayed = (
+                relay.forward(image_name, request.headers)
+                if relay is not None
+                else None
+            )
+            replicas: list[str] = []
+            try:
+                async for chunk in request.content.iter_chunked(RECEIVE_CHUNK_BYTES):
+                    await sink.write(chunk)
+                    if relayed is not None:
+                        await relayed.write(chunk)
+                    received = self._transfer_progress.get(image_name, 0) + len(chunk)
+                    self._transfer_progress[image_name] = received
+                    if self._on_progress_callback:
+                        self._on_progress_callback(image_name, received)
+                if relayed is not None:
+                    replicas = await relayed.finish()
+                    relayed = None
+            finally:
+                if relayed is not None:
+                    await relayed.abort()
+                # Journal whatever arrived, even if the sender went away
+                await sink.close()
+
+            blocks = partial.received_blocks()
+            range_complete = all(
+                index in blocks for index in range(first_block, end_block)
+            )
+            log.info(
+                f"Upload range stored: {image_name} {params['file']} "
+                f"{offset}-{end} ({partial.received_bytes}/{partial.size} bytes)"
+            )
+            return web.json_response(
+                {
+                    "received_bytes": partial.received_bytes,
+                    "status": "received" if range_complete else "partial",
+                    "replicas": replicas,
+                }
+            )
+        finally:
+            self._release_partial(partial)
+
+    async def _handle_upload_commit(self, request: web.Request) -> web.Response:
+        """Handle POST /upload/{image_name}/commit - Verify and finish a file.
+
+        Request: {"file": "", "size": n, "source": "...", "digest": "sha256"}
+        Response: {"status": "complete", "replicas": [...]}, 409 if incomplete,
+                  422 on mismatch ("replicas" are the relay hops that committed)
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+
+        image_name = request.match_info["image_name"]
+        try:
+            data = await request.json()
+            expected = str(data["digest"])
+            partial = self._acquire_partial(request, image_name, data)
+        except (KeyError, ValueError) as e:
+            return web.json_response({"error": f"Bad request: {e}"}, status=400)
+
+        try:
+            if not partial.complete:
+                return web.json_response(
+                    {"error": "Upload incomplete", "received": partial.received_bytes},
+                    status=409,
+                )
+            if partial.digest() != expected:
+                log.error(f"Checksum mismatch for {image_name} {data.get('file', '')}")
+                partial.discard()
+                self._free_space_changed()
+                return web.json_response({"error": "Checksum mismatch"}, status=422)
+
+            loop = asyncio.get_running_loop()
+            # The digests above are of the stream as received; check that the
+            # drive holds the same, as USB copies do
+            bad = await loop.run_in_executor(None, partial.verify_written)
+            if bad:
+                log.warning(
+                    f"{len(bad)} block(s) of {image_name} {data.get('file', '')} "
+                    "did not verify on disk, asking for them again"
+                )
+                partial.forget(bad)
+                return web.json_response(
+                    {"error": "Upload incomplete", "received": partial.received_bytes},
+                    status=409,
+                )
+
+            blocks = partial.received_blocks()
+            await loop.run_in_executor(None, partial.commit)
+            self._free_space_changed()
+            # The content is verified, so later transfers can reuse it
+            index = image_repo.get_repo_block_index(self.destination_repo.path)
+            index.record(
+                partial.dest,
+                partial.block_bytes,
+                [blocks[block] for block in range(partial.block_count)],
+            )
+            await loop.run_in_executor(None, index.save)
+        finally:
+            self._release_partial(partial)
+        log.info(f"Upload verified: {image_name} {data.get('file', '')}")
+        replicas: list[str] = []
+        relay = self._relay_for(request)
+        if relay is not None:
+            replicas = await relay.commit(image_name, request.headers, data)
+        return web.json_response({"status": "complete", "replicas": replicas})
+
     async def _handle_binary_upload(
         self, request: web.Request, dest_path: Path, image_name: str
     ) -> int:
         """Handle binary file upload (for ISOs and .BIN files)."""
         received_bytes = 0
-        chunk_size = 1024 * 1024  # 1MB chunks
 
         with open(dest_path, "wb") as f:
-            async for chunk in request.content.iter_chunked(chunk_size):
-                f.write(chunk)
-                received_bytes += len(chunk)
-
-                # Update progress
-                self._transfer_progress[image_name] = received_bytes
-                if self._on_progress_callback:
-                    # We don't know total size here, callback will get bytes received
-                    self._on_progress_callback(image_name, received_bytes)
+            if request.content_length:
+                transfer_engine.preallocate(f.fileno(), request.content_length)
+            sink = _QueuedWriter(f)
+            try:
+                async for chunk in request.content.iter_chunked(RECEIVE_CHUNK_BYTES):
+                    await sink.write(chunk)
+                    received_bytes += len(chunk)
+
+                    # Update progress
+                    self._transfer_progress[image_name] = received_bytes
+                    if self._on_progress_callback:
+                        # We don't know total size here, callback will get bytes received
+                        self._on_progress_callback(image_name, received_bytes)
+            finally:
+                await sink.close()
 
         return received_bytes
 
@@ -295,32 +905,199 @@ class TransferServer:
                 file_path.parent.mkdir(parents=True, exist_ok=True)
 
                 with open(file_path, "wb") as f:
-                    while True:
-                        chunk = await part.read_chunk()
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        received_bytes += len(chunk)
-
-                        # Update progress
-                        self._transfer_progress[image_name] = received_bytes
-                        if self._on_progress_callback:
-                            self._on_progress_callback(image_name, received_bytes)
+                    sink = _QueuedWriter(f)
+                    try:
+                        while True:
+                            chunk = await part.read_chunk(RECEIVE_CHUNK_BYTES)
+                            if not chunk:
+                                break
+                            await sink.write(chunk)
+                            received_bytes += len(chunk)
+
+                            # Update progress
+                            self._transfer_progress[image_name] = received_bytes
+                            if self._on_progress_callback:
+                                self._on_progress_callback(image_name, received_bytes)
+                    finally:
+                        await sink.close()
 
         return received_bytes
 
     async def _handle_status(self, request: web.Request) -> web.Response:
-        """Handle GET /status - Server status check."""
+        """Handle GET /status - Server status check.
+
+        Also reports the free space of the destination repo and how many
+        files are being received, so senders can pick the best peer.
+        """
         return web.json_response(
             {
                 "status": "ready",
                 "pin_required": True,
                 "destination": str(self.destination_repo.path),
+                "free_bytes": image_repo.get_repo_free_bytes(self.destination_repo),
+                "active_uploads": len(self._partials),
             }
         )
 
+    async def _handle_probe(self, request: web.Request) -> web.StreamResponse:
+        """Handle GET /probe?bytes=N - Send N bytes for a link speed probe.
+
+        Nothing is read from disk. N is capped at MAX_PROBE_BYTES and each
+        address may probe MAX_PROBES times per PROBE_WINDOW, so the endpoint
+        needs no session.
+        """
+        if not self._check_probe_limit(request.remote or "unknown"):
+            return web.json_response(
+                {"error": "Too many probes", "retry_after": PROBE_WINDOW}, status=429
+            )
+        try:
+            size = int(request.query.get("bytes", "0"))
+        except ValueError:
+            return web.json_response({"error": "Bad request"}, status=400)
+        size = max(0, min(size, MAX_PROBE_BYTES))
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        response.content_length = size
+        await response.prepare(request)
+        view = memoryview(PROBE_CHUNK)
+        while size > 0:
+            chunk = view[: min(size, len(view))]
+            await response.write(chunk)
+            size -= len(chunk)
+        await response.write_eof()
+        return response
+
+    async def _handle_bench_source(self, request: web.Request) -> web.StreamResponse:
+        """Handle GET /bench/source?bytes=N - Send N bytes from memory.
+
+        The client may close the connection once it has timed enough.
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        try:
+            size = _bench_bytes(request)
+        except ValueError:
+            return web.json_response({"error": "Bad request"}, status=400)
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        response.content_length = size
+        await response.prepare(request)
+        view = memoryview(bytes(link_benchmark.BENCH_CHUNK_BYTES))
+        try:
+            while size > 0:
+                chunk = view[: min(size, len(view))]
+                await response.write(chunk)
+                size -= len(chunk)
+            await response.write_eof()
+        except ConnectionResetError:
+            log.debug("Benchmark download stopped by the client")
+        return response
+
+    async def _handle_bench_sink(self, request: web.Request) -> web.Response:
+        """Handle POST /bench/sink?path=raw|upload - Receive and drop a stream.
+
+        With ``path=upload`` the stream is hashed block by block on a writer
+        thread, as an upload would be, but nothing is written.
+
+        Response: {"bytes": n, "seconds": t}
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        mode = request.query.get("path", "raw")
+        if mode not in ("raw", "upload"):
+            return web.json_response({"error": f"Unknown path: {mode}"}, status=400)
+
+        sink = (
+            _QueuedWriter(link_benchmark.HashingSink(resumable_transfer.BLOCK_BYTES))
+            if mode == "upload"
+            else None
+        )
+        received = 0
+        started = time.monotonic()
+        try:
+            async for chunk in request.content.iter_chunked(RECEIVE_CHUNK_BYTES):
+                received += len(chunk)
+                if received > link_benchmark.MAX_BENCH_BYTES:
+                    return web.json_response(
+                        {"error": "Benchmark too large"}, status=413
+                    )
+                if sink is not None:
+                    await sink.write(chunk)
+        finally:
+            if sink is not None:
+                await sink.close()
+        return web.json_response(
+            {"bytes": received, "seconds": time.monotonic() - started}
+        )
+
+    async def _handle_bench_disk(self, request: web.Request) -> web.Response:
+        """Handle POST /bench/disk?bytes=N - Time a write to the repo drive.
+
+        A test file of up to N bytes is written and synced, then deleted.
+
+        Response: {"bytes": n, "seconds": t}
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        try:
+            size = _bench_bytes(request)
+        except ValueError:
+            return web.json_response({"error": "Bad request"}, status=400)
+
+        loop = asyncio.get_running_loop()
+        try:
+            written, seconds = await loop.run_in_executor(
+                None,
+                link_benchmark.write_test_file,
+                self.destination_repo.path,
+                size,
+            )
+        except OSError as e:
+            log.error(f"Disk benchmark failed: {e}")
+            return web.json_response({"error": f"Write failed: {e}"}, status=500)
+        return web.json_response({"bytes": written, "seconds": seconds})
+
+    async def _handle_repo_file(self, request: web.Request) -> web.StreamResponse:
+        """Handle GET /repo/{path} - Read the destination repo.
+
+        ``index.json`` is the repo manifest; any other path is a file of an
+        image, served with ``Range`` support.
+        """
+        if not self._verify_token(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        name = request.match_info["path"]
+        repo_root = self.destination_repo.path
+        if name == remote_repo.MANIFEST_FILENAME:
+            loop = asyncio.get_running_loop()
+            manifest = await loop.run_in_executor(
+                None, remote_repo.build_manifest, repo_root
+            )
+            return web.json_response(manifest)
+
+        try:
+            _check_relative_name(name)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        path = remote_repo.published_path(repo_root, name)
+        if path is None:
+            return web.json_response({"error": "Not found"}, status=404)
+
+        response = web.FileResponse(path, chunk_size=RECEIVE_CHUNK_BYTES)
+        try:
+            await response.prepare(request)
+        except ConnectionResetError:
+            log.debug(f"Repo read of {name} stopped by the client")
+        return response
+
     def _verify_token(self, request: web.Request) -> bool:
-        """Verify session token from Authorization header."""
+        """Verify session token from Authorization header.
+
+        Using a session refreshes it; it expires SESSION_TIMEOUT after its
+        last request ended, unless a request is still in flight.
+        """
         auth_header = request.headers.get("Authorization", "")
 
         if not auth_header.startswith("Bearer "):
@@ -331,14 +1108,16 @@ class TransferServer:
         if token not in _active_sessions:
             return False
 
-        # Check session timeout
+        # Check idle timeout
         session = _active_sessions[token]
-        age = time.time() - session["created_at"]
+        now = time.time()
+        idle = now - session.get("last_used", session["created_at"])
 
-        if age > SESSION_TIMEOUT:
+        if idle > SESSION_TIMEOUT and not session.get("in_flight"):
             _active_sessions.pop(token, None)
             return False
 
+        session["last_used"] = now
         return True
 
     def _check_rate_limit(self, client_ip: str) -> bool:
@@ -357,6 +1136,20 @@ class TransferServer:
 
         return True
 
+    def _check_probe_limit(self, client_ip: str) -> bool:
+        """Record a probe; False if the client probed too often lately."""
+        now = time.time()
+        self._probes = {
+            ip: recent
+            for ip, times in self._probes.items()
+            if (recent := [ts for ts in times if now - ts < PROBE_WINDOW])
+        }
+        recent = self._probes.setdefault(client_ip, [])
+        if len(recent) >= MAX_PROBES:
+            return False
+        recent.append(now)
+        return True
+
     def _record_failed_attempt(self, client_ip: str) -> None:
         """Record a failed authentication attempt."""
         now = time.time()
@@ -0,0 +1,569 @@
+"""Resumable, verified image file transfers.
+
+A file being transferred, whether copied from another repo drive or uploaded
+by a peer, is written to ``<name>.part`` next to its final location. Next to
+it sits an append-only journal, ``<name>.part.blocks``: a JSON header line
+(file size, source identity and block size) followed by one ``<index>
+<sha256>`` line per completed block of the *source* data. Blocks may arrive
+in any order, so several streams can fill different byte ranges of one file
+at once. When a transfer is interrupted by a pulled cable, a Wi-Fi drop or a
+power cut, the next attempt knows exactly which blocks arrived intact and
+only sends the rest.
+
+Journal lines are only appended right after the ``.part`` data has been
+synced, so after a power cut the journal never lists a block whose data had
+not reached the drive.
+
+When the last block is in, the file is checked end to end before it is
+renamed into place:
+
+- the written ``.part`` is read back from the drive and every block compared
+  with the journal. USB copies copy blocks that differ again once; peer
+  uploads forget them so the sender sends them again
+- peer uploads also compare the digest of the journal's block list with the
+  digest the sender computed from its own file
+
+The source identity is the source's size and mtime. If the source changed
+since the partial transfer started, the partial file is discarded.
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.services import transfer_engine
+
+
+log = get_logger(source=__name__, tags=["transfer"])
+
+BLOCK_BYTES = 4 * 1024 * 1024
+PART_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".part.blocks"
+JOURNAL_VERSION = 2
+# Blocks written between fsyncs of the .part file and its journal
+SYNC_EVERY_BLOCKS = 16
+
+ByteCallback = Callable[[int], None]
+
+
+def source_id(path: Path) -> str:
+    """Identity of a source file: changes whenever its content may have."""
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def digest_of_blocks(block_digests: Iterable[str]) -> str:
+    """Whole-file digest: SHA-256 over the concatenated block digests."""
+    digest = hashlib.sha256()
+    for block_digest in block_digests:
+        digest.update(bytes.fromhex(block_digest))
+    return digest.hexdigest()
+
+
+def _digest_range(fd: int, start: int, end: int) -> str:
+    digest = hashlib.sha256()
+    offset = start
+    while offset < end:
+        data = os.pread(fd, min(transfer_engine.CHUNK_BYTES, end - offset), offset)
+        if not data:
+            raise OSError(errno.EIO, f"Unexpected end of file at byte {offset}")
+        digest.update(data)
+        offset += len(data)
+    return digest.hexdigest()
+
+
+def block_digests(path: Path, end: int, block_bytes: int) -> list[str]:
+    """Digests of the blocks of ``path`` that lie entirely before ``end``.
+
+    The last block of the file counts as entire when ``end`` is the file size.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        file_size = os.fstat(fd).st_size
+        limit = min(file_size, end)
+        digests = []
+        for start in range(0, limit, block_bytes):
+            stop = min(start + block_bytes, file_size)
+            if stop > limit:
+                break
+            digests.append(_digest_range(fd, start, stop))
+        return digests
+    finally:
+        os.close(fd)
+
+
+def read_block_digests(
+    path: Path, indexes: Iterable[int], block_bytes: int
+) -> dict[int, str]:
+    """Digests of the given blocks of ``path``; blocks past its end are left out."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        file_size = os.fstat(fd).st_size
+        digests = {}
+        for index in indexes:
+            start = index * block_bytes
+            if start >= file_size:
+                continue
+            digests[index] = _digest_range(
+                fd, start, min(start + block_bytes, file_size)
+            )
+        return digests
+    finally:
+        os.close(fd)
+
+
+class PartialFile:
+    """A destination file that is still being written, with its block journal.
+
+    Blocks can be recorded from several writer threads at once.
+    """
+
+    def __init__(
+        self, dest: Path, size: int, source: str, block_bytes: int | None = None
+    ) -> None:
+        self.dest = dest
+        self.size = size
+        self.source = source
+        self.block_bytes = block_bytes or BLOCK_BYTES
+        self.blocks: dict[int, str] = {}
+        self.part_path = dest.with_name(dest.name + PART_SUFFIX)
+        self.journal_path = dest.with_name(dest.name + JOURNAL_SUFFIX)
+        self._journal = None
+        # Blocks whose data has not been synced yet, so are not journaled
+        self._pending: list[int] = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, dest: Path, size: int, source: str) -> PartialFile:
+        """Resume the journaled partial file for ``dest``, or start a new one."""
+        partial = cls(dest, size, source)
+        if not partial._load():
+            partial._reset()
+        return partial
+
+    @property
+    def block_count(self) -> int:
+        return -(-self.size // self.block_bytes)
+
+    @property
+    def received(self) -> int:
+        """Bytes received intact from the start of the file, in whole blocks."""
+        index = 0
+        while index in self.blocks:
+            index += 1
+        return min(index * self.block_bytes, self.size)
+
+    @property
+    def received_bytes(self) -> int:
+        """Bytes received intact anywhere in the file."""
+        return sum(
+            end - start for start, end in map(self.block_range, self.received_blocks())
+        )
+
+    @property
+    def complete(self) -> bool:
+        return len(self.blocks) >= self.block_count
+
+    def received_blocks(self) -> dict[int, str]:
+        """Copy of the journaled block digests, by block index."""
+        with self._lock:
+            return dict(self.blocks)
+
+    def missing(self) -> list[int]:
+        """Indexes of the blocks still to be received, in order."""
+        blocks = self.received_blocks()
+        return [index for index in range(self.block_count) if index not in blocks]
+
+    def block_range(self, index: int) -> tuple[int, int]:
+        start = min(index * self.block_bytes, self.size)
+        return start, min(start + self.block_bytes, self.size)
+
+    def digest(self) -> str:
+        blocks = self.received_blocks()
+        return digest_of_blocks(blocks[index] for index in range(self.block_count))
+
+    def record(self, index: int, block_digest: str) -> None:
+        """Mark block ``index`` as received; it is journaled by ``sync()``."""
+        with self._lock:
+            self.blocks[index] = block_digest
+            self._pending.append(index)
+
+    def sync(self, part_fd: int) -> None:
+        """Sync the data written so far, then journal the blocks recorded."""
+        # Held throughout so no block is recorded between the data sync and
+        # the journal append without its data having been synced
+        with self._lock:
+            os.fdatasync(part_fd)
+            if not self._pending:
+                return
+            if self._journal is None:
+                self._journal = self.journal_path.open("a")
+            self._journal.writelines(
+                f"{index} {self.blocks[index]}\n"
+                for index in self._pending
+                if index in self.blocks
+            )
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending = []
+
+    def sync_due(self) -> bool:
+        return len(self._pending) >= SYNC_EVERY_BLOCKS
+
+    def forget(self, indexes: Iterable[int]) -> None:
+        """Forget the given blocks so they are received again.
+
+        Blocks other writers recorded but have not synced yet stay pending,
+        to be journaled by their next ``sync()``.
+        """
+        forgotten = set(indexes)
+        with self._lock:
+            if forgotten.isdisjoint(self.blocks):
+                return
+            self.blocks = {
+                index: block_digest
+                for index, block_digest in self.blocks.items()
+                if index not in forgotten
+            }
+            self._pending = [index for index in self._pending if index not in forgotten]
+            # The journal is replaced, so appends go to a new handle
+            self._close_journal()
+            self._write_journal()
+
+    def verify_written(self) -> list[int]:
+        """Read the .part file back from disk; return indexes of bad blocks."""
+        fd = os.open(self.part_path, os.O_RDONLY)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                # Read what is on the drive, not what is still in the page cache
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            if os.fstat(fd).st_size < self.size:
+                return sorted(self.blocks)
+            return [
+                index
+                for index, expected in sorted(self.blocks.items())
+                if _digest_range(fd, *self.block_range(index)) != expected
+            ]
+        finally:
+            os.close(fd)
+
+    def commit(self) -> None:
+        """Move the finished file into place and drop its journal."""
+        self.close()
+        with self.part_path.open("r+b") as part:
+            part.truncate(self.size)
+            os.fsync(part.fileno())
+        self.part_path.replace(self.dest)
+        self.journal_path.unlink(missing_ok=True)
+
+    def discard(self) -> None:
+        with self._lock:
+            self.close()
+            self.blocks = {}
+            self.part_path.unlink(missing_ok=True)
+            self.journal_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """Close the journal; blocks recorded since the last sync are dropped."""
+        with self._lock:
+            for index in self._pending:
+                self.blocks.pop(index, None)
+            self._pending = []
+            self._close_journal()
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def writer(
+        self, first_block: int | None = None, end_block: int | None = None
+    ) -> BlockWriter:
+        """Return a writer for blocks ``first_block`` up to ``end_block``.
+
+        By default it appends after ``received`` up to the end of the file.
+        """
+        return BlockWriter(self, first_block, end_block)
+
+    def _header(self) -> str:
+        return json.dumps(
+            {
+                "version": JOURNAL_VERSION,
+                "size": self.size,
+                "source": self.source,
+                "block_bytes": self.block_bytes,
+            },
+            sort_keys=True,
+        )
+
+    def _load(self) -> bool:
+        try:
+            lines = self.journal_path.read_text().splitlines()
+            header = json.loads(lines[0])
+            part_size = self.part_path.stat().st_size
+        except (OSError, ValueError, IndexError):
+            return False
+        if not isinstance(header, dict) or (
+            header.get("version"),
+            header.get("size"),
+            header.get("source"),
+        ) != (JOURNAL_VERSION, self.size, self.source):
+            return False
+        block_bytes = header.get("block_bytes")
+        if not isinstance(block_bytes, int) or block_bytes <= 0:
+            return False
+        self.block_bytes = block_bytes
+        blocks = {}
+        for line in lines[1:]:
+            fields = line.split(" ")
+            # A torn last line means the block was never fully journaled
+            if len(fields) != 2 or not fields[0].isdigit() or len(fields[1]) != 64:
+                break
+            index = int(fields[0])
+            # Blocks past the end of a shorter .part file were never written
+            if index < self.block_count and self.block_range(index)[1] <= part_size:
+                blocks[index] = fields[1]
+        self.blocks = blocks
+        # Rewrite without any torn tail so appends start on a new line
+        self._write_journal()
+        if self.blocks:
+            log.info(
+                f"Resuming {self.dest.name} with "
+                f"{self.received_bytes}/{self.size} bytes",
+                tags=["transfer", "resume"],
+            )
+        return True
+
+    def _reset(self) -> None:
+        self.close()
+        self.blocks = {}
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        with self.part_path.open("wb"):
+            pass
+        self._write_journal()
+
+    def _write_journal(self) -> None:
+        """Rewrite the journal with the blocks whose data has been synced."""
+        pending = set(self._pending)
+        temp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with temp_path.open("w") as journal:
+            journal.write(self._header() + "\n")
+            for index, block_digest in sorted(self.blocks.items()):
+                if index not in pending:
+                    journal.write(f"{index} {block_digest}\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        temp_path.replace(self.journal_path)
+
+
+class BlockWriter:
+    """Write a stream into a range of a partial file, journaling each block."""
+
+    def __init__(
+        self,
+        partial: PartialFile,
+        first_block: int | None = None,
+        end_block: int | None = None,
+    ) -> None:
+        self.partial = partial
+        if first_block is None:
+            self.offset = partial.received
+        else:
+            self.offset = partial.block_range(first_block)[0]
+        if end_block is None:
+            self.end = partial.size
+        else:
+            self.end = partial.block_range(end_block)[0]
+        self._fd = os.open(partial.part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        self._hash = hashlib.sha256()
+        try:
+            transfer_engine.preallocate(self._fd, partial.size)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def write(self, data: bytes) -> None:
+        partial = self.partial
+        if self.offset + len(data) > self.end:
+            raise ValueError(
+                f"Received more than {self.end} bytes for {partial.dest.name}"
+            )
+        view = memoryview(data)
+        while view:
+            index = self.offset // partial.block_bytes
+            _start, block_end = partial.block_range(index)
+            piece = view[: block_end - self.offset]
+            written = os.pwrite(self._fd, piece, self.offset)
+            self._hash.update(piece[:written])
+            self.offset += written
+            view = view[written:]
+            if self.offset == block_end:
+                partial.record(index, self._hash.hexdigest())
+                self._hash = hashlib.sha256()
+                if partial.sync_due():
+                    partial.sync(self._fd)
+
+    def close(self) -> None:
+        """Sync what was received; a trailing partial block is sent again."""
+        try:
+            self.partial.sync(self._fd)
+        finally:
+            os.close(self._fd)
+
+
+def _copy_blocks(
+    partial: PartialFile,
+    src_fd: int,
+    part_fd: int,
+    indexes: Iterable[int],
+    on_bytes: ByteCallback | None,
+    record: bool,
+) -> None:
+    for index in indexes:
+        start, end = partial.block_range(index)
+        reached = transfer_engine.copy_range(src_fd, part_fd, start, end, on_bytes)
+        if reached != end:
+            raise OSError(
+                errno.EIO, f"Source changed during copy ({reached}/{partial.size})"
+            )
+        if record:
+            # Just copied, so this is read from the page cache
+            partial.record(index, _digest_range(src_fd, start, end))
+            if partial.sync_due():
+                partial.sync(part_fd)
+
+
+def _paced(
+    on_bytes: ByteCallback | None, pace: ByteCallback | None
+) -> ByteCallback | None:
+    if pace is None:
+        return on_bytes
+
+    def callback(count: int) -> None:
+        if on_bytes is not None:
+            on_bytes(count)
+        pace(count)
+
+    return callback
+
+
+def copy_resumable(
+    src: Path,
+    dest: Path,
+    on_bytes: ByteCallback | None = None,
+    verify: bool = True,
+    pace: ByteCallback | None = None,
+) -> int:
+    """Copy ``src`` to ``dest``, resuming an interrupted copy of the same source.
+
+    ``pace`` is called with each chunk copied, unlike ``on_bytes`` not with
+    the bytes already there, and may block to slow the copy down (see
+    storage.transfer_scheduler).
+
+    Returns:
+        Number of bytes copied in this call
+
+    Raises:
+        OSError: If the copy fails or the written data does not verify
+    """
+    partial = PartialFile.open(dest, src.stat().st_size, source_id(src))
+    resumed_at = partial.received_bytes
+    if resumed_at and on_bytes is not None:
+        on_bytes(resumed_at)
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        part_fd = os.open(partial.part_path, os.O_WRONLY)
+        try:
+            transfer_engine.preallocate(part_fd, partial.size)
+            _copy_blocks(
+                partial,
+                src_fd,
+                part_fd,
+                partial.missing(),
+                _paced(on_bytes, pace),
+                record=True,
+            )
+            partial.sync(part_fd)
+            if verify:
+                bad = partial.verify_written()
+                if bad:
+                    log.warning(
+                        f"{len(bad)} block(s) of {dest.name} did not verify, recopying",
+                        tags=["transfer", "verify"],
+                    )
+                    _copy_blocks(partial, src_fd, part_fd, bad, None, record=False)
+                    partial.sync(part_fd)
+                    bad = partial.verify_written()
+                if bad:
+                    partial.forget(bad)
+                    raise OSError(errno.EIO, f"Verification failed for {dest}")
+        finally:
+            os.close(part_fd)
+    finally:
+        os.close(src_fd)
+        partial.close()
+    partial.commit()
+    shutil.copystat(src, dest)
+    return partial.size - resumed_at
+
+
+def fill_from_local(
+    partial: PartialFile,
+    block_digests: list[str],
+    locate: Callable[[str], tuple[Path, int] | None],
+) -> int:
+    """Fill missing blocks of ``partial`` with identical data already on disk.
+
+    ``block_digests`` are the digests of every block of the file being
+    received, and ``locate`` maps a digest to a file and offset that should
+    hold the same data. Each block is hashed again after it is read, so a
+    stale location only costs a wasted read.
+
+    Returns:
+        Number of blocks filled
+    """
+    filled = 0
+    sources: dict[Path, int] = {}
+    part_fd = os.open(partial.part_path, os.O_WRONLY)
+    try:
+        for index in partial.missing():
+            if index >= len(block_digests):
+                break
+            expected = block_digests[index]
+            location = locate(expected)
+            if location is None:
+                continue
+            path, offset = location
+            start, end = partial.block_range(index)
+            try:
+                if path not in sources:
+                    sources[path] = os.open(path, os.O_RDONLY)
+                data = os.pread(sources[path], end - start, offset)
+            except OSError:
+                continue
+            if len(data) != end - start or hashlib.sha256(data).hexdigest() != expected:
+                continue
+            view = memoryview(data)
+            position = start
+            while view:
+                written = os.pwrite(part_fd, view, position)
+                position += written
+                view = view[written:]
+            partial.record(index, expected)
+            filled += 1
+            if partial.sync_due():
+                partial.sync(part_fd)
+        partial.sync(part_fd)
+    finally:
+        os.close(part_fd)
+        for fd in sources.values():
+            os.close(fd)
+    return filled
@@ -1,19 +1,23 @@
 """Image transfer service for copying images between repositories.
 
 This module provides functionality for transferring disk images between
-image repositories, primarily for USB-to-USB transfers.
+image repositories, primarily for USB-to-USB transfers. Files are copied
+resumably and verified before they are moved into place (see
+services.resumable_transfer).
 """
 
 from __future__ import annotations
 
+import functools
 import os
-import shutil
 from pathlib import Path
 from typing import Callable
 
 from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.storage import image_repo
+from rpi_usb_cloner.services import resumable_transfer, transfer_engine
+from rpi_usb_cloner.storage import image_repo, transfer_scheduler
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
 
 
 log = get_logger(source=__name__)
@@ -57,6 +61,8 @@ def copy_images_to_repo(
     images: list[DiskImage],
     destination: ImageRepo,
     progress_callback: Callable[[str, float], None] | None = None,
+    *,
+    priority: Priority = Priority.TRANSFER,
 ) -> tuple[int, int]:
     """Copy multiple disk images to a destination repository.
 
@@ -65,6 +71,8 @@ def copy_images_to_repo(
         destination: Target ImageRepo to copy images to
         progress_callback: Optional callback(image_name, progress_ratio) called during copy.
                           progress_ratio is 0.0 to 1.0 per image.
+        priority: Scheduler priority of the copies; background syncs yield
+            the drives to clones and restores
 
     Returns:
         Tuple of (success_count, failure_count)
@@ -83,7 +91,12 @@ def copy_images_to_repo(
 
     for img in images:
         try:
-            _copy_single_image(img, destination, progress_callback)
+            with transfer_scheduler.job(
+                f"copy {img.name}", priority, paths=[img.path, destination.path]
+            ) as job:
+                _copy_single_image(
+                    img, destination, progress_callback, pace=job.consume
+                )
             success_count += 1
             log.info(f"Successfully copied image: {img.name}")
         except Exception as e:
@@ -97,6 +110,8 @@ def _copy_single_image(
     image: DiskImage,
     destination: ImageRepo,
     progress_callback: Callable[[str, float], None] | None = None,
+    *,
+    pace: Callable[[int], None] | None = None,
 ) -> None:
     """Copy a single image to destination repository.
 
@@ -104,6 +119,8 @@ def _copy_single_image(
         image: DiskImage to copy
         destination: Target ImageRepo
         progress_callback: Optional callback for progress updates
+        pace: Optional callback with each chunk copied, which may block to
+            slow the copy down
 
     Raises:
         ValueError: If image type is unsupported
@@ -123,7 +140,7 @@ def _copy_single_image(
 
         log.info(f"Copying Clonezilla directory {image.name} to {dest_image_path}")
         _copy_directory_with_progress(
-            image.path, dest_image_path, image.name, progress_callback
+            image.path, dest_image_path, image.name, progress_callback, pace=pace
         )
 
     elif image.image_type == ImageType.ISO:
@@ -132,7 +149,7 @@ def _copy_single_image(
 
         log.info(f"Copying ISO {image.name} to {dest_image_path}")
         _copy_file_with_progress(
-            image.path, dest_image_path, image.name, progress_callback
+            image.path, dest_image_path, image.name, progress_callback, pace=pace
         )
 
     elif image.image_type == ImageType.IMAGEUSB_BIN:
@@ -141,7 +158,16 @@ def _copy_single_image(
 
         log.info(f"Copying ImageUSB .BIN {image.name} to {dest_image_path}")
         _copy_file_with_progress(
-            image.path, dest_image_path, image.name, progress_callback
+            image.path, dest_image_path, image.name, progress_callback, pace=pace
+        )
+
+    elif image.image_type == ImageType.COMPRESSED_RAW:
+        # Copy compressed raw image to root of repo
+        dest_image_path = dest_path / image.name
+
+        log.info(f"Copying compressed image {image.name} to {dest_image_path}")
+        _copy_file_with_progress(
+            image.path, dest_image_path, image.name, progress_callback, pace=pace
         )
 
     else:
@@ -156,6 +182,8 @@ def _copy_file_with_progress(
     dest: Path,
     image_name: str,
     progress_callback: Callable[[str, float], None] | None,
+    *,
+    pace: Callable[[int], None] | None = None,
 ) -> None:
     """Copy a single file with progress reporting.
 
@@ -164,35 +192,14 @@ def _copy_file_with_progress(
         dest: Destination file path
         image_name: Name for progress reporting
         progress_callback: Optional callback for progress updates
+        pace: Optional callback with each chunk copied
     """
     if dest.exists():
         log.warning(f"Destination file exists, will be overwritten: {dest}")
 
-    file_size = src.stat().st_size
-
-    if file_size == 0 or progress_callback is None:
-        # Just copy directly if no progress needed or file is empty
-        shutil.copy2(src, dest)
-        return
-
-    # Copy with progress tracking
-    bytes_copied = 0
-    chunk_size = 1024 * 1024  # 1MB chunks
-
-    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
-        while True:
-            chunk = src_file.read(chunk_size)
-            if not chunk:
-                break
-            dest_file.write(chunk)
-            bytes_copied += len(chunk)
-
-            # Report progress
-            progress = bytes_copied / file_size
-            progress_callback(image_name, progress)
-
-    # Copy metadata (timestamps, permissions)
-    shutil.copystat(src, dest)
+    throttle = _progress_throttle(src.stat().st_size, image_name, progress_callback)
+    resumable_transfer.copy_resumable(src, dest, throttle.add, pace=pace)
+    throttle.finish()
 
 
 def _copy_directory_with_progress(
@@ -200,14 +207,20 @@ def _copy_directory_with_progress(
     dest: Path,
     image_name: str,
     progress_callback: Callable[[str, float], None] | None,
+    *,
+    pace: Callable[[int], None] | None = None,
 ) -> None:
     """Copy a directory tree with progress reporting.
 
+    Volumes are copied concurrently when ``src`` and ``dest`` are on
+    different devices.
+
     Args:
         src: Source directory path
         dest: Destination directory path
         image_name: Name for progress reporting
         progress_callback: Optional callback for progress updates
+        pace: Optional callback with each chunk copied
     """
     if dest.exists():
         log.warning(f"Destination directory exists, merging: {dest}")
@@ -219,37 +232,52 @@ def _copy_directory_with_progress(
     for root, _, files in os.walk(src):
         root_path = Path(root)
         for file in files:
+            if file.endswith(
+                (resumable_transfer.PART_SUFFIX, resumable_transfer.JOURNAL_SUFFIX)
+            ):
+                # Leftovers of an unfinished transfer into the source repo
+                continue
             file_path = root_path / file
             try:
                 size = file_path.stat().st_size
                 total_size += size
-                file_list.append((file_path, size))
+                file_list.append(file_path)
             except OSError as e:
                 log.warning(f"Could not stat file {file_path}: {e}")
 
-    if total_size == 0:
+    dest.mkdir(parents=True, exist_ok=True)
+    if not file_list:
         # Empty directory or all files errored
-        dest.mkdir(parents=True, exist_ok=True)
         return
 
-    # Copy files with progress tracking
-    bytes_copied = 0
-
-    for file_path, file_size in file_list:
-        # Calculate relative path and destination
-        rel_path = file_path.relative_to(src)
-        dest_file = dest / rel_path
+    pairs = []
+    for file_path in file_list:
+        dest_file = dest / file_path.relative_to(src)
         dest_file.parent.mkdir(parents=True, exist_ok=True)
+        pairs.append((file_path, dest_file))
+
+    throttle = _progress_throttle(total_size, image_name, progress_callback)
+    workers = transfer_engine.volume_workers(src, dest)
+    try:
+        transfer_engine.copy_files(
+            pairs,
+            throttle.add,
+            workers=workers,
+            copy=functools.partial(resumable_transfer.copy_resumable, pace=pace),
+        )
+    except OSError as e:
+        log.error(f"Failed to copy {src} to {dest}: {e}")
+        raise
+    throttle.finish()
 
-        try:
-            shutil.copy2(file_path, dest_file)
-            bytes_copied += file_size
-
-            # Report progress
-            if progress_callback and total_size > 0:
-                progress = bytes_copied / total_size
-                progress_callback(image_name, progress)
 
-        except OSError as e:
-            log.error(f"Failed to copy {file_path} to {dest_file}: {e}")
-            raise
+def _progress_throttle(
+    total_bytes: int,
+    image_name: str,
+    progress_callback: Callable[[str, float], None] | None,
+) -> transfer_engine.ProgressThrottle:
+    if progress_callback is None:
+        return transfer_engine.ProgressThrottle(total_bytes, None)
+    return transfer_engine.ProgressThrottle(
+        total_bytes, lambda ratio: progress_callback(image_name, ratio)
+    )
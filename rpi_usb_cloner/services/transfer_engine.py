@@ -0,0 +1,273 @@
+"""File transfer engine for copying images between repo drives.
+
+Copies are done in the kernel where possible: ``copy_file_range`` first, then
+``sendfile``, and a plain ``pread``/``pwrite`` loop only when neither works
+between the two filesystems (FAT and exFAT sticks on older kernels, for
+example). Destination files get their blocks reserved up front with
+``fallocate`` so FAT allocation does not fragment while the copy runs.
+
+Progress is counted in bytes as they are copied, not per file, and is
+reported through a throttle so a multi-gigabyte volume shows movement
+without calling the UI thousands of times a second. When the source and
+destination are on different devices the volumes of an image are copied
+concurrently, which keeps both drives busy and lets the transfer run at the
+slower drive's speed. On the same device they are copied one at a time to
+avoid seeking back and forth.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Sequence, Tuple
+
+from rpi_usb_cloner.logging import get_logger
+
+
+log = get_logger(source=__name__, tags=["transfer"])
+
+CHUNK_BYTES = 8 * 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 0.25
+PARALLEL_VOLUME_WORKERS = 3
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+# Errors meaning "this copy method is not available here", not "copy failed"
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EBADF,
+}
+
+ByteCallback = Callable[[int], None]
+FilePair = Tuple[Path, Path]
+
+_fallocate = None
+_fallocate_loaded = False
+
+
+class ProgressThrottle:
+    """Collect copied byte counts from any thread and report a ratio.
+
+    The callback gets ``copied / total`` at most once per interval, plus a
+    final 1.0 from ``finish()``.
+    """
+
+    def __init__(
+        self,
+        total_bytes: int,
+        callback: Callable[[float], None] | None,
+        interval: float | None = None,
+    ) -> None:
+        self.total_bytes = total_bytes
+        self.copied_bytes = 0
+        self._callback = callback
+        self._interval = PROGRESS_INTERVAL_SECONDS if interval is None else interval
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.copied_bytes += count
+            if self._callback is None or self.total_bytes <= 0:
+                return
+            now = time.monotonic()
+            if now - self._last_report < self._interval:
+                return
+            self._last_report = now
+            self._callback(min(self.copied_bytes / self.total_bytes, 1.0))
+
+    def finish(self) -> None:
+        with self._lock:
+            if self._callback is not None:
+                self._callback(1.0)
+
+
+def _load_fallocate():
+    global _fallocate, _fallocate_loaded
+    if not _fallocate_loaded:
+        _fallocate_loaded = True
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            function = libc.fallocate64
+        except (OSError, AttributeError, TypeError):
+            return None
+        function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        function.restype = ctypes.c_int
+        _fallocate = function
+    return _fallocate
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """Reserve ``size`` bytes of blocks for ``fd`` without changing its length.
+
+    Uses the fallocate syscall directly rather than ``posix_fallocate``,
+    whose fallback on filesystems without support writes every block.
+
+    Returns:
+        True if the space was reserved
+    """
+    function = _load_fallocate()
+    if function is None or size <= 0:
+        return False
+    if function(fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error == errno.ENOSPC:
+        raise OSError(error, os.strerror(error))
+    return False
+
+
+def _copy_range_kernel(
+    src_fd: int, dest_fd: int, offset: int, size: int, on_bytes: ByteCallback | None
+) -> int:
+    """Copy with copy_file_range, then sendfile; returns the offset reached."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                count = min(CHUNK_BYTES, size - offset)
+                copied = os.copy_file_range(src_fd, dest_fd, count, offset, offset)
+                if copied == 0:
+                    return offset
+                offset += copied
+                if on_bytes is not None:
+                    on_bytes(copied)
+            return offset
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            log.debug(f"copy_file_range unavailable, using sendfile: {error}")
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(dest_fd, offset, os.SEEK_SET)
+            while offset < size:
+                count = min(CHUNK_BYTES, size - offset)
+                copied = os.sendfile(dest_fd, src_fd, offset, count)
+                if copied == 0:
+                    return offset
+                offset += copied
+                if on_bytes is not None:
+                    on_bytes(copied)
+            return offset
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            log.debug(f"sendfile unavailable, using read/write: {error}")
+    return offset
+
+
+def copy_range(
+    src_fd: int,
+    dest_fd: int,
+    offset: int,
+    size: int,
+    on_bytes: ByteCallback | None = None,
+) -> int:
+    """Copy bytes ``offset``..``size`` of ``src_fd`` to the same range of ``dest_fd``.
+
+    Returns:
+        The offset reached, less than ``size`` if the source ended early
+    """
+    offset = _copy_range_kernel(src_fd, dest_fd, offset, size, on_bytes)
+    while offset < size:
+        data = os.pread(src_fd, min(CHUNK_BYTES, size - offset), offset)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dest_fd, view, offset)
+            offset += written
+            view = view[written:]
+        if on_bytes is not None:
+            on_bytes(len(data))
+    return offset
+
+
+def copy_file(src: Path, dest: Path, on_bytes: ByteCallback | None = None) -> int:
+    """Copy one file and its metadata, reporting bytes as they are copied.
+
+    Returns:
+        Number of bytes copied
+
+    Raises:
+        OSError: If the source cannot be read or the destination written
+    """
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        size = os.fstat(src_fd).st_size
+        dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            preallocate(dest_fd, size)
+            copied = copy_range(src_fd, dest_fd, 0, size, on_bytes)
+            if copied != size:
+                raise OSError(
+                    errno.EIO, f"Source changed during copy ({copied}/{size} bytes)"
+                )
+        finally:
+            os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dest)
+    return copied
+
+
+def on_same_device(src: Path, dest_dir: Path) -> bool:
+    """Whether copying from ``src`` into ``dest_dir`` stays on one device."""
+    try:
+        return src.stat().st_dev == dest_dir.stat().st_dev
+    except OSError:
+        return True
+
+
+def copy_files(
+    pairs: Sequence[FilePair],
+    on_bytes: ByteCallback | None = None,
+    workers: int = 1,
+    copy: Callable[[Path, Path, ByteCallback | None], int] | None = None,
+) -> None:
+    """Copy ``(src, dest)`` pairs, up to ``workers`` at a time.
+
+    ``copy`` replaces ``copy_file`` for each pair.
+
+    Raises:
+        OSError: The first copy failure; remaining copies are not started
+    """
+    copy = copy or copy_file
+    if workers <= 1 or len(pairs) <= 1:
+        for src, dest in pairs:
+            copy(src, dest, on_bytes)
+        return
+    failed = threading.Event()
+
+    def copy_one(pair: FilePair) -> None:
+        if failed.is_set():
+            return
+        try:
+            copy(pair[0], pair[1], on_bytes)
+        except BaseException:
+            failed.set()
+            raise
+
+    with ThreadPoolExecutor(
+        max_workers=min(workers, len(pairs)), thread_name_prefix="transfer"
+    ) as pool:
+        futures = [pool.submit(copy_one, pair) for pair in pairs]
+    for future in futures:
+        future.result()
+
+
+def volume_workers(src: Path, dest_dir: Path) -> int:
+    """Number of files of one image to copy concurrently."""
+    if on_same_device(src, dest_dir):
+        return 1
+    return PARALLEL_VOLUME_WORKERS
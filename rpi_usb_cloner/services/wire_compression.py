@@ -0,0 +1,162 @@
+"""Optional compression of peer upload streams.
+
+The sender offers the codecs it supports when a transfer is initialized and
+the receiver answers with the one it accepts, or none. Only zlib's deflate
+is offered, since it ships with Python on both ends.
+
+Whether to compress, and how hard, is decided for each uploaded byte range
+from a sample of its data: every candidate level is timed on the sample and
+the one giving the highest effective transfer rate wins, where the rate of
+a level is the slower of its compression speed and the measured link speed
+divided by its compression ratio. On a fast link, or for data that does not
+shrink, the range is sent as is. Files that are compressed already, such as
+Clonezilla ``.gz``/``.zst`` volumes, are never sampled.
+
+Compression only changes the bytes on the wire. Block digests are always of
+the uncompressed data, so resumable uploads verify the decompressed result.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import zlib
+from typing import Any, Iterable
+
+
+CODECS = ("deflate",)
+LEVELS = (1, 3, 6)
+SAMPLE_BYTES = 1024 * 1024
+# Compress only when the sample shrinks by at least this fraction
+MIN_SAVING = 0.1
+# Assumed until something has been sent: about 40 Mbit/s, typical Wi-Fi Direct
+DEFAULT_LINK_BYTES_PER_SECOND = 5 * 1024 * 1024
+MIN_MEASURE_SECONDS = 1.0
+# Most decompressed bytes produced per step, so a small upload of zeros
+# cannot expand into a huge buffer on the receiver
+DECODE_CHUNK_BYTES = 4 * 1024 * 1024
+
+PRECOMPRESSED_EXTENSIONS = frozenset(
+    {"gz", "zst", "xz", "bz2", "lz4", "lzo", "lzma", "lzip", "zip", "7z"}
+)
+
+
+def negotiate(offered: Iterable[str]) -> str | None:
+    """Pick the first offered codec this device supports."""
+    for codec in offered:
+        if codec in CODECS:
+            return codec
+    return None
+
+
+def is_precompressed(name: str) -> bool:
+    """Whether a file name marks compressed data.
+
+    Clonezilla puts the compressor before the split suffix, as in
+    ``sda1.ext4-ptcl-img.gz.aa``, so every extension is checked.
+    """
+    return any(
+        extension in PRECOMPRESSED_EXTENSIONS
+        for extension in name.lower().split(".")[1:]
+    )
+
+
+def compressor(codec: str, level: int) -> Any:
+    """Streaming compressor with ``compress()`` and ``flush()``."""
+    if codec != "deflate":
+        raise ValueError(f"Unsupported codec: {codec}")
+    return zlib.compressobj(level)
+
+
+def choose_level(
+    codec: str, sample: bytes, link_bytes_per_second: float, workers: int = 1
+) -> int | None:
+    """Compression level giving the fastest transfer of data like ``sample``.
+
+    Args:
+        codec: Negotiated codec
+        sample: Data from the start of what is about to be sent
+        link_bytes_per_second: Measured upload throughput on the wire
+        workers: Streams compressing at the same time, each on its own core
+
+    Returns:
+        Level to use, or None to send uncompressed
+    """
+    if codec not in CODECS or not sample:
+        return None
+    best_level = None
+    best_rate = link_bytes_per_second
+    for level in LEVELS:
+        encoder = compressor(codec, level)
+        start = time.perf_counter()
+        compressed = len(encoder.compress(sample)) + len(encoder.flush())
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        ratio = compressed / len(sample)
+        if ratio > 1 - MIN_SAVING:
+            # Higher levels will not make incompressible data worth it either
+            break
+        rate = min(len(sample) / elapsed * workers, link_bytes_per_second / ratio)
+        if rate > best_rate:
+            best_level, best_rate = level, rate
+    return best_level
+
+
+class LinkMeter:
+    """Upload throughput, measured as bytes on the wire per second.
+
+    Counts from all streams of a transfer, so the rate is that of the link
+    rather than of one connection.
+    """
+
+    def __init__(self, initial: float | None = None) -> None:
+        self._initial = DEFAULT_LINK_BYTES_PER_SECOND if initial is None else initial
+        self._bytes = 0
+        self._started: float | None = None
+        self._lock = threading.Lock()
+
+    def add(self, wire_bytes: int) -> None:
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            self._bytes += wire_bytes
+
+    @property
+    def bytes_per_second(self) -> float:
+        with self._lock:
+            if self._started is None:
+                return self._initial
+            elapsed = time.monotonic() - self._started
+            if elapsed < MIN_MEASURE_SECONDS:
+                return self._initial
+            return self._bytes / elapsed
+
+
+class DecodingWriter:
+    """Decompress a stream before handing it to another writer."""
+
+    def __init__(self, writer: Any, codec: str) -> None:
+        if codec != "deflate":
+            raise ValueError(f"Unsupported codec: {codec}")
+        self._writer = writer
+        self._decoder = zlib.decompressobj()
+
+    def write(self, data: bytes) -> None:
+        while data:
+            output = self._decoder.decompress(data, DECODE_CHUNK_BYTES)
+            if output:
+                self._writer.write(output)
+            data = self._decoder.unconsumed_tail
+
+    def close(self) -> None:
+        """Write what is left in the decoder and close the writer.
+
+        A stream cut short leaves its last blocks incomplete, so they are
+        not journaled and are sent again.
+        """
+        try:
+            if not self._decoder.eof:
+                output = self._decoder.flush()
+                if output:
+                    self._writer.write(output)
+        finally:
+            self._writer.close()
@@ -0,0 +1,138 @@
+"""Persistent block digest index for image repos.
+
+Peer transfers describe each file by the SHA-256 of every 4 MiB block, so
+the receiver can tell which files, and which blocks of other files, it
+already holds. Hashing a repo is slow, so the digests are kept in a JSON
+sidecar on the repo (``.rpi-usb-cloner-block-index.json``) together with
+each file's inode, size and mtime, and a file is only hashed again when
+those change. As in the size index, files modified within the last couple
+of seconds are not stored since they may still be being written; digests
+of files whose content is known exactly, such as a verified upload, are
+recorded directly.
+
+The index also answers where a block with a given digest can be found, so
+a receiver can copy it locally instead of having it sent.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Any, List
+
+from rpi_usb_cloner.storage.sidecar_index import (
+    IndexRegistry,
+    SidecarIndex,
+    is_settled,
+)
+
+
+BLOCK_INDEX_FILENAME = ".rpi-usb-cloner-block-index.json"
+BLOCK_INDEX_VERSION = 1
+
+# [inode, size, mtime_ns]
+Stamp = List[int]
+
+
+def _file_stamp(path: Path) -> Stamp:
+    stat = path.stat()
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def hash_blocks(path: Path, block_bytes: int) -> list[str]:
+    """SHA-256 of each ``block_bytes`` block of a file, the last one short."""
+    digests = []
+    with path.open("rb") as f:
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            digests.append(hashlib.sha256(block).hexdigest())
+    return digests
+
+
+class BlockIndex(SidecarIndex):
+    """Block digests of the files in one repo, re-hashed only when they change."""
+
+    FILENAME = BLOCK_INDEX_FILENAME
+    VERSION = BLOCK_INDEX_VERSION
+    DESCRIPTION = "block index"
+
+    def __init__(self, repo_root: Path, *, persist: bool = True) -> None:
+        self._locations: dict[tuple[str, int], tuple[str, int]] | None = None
+        super().__init__(repo_root, persist=persist)
+
+    def file_blocks(self, path: Path, block_bytes: int) -> list[str]:
+        """Return the block digests of a file, hashing it only if it changed.
+
+        Raises:
+            OSError: If the file cannot be read
+        """
+        key = self._key(path)
+        stamp = _file_stamp(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry.get("stamp") == stamp
+                and entry.get("block_bytes") == block_bytes
+            ):
+                return list(entry["blocks"])
+        blocks = hash_blocks(path, block_bytes)
+        if is_settled(stamp[2]):
+            self._store(key, stamp, block_bytes, blocks)
+        return blocks
+
+    def record(self, path: Path, block_bytes: int, blocks: list[str]) -> None:
+        """Store digests already known for a file, such as a verified upload."""
+        try:
+            stamp = _file_stamp(path)
+        except OSError:
+            return
+        self._store(self._key(path), stamp, block_bytes, list(blocks))
+
+    def locate(self, block_digest: str, block_bytes: int) -> tuple[Path, int] | None:
+        """Return a file and offset holding a block with this digest, if any.
+
+        The location may be stale; callers check the data they read.
+        """
+        with self._lock:
+            if self._locations is None:
+                self._locations = {}
+                for key, entry in self._entries.items():
+                    size = entry["block_bytes"]
+                    for index, digest in enumerate(entry["blocks"]):
+                        self._locations.setdefault((digest, size), (key, index))
+            location = self._locations.get((block_digest, block_bytes))
+        if location is None:
+            return None
+        key, index = location
+        return self.repo_root / key, index * block_bytes
+
+    def _store(
+        self, key: str, stamp: Stamp, block_bytes: int, blocks: list[str]
+    ) -> None:
+        self._put(key, {"stamp": stamp, "block_bytes": block_bytes, "blocks": blocks})
+
+    def _entries_changed(self) -> None:
+        self._locations = None
+
+    def _valid_entry(self, entry: dict[str, Any]) -> bool:
+        return (
+            isinstance(entry.get("stamp"), list)
+            and isinstance(entry.get("block_bytes"), int)
+            and isinstance(entry.get("blocks"), list)
+        )
+
+
+_indexes: IndexRegistry[BlockIndex] = IndexRegistry(BlockIndex)
+
+
+def get_block_index(repo_root: Path, *, persist: bool = True) -> BlockIndex:
+    """Return the shared block index for a repo, loading its sidecar once."""
+    return _indexes.get(repo_root, persist=persist)
+
+
+def clear_block_indexes() -> None:
+    """Forget all loaded indexes; sidecars are re-read on next use."""
+    _indexes.clear()
@@ -10,6 +10,8 @@ Main Functions:
     - copy_partition_table(): Copy partition table between devices
     - verify_clone(): SHA256 verification
     - erase_device(): Quick or full disk erasure
+    - erase_devices(): Erase several drives concurrently
+    - write_stream_to_device(): In-process block writer with zero-block offload
 
 Helper Functions:
     - get_partition_display_name(): Get friendly partition name
@@ -28,7 +30,7 @@ from .command_runners import (
     run_checked_with_streaming_progress,
     run_progress_command,
 )
-from .erase import erase_device
+from .erase import erase_device, erase_devices
 from .models import (
     format_filesystem_type,
     get_partition_display_name,
@@ -49,6 +51,7 @@ from .progress import (
     format_progress_display,
     format_progress_lines,
 )
+from .stream_writer import write_stream_to_device
 from .verification import compute_sha256, verify_clone, verify_clone_device
 
 
@@ -61,6 +64,8 @@ __all__ = [
     "clone_partclone",
     "copy_partition_table",
     "erase_device",
+    "erase_devices",
+    "write_stream_to_device",
     # Verification
     "verify_clone",
     "verify_clone_device",
@@ -0,0 +1,416 @@
+"""Allocated-block-only copy for FAT, exFAT and ext2/3/4 partitions.
+
+When no ``partclone.<fs>`` tool is installed, smart clones used to fall back to
+a full-partition ``dd``. For the common filesystems on removable media the
+allocation map is simple enough to read directly:
+
+- FAT12/16/32: reserved area, FATs and root directory, plus every cluster with
+  a non-zero FAT entry
+- exFAT: boot region and FAT, plus every cluster set in the allocation bitmap
+- ext2/3/4: every block set in the per-group block bitmaps (groups whose bitmap
+  is not initialised are copied whole)
+
+Only those byte ranges are copied. Gaps are zeroed on the target with
+``BLKZEROOUT`` when the device offloads it and otherwise left untouched, which
+is what ``partclone`` does for unused blocks as well.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import time
+from typing import Callable, Tuple
+
+from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.ui.display import display_lines
+
+from .progress import format_eta, format_progress_display
+from .stream_writer import get_write_zeroes_max_bytes, zero_out_range
+
+
+log = LoggerFactory.for_clone()
+
+FAT_FSTYPES = {"vfat", "fat", "fat12", "fat16", "fat32", "msdos"}
+EXFAT_FSTYPES = {"exfat"}
+EXT_FSTYPES = {"ext2", "ext3", "ext4"}
+
+COPY_CHUNK_BYTES = 4 * 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+EXT_SUPERBLOCK_OFFSET = 1024
+EXT_MAGIC = 0xEF53
+EXT_INCOMPAT_64BIT = 0x80
+# Features that leave the block bitmaps and the group descriptor table as
+# plain per-block bitmaps right after the superblock. Anything else, such
+# as bigalloc (bitmaps of clusters) or meta_bg (scattered descriptors), is
+# copied whole instead.
+EXT_SUPPORTED_INCOMPAT = (
+    0x0002  # filetype
+    | 0x0004  # recover
+    | 0x0040  # extents
+    | EXT_INCOMPAT_64BIT
+    | 0x0100  # mmp
+    | 0x0200  # flex_bg
+    | 0x0400  # ea_inode
+    | 0x1000  # dirdata
+    | 0x2000  # csum_seed
+    | 0x4000  # largedir
+    | 0x8000  # inline_data
+    | 0x10000  # encrypt
+    | 0x20000  # casefold
+)
+EXT_SUPPORTED_RO_COMPAT = (
+    0x0001  # sparse_super
+    | 0x0002  # large_file
+    | 0x0004  # btree_dir
+    | 0x0008  # huge_file
+    | 0x0010  # gdt_csum
+    | 0x0020  # dir_nlink
+    | 0x0040  # extra_isize
+    | 0x0100  # quota
+    | 0x0400  # metadata_csum
+    | 0x1000  # readonly
+    | 0x2000  # project
+    | 0x8000  # verity
+    | 0x10000  # orphan_present
+)
+EXT_BG_BLOCK_UNINIT = 0x0002
+
+Range = Tuple[int, int]
+
+
+def _pread_exact(fd: int, length: int, offset: int) -> bytes:
+    data = os.pread(fd, length, offset)
+    if len(data) != length:
+        raise ValueError(f"short read at {offset}")
+    return data
+
+
+def _merge_ranges(ranges: list[Range]) -> list[Range]:
+    """Sort and merge (offset, length) ranges, joining adjacent ones."""
+    merged: list[Range] = []
+    for offset, length in sorted(r for r in ranges if r[1] > 0):
+        if merged and offset <= merged[-1][0] + merged[-1][1]:
+            start, current = merged[-1]
+            merged[-1] = (start, max(current, offset + length - start))
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+def _runs_from_flags(flags, base: int, unit: int) -> list[Range]:
+    """Turn an iterable of per-unit allocation flags into byte ranges."""
+    ranges: list[Range] = []
+    run_start = None
+    index = -1
+    for index, used in enumerate(flags):
+        if used and run_start is None:
+            run_start = index
+        elif not used and run_start is not None:
+            ranges.append((base + run_start * unit, (index - run_start) * unit))
+            run_start = None
+    if run_start is not None:
+        ranges.append((base + run_start * unit, (index + 1 - run_start) * unit))
+    return ranges
+
+
+def _bitmap_flags(bitmap: bytes, count: int):
+    """Yield allocation flags from an LSB-first bitmap."""
+    for index in range(count):
+        yield bitmap[index >> 3] >> (index & 7) & 1
+
+
+def _fat_ranges(fd: int) -> list[Range]:
+    boot = _pread_exact(fd, 512, 0)
+    if boot[510:512] != b"\x55\xaa":
+        raise ValueError("missing FAT boot signature")
+    (
+        bytes_per_sector,
+        sectors_per_cluster,
+        reserved,
+        num_fats,
+        root_entries,
+        total16,
+    ) = struct.unpack_from("<HBHBHH", boot, 11)
+    fat_size16 = struct.unpack_from("<H", boot, 22)[0]
+    total32, fat_size32 = struct.unpack_from("<II", boot, 32)
+    if bytes_per_sector not in (512, 1024, 2048, 4096) or not sectors_per_cluster:
+        raise ValueError("invalid FAT BPB")
+    fat_sectors = fat_size16 or fat_size32
+    total_sectors = total16 or total32
+    root_sectors = (root_entries * 32 + bytes_per_sector - 1) // bytes_per_sector
+    data_start = reserved + num_fats * fat_sectors + root_sectors
+    cluster_count = (total_sectors - data_start) // sectors_per_cluster
+    if fat_sectors == 0 or cluster_count <= 0:
+        raise ValueError("invalid FAT geometry")
+
+    fat = _pread_exact(fd, fat_sectors * bytes_per_sector, reserved * bytes_per_sector)
+    if cluster_count < 4085:
+
+        def entry(cluster: int) -> int:
+            value = struct.unpack_from("<H", fat, cluster * 3 // 2)[0]
+            return value >> 4 if cluster & 1 else value & 0x0FFF
+
+    elif cluster_count < 65525:
+
+        def entry(cluster: int) -> int:
+            return struct.unpack_from("<H", fat, cluster * 2)[0]
+
+    else:
+
+        def entry(cluster: int) -> int:
+            return struct.unpack_from("<I", fat, cluster * 4)[0] & 0x0FFFFFFF
+
+    cluster_size = sectors_per_cluster * bytes_per_sector
+    data_offset = data_start * bytes_per_sector
+    ranges = [(0, data_offset)]
+    ranges.extend(
+        _runs_from_flags(
+            (entry(cluster) != 0 for cluster in range(2, cluster_count + 2)),
+            data_offset,
+            cluster_size,
+        )
+    )
+    return ranges
+
+
+def _exfat_ranges(fd: int) -> list[Range]:
+    boot = _pread_exact(fd, 512, 0)
+    if boot[3:11] != b"EXFAT   ":
+        raise ValueError("missing exFAT signature")
+    fat_offset, fat_length, heap_offset, cluster_count, root_cluster = (
+        struct.unpack_from("<IIIII", boot, 80)
+    )
+    sector_shift, cluster_shift = boot[108], boot[109]
+    sector_size = 1 << sector_shift
+    cluster_size = sector_size << cluster_shift
+    heap_start = heap_offset * sector_size
+    fat = _pread_exact(fd, fat_length * sector_size, fat_offset * sector_size)
+
+    def cluster_offset(cluster: int) -> int:
+        return heap_start + (cluster - 2) * cluster_size
+
+    def chain(first: int, limit: int) -> list[int]:
+        clusters = []
+        cluster = first
+        while 2 <= cluster < cluster_count + 2 and len(clusters) < limit:
+            clusters.append(cluster)
+            cluster = struct.unpack_from("<I", fat, cluster * 4)[0]
+        return clusters
+
+    bitmap_cluster = bitmap_length = None
+    for cluster in chain(root_cluster, cluster_count):
+        directory = _pread_exact(fd, cluster_size, cluster_offset(cluster))
+        for entry_offset in range(0, cluster_size, 32):
+            entry_type = directory[entry_offset]
+            if entry_type == 0x00:
+                break
+            # First allocation bitmap (TexFAT volumes carry a second one)
+            if entry_type == 0x81 and not directory[entry_offset + 1] & 0x01:
+                bitmap_cluster, bitmap_length = struct.unpack_from(
+                    "<IQ", directory, entry_offset + 20
+                )
+                break
+        if bitmap_cluster is not None:
+            break
+    if bitmap_cluster is None or bitmap_length is None:
+        raise ValueError("exFAT allocation bitmap not found")
+
+    clusters_needed = -(-bitmap_length // cluster_size)
+    bitmap_clusters = chain(bitmap_cluster, clusters_needed)
+    if len(bitmap_clusters) < clusters_needed:
+        # Some formatters leave the bitmap's FAT chain empty; it is contiguous
+        bitmap_clusters = list(range(bitmap_cluster, bitmap_cluster + clusters_needed))
+    bitmap = b"".join(
+        _pread_exact(fd, cluster_size, cluster_offset(cluster))
+        for cluster in bitmap_clusters
+    )[:bitmap_length]
+    if len(bitmap) * 8 < cluster_count:
+        raise ValueError("exFAT allocation bitmap truncated")
+
+    ranges = [(0, heap_start)]
+    ranges.extend(
+        _runs_from_flags(_bitmap_flags(bitmap, cluster_count), heap_start, cluster_size)
+    )
+    return ranges
+
+
+def _ext_ranges(fd: int) -> list[Range]:
+    superblock = _pread_exact(fd, 1024, EXT_SUPERBLOCK_OFFSET)
+    if struct.unpack_from("<H", superblock, 56)[0] != EXT_MAGIC:
+        raise ValueError("missing ext superblock magic")
+    blocks_lo = struct.unpack_from("<I", superblock, 4)[0]
+    first_data_block, log_block_size = struct.unpack_from("<II", superblock, 20)
+    blocks_per_group = struct.unpack_from("<I", superblock, 32)[0]
+    incompat, ro_compat = struct.unpack_from("<II", superblock, 96)
+    if incompat & ~EXT_SUPPORTED_INCOMPAT:
+        raise ValueError(f"unsupported ext incompat features {incompat:#x}")
+    if ro_compat & ~EXT_SUPPORTED_RO_COMPAT:
+        raise ValueError(f"unsupported ext ro_compat features {ro_compat:#x}")
+    block_size = 1024 << log_block_size
+    blocks_count = blocks_lo
+    desc_size = 32
+    if incompat & EXT_INCOMPAT_64BIT:
+        blocks_count |= struct.unpack_from("<I", superblock, 0x150)[0] << 32
+        desc_size = struct.unpack_from("<H", superblock, 0xFE)[0] or 64
+    if not blocks_per_group or blocks_count <= first_data_block:
+        raise ValueError("invalid ext geometry")
+    group_count = -(-(blocks_count - first_data_block) // blocks_per_group)
+    descriptors = _pread_exact(
+        fd, group_count * desc_size, (first_data_block + 1) * block_size
+    )
+
+    # Boot block and primary superblock are always copied
+    ranges: list[Range] = [(0, max(block_size, 2 * EXT_SUPERBLOCK_OFFSET))]
+    for group in range(group_count):
+        desc_offset = group * desc_size
+        bitmap_block = struct.unpack_from("<I", descriptors, desc_offset)[0]
+        if desc_size >= 64:
+            bitmap_block |= (
+                struct.unpack_from("<I", descriptors, desc_offset + 0x20)[0] << 32
+            )
+        flags = struct.unpack_from("<H", descriptors, desc_offset + 0x12)[0]
+        group_start = first_data_block + group * blocks_per_group
+        group_blocks = min(blocks_per_group, blocks_count - group_start)
+        if flags & EXT_BG_BLOCK_UNINIT or not bitmap_block:
+            ranges.append((group_start * block_size, group_blocks * block_size))
+            continue
+        bitmap = _pread_exact(fd, block_size, bitmap_block * block_size)
+        ranges.extend(
+            _runs_from_flags(
+                _bitmap_flags(bitmap, group_blocks),
+                group_start * block_size,
+                block_size,
+            )
+        )
+    return ranges
+
+
+def get_allocated_ranges(device_node: str, fstype: str | None) -> list[Range] | None:
+    """Return the byte ranges of a partition that hold allocated data.
+
+    Args:
+        device_node: Partition device node
+        fstype: Filesystem type as reported by lsblk
+
+    Returns:
+        Sorted, merged (offset, length) ranges, or None if the filesystem is
+        unsupported or its metadata cannot be read
+    """
+    fstype = (fstype or "").lower()
+    if fstype in FAT_FSTYPES:
+        reader = _fat_ranges
+    elif fstype in EXFAT_FSTYPES:
+        reader = _exfat_ranges
+    elif fstype in EXT_FSTYPES:
+        reader = _ext_ranges
+    else:
+        return None
+    try:
+        fd = os.open(device_node, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        log.debug(f"Cannot open {device_node} for allocation map: {error}")
+        return None
+    try:
+        return _merge_ranges(reader(fd))
+    except (OSError, ValueError, IndexError, struct.error) as error:
+        log.warning(
+            f"Unable to read {fstype} allocation map on {device_node}: {error}",
+            device=device_node,
+            fstype=fstype,
+            tags=["clone", "allocated"],
+        )
+        return None
+    finally:
+        os.close(fd)
+
+
+def copy_allocated_ranges(
+    src_node: str,
+    dst_node: str,
+    ranges: list[Range],
+    *,
+    title: str = "CLONING",
+    subtitle: str | None = None,
+    zero_gaps: bool = True,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> int:
+    """Copy only the given byte ranges from one partition to another.
+
+    Returns:
+        Number of bytes copied
+
+    Raises:
+        RuntimeError: If either device cannot be opened or an I/O error occurs
+    """
+
+    def emit_progress(lines: list[str], ratio: float | None = None) -> None:
+        if progress_callback:
+            progress_callback(lines, ratio)
+        else:
+            display_lines(lines)
+
+    total = sum(length for _, length in ranges)
+    copied = 0
+    start_time = time.monotonic()
+    last_emit = 0.0
+
+    def report(force: bool = False) -> None:
+        nonlocal last_emit
+        now = time.monotonic()
+        if not force and now - last_emit < PROGRESS_INTERVAL_SECONDS:
+            return
+        last_emit = now
+        elapsed = now - start_time
+        rate = copied / elapsed if elapsed > 0 and copied else None
+        eta = format_eta((total - copied) / rate) if rate and total else None
+        emit_progress(
+            format_progress_display(
+                title, None, None, copied, total, None, rate, eta, subtitle=subtitle
+            ),
+            ratio=min(1.0, copied / total) if total else None,
+        )
+
+    try:
+        src_fd = os.open(src_node, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {src_node}: {error}") from error
+    try:
+        dst_fd = os.open(dst_node, os.O_WRONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        os.close(src_fd)
+        raise RuntimeError(f"Cannot open {dst_node}: {error}") from error
+
+    offload_zeroes = zero_gaps and get_write_zeroes_max_bytes(dst_node) > 0
+    report(force=True)
+    try:
+        position = 0
+        for offset, length in ranges:
+            if offload_zeroes and offset > position:
+                offload_zeroes = zero_out_range(dst_fd, position, offset - position)
+            end = offset + length
+            while offset < end:
+                chunk = os.pread(src_fd, min(COPY_CHUNK_BYTES, end - offset), offset)
+                if not chunk:
+                    raise RuntimeError(f"Unexpected end of {src_node} at {offset}")
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(dst_fd, view, offset)
+                    view = view[written:]
+                    offset += written
+                    copied += written
+                report()
+            position = end
+        if offload_zeroes:
+            device_end = os.lseek(dst_fd, 0, os.SEEK_END)
+            if device_end > position:
+                zero_out_range(dst_fd, position, device_end - position)
+        os.fsync(dst_fd)
+    except OSError as error:
+        raise RuntimeError(f"Copy {src_node} -> {dst_node} failed: {error}") from error
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    report(force=True)
+    return copied
@@ -0,0 +1,190 @@
+"""Hardware-offloaded erase via ranged block ioctls.
+
+Many USB SSDs (UAS) and recent SD cards can zero or discard a range of
+blocks without the host sending any data. The request queue advertises this
+in sysfs (``discard_max_bytes``, ``write_zeroes_max_bytes`` and
+``discard_zeroes_data``); when it does, erasing is done with ``BLKZEROOUT``,
+``BLKDISCARD`` or ``BLKSECDISCARD`` issued in chunks so progress can still be
+reported. Callers fall back to streaming zeros when offload is unavailable.
+"""
+
+from __future__ import annotations
+
+import errno
+import fcntl
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+from .progress import format_eta, format_progress_display
+from .stream_writer import BLKZEROOUT, SECTOR_SIZE, read_queue_attribute
+
+
+log = LoggerFactory.for_clone()
+
+# Linux block ioctls from <linux/fs.h>: _IO(0x12, 119) and _IO(0x12, 125)
+BLKDISCARD = 0x1277
+BLKSECDISCARD = 0x127D
+
+OFFLOAD_CHUNK_BYTES = 256 * 1024 * 1024
+
+# Errors meaning the device or driver does not implement the request
+_UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL}
+
+OFFLOAD_OPERATIONS = {
+    "zeroout": (BLKZEROOUT, "BLKZEROOUT"),
+    "discard": (BLKDISCARD, "BLKDISCARD"),
+    "secdiscard": (BLKSECDISCARD, "BLKSECDISCARD"),
+}
+
+
+@dataclass(frozen=True)
+class OffloadCapabilities:
+    """Erase offload limits advertised by a device's request queue.
+
+    Each limit is None when the attribute could not be read (for example
+    when sysfs is unavailable), which is distinct from a reported 0.
+    """
+
+    discard_max_bytes: int | None
+    write_zeroes_max_bytes: int | None
+    discard_zeroes_data: bool = False
+
+    @property
+    def known(self) -> bool:
+        return (
+            self.discard_max_bytes is not None
+            or self.write_zeroes_max_bytes is not None
+        )
+
+    @property
+    def can_discard(self) -> bool:
+        return bool(self.discard_max_bytes)
+
+    @property
+    def can_zero_out(self) -> bool:
+        return bool(self.write_zeroes_max_bytes)
+
+
+def _read_int_attribute(device_node: str, attribute: str) -> int | None:
+    value = read_queue_attribute(device_node, attribute)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def probe_offload_capabilities(device_node: str) -> OffloadCapabilities:
+    """Read the erase offload capabilities of a device from sysfs."""
+    capabilities = OffloadCapabilities(
+        discard_max_bytes=_read_int_attribute(device_node, "discard_max_bytes"),
+        write_zeroes_max_bytes=_read_int_attribute(
+            device_node, "write_zeroes_max_bytes"
+        ),
+        discard_zeroes_data=bool(
+            _read_int_attribute(device_node, "discard_zeroes_data")
+        ),
+    )
+    log.debug(
+        f"Offload capabilities for {device_node}: {capabilities}",
+        device=device_node,
+        tags=["erase", "offload"],
+    )
+    return capabilities
+
+
+def offload_erase_range(
+    device_node: str,
+    operation: str,
+    offset: int = 0,
+    length: int | None = None,
+    *,
+    title: str = "ERASING",
+    subtitle: str | None = None,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> bool:
+    """Zero or discard a byte range of a device with block ioctls.
+
+    Args:
+        device_node: Whole-device node (e.g., "/dev/sda")
+        operation: "zeroout", "discard" or "secdiscard"
+        offset: Start of the range in bytes (sector-aligned)
+        length: Length in bytes; defaults to the rest of the device
+        title: Progress title
+        subtitle: Progress subtitle
+        progress_callback: Receives (lines, ratio) progress updates
+
+    Returns:
+        True when the whole range was processed, False when the device
+        rejected the very first request as unsupported (nothing was changed,
+        so the caller may fall back to writing zeros)
+
+    Raises:
+        ValueError: For an unknown operation or unaligned range
+        RuntimeError: If the device cannot be opened or fails part-way
+    """
+    if operation not in OFFLOAD_OPERATIONS:
+        raise ValueError(f"Unknown offload operation: {operation}")
+    request, request_name = OFFLOAD_OPERATIONS[operation]
+    try:
+        fd = os.open(device_node, os.O_WRONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {device_node}: {error}") from error
+    try:
+        if length is None:
+            length = os.lseek(fd, 0, os.SEEK_END) - offset
+        if offset % SECTOR_SIZE or length % SECTOR_SIZE:
+            raise ValueError(f"Unaligned range {offset}+{length}")
+        done = 0
+        start_time = time.monotonic()
+
+        def report() -> None:
+            if not progress_callback:
+                return
+            elapsed = time.monotonic() - start_time
+            rate = done / elapsed if elapsed > 0 and done else None
+            eta = format_eta((length - done) / rate) if rate else None
+            progress_callback(
+                format_progress_display(
+                    title, None, None, done, length, None, rate, eta, subtitle=subtitle
+                ),
+                min(1.0, done / length) if length else 1.0,
+            )
+
+        report()
+        while done < length:
+            chunk = min(OFFLOAD_CHUNK_BYTES, length - done)
+            try:
+                fcntl.ioctl(fd, request, struct.pack("QQ", offset + done, chunk))
+            except OSError as error:
+                if done == 0 and error.errno in _UNSUPPORTED_ERRNOS:
+                    log.info(
+                        f"{request_name} not supported by {device_node}: {error}",
+                        device=device_node,
+                        tags=["erase", "offload"],
+                    )
+                    return False
+                raise RuntimeError(
+                    f"{request_name} failed at {offset + done}: {error}"
+                ) from error
+            done += chunk
+            report()
+        if operation == "zeroout":
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    log.info(
+        f"{request_name} completed on {device_node}",
+        device=device_node,
+        offset=offset,
+        length=length,
+        duration=time.monotonic() - start_time,
+        tags=["erase", "offload"],
+    )
+    return True
@@ -1,9 +1,11 @@
 """Device erasure operations."""
 
 import shutil
+import time
 
 import rpi_usb_cloner.ui.display as display
 from rpi_usb_cloner.app import state as app_state
+from rpi_usb_cloner.config.settings import get_bool
 from rpi_usb_cloner.logging import LoggerFactory
 from rpi_usb_cloner.storage.device_lock import device_operation
 from rpi_usb_cloner.storage.devices import (
@@ -15,12 +17,20 @@ from rpi_usb_cloner.storage.exceptions import (
     DeviceBusyError,
     MountVerificationError,
 )
+from rpi_usb_cloner.storage.parallel_jobs import run_parallel_device_jobs
 from rpi_usb_cloner.storage.validation import (
     validate_device_unmounted,
     validate_erase_operation,
 )
 
+from .block_offload import offload_erase_range, probe_offload_capabilities
 from .command_runners import run_checked_with_streaming_progress
+from .secure_erase import (
+    VERIFY_FULL,
+    VERIFY_SAMPLED,
+    secure_erase_device,
+    verify_discarded_device,
+)
 
 
 # Create logger for erase operations
@@ -37,9 +47,14 @@ def erase_device(target, mode, progress_callback=None):
     Modes:
         quick: Fast erase (wipefs + zero start/end of disk)
         zero: Full zero fill
-        secure: Secure erase with shred
+        secure: Single seeded-pattern pass (optionally followed by zeros) with
+            read-back verification
         discard: TRIM/discard (for SSDs)
 
+    When the device advertises discard or write-zeroes offload in sysfs, the
+    erase is issued as ranged BLKZEROOUT/BLKDISCARD/BLKSECDISCARD ioctls and
+    zeros are only streamed when offload is missing.
+
     Args:
         target: Target device dict
         mode: Erase mode string
@@ -127,26 +142,40 @@ def erase_device(target, mode, progress_callback=None):
                 log.error(f"Erase command failed: {e}")
                 return False
 
-        if mode == "secure":
-            shred_path = shutil.which("shred")
-            if not shred_path:
-                emit_error("no shred tool")
-                log.error("Erase failed: shred not available")
-                return False
-            return run_erase_command(
-                [shred_path, "-v", "-n", "1", "-z", target_node],
-                total_bytes=target.get("size"),
-            )
+        capabilities = probe_offload_capabilities(target_node)
 
-        if mode == "discard":
-            discard_path = shutil.which("blkdiscard")
-            if not discard_path:
-                emit_error("no discard")
-                log.error("Erase failed: blkdiscard not available")
+        def run_offload(operation, offset=0, length=None):
+            """Run an offloaded erase; returns None when the device rejects it."""
+            try:
+                completed = offload_erase_range(
+                    target_node,
+                    operation,
+                    offset,
+                    length,
+                    title="ERASING",
+                    subtitle=subtitle,
+                    progress_callback=progress_callback
+                    or (lambda lines, _ratio: display_lines(lines)),
+                )
+            except (RuntimeError, ValueError) as e:
+                log.error(f"Offloaded erase failed: {e}")
                 return False
-            return run_erase_command([discard_path, target_node])
+            return True if completed else None
 
-        if mode == "zero":
+        def zero_with_offload(offset=0, length=None):
+            """Zero a range without sending data; returns None if unsupported."""
+            if capabilities.can_zero_out:
+                result = run_offload("zeroout", offset, length)
+                if result is not None:
+                    return result
+            if capabilities.can_discard and capabilities.discard_zeroes_data:
+                return run_offload("discard", offset, length)
+            return None
+
+        def zero_fill():
+            result = zero_with_offload()
+            if result is not None:
+                return result
             dd_path = shutil.which("dd")
             if not dd_path:
                 emit_error("no dd tool")
@@ -164,6 +193,75 @@ def erase_device(target, mode, progress_callback=None):
                 total_bytes=target.get("size"),
             )
 
+        if mode == "secure":
+            verify_mode = (
+                VERIFY_FULL
+                if get_bool("secure_erase_full_verify", default=False)
+                else VERIFY_SAMPLED
+            )
+            erase_result = None
+            if capabilities.can_discard:
+                started_at = time.monotonic()
+                result = run_offload("secdiscard")
+                if result is False:
+                    return False
+                if result:
+                    # Same read-back check and audit record as a pattern pass
+                    try:
+                        erase_result = verify_discarded_device(
+                            target_node,
+                            verify=verify_mode,
+                            started_at=started_at,
+                            subtitle=subtitle,
+                            progress_callback=progress_callback
+                            or (lambda lines, _ratio: display_lines(lines)),
+                        )
+                    except (RuntimeError, ValueError) as e:
+                        emit_error("verify failed")
+                        log.error(f"Secure erase verification failed: {e}")
+                        return False
+            try:
+                if erase_result is None:
+                    erase_result = secure_erase_device(
+                        target_node,
+                        zero_pass=get_bool("secure_erase_zero_pass", default=False),
+                        verify=verify_mode,
+                        subtitle=subtitle,
+                        progress_callback=progress_callback
+                        or (lambda lines, _ratio: display_lines(lines)),
+                    )
+            except (RuntimeError, ValueError) as e:
+                emit_error("write failed")
+                log.error(f"Secure erase failed: {e}")
+                return False
+            if not erase_result.verified:
+                emit_error("verify failed")
+                log.error(
+                    f"Secure erase verification failed: {erase_result.mismatches} "
+                    f"of {erase_result.samples_checked} regions not wiped"
+                )
+                return False
+            return True
+
+        if mode == "discard":
+            if capabilities.can_discard:
+                result = run_offload("discard")
+                if result is not None:
+                    return result
+            if capabilities.known and not capabilities.can_discard:
+                # The device reports no discard support; erase with zeros
+                log.info(f"{target_node} does not support discard; zero filling")
+                return zero_fill()
+            discard_path = shutil.which("blkdiscard")
+            if not discard_path:
+                emit_error("no discard")
+                log.error("Erase failed: blkdiscard not available")
+                return False
+            return run_erase_command([discard_path, target_node])
+
+        if mode == "zero":
+            return zero_fill()
+
         if mode != "quick":
             emit_error("unknown mode")
             log.error(f"Erase failed: unknown mode {mode}")
@@ -202,36 +300,52 @@ def erase_device(target, mode, progress_callback=None):
         wipe_mib = coerce_int(
             min(quick_wipe_mib, size_mib) if size_mib else quick_wipe_mib
         )
-        wipe_bytes = wipe_mib * bytes_per_mib
 
-        if not run_erase_command(
-            [
+        def zero_mib(count_mib, seek_mib=0):
+            result = zero_with_offload(
+                seek_mib * bytes_per_mib, count_mib * bytes_per_mib
+            )
+            if result is not None:
+                return result
+            command = [
                 dd_path,
                 "if=/dev/zero",
                 f"of={target_node}",
                 "bs=1M",
-                f"count={wipe_mib}",
-                "status=progress",
-                "conv=fsync",
-            ],
-            total_bytes=wipe_bytes,
-        ):
+                f"count={count_mib}",
+            ]
+            if seek_mib:
+                command.append(f"seek={seek_mib}")
+            command.extend(["status=progress", "conv=fsync"])
+            return run_erase_command(command, total_bytes=count_mib * bytes_per_mib)
+
+        if not zero_mib(wipe_mib):
             return False
 
         if size_mib > wipe_mib:
-            seek_mib = size_mib - wipe_mib
-            return run_erase_command(
-                [
-                    dd_path,
-                    "if=/dev/zero",
-                    f"of={target_node}",
-                    "bs=1M",
-                    f"count={wipe_mib}",
-                    f"seek={seek_mib}",
-                    "status=progress",
-                    "conv=fsync",
-                ],
-                total_bytes=wipe_bytes,
-            )
+            return zero_mib(wipe_mib, seek_mib=size_mib - wipe_mib)
 
         return True
+
+
+def erase_devices(targets, mode, progress_callback=None, max_workers=None):
+    """Erase several devices concurrently.
+
+    Each device goes through ``erase_device`` (and so the full erase safety
+    validation) on its own worker; concurrency is limited per USB root hub.
+
+    Args:
+        targets: Target device dicts
+        mode: Erase mode string (see ``erase_device``)
+        progress_callback: Optional callback(device_name, lines, ratio)
+        max_workers: Optional overall concurrency cap
+
+    Returns:
+        List of DeviceJobResult, one per target in input order
+    """
+    return run_parallel_device_jobs(
+        targets,
+        lambda target, progress: erase_device(target, mode, progress_callback=progress),
+        max_workers=max_workers,
+        progress_callback=progress_callback,
+    )
@@ -2,6 +2,8 @@
 
 import re
 
+from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot
+
 
 def get_partition_display_name(part):
     """Get a friendly display name for a partition.
@@ -80,7 +82,9 @@ def normalize_clone_mode(mode):
 
 
 def resolve_device_node(device):
-    """Convert device name or dict to device node path."""
+    """Convert device name, dict or snapshot to device node path."""
     if isinstance(device, str):
         return device if device.startswith("/dev/") else f"/dev/{device}"
+    if isinstance(device, DeviceSnapshot):
+        return device.node
     return f"/dev/{device.get('name')}"
@@ -3,11 +3,17 @@
 import os
 import shutil
 from pathlib import Path
-from typing import Any, Optional, Union
+from typing import Any, Optional
 
 from rpi_usb_cloner.domain import CloneJob
 from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.storage import transfer_scheduler
 from rpi_usb_cloner.storage.device_lock import device_operation
+from rpi_usb_cloner.storage.device_snapshot import (
+    DeviceRef,
+    DeviceSnapshot,
+    capture_device,
+)
 from rpi_usb_cloner.storage.devices import (
     get_children,
     get_device_by_name,
@@ -16,16 +22,19 @@ from rpi_usb_cloner.storage.devices import (
 )
 from rpi_usb_cloner.storage.exceptions import (
     DeviceBusyError,
+    DeviceNotFoundError,
     InsufficientSpaceError,
     MountVerificationError,
     SourceDestinationSameError,
 )
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
 from rpi_usb_cloner.storage.validation import (
     validate_clone_operation,
     validate_device_unmounted,
 )
 from rpi_usb_cloner.ui.display import display_lines
 
+from .allocated_copy import copy_allocated_ranges, get_allocated_ranges
 from .command_runners import run_checked_command, run_checked_with_streaming_progress
 from .models import (
     format_filesystem_type,
@@ -34,22 +43,44 @@ from .models import (
     normalize_clone_mode,
     resolve_device_node,
 )
+from .partition_span import PartitionSpan, read_partition_span, write_gpt_backup
 
 
 # Create logger for clone operations
 log = LoggerFactory.for_clone()
 
 
-def _get_device_dict(device: Union[str, dict[str, Any]]) -> Optional[dict[str, Any]]:
-    if isinstance(device, dict):
-        return device
+def _get_device_dict(device: DeviceRef) -> Optional[dict[str, Any]]:
+    """Return the device dict for partition mapping.
+
+    Snapshots are used as captured; names and dicts are looked up again.
+    """
+    if isinstance(device, DeviceSnapshot):
+        return device.to_dict()
     device_node = resolve_device_node(device)
-    return get_device_by_name(Path(device_node).name)
+    return get_device_by_name(Path(device_node).name) or (
+        device if isinstance(device, dict) else None
+    )
 
 
-def copy_partition_table(
-    src: Union[str, dict[str, Any]], dst: Union[str, dict[str, Any]]
-) -> None:
+def get_exact_clone_span(
+    source: DeviceRef, source_size: Optional[int] = None
+) -> Optional[PartitionSpan]:
+    """Return the partitioned span of the source when it is worth limiting to.
+
+    Exact clones copy everything up to the last used LBA (plus, for GPT, a
+    rebuilt backup header). Devices without a readable partition table, or
+    whose partitions fill the device, are copied whole.
+    """
+    span = read_partition_span(resolve_device_node(source))
+    if span is None:
+        return None
+    if source_size and span.end_bytes >= int(source_size):
+        return None
+    return span
+
+
+def copy_partition_table(src: DeviceRef, dst: DeviceRef) -> None:
     """Copy partition table from source to destination device."""
     src_node = resolve_device_node(src)
     dst_node = resolve_device_node(dst)
@@ -93,37 +124,47 @@ def copy_partition_table(
 
 
 def clone_dd(
-    src: Union[str, dict[str, Any]],
-    dst: Union[str, dict[str, Any]],
+    src: DeviceRef,
+    dst: DeviceRef,
     total_bytes: Optional[int] = None,
     title: str = "CLONING",
     subtitle: Optional[str] = None,
+    byte_count: Optional[int] = None,
 ) -> None:
-    """Clone a device using dd (raw block-level copy)."""
+    """Clone a device using dd (raw block-level copy).
+
+    Args:
+        byte_count: Copy only the first ``byte_count`` bytes of the source
+    """
     dd_path = shutil.which("dd")
     if not dd_path:
         raise RuntimeError("dd not found")
     src_node = resolve_device_node(src)
     dst_node = resolve_device_node(dst)
+    command = [
+        dd_path,
+        f"if={src_node}",
+        f"of={dst_node}",
+        "bs=4M",
+        "status=progress",
+        "conv=fsync",
+    ]
+    if byte_count:
+        command.extend([f"count={int(byte_count)}", "iflag=count_bytes"])
     run_checked_with_streaming_progress(
-        [
-            dd_path,
-            f"if={src_node}",
-            f"of={dst_node}",
-            "bs=4M",
-            "status=progress",
-            "conv=fsync",
-        ],
+        command,
         total_bytes=total_bytes,
         title=title,
         subtitle=subtitle,
     )
 
 
-def clone_partclone(
-    source: Union[str, dict[str, Any]], target: Union[str, dict[str, Any]]
-) -> None:
-    """Clone a device using partclone (filesystem-aware cloning)."""
+def clone_partclone(source: DeviceRef, target: DeviceRef) -> None:
+    """Clone a device using partclone (filesystem-aware cloning).
+
+    Pass snapshots taken after the target's partition table was written;
+    names and dicts are looked up again.
+    """
     partclone_tools = {
         "ext2": "partclone.ext2",
         "ext3": "partclone.ext3",
@@ -138,14 +179,8 @@ def clone_partclone(
     }
     source_node = resolve_device_node(source)
     target_node = resolve_device_node(target)
-    source_name = Path(source_node).name
-    target_name = Path(target_node).name
-    source_device = get_device_by_name(source_name) or (
-        source if isinstance(source, dict) else None
-    )
-    target_device = get_device_by_name(target_name) or (
-        target if isinstance(target, dict) else None
-    )
+    source_device = _get_device_dict(source)
+    target_device = _get_device_dict(target)
     if not source_device or not target_device:
         clone_dd(
             source_node,
@@ -201,7 +236,26 @@ def clone_partclone(
         info_line = " ".join(info_parts) if info_parts else ""
 
         if not tool_path:
-            # Use raw copy when no partclone tool available
+            # Copy only allocated blocks when the filesystem map can be read,
+            # otherwise fall back to a raw copy of the whole partition
+            ranges = get_allocated_ranges(src_part, fstype)
+            if ranges is not None:
+                log.info(
+                    f"Copying allocated blocks of {src_part} without partclone",
+                    source=src_part,
+                    target=dst_part,
+                    fstype=fstype,
+                    allocated_bytes=sum(length for _, length in ranges),
+                    tags=["clone", "allocated"],
+                )
+                copy_allocated_ranges(
+                    src_part,
+                    dst_part,
+                    ranges,
+                    title=title_line,
+                    subtitle=info_line,
+                )
+                continue
             clone_dd(
                 src_part,
                 dst_part,
@@ -223,15 +277,19 @@ def clone_partclone(
 
 
 def clone_device(
-    source: Union[str, dict[str, Any]],
-    target: Union[str, dict[str, Any]],
+    source: DeviceRef,
+    target: DeviceRef,
     mode: Optional[str] = None,
 ) -> bool:
     """Clone a device using the specified mode.
 
+    Each device is captured once as a ``DeviceSnapshot`` and that snapshot is
+    used for validation, cloning and verification. The target is only re-read
+    after the clone wrote a new partition table to it.
+
     Args:
-        source: Source device dict or path
-        target: Target device dict or path
+        source: Source device snapshot, dict or path
+        target: Target device snapshot, dict or path
         mode: Clone mode ("smart", "exact", "verify")
 
     Returns:
@@ -239,16 +297,26 @@ def clone_device(
     """
     # SAFETY: Validate clone operation before proceeding
     try:
+        source_snapshot = capture_device(source)
+        target_snapshot = capture_device(target)
         # For exact mode, we don't check space since we're doing raw copy
         check_space = (
             mode not in ("exact", None) or os.environ.get("CLONE_MODE") != "exact"
         )
         validate_clone_operation(
-            source,
-            target,
+            source_snapshot,
+            target_snapshot,
             check_space=check_space,
             check_unmounted=False,
         )
+    except DeviceNotFoundError as error:
+        log.error(
+            "Clone aborted: device not found",
+            error=str(error),
+            tags=["clone", "device", "error"],
+        )
+        display_lines(["FAILED", "Device missing"])
+        return False
     except SourceDestinationSameError as error:
         log.error(
             "Clone aborted: source and destination are the same device",
@@ -287,50 +355,80 @@ def clone_device(
         mode = os.environ.get("CLONE_MODE", "smart")
     mode = normalize_clone_mode(mode)
     if mode in ("smart", "verify"):
-        success = clone_device_smart(source, target)
+        success = clone_device_smart(source_snapshot, target_snapshot)
         if not success:
             return False
         if mode == "verify":
             from .verification import verify_clone
 
-            return verify_clone(source, target)
+            # The target now carries the source's partitions
+            cloned_target = target_snapshot.refresh()
+            if cloned_target is None:
+                log.error(
+                    "Verify aborted: target device disappeared after clone",
+                    target=target_snapshot.node,
+                    tags=["clone", "verify", "device", "error"],
+                )
+                display_lines(["FAILED", "Target missing"])
+                return False
+            return verify_clone(source_snapshot, cloned_target)
         return True
-    target_device = _get_device_dict(target)
-    if not target_device:
-        log.error(
-            "Clone aborted: target device not found",
-            target=str(target),
-            tags=["clone", "device", "error"],
-        )
-        display_lines(["FAILED", "Target missing"])
-        return False
 
-    target_name = target_device.get("name", "unknown")
+    target_name = target_snapshot.name
 
-    # Use device operation lock to pause web UI scanning
-    with device_operation(target_name):
-        if not unmount_device(target_device):
+    # Use device operation lock to pause web UI scanning; the scheduler
+    # slows down transfers sharing the drives or their USB bus
+    with device_operation(target_name), transfer_scheduler.job(
+        f"clone {source_snapshot.name} to {target_name}",
+        Priority.INTERACTIVE,
+        devices=[source_snapshot.name, target_name],
+    ):
+        if not unmount_device(target_snapshot.to_dict()):
             log.error(
                 "Clone aborted: failed to unmount target device",
-                target=target_device.get("name"),
+                target=target_name,
                 tags=["clone", "unmount", "error"],
             )
             display_lines(["FAILED", "Unmount target"])
             return False
         try:
-            validate_device_unmounted(target_device)
+            validate_device_unmounted(target_snapshot)
         except (DeviceBusyError, MountVerificationError) as error:
             log.error(
                 "Clone aborted: target still mounted after unmount attempt",
-                target=target_device.get("name"),
+                target=target_name,
                 error=str(error),
                 tags=["clone", "busy", "error"],
             )
             display_lines(["FAILED", "Device busy"])
             return False
         try:
-            total_bytes = source.get("size") if isinstance(source, dict) else None
-            clone_dd(source, target, total_bytes=total_bytes, title="CLONING")
+            total_bytes = source_snapshot.size
+            span = get_exact_clone_span(source_snapshot, total_bytes)
+            if span is None:
+                clone_dd(
+                    source_snapshot,
+                    target_snapshot,
+                    total_bytes=total_bytes,
+                    title="CLONING",
+                )
+            else:
+                log.info(
+                    f"Exact clone limited to partitioned span ({human_size(span.end_bytes)})",
+                    source=source_snapshot.node,
+                    span_bytes=span.end_bytes,
+                    label=span.label,
+                    tags=["clone", "dd", "span"],
+                )
+                clone_dd(
+                    source_snapshot,
+                    target_snapshot,
+                    total_bytes=span.end_bytes,
+                    title="CLONING",
+                    byte_count=span.end_bytes,
+                )
+                if span.label == "gpt":
+                    write_gpt_backup(target_snapshot.node, sector_size=span.sector_size)
         except RuntimeError as error:
             log.error(
                 "Clone failed during dd operation",
@@ -342,26 +440,34 @@ def clone_device(
         return True
 
 
-def clone_device_smart(
-    source: Union[str, dict[str, Any]], target: Union[str, dict[str, Any]]
-) -> bool:
+def clone_device_smart(source: DeviceRef, target: DeviceRef) -> bool:
     """Clone a device using smart mode (partition-aware).
 
     Args:
-        source: Source device dict
-        target: Target device dict
+        source: Source device snapshot, dict or path
+        target: Target device snapshot, dict or path
 
     Returns:
         True if successful, False otherwise
     """
     # SAFETY: Validate clone operation before proceeding
     try:
+        source_snapshot = capture_device(source)
+        target_snapshot = capture_device(target)
         validate_clone_operation(
-            source,
-            target,
+            source_snapshot,
+            target_snapshot,
             check_space=True,
             check_unmounted=False,
         )
+    except DeviceNotFoundError as error:
+        log.error(
+            "Smart clone aborted: source or target device not found",
+            error=str(error),
+            tags=["clone", "smart", "device", "error"],
+        )
+        display_lines(["FAILED", "Device missing"])
+        return False
     except SourceDestinationSameError as error:
         log.error(
             "Smart clone aborted: source and destination are the same",
@@ -396,24 +502,18 @@ def clone_device_smart(
         display_lines(["FAILED", "Validation"])
         return False
 
-    source_device = _get_device_dict(source)
-    target_device = _get_device_dict(target)
-    if not source_device or not target_device:
-        log.error(
-            "Smart clone aborted: source or target device not found",
-            source=str(source) if not source_device else None,
-            target=str(target) if not target_device else None,
-            tags=["clone", "smart", "device", "error"],
-        )
-        display_lines(["FAILED", "Device missing"])
-        return False
-    source_node = f"/dev/{source_device.get('name')}"
-    target_node = f"/dev/{target_device.get('name')}"
-    target_name = target_device.get("name", "unknown")
-
-    # Use device operation lock to pause web UI scanning
-    with device_operation(target_name):
-        if not unmount_device(target_device):
+    source_node = source_snapshot.node
+    target_node = target_snapshot.node
+    target_name = target_snapshot.name
+
+    # Use device operation lock to pause web UI scanning; the scheduler
+    # slows down transfers sharing the drives or their USB bus
+    with device_operation(target_name), transfer_scheduler.job(
+        f"clone {source_snapshot.name} to {target_name}",
+        Priority.INTERACTIVE,
+        devices=[source_snapshot.name, target_name],
+    ):
+        if not unmount_device(target_snapshot.to_dict()):
             log.error(
                 "Smart clone aborted: failed to unmount target",
                 target=target_node,
@@ -422,7 +522,7 @@ def clone_device_smart(
             display_lines(["FAILED", "Unmount target"])
             return False
         try:
-            validate_device_unmounted(target_device)
+            validate_device_unmounted(target_snapshot)
         except (DeviceBusyError, MountVerificationError) as error:
             log.error(
                 "Smart clone aborted: target still mounted after unmount",
@@ -434,7 +534,7 @@ def clone_device_smart(
             return False
         try:
             display_lines(["CLONING", "Copy table"])
-            copy_partition_table(source, target)
+            copy_partition_table(source_snapshot, target_snapshot)
         except RuntimeError as error:
             log.error(
                 "Partition table copy failed during smart clone",
@@ -445,8 +545,18 @@ def clone_device_smart(
             )
             display_lines(["FAILED", "Partition tbl"])
             return False
+        # Explicit refresh point: the target's partitions were just replaced
+        partitioned_target = target_snapshot.refresh()
+        if partitioned_target is None:
+            log.error(
+                "Smart clone aborted: target disappeared after partitioning",
+                target=target_node,
+                tags=["clone", "smart", "device", "error"],
+            )
+            display_lines(["FAILED", "Target missing"])
+            return False
         try:
-            clone_partclone(source, target)
+            clone_partclone(source_snapshot, partitioned_target)
         except RuntimeError as error:
             log.error(
                 f"Smart clone failed: {source_node} -> {target_node}",
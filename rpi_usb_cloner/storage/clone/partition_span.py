@@ -0,0 +1,251 @@
+"""Partitioned-span detection for exact (raw) clones.
+
+An exact clone only needs the bytes the partition table refers to: the table
+itself and every partition up to the last used LBA. Anything past that is
+unallocated space whose contents nothing reads. For GPT disks the backup header
+and entry array sit in the last sectors of the disk, outside that span, so they
+are rebuilt at the end of the target from the (already copied) primary header.
+
+Both tables are parsed directly from the first sectors of the device, so no
+partitioning tool is required.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+from .stream_writer import read_queue_attribute
+
+
+log = LoggerFactory.for_clone()
+
+DEFAULT_SECTOR_SIZE = 512
+MBR_SIGNATURE = b"\x55\xaa"
+GPT_SIGNATURE = b"EFI PART"
+PROTECTIVE_MBR_TYPE = 0xEE
+# x86 short/near jump opcodes that start a volume boot record
+VBR_JUMP_OPCODES = (0xEB, 0xE9)
+# (offset, filesystem ID) pairs written by mkfs for FAT12/16, FAT32, NTFS and
+# exFAT boot records
+VBR_FILESYSTEM_IDS = (
+    (54, b"FAT"),
+    (82, b"FAT32"),
+    (3, b"NTFS    "),
+    (3, b"EXFAT   "),
+)
+
+# Signature, revision, header size, header CRC32, reserved, current LBA,
+# backup LBA, first usable LBA, last usable LBA, disk GUID, entries LBA,
+# entry count, entry size, entries CRC32.
+_GPT_HEADER = struct.Struct("<8sIIII QQQQ 16s QIII")
+_MBR_ENTRY = struct.Struct("<B3sB3sII")
+
+
+@dataclass(frozen=True)
+class PartitionSpan:
+    """Region of a device described by its partition table."""
+
+    label: str  # "gpt" or "dos"
+    sector_size: int
+    end_lba: int  # exclusive: first sector past the last used one
+
+    @property
+    def end_bytes(self) -> int:
+        return self.end_lba * self.sector_size
+
+
+def get_logical_sector_size(device_node: str) -> int:
+    """Return the device's logical sector size (512 when unknown)."""
+    value = read_queue_attribute(device_node, "logical_block_size")
+    try:
+        size = int(value) if value else 0
+    except ValueError:
+        size = 0
+    return size if size >= DEFAULT_SECTOR_SIZE else DEFAULT_SECTOR_SIZE
+
+
+def _pread_exact(fd: int, length: int, offset: int) -> bytes:
+    data = os.pread(fd, length, offset)
+    if len(data) != length:
+        raise ValueError(f"short read at {offset}")
+    return data
+
+
+def _gpt_header_crc(header: bytes, header_size: int) -> int:
+    zeroed = header[:16] + b"\x00\x00\x00\x00" + header[20:header_size]
+    return zlib.crc32(zeroed) & 0xFFFFFFFF
+
+
+def _entries_sectors(entry_count: int, entry_size: int, sector_size: int) -> int:
+    return -(-(entry_count * entry_size) // sector_size)
+
+
+def _read_gpt_span(fd: int, sector_size: int) -> PartitionSpan | None:
+    header = _pread_exact(fd, sector_size, sector_size)
+    fields = _GPT_HEADER.unpack_from(header)
+    signature, _, header_size = fields[0], fields[1], fields[2]
+    if signature != GPT_SIGNATURE or not 92 <= header_size <= sector_size:
+        return None
+    if _gpt_header_crc(header, header_size) != fields[3]:
+        log.warning("GPT primary header CRC mismatch; copying whole device")
+        return None
+    entries_lba, entry_count, entry_size, entries_crc = fields[10:14]
+    if entry_size < 128 or entry_count > 4096:
+        return None
+    entries = _pread_exact(fd, entry_count * entry_size, entries_lba * sector_size)
+    if zlib.crc32(entries) & 0xFFFFFFFF != entries_crc:
+        log.warning("GPT entry array CRC mismatch; copying whole device")
+        return None
+    end_lba = entries_lba + _entries_sectors(entry_count, entry_size, sector_size)
+    for index in range(entry_count):
+        entry = entries[index * entry_size : (index + 1) * entry_size]
+        if entry[:16] == bytes(16):
+            continue
+        last_lba = struct.unpack_from("<Q", entry, 40)[0]
+        end_lba = max(end_lba, last_lba + 1)
+    return PartitionSpan("gpt", sector_size, end_lba)
+
+
+def _is_volume_boot_record(sector: bytes) -> bool:
+    """Whether sector 0 is a filesystem boot record (an unpartitioned volume).
+
+    Superfloppy FAT, exFAT and NTFS volumes end their boot sector with the
+    same 0x55AA signature as an MBR.
+    """
+    if sector[0] not in VBR_JUMP_OPCODES:
+        return False
+    return any(
+        sector[offset : offset + len(fs_id)] == fs_id
+        for offset, fs_id in VBR_FILESYSTEM_IDS
+    )
+
+
+def _read_mbr_span(mbr: bytes, sector_size: int) -> PartitionSpan | None:
+    # Extended partitions contain their logical partitions, so the four
+    # primary entries are enough to bound the used region.
+    end_lba = 0
+    for index in range(4):
+        status, _, part_type, _, start, count = _MBR_ENTRY.unpack_from(
+            mbr, 446 + index * 16
+        )
+        if part_type == 0 or count == 0:
+            continue
+        if status not in (0x00, 0x80) or start == 0:
+            # Not a partition entry, so not a partition table
+            return None
+        end_lba = max(end_lba, start + count)
+    if end_lba == 0:
+        # An empty table bounds nothing
+        return None
+    return PartitionSpan("dos", sector_size, end_lba)
+
+
+def read_partition_span(
+    device_node: str, sector_size: int | None = None
+) -> PartitionSpan | None:
+    """Work out the span of a device covered by its partition table.
+
+    Args:
+        device_node: Device to inspect (e.g., "/dev/sda")
+        sector_size: Logical sector size; read from sysfs when omitted
+
+    Returns:
+        The partitioned span, or None when the device has no (valid)
+        partition table and must be copied whole
+    """
+    if sector_size is None:
+        sector_size = get_logical_sector_size(device_node)
+    try:
+        fd = os.open(device_node, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        log.debug(f"Cannot open {device_node} for partition span: {error}")
+        return None
+    try:
+        mbr = _pread_exact(fd, DEFAULT_SECTOR_SIZE, 0)
+        if mbr[510:512] != MBR_SIGNATURE or _is_volume_boot_record(mbr):
+            return None
+        part_types = [mbr[446 + index * 16 + 4] for index in range(4)]
+        if PROTECTIVE_MBR_TYPE in part_types:
+            return _read_gpt_span(fd, sector_size)
+        return _read_mbr_span(mbr, sector_size)
+    except (OSError, ValueError, struct.error) as error:
+        log.debug(f"Unable to read partition table on {device_node}: {error}")
+        return None
+    finally:
+        os.close(fd)
+
+
+def write_gpt_backup(target_node: str, sector_size: int | None = None) -> None:
+    """Rebuild the GPT backup header and entries at the end of the target.
+
+    Uses the primary header and entry array already present on the target.
+    The primary header's backup LBA is updated for the target's size, and the
+    last usable LBA is clamped if the target is smaller than the source layout.
+    On a target the same size as the source this reproduces the original
+    backup structures exactly.
+
+    Raises:
+        RuntimeError: If the primary GPT is missing or the target is too small
+    """
+    if sector_size is None:
+        sector_size = get_logical_sector_size(target_node)
+    try:
+        fd = os.open(target_node, os.O_RDWR | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {target_node}: {error}") from error
+    try:
+        last_lba = os.lseek(fd, 0, os.SEEK_END) // sector_size - 1
+        header = _pread_exact(fd, sector_size, sector_size)
+        fields = list(_GPT_HEADER.unpack_from(header))
+        header_size = fields[2]
+        if fields[0] != GPT_SIGNATURE or not 92 <= header_size <= sector_size:
+            raise RuntimeError("Primary GPT header not found on target")
+        entries_lba, entry_count, entry_size = fields[10:13]
+        entries_size = entry_count * entry_size
+        entries = _pread_exact(fd, entries_size, entries_lba * sector_size)
+        backup_entries_lba = last_lba - _entries_sectors(
+            entry_count, entry_size, sector_size
+        )
+        for index in range(entry_count):
+            entry = entries[index * entry_size : (index + 1) * entry_size]
+            if entry[:16] == bytes(16):
+                continue
+            if struct.unpack_from("<Q", entry, 40)[0] >= backup_entries_lba:
+                raise RuntimeError("Target too small for source partitions")
+        last_usable = min(fields[8], backup_entries_lba - 1)
+
+        def build(my_lba: int, alternate_lba: int, table_lba: int) -> bytes:
+            values = list(fields)
+            values[3] = 0
+            values[5] = my_lba
+            values[6] = alternate_lba
+            values[8] = last_usable
+            values[10] = table_lba
+            packed = bytearray(header)
+            _GPT_HEADER.pack_into(packed, 0, *values)
+            crc = _gpt_header_crc(bytes(packed), header_size)
+            struct.pack_into("<I", packed, 16, crc)
+            return bytes(packed)
+
+        primary = build(1, last_lba, entries_lba)
+        backup = build(last_lba, 1, backup_entries_lba)
+        os.pwrite(fd, entries, backup_entries_lba * sector_size)
+        os.pwrite(fd, backup, last_lba * sector_size)
+        if primary != header:
+            os.pwrite(fd, primary, sector_size)
+        os.fsync(fd)
+    except (OSError, ValueError, struct.error) as error:
+        raise RuntimeError(f"GPT backup write failed: {error}") from error
+    finally:
+        os.close(fd)
+    log.info(
+        f"GPT backup header written at LBA {last_lba} on {target_node}",
+        target=target_node,
+        backup_lba=last_lba,
+        tags=["partition", "gpt"],
+    )
@@ -0,0 +1,442 @@
+"""In-process secure erase with a seeded pattern and read-back verification.
+
+``shred -n 1 -z`` writes the whole device twice (a random pass and a zero
+pass) using a slow generator and never checks the result. This engine writes
+a single pass of a seeded pattern in large buffers, optionally followed by a
+zero pass, and then reads the device back to confirm the wipe.
+
+The pattern comes from a random pool twice the block size: block ``i`` is the
+pool window starting at a per-block shift derived from the seed, so every
+block differs and any region can be regenerated for comparison without
+storing anything. Verification either reads every byte or a random sample of
+regions sized so that, if more than ``max_unwritten_fraction`` of the device
+had been skipped, at least one sample would land there with probability
+``confidence``.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import os
+import random
+import secrets
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+from .block_offload import offload_erase_range, probe_offload_capabilities
+from .progress import format_eta, format_progress_display
+
+
+log = LoggerFactory.for_clone()
+
+ERASE_BLOCK_SIZE = 4 * 1024 * 1024
+SAMPLE_SIZE = 4096
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+VERIFY_NONE = "none"
+VERIFY_SAMPLED = "sampled"
+VERIFY_FULL = "full"
+
+_SHIFT_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+class PatternGenerator:
+    """Deterministic, seedable block pattern."""
+
+    def __init__(self, seed: int, block_size: int = ERASE_BLOCK_SIZE) -> None:
+        self.seed = seed
+        self.block_size = block_size
+        pool_bytes = 2 * block_size
+        pool = random.Random(seed).getrandbits(pool_bytes * 8)
+        self._pool = memoryview(pool.to_bytes(pool_bytes, "little"))
+
+    def block(self, index: int) -> memoryview:
+        """Return the pattern for block ``index`` (no copy)."""
+        shift = ((index + 1) * _SHIFT_MULTIPLIER ^ self.seed) % self.block_size
+        return self._pool[shift : shift + self.block_size]
+
+    def expected(self, offset: int, length: int) -> bytes:
+        """Return the pattern bytes for an arbitrary device range."""
+        chunks = []
+        while length > 0:
+            index, start = divmod(offset, self.block_size)
+            count = min(length, self.block_size - start)
+            chunks.append(bytes(self.block(index)[start : start + count]))
+            offset += count
+            length -= count
+        return b"".join(chunks)
+
+
+@dataclass(frozen=True)
+class SecureEraseResult:
+    """Audit record of a secure erase run."""
+
+    device: str
+    size_bytes: int
+    seed: int
+    passes: tuple[str, ...]
+    verify_mode: str
+    bytes_checked: int
+    samples_checked: int
+    mismatches: int
+    first_mismatch_offset: int | None
+    duration_seconds: float
+
+    @property
+    def verified(self) -> bool:
+        return self.verify_mode != VERIFY_NONE and self.mismatches == 0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["passes"] = list(self.passes)
+        data["verified"] = self.verified
+        return data
+
+
+def sample_count(
+    size_bytes: int,
+    *,
+    confidence: float = 0.99,
+    max_unwritten_fraction: float = 0.001,
+    sample_size: int = SAMPLE_SIZE,
+) -> int:
+    """Number of random samples needed to detect an unwritten fraction.
+
+    With ``n`` uniform samples, the chance that all of them miss a region
+    covering a fraction ``p`` of the device is ``(1 - p) ** n``.
+    """
+    regions = max(1, size_bytes // sample_size)
+    if not 0 < max_unwritten_fraction < 1 or not 0 < confidence < 1:
+        return regions
+    needed = math.ceil(math.log(1 - confidence) / math.log(1 - max_unwritten_fraction))
+    return min(regions, needed)
+
+
+class _Progress:
+    def __init__(
+        self,
+        title: str,
+        subtitle: str | None,
+        total: int,
+        callback: Callable[[list[str], float | None], None] | None,
+    ) -> None:
+        self.title = title
+        self.subtitle = subtitle
+        self.total = total
+        self.callback = callback
+        self.start = time.monotonic()
+        self.last_emit = 0.0
+
+    def update(self, done: int, force: bool = False) -> None:
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_emit < PROGRESS_INTERVAL_SECONDS:
+            return
+        self.last_emit = now
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed > 0 and done else None
+        eta = format_eta((self.total - done) / rate) if rate and self.total else None
+        self.callback(
+            format_progress_display(
+                self.title,
+                None,
+                None,
+                done,
+                self.total,
+                None,
+                rate,
+                eta,
+                subtitle=self.subtitle,
+            ),
+            min(1.0, done / self.total) if self.total else None,
+        )
+
+
+def _write_pass(
+    fd: int,
+    size: int,
+    block_for: Callable[[int], memoryview],
+    progress: _Progress,
+    block_size: int,
+) -> None:
+    offset = 0
+    progress.update(0, force=True)
+    while offset < size:
+        data = block_for(offset // block_size)[: min(block_size, size - offset)]
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        progress.update(offset)
+    os.fsync(fd)
+    progress.update(size, force=True)
+
+
+def _drop_cache(fd: int) -> None:
+    fadvise = getattr(os, "posix_fadvise", None)
+    if fadvise is not None:
+        with contextlib.suppress(OSError):
+            fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _is_cleared(data: bytes) -> bool:
+    # Discarded blocks read back as all zeros or, on some flash, all ones
+    return not data.strip(b"\x00") or not data.strip(b"\xff")
+
+
+def _verify_device(
+    fd: int,
+    size: int,
+    matches: Callable[[int, bytes], bool],
+    verify: str,
+    *,
+    confidence: float,
+    max_unwritten_fraction: float,
+    subtitle: str | None,
+    progress_callback: Callable[[list[str], float | None], None] | None,
+) -> dict:
+    """Read back every block or a random sample; return the audit counters."""
+    bytes_checked = samples_checked = mismatches = 0
+    first_mismatch = None
+    if verify != VERIFY_NONE:
+        _drop_cache(fd)
+        if verify == VERIFY_FULL:
+            regions = [
+                (offset, min(ERASE_BLOCK_SIZE, size - offset))
+                for offset in range(0, size, ERASE_BLOCK_SIZE)
+            ]
+        else:
+            count = sample_count(
+                size,
+                confidence=confidence,
+                max_unwritten_fraction=max_unwritten_fraction,
+            )
+            slots = max(1, size // SAMPLE_SIZE)
+            # Always include the first and last regions
+            picks = {0, slots - 1}
+            sampler = secrets.SystemRandom()
+            inner = range(1, max(1, slots - 1))
+            picks.update(
+                sampler.sample(inner, min(len(inner), max(0, count - len(picks))))
+            )
+            regions = [
+                (slot * SAMPLE_SIZE, min(SAMPLE_SIZE, size - slot * SAMPLE_SIZE))
+                for slot in sorted(picks)
+            ]
+        verify_total = sum(length for _, length in regions)
+        progress = _Progress("VERIFYING", subtitle, verify_total, progress_callback)
+        progress.update(0, force=True)
+        for offset, length in regions:
+            data = os.pread(fd, length, offset)
+            samples_checked += 1
+            bytes_checked += len(data)
+            if not matches(offset, data):
+                mismatches += 1
+                if first_mismatch is None:
+                    first_mismatch = offset
+            progress.update(bytes_checked)
+        progress.update(bytes_checked, force=True)
+    return {
+        "bytes_checked": bytes_checked,
+        "samples_checked": samples_checked,
+        "mismatches": mismatches,
+        "first_mismatch_offset": first_mismatch,
+    }
+
+
+def _audit(result: SecureEraseResult) -> SecureEraseResult:
+    verify = result.verify_mode
+    log_method = log.info if result.verified or verify == VERIFY_NONE else log.error
+    log_method(
+        f"Secure erase of {result.device}: "
+        f"{'verified' if result.verified else 'NOT verified'}",
+        tags=["erase", "secure", "audit"],
+        **result.to_dict(),
+    )
+    return result
+
+
+def secure_erase_device(
+    device_node: str,
+    *,
+    zero_pass: bool = False,
+    verify: str = VERIFY_SAMPLED,
+    confidence: float = 0.99,
+    max_unwritten_fraction: float = 0.001,
+    seed: int | None = None,
+    title: str = "ERASING",
+    subtitle: str | None = None,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> SecureEraseResult:
+    """Overwrite a whole device and verify the result by reading it back.
+
+    Args:
+        device_node: Whole-device node (e.g., "/dev/sda")
+        zero_pass: Finish with a zero pass (offloaded with BLKZEROOUT when
+            the device supports it)
+        verify: "sampled", "full" or "none"
+        confidence: Detection probability for sampled verification
+        max_unwritten_fraction: Smallest skipped fraction sampling must detect
+        seed: Pattern seed; a random one is chosen when omitted
+        title: Progress title
+        subtitle: Progress subtitle
+        progress_callback: Receives (lines, ratio) progress updates
+
+    Returns:
+        The audit record; check ``verified`` for the outcome
+
+    Raises:
+        ValueError: For an unknown verify mode
+        RuntimeError: If the device cannot be opened or an I/O error occurs
+    """
+    if verify not in (VERIFY_NONE, VERIFY_SAMPLED, VERIFY_FULL):
+        raise ValueError(f"Unknown verify mode: {verify}")
+    if seed is None:
+        seed = secrets.randbits(64)
+    start_time = time.monotonic()
+    pattern = PatternGenerator(seed, ERASE_BLOCK_SIZE)
+    passes = ["pattern"]
+    try:
+        fd = os.open(device_node, os.O_RDWR | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {device_node}: {error}") from error
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        _write_pass(
+            fd,
+            size,
+            pattern.block,
+            _Progress(
+                f"{title} 1/2" if zero_pass else title,
+                subtitle,
+                size,
+                progress_callback,
+            ),
+            pattern.block_size,
+        )
+        if zero_pass:
+            passes.append("zero")
+            pass_title = f"{title} 2/2"
+            offloaded = False
+            if probe_offload_capabilities(device_node).can_zero_out:
+                offloaded = offload_erase_range(
+                    device_node,
+                    "zeroout",
+                    title=pass_title,
+                    subtitle=subtitle,
+                    progress_callback=progress_callback,
+                )
+            if not offloaded:
+                zeros = memoryview(bytes(ERASE_BLOCK_SIZE))
+                _write_pass(
+                    fd,
+                    size,
+                    lambda _index: zeros,
+                    _Progress(pass_title, subtitle, size, progress_callback),
+                    ERASE_BLOCK_SIZE,
+                )
+
+        def matches(offset: int, data: bytes) -> bool:
+            if zero_pass:
+                return data == bytes(len(data))
+            return data == pattern.expected(offset, len(data))
+
+        checked = _verify_device(
+            fd,
+            size,
+            matches,
+            verify,
+            confidence=confidence,
+            max_unwritten_fraction=max_unwritten_fraction,
+            subtitle=subtitle,
+            progress_callback=progress_callback,
+        )
+    except OSError as error:
+        raise RuntimeError(f"Secure erase of {device_node} failed: {error}") from error
+    finally:
+        os.close(fd)
+
+    return _audit(
+        SecureEraseResult(
+            device=device_node,
+            size_bytes=size,
+            seed=seed,
+            passes=tuple(passes),
+            verify_mode=verify,
+            duration_seconds=round(time.monotonic() - start_time, 3),
+            **checked,
+        )
+    )
+
+
+def verify_discarded_device(
+    device_node: str,
+    *,
+    verify: str = VERIFY_SAMPLED,
+    confidence: float = 0.99,
+    max_unwritten_fraction: float = 0.001,
+    started_at: float | None = None,
+    subtitle: str | None = None,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> SecureEraseResult:
+    """Check a device after BLKSECDISCARD by reading it back.
+
+    Every region read must be cleared (all zeros or all 0xFF). The audit
+    record is logged like that of ``secure_erase_device()``.
+
+    Args:
+        device_node: Whole-device node (e.g., "/dev/sda")
+        verify: "sampled" or "full"
+        confidence: Detection probability for sampled verification
+        max_unwritten_fraction: Smallest uncleared fraction sampling must detect
+        started_at: ``time.monotonic()`` when the discard started, for the
+            audit record's duration
+        subtitle: Progress subtitle
+        progress_callback: Receives (lines, ratio) progress updates
+
+    Returns:
+        The audit record; check ``verified`` for the outcome
+
+    Raises:
+        ValueError: For an unknown verify mode
+        RuntimeError: If the device cannot be opened or read
+    """
+    if verify not in (VERIFY_SAMPLED, VERIFY_FULL):
+        raise ValueError(f"Unknown verify mode: {verify}")
+    start_time = time.monotonic() if started_at is None else started_at
+    try:
+        fd = os.open(device_node, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {device_node}: {error}") from error
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        checked = _verify_device(
+            fd,
+            size,
+            lambda _offset, data: _is_cleared(data),
+            verify,
+            confidence=confidence,
+            max_unwritten_fraction=max_unwritten_fraction,
+            subtitle=subtitle,
+            progress_callback=progress_callback,
+        )
+    except OSError as error:
+        raise RuntimeError(f"Secure erase of {device_node} failed: {error}") from error
+    finally:
+        os.close(fd)
+    return _audit(
+        SecureEraseResult(
+            device=device_node,
+            size_bytes=size,
+            seed=0,
+            passes=("secdiscard",),
+            verify_mode=verify,
+            duration_seconds=round(time.monotonic() - start_time, 3),
+            **checked,
+        )
+    )
@@ -0,0 +1,243 @@
+"""In-process block writer for streaming image data onto a device.
+
+Raw disk images are mostly empty space. The writer reads the incoming stream in
+fixed-size blocks and, when the target advertises write-zeroes offload
+(``/sys/block/<dev>/queue/write_zeroes_max_bytes``), turns runs of all-zero
+blocks into ``BLKZEROOUT`` requests instead of pushing the zeros over USB. The
+result is identical to a plain ``dd`` of the stream; only the transfer cost of
+empty regions changes.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import os
+import struct
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.ui.display import display_lines
+
+from .progress import format_eta, format_progress_display
+
+
+log = LoggerFactory.for_clone()
+
+# Linux block ioctls from <linux/fs.h>: _IO(0x12, 127)
+BLKZEROOUT = 0x127F
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+SECTOR_SIZE = 512
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+
+def read_queue_attribute(device_node: str, attribute: str) -> str | None:
+    """Read a request-queue attribute for a disk or partition from sysfs.
+
+    Partitions do not have their own ``queue`` directory, so the parent disk
+    is consulted when the node is a partition.
+    """
+    # /sys/class/block/<name> links into the device tree; a partition's
+    # directory sits inside its parent disk's directory.
+    block_dir = Path("/sys/class/block") / Path(device_node).name
+    if not block_dir.exists():
+        return None
+    try:
+        resolved = block_dir.resolve()
+    except OSError:
+        return None
+    for queue_dir in (resolved / "queue", resolved.parent / "queue"):
+        candidate = queue_dir / attribute
+        try:
+            if candidate.is_file():
+                return candidate.read_text().strip()
+        except OSError:
+            continue
+    return None
+
+
+def get_write_zeroes_max_bytes(device_node: str) -> int:
+    """Return the device's write-zeroes offload limit (0 when unsupported)."""
+    value = read_queue_attribute(device_node, "write_zeroes_max_bytes")
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
+
+
+def zero_out_range(fd: int, offset: int, length: int) -> bool:
+    """Issue BLKZEROOUT for a sector-aligned byte range.
+
+    Returns:
+        True if the kernel accepted the request, False otherwise
+    """
+    if length <= 0 or offset % SECTOR_SIZE or length % SECTOR_SIZE:
+        return False
+    try:
+        fcntl.ioctl(fd, BLKZEROOUT, struct.pack("QQ", offset, length))
+    except OSError as error:
+        log.debug(f"BLKZEROOUT rejected at {offset}+{length}: {error}")
+        return False
+    return True
+
+
+def _read_full(stream: BinaryIO, buffer: memoryview) -> int:
+    """Fill ``buffer`` from ``stream``; returns fewer bytes only at EOF."""
+    filled = 0
+    size = len(buffer)
+    while filled < size:
+        count = stream.readinto(buffer[filled:])  # type: ignore[attr-defined]
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def _write_all(fd: int, data: memoryview) -> None:
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def write_stream_to_device(
+    stream: BinaryIO,
+    target_node: str,
+    *,
+    total_bytes: int | None = None,
+    title: str = "WRITING",
+    subtitle: str | None = None,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+    skip_zero_blocks: bool = True,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> int:
+    """Write a binary stream to a device node block by block.
+
+    Args:
+        stream: Readable binary stream supporting ``readinto``
+        target_node: Device node (or file) to write to
+        total_bytes: Expected stream length for progress, if known
+        title: Progress title line
+        subtitle: Optional progress subtitle line
+        progress_callback: Optional callback(lines, ratio); falls back to the display
+        skip_zero_blocks: Offload all-zero blocks to BLKZEROOUT when supported
+        block_size: Read/write block size in bytes (multiple of 512)
+
+    Returns:
+        Number of stream bytes written to the target
+
+    Raises:
+        RuntimeError: If the target cannot be opened or written
+    """
+    if block_size <= 0 or block_size % SECTOR_SIZE:
+        raise ValueError("block_size must be a positive multiple of 512")
+
+    def emit_progress(lines: list[str], ratio: float | None = None) -> None:
+        if progress_callback:
+            progress_callback(lines, ratio)
+        else:
+            display_lines(lines)
+
+    offload = skip_zero_blocks and get_write_zeroes_max_bytes(target_node) > 0
+    zero_block = bytes(block_size)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+
+    written = 0
+    offloaded = 0
+    pending_zero_start: int | None = None
+    start_time = time.monotonic()
+    last_emit = 0.0
+
+    def report(force: bool = False) -> None:
+        nonlocal last_emit
+        now = time.monotonic()
+        if not force and now - last_emit < PROGRESS_INTERVAL_SECONDS:
+            return
+        last_emit = now
+        elapsed = now - start_time
+        rate = written / elapsed if elapsed > 0 and written else None
+        eta = None
+        if rate and total_bytes and written <= total_bytes:
+            eta = format_eta((total_bytes - written) / rate)
+        ratio = None
+        if total_bytes:
+            ratio = max(0.0, min(1.0, written / total_bytes))
+        emit_progress(
+            format_progress_display(
+                title,
+                None,
+                None,
+                written,
+                total_bytes,
+                None,
+                rate,
+                eta,
+                subtitle=subtitle,
+            ),
+            ratio=ratio,
+        )
+
+    try:
+        fd = os.open(target_node, os.O_WRONLY | getattr(os, "O_CLOEXEC", 0))
+    except OSError as error:
+        raise RuntimeError(f"Cannot open {target_node}: {error}") from error
+
+    def flush_zero_run(end: int) -> None:
+        nonlocal pending_zero_start, offload, offloaded
+        if pending_zero_start is None:
+            return
+        start = pending_zero_start
+        pending_zero_start = None
+        length = end - start
+        if offload and zero_out_range(fd, start, length):
+            offloaded += length
+            return
+        # Offload refused: stop trying and write the zeros ourselves.
+        offload = False
+        os.lseek(fd, start, os.SEEK_SET)
+        remaining = length
+        while remaining:
+            chunk = min(remaining, block_size)
+            _write_all(fd, memoryview(zero_block)[:chunk])
+            remaining -= chunk
+
+    report(force=True)
+    try:
+        while True:
+            count = _read_full(stream, view)
+            if not count:
+                break
+            chunk = view[:count]
+            is_zero = (
+                offload and count % SECTOR_SIZE == 0 and chunk == zero_block[:count]
+            )
+            if is_zero:
+                if pending_zero_start is None:
+                    pending_zero_start = written
+            else:
+                flush_zero_run(written)
+                os.lseek(fd, written, os.SEEK_SET)
+                _write_all(fd, chunk)
+            written += count
+            report()
+            if count < block_size:
+                break
+        flush_zero_run(written)
+        os.fsync(fd)
+    except OSError as error:
+        raise RuntimeError(f"Write to {target_node} failed: {error}") from error
+    finally:
+        os.close(fd)
+
+    if offloaded:
+        log.debug(
+            f"Offloaded {offloaded} zero bytes to BLKZEROOUT on {target_node}",
+            target=target_node,
+            offloaded_bytes=offloaded,
+            tags=["write", "zeroout"],
+        )
+    report(force=True)
+    emit_progress([title, "Complete"], ratio=1.0)
+    return written
@@ -8,10 +8,12 @@ from pathlib import Path
 from typing import Any, Optional, Union
 
 from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.storage.device_snapshot import DeviceRef, DeviceSnapshot
 from rpi_usb_cloner.storage.devices import get_children, get_device_by_name, human_size
 from rpi_usb_cloner.ui.display import display_lines
 
 from .models import get_partition_number, resolve_device_node
+from .partition_span import read_partition_span
 
 
 log = get_logger(source=__name__, tags=["verify"])
@@ -85,31 +87,31 @@ def compute_sha256(
     return checksum
 
 
-def verify_clone(
-    source: Union[str, dict[str, Any]], target: Union[str, dict[str, Any]]
-) -> bool:
+def _lookup_device(device: DeviceRef) -> Optional[dict[str, Any]]:
+    if isinstance(device, DeviceSnapshot):
+        return device.to_dict()
+    name = Path(resolve_device_node(device)).name
+    return get_device_by_name(name) or (device if isinstance(device, dict) else None)
+
+
+def verify_clone(source: DeviceRef, target: DeviceRef) -> bool:
     """Verify that target matches source using SHA256 checksums.
 
     Verifies each partition individually for partition-based clones,
     or the entire device for raw clones.
 
     Args:
-        source: Source device dict or path
-        target: Target device dict or path
+        source: Source device snapshot, dict or path
+        target: Target device snapshot, dict or path (snapshots should be
+            taken after the clone)
 
     Returns:
         True if verification succeeds, False otherwise
     """
     source_node = resolve_device_node(source)
     target_node = resolve_device_node(target)
-    source_name = Path(source_node).name
-    target_name = Path(target_node).name
-    source_device = get_device_by_name(source_name) or (
-        source if isinstance(source, dict) else None
-    )
-    target_device = get_device_by_name(target_name) or (
-        target if isinstance(target, dict) else None
-    )
+    source_device = _lookup_device(source)
+    target_device = _lookup_device(target)
     if not source_device or not target_device:
         return verify_clone_device(
             source_node,
@@ -178,6 +180,9 @@ def verify_clone_device(
 ) -> bool:
     """Verify entire device using SHA256 checksums.
 
+    When the source has a partition table, only the span it covers is
+    compared, matching what an exact clone copies.
+
     Args:
         source_node: Source device node path
         target_node: Target device node path
@@ -186,6 +191,9 @@ def verify_clone_device(
     Returns:
         True if verification succeeds, False otherwise
     """
+    span = read_partition_span(source_node)
+    if span is not None and (not total_bytes or span.end_bytes < int(total_bytes)):
+        total_bytes = span.end_bytes
     log.info(f"Verifying {source_node} -> {target_node}")
     try:
         src_hash = compute_sha256(
@@ -18,6 +18,8 @@ Main Functions:
     - restore_image(): Restore image (legacy API)
     - restore_clonezilla_image(): Restore image with full partition mode support
     - verify_restored_image(): Verify restoration with SHA256
+    - read_partclone_header(): Read used/filesystem size from a partclone image
+    - restore_partclone_image(): Restore a partclone image without partclone
 
 Data Models:
     - ClonezillaImage: Image metadata
@@ -46,6 +48,11 @@ from .image_discovery import (
     parse_clonezilla_image,
 )
 from .models import ClonezillaImage, DiskLayoutOp, PartitionRestoreOp, RestorePlan
+from .partclone_image import (
+    PartcloneHeader,
+    read_partclone_header,
+    restore_partclone_image,
+)
 from .restore import restore_clonezilla_image, restore_image
 from .verification import verify_restored_image
 
@@ -64,6 +71,8 @@ __all__ = [
     "restore_image",
     "restore_clonezilla_image",
     "verify_restored_image",
+    "read_partclone_header",
+    "restore_partclone_image",
     # Helper functions
     "find_partition_table",
     "get_mountpoint",
@@ -75,4 +84,5 @@ __all__ = [
     "RestorePlan",
     "BackupResult",
     "PartitionInfo",
+    "PartcloneHeader",
 ]
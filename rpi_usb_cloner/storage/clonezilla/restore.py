@@ -10,7 +10,7 @@ from pathlib import Path
 from typing import Callable, Iterable, TypedDict
 
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.storage import clone, devices
+from rpi_usb_cloner.storage import clone, devices, remote_repo
 from rpi_usb_cloner.storage.clone import (
     format_filesystem_type,
     get_partition_display_name,
@@ -22,6 +22,7 @@ from .compression import get_compression_type
 from .file_utils import sorted_clonezilla_volumes
 from .image_discovery import get_partclone_tool
 from .models import ClonezillaImage, PartitionRestoreOp, RestorePlan
+from .partclone_image import read_partclone_header, restore_partclone_image
 from .partition_table import (
     apply_disk_layout_op,
     build_partition_mode_layout_ops,
@@ -245,13 +246,15 @@ def run_restore_pipeline(
     progress_callback: Callable[[list[str], float | None], None] | None = None,
     subtitle: str | None = None,
 ) -> None:
-    """Execute the restoration pipeline with decompression and progress tracking."""
+    """Execute the restoration pipeline with decompression and progress tracking.
+
+    Volumes staged from a network repo are streamed over HTTP instead of
+    read by ``cat`` (see storage.remote_repo).
+    """
     if not image_files:
         raise RuntimeError("No image files")
     image_files = sorted_clonezilla_volumes(image_files)
-    cat_proc = subprocess.Popen(
-        ["cat", *[str(path) for path in image_files]], stdout=subprocess.PIPE
-    )
+    cat_proc = remote_repo.open_volumes(image_files)
     upstream = cat_proc.stdout
     decompress_proc = None
     compression_type = get_compression_type(image_files)
@@ -314,7 +317,26 @@ def restore_partition_op(
     progress_callback: Callable[[list[str], float | None], None] | None = None,
     subtitle: str | None = None,
 ) -> None:
-    """Restore a single partition from a restore operation."""
+    """Restore a single partition from a restore operation.
+
+    Partclone images whose ``partclone.<fs>`` tool is not installed are
+    restored natively, writing only the used blocks.
+    """
+    if op.tool == "partclone" and not get_partclone_tool((op.fstype or "").lower()):
+        log.info(
+            f"partclone tool missing for '{op.fstype}', using built-in restore",
+            partition=op.partition,
+            target=target_part,
+            tags=["clonezilla", "restore", "partclone"],
+        )
+        restore_partclone_image(
+            op.image_files,
+            target_part,
+            title=title,
+            subtitle=subtitle,
+            progress_callback=progress_callback,
+        )
+        return
     restore_command = build_restore_command_from_plan(op, target_part)
     run_restore_pipeline(
         op.image_files,
@@ -571,12 +593,24 @@ def restore_clonezilla_image(
             subtitle_parts.append(format_filesystem_type(op.fstype))
         subtitle = " ".join(subtitle_parts) if subtitle_parts else None
 
+        # Partclone images record their used size and source filesystem size
+        total_bytes = target_part.get("size_bytes")
+        if op.tool == "partclone":
+            header = read_partclone_header(op.image_files)
+            if header:
+                if total_bytes and header.device_size > int(total_bytes):
+                    raise RuntimeError(
+                        f"Target partition too small for {op.partition} "
+                        f"({devices.human_size(total_bytes)} < {devices.human_size(header.device_size)})"
+                    )
+                total_bytes = header.used_bytes
+
         try:
             restore_partition_op(
                 op,
                 part_node,
                 title=title,
-                total_bytes=target_part.get("size_bytes"),
+                total_bytes=total_bytes,
                 progress_callback=progress_callback,
                 subtitle=subtitle,
             )
@@ -0,0 +1,368 @@
+"""Compressed raw disk image support (.img.xz / .img.gz / .img.zst / .zip).
+
+Most OS images are distributed compressed. Rather than decompressing them into
+the repository first, the image is decompressed as a stream and written
+straight to the target device through the block stream writer, so the repo
+never holds the expanded copy and empty regions of the image are offloaded.
+
+Progress is reported against the uncompressed size, which is read from the
+container metadata where the format records it:
+- xz: stream index (exact, multi-stream aware)
+- zstd: frame headers (exact when the encoder stored the content size)
+- zip: central directory entry (exact)
+- gzip: ISIZE trailer (modulo 4 GiB, used only when plausible)
+"""
+
+from __future__ import annotations
+
+import gzip
+import lzma
+import os
+import shutil
+import struct
+import subprocess
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator
+
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.storage import devices, iso
+from rpi_usb_cloner.storage.clone import resolve_device_node
+from rpi_usb_cloner.storage.clone.stream_writer import write_stream_to_device
+
+
+log = get_logger(source=__name__)
+
+# Filename suffix -> compression format
+COMPRESSED_IMAGE_SUFFIXES = {
+    ".img.xz": "xz",
+    ".img.gz": "gzip",
+    ".img.zst": "zstd",
+    ".zip": "zip",
+}
+
+# Members inside a .zip archive that are treated as raw disk images
+ZIP_IMAGE_MEMBER_SUFFIXES = (".img", ".iso", ".raw")
+
+_XZ_FOOTER_MAGIC = b"YZ"
+_ZSTD_FRAME_MAGIC = 0xFD2FB528
+_ZSTD_SKIPPABLE_MASK = 0xFFFFFFF0
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+
+
+def get_compression_format(path: Path) -> str | None:
+    """Return the compression format for a compressed image filename."""
+    lowered = path.name.lower()
+    for suffix, compression in COMPRESSED_IMAGE_SUFFIXES.items():
+        if lowered.endswith(suffix):
+            return compression
+    return None
+
+
+def find_zip_image_member(path: Path) -> zipfile.ZipInfo | None:
+    """Return the disk image member of a .zip archive (largest match)."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info
+                for info in archive.infolist()
+                if not info.is_dir()
+                and info.filename.lower().endswith(ZIP_IMAGE_MEMBER_SUFFIXES)
+            ]
+    except (OSError, zipfile.BadZipFile):
+        return None
+    if not members:
+        return None
+    return max(members, key=lambda info: info.file_size)
+
+
+def is_compressed_image_file(path: Path) -> bool:
+    """Check if a file is a compressed raw disk image."""
+    compression = get_compression_format(path)
+    if compression is None:
+        return False
+    try:
+        if not path.is_file():
+            return False
+    except OSError:
+        return False
+    if compression == "zip":
+        return find_zip_image_member(path) is not None
+    return True
+
+
+def _read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """Decode an xz multibyte integer, returning (value, next_offset)."""
+    value = 0
+    for index in range(9):
+        if offset >= len(data):
+            raise ValueError("truncated xz integer")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << (7 * index)
+        if not byte & 0x80:
+            return value, offset
+    raise ValueError("xz integer too long")
+
+
+def _xz_uncompressed_size(path: Path) -> int | None:
+    """Sum the uncompressed sizes recorded in every xz stream index."""
+    try:
+        with path.open("rb") as handle:
+            end = handle.seek(0, os.SEEK_END)
+            total = 0
+            while end > 0:
+                # Skip stream padding (multiples of four NUL bytes).
+                handle.seek(end - 4)
+                if handle.read(4) == b"\x00\x00\x00\x00":
+                    end -= 4
+                    continue
+                if end < 24:
+                    return None
+                handle.seek(end - 12)
+                footer = handle.read(12)
+                if footer[10:12] != _XZ_FOOTER_MAGIC:
+                    return None
+                backward_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+                index_start = end - 12 - backward_size
+                if index_start < 12:
+                    return None
+                handle.seek(index_start)
+                index = handle.read(backward_size)
+                if not index or index[0] != 0x00:
+                    return None
+                records, offset = _read_varint(index, 1)
+                blocks_size = 0
+                for _ in range(records):
+                    unpadded, offset = _read_varint(index, offset)
+                    uncompressed, offset = _read_varint(index, offset)
+                    blocks_size += (unpadded + 3) & ~3
+                    total += uncompressed
+                end = index_start - blocks_size - 12
+                if end < 0:
+                    return None
+            return total
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _zstd_uncompressed_size(path: Path) -> int | None:
+    """Sum frame content sizes across all zstd frames, walking block headers."""
+    try:
+        with path.open("rb") as handle:
+            file_size = handle.seek(0, os.SEEK_END)
+            handle.seek(0)
+            total = 0
+            while handle.tell() < file_size:
+                header = handle.read(4)
+                if len(header) < 4:
+                    return None
+                magic = struct.unpack("<I", header)[0]
+                if magic & _ZSTD_SKIPPABLE_MASK == _ZSTD_SKIPPABLE_MAGIC:
+                    frame_size = struct.unpack("<I", handle.read(4))[0]
+                    handle.seek(frame_size, os.SEEK_CUR)
+                    continue
+                if magic != _ZSTD_FRAME_MAGIC:
+                    return None
+                descriptor = handle.read(1)[0]
+                fcs_flag = descriptor >> 6
+                single_segment = bool(descriptor & 0x20)
+                has_checksum = bool(descriptor & 0x04)
+                dict_id_size = (0, 1, 2, 4)[descriptor & 0x03]
+                if not single_segment:
+                    handle.read(1)  # window descriptor
+                handle.read(dict_id_size)
+                fcs_size = (1 if single_segment else 0, 2, 4, 8)[fcs_flag]
+                if fcs_size == 0:
+                    return None
+                fcs_bytes = handle.read(fcs_size)
+                content_size = int.from_bytes(fcs_bytes, "little")
+                if fcs_size == 2:
+                    content_size += 256
+                total += content_size
+                while True:
+                    block_header = handle.read(3)
+                    if len(block_header) < 3:
+                        return None
+                    value = int.from_bytes(block_header, "little")
+                    last_block = value & 0x01
+                    block_type = (value >> 1) & 0x03
+                    block_size = value >> 3
+                    # RLE blocks store a single byte regardless of block_size.
+                    handle.seek(1 if block_type == 1 else block_size, os.SEEK_CUR)
+                    if last_block:
+                        break
+                if has_checksum:
+                    handle.seek(4, os.SEEK_CUR)
+            return total
+    except (OSError, IndexError, struct.error):
+        return None
+
+
+def _gzip_uncompressed_size(path: Path) -> int | None:
+    """Read the gzip ISIZE trailer when it is plausible.
+
+    ISIZE is stored modulo 2**32, so a value smaller than the compressed file
+    itself means the image wrapped and the size is unknown.
+    """
+    try:
+        with path.open("rb") as handle:
+            file_size = handle.seek(0, os.SEEK_END)
+            if file_size < 18:
+                return None
+            handle.seek(-4, os.SEEK_END)
+            isize = struct.unpack("<I", handle.read(4))[0]
+    except (OSError, struct.error):
+        return None
+    if isize < file_size:
+        return None
+    return isize
+
+
+def get_uncompressed_size(path: Path) -> int | None:
+    """Return the uncompressed image size from container metadata, if known."""
+    compression = get_compression_format(path)
+    if compression == "xz":
+        return _xz_uncompressed_size(path)
+    if compression == "zstd":
+        return _zstd_uncompressed_size(path)
+    if compression == "gzip":
+        return _gzip_uncompressed_size(path)
+    if compression == "zip":
+        member = find_zip_image_member(path)
+        return member.file_size if member else None
+    return None
+
+
+def _decompress_command(compression: str) -> list[str] | None:
+    if compression == "xz":
+        xz_path = shutil.which("xz")
+        return [xz_path, "-dc", "-T0"] if xz_path else None
+    if compression == "gzip":
+        gzip_path = shutil.which("pigz") or shutil.which("gzip")
+        return [gzip_path, "-dc"] if gzip_path else None
+    if compression == "zstd":
+        zstd_path = shutil.which("pzstd") or shutil.which("zstd")
+        return [zstd_path, "-dc"] if zstd_path else None
+    return None
+
+
+@contextmanager
+def open_decompressed_stream(path: Path) -> Iterator[BinaryIO]:
+    """Open a compressed image as a stream of uncompressed bytes.
+
+    External decompressors (xz, pigz/gzip, pzstd/zstd) are preferred because
+    they run on another core; xz and gzip fall back to the standard library.
+
+    Raises:
+        RuntimeError: If the format is unsupported, no decompressor is
+            available, or decompression fails
+    """
+    compression = get_compression_format(path)
+    if compression is None:
+        raise RuntimeError(f"Unsupported compressed image: {path.name}")
+
+    if compression == "zip":
+        member = find_zip_image_member(path)
+        if member is None:
+            raise RuntimeError(f"No disk image found in {path.name}")
+        with zipfile.ZipFile(path) as archive, archive.open(member) as stream:
+            yield stream  # type: ignore[misc]
+        return
+
+    command = _decompress_command(compression)
+    if command is None:
+        if compression == "xz":
+            with lzma.open(path, "rb") as stream:
+                yield stream  # type: ignore[misc]
+            return
+        if compression == "gzip":
+            with gzip.open(path, "rb") as stream:
+                yield stream  # type: ignore[misc]
+            return
+        raise RuntimeError(f"{compression} not found")
+
+    with path.open("rb") as source:
+        process = subprocess.Popen(
+            command,
+            stdin=source,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    assert process.stdout is not None
+    error: BaseException | None = None
+    try:
+        yield process.stdout  # type: ignore[misc]
+    except BaseException as exc:
+        error = exc
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        _, stderr = process.communicate()
+        if error is None and process.returncode != 0:
+            message = stderr.decode("utf-8", "replace").strip() if stderr else ""
+            raise RuntimeError(
+                f"Image decompression failed: {message or process.returncode}"
+            )
+
+
+def restore_compressed_image(
+    image_path: Path,
+    target_device: str,
+    *,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> None:
+    """Decompress a raw image on the fly and write it to a device.
+
+    Args:
+        image_path: Path to the compressed image (.img.xz/.img.gz/.img.zst/.zip)
+        target_device: Target device name (e.g., "sda") or node
+        progress_callback: Optional callback for progress updates
+
+    Raises:
+        RuntimeError: If validation, decompression or writing fails
+    """
+    if os.geteuid() != 0:
+        raise RuntimeError("Run as root")
+
+    if not is_compressed_image_file(image_path):
+        raise RuntimeError(f"Compressed image not found: {image_path}")
+
+    target_node = resolve_device_node(target_device)
+    target_name = Path(target_node).name
+    target_info = devices.get_device_by_name(target_name)
+
+    if target_info and not devices.unmount_device(target_info):
+        raise RuntimeError("Failed to unmount target device before image write")
+
+    image_size = get_uncompressed_size(image_path)
+    target_size = iso._get_device_size_bytes(target_info, target_node)
+    if image_size and target_size and image_size > target_size:
+        raise RuntimeError(
+            f"Target device too small ({devices.human_size(target_size)} < {devices.human_size(image_size)})"
+        )
+
+    log.info(
+        f"Writing compressed image {image_path.name} to {target_node}",
+        image=image_path.name,
+        target=target_node,
+        uncompressed_bytes=image_size,
+        tags=["image", "compressed", "write"],
+    )
+    with open_decompressed_stream(image_path) as stream:
+        written = write_stream_to_device(
+            stream,
+            target_node,
+            total_bytes=image_size,
+            title=f"Writing {image_path.name}",
+            progress_callback=progress_callback,
+        )
+    log.info(
+        f"Compressed image write complete: {written} bytes",
+        image=image_path.name,
+        target=target_node,
+        written_bytes=written,
+        tags=["image", "compressed", "write"],
+    )
@@ -0,0 +1,144 @@
+"""Immutable device snapshots threaded through a clone job.
+
+A clone used to resolve the same devices again at every step: validation,
+the smart/exact dispatch, partition mapping in ``clone_partclone``, unmount
+checks and verification each looked the device up by name, each possibly
+re-running lsblk and each possibly seeing a different state. Now a job
+captures one ``DeviceSnapshot`` per device up front and passes it down. The
+device is only re-read at explicit points, such as after a new partition
+table was written to the target (``DeviceSnapshot.refresh()``).
+
+Snapshots are small frozen ``__slots__`` objects; ``to_dict()`` gives the
+lsblk-shaped dict for helpers that still take one.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Union
+
+from rpi_usb_cloner.storage.devices import get_children, query_block_device
+from rpi_usb_cloner.storage.exceptions import DeviceNotFoundError
+
+
+@dataclass(frozen=True)
+class DeviceSnapshot:
+    """One block device (and its children) as seen at a single point in time."""
+
+    __slots__ = (
+        "name",
+        "device_type",
+        "size",
+        "fstype",
+        "label",
+        "mountpoint",
+        "pttype",
+        "ptuuid",
+        "removable",
+        "transport",
+        "model",
+        "vendor",
+        "serial",
+        "children",
+    )
+
+    name: str
+    device_type: str | None
+    size: int | None
+    fstype: str | None
+    label: str | None
+    mountpoint: str | None
+    pttype: str | None
+    ptuuid: str | None
+    removable: bool | None
+    transport: str | None
+    model: str | None
+    vendor: str | None
+    serial: str | None
+    children: tuple[DeviceSnapshot, ...]
+
+    @classmethod
+    def from_lsblk(cls, device: dict[str, Any]) -> DeviceSnapshot:
+        """Build a snapshot from an lsblk-shaped device dict."""
+        size = device.get("size")
+        return cls(
+            name=str(device.get("name") or ""),
+            device_type=device.get("type"),
+            size=int(size) if size is not None else None,
+            fstype=device.get("fstype"),
+            label=device.get("label"),
+            mountpoint=device.get("mountpoint"),
+            pttype=device.get("pttype"),
+            ptuuid=device.get("ptuuid"),
+            removable=device.get("rm"),
+            transport=device.get("tran"),
+            model=device.get("model"),
+            vendor=device.get("vendor"),
+            serial=device.get("serial"),
+            children=tuple(cls.from_lsblk(child) for child in get_children(device)),
+        )
+
+    @property
+    def node(self) -> str:
+        return f"/dev/{self.name}"
+
+    @property
+    def partitions(self) -> tuple[DeviceSnapshot, ...]:
+        return tuple(child for child in self.children if child.device_type == "part")
+
+    def mountpoints(self) -> list[str]:
+        """Mountpoints of the device and all its children when captured."""
+        found = [self.mountpoint] if self.mountpoint else []
+        for child in self.children:
+            found.extend(child.mountpoints())
+        return found
+
+    def refresh(self) -> DeviceSnapshot | None:
+        """Re-read the device; returns None if it no longer exists."""
+        device = query_block_device(self.name)
+        return DeviceSnapshot.from_lsblk(device) if device else None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the lsblk-shaped dict this snapshot was built from."""
+        device: dict[str, Any] = {
+            "name": self.name,
+            "type": self.device_type,
+            "size": self.size,
+            "fstype": self.fstype,
+            "label": self.label,
+            "mountpoint": self.mountpoint,
+            "pttype": self.pttype,
+            "ptuuid": self.ptuuid,
+            "rm": self.removable,
+            "tran": self.transport,
+            "model": self.model,
+            "vendor": self.vendor,
+            "serial": self.serial,
+        }
+        if self.children:
+            device["children"] = [child.to_dict() for child in self.children]
+        return device
+
+
+DeviceRef = Union[str, "dict[str, Any]", DeviceSnapshot]
+
+
+def capture_device(device: DeviceRef) -> DeviceSnapshot:
+    """Snapshot a device given as a snapshot, lsblk dict, name or node path.
+
+    Dicts are taken as the caller's view of the device and are not re-read;
+    names are read once, fresh.
+
+    Raises:
+        DeviceNotFoundError: If a named device does not exist
+    """
+    if isinstance(device, DeviceSnapshot):
+        return device
+    if isinstance(device, dict):
+        return DeviceSnapshot.from_lsblk(device)
+    name = Path(str(device)).name
+    found = query_block_device(name) if name else None
+    if not found:
+        raise DeviceNotFoundError(name or "(empty name)")
+    return DeviceSnapshot.from_lsblk(found)
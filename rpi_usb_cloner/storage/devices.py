@@ -1,11 +1,13 @@
-"""USB device detection, management, and filtering using lsblk.
+"""USB device detection, management, and filtering.
 
 This module provides utilities for detecting, querying, and managing USB storage devices
-on Raspberry Pi systems. It uses the lsblk command to gather device information and
+on Raspberry Pi systems. It enumerates devices from sysfs (lsblk as a fallback) and
 implements filtering logic to identify safe-to-modify removable devices.
 
 Device Detection:
-    Uses lsblk with JSON output to enumerate block devices and their properties:
+    Reads /sys/block and /proc/self/mountinfo (storage.sysfs_devices), or runs lsblk
+    with JSON output where sysfs is unavailable, to enumerate block devices and their
+    properties in the lsblk -J shape:
     - Device name (e.g., sda, sdb)
     - Size in bytes
     - Mountpoints (if any)
@@ -43,7 +45,9 @@ Security Issues:
     1. Silent umount failures - operations may proceed on mounted devices
     2. No validation that source != destination before cloning
     3. No verification that device is actually removable before destructive ops
-    4. Race conditions possible between detection and operation
+    4. Race conditions possible between detection and operation (clone jobs
+       capture one storage.device_snapshot.DeviceSnapshot per device and only
+       re-read it at explicit points, which narrows this window)
 
 Example:
     >>> from rpi_usb_cloner.storage.devices import list_media_drive_names
@@ -57,7 +61,10 @@ Example:
     Device: sda, Size: 7.5GB
 
 Implementation Notes:
-    - Relies on lsblk command availability (standard on Raspberry Pi OS)
+    - Builds device dicts from sysfs without forking; lsblk (standard on Raspberry
+      Pi OS) is only needed where /sys/block is unavailable
+    - While the hotplug monitor (storage.hotplug) runs, get_block_devices() is
+      served from its live device table instead of forking lsblk
     - Uses JSON parsing for structured output
     - Global log.debug and _error_handler for debugging and error reporting
     - Must be configured with configure_device_helpers() before use
@@ -71,10 +78,16 @@ import time
 from typing import Any, Callable, Iterable, Optional, Union
 
 from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.storage import sysfs_devices
+from rpi_usb_cloner.storage.mount_table import is_mountpoint_active
 
 
 ROOT_MOUNTPOINTS = {"/", "/boot", "/boot/firmware"}
 LSBLK_CACHE_TTL_SECONDS = 1.0
+LSBLK_COLUMNS = (
+    "NAME,TYPE,SIZE,MODEL,VENDOR,TRAN,RM,MOUNTPOINT,FSTYPE,LABEL,SERIAL,PTTYPE,"
+    "ROTA,PTUUID"
+)
 
 # Create logger for device operations
 log = LoggerFactory.for_usb()
@@ -83,6 +96,8 @@ _error_handler: Optional[Callable[[Iterable[str]], None]]
 _last_lsblk_names: Optional[tuple[str, ...]] = None
 _lsblk_cache: Optional[list[dict]] = None
 _lsblk_cache_time: Optional[float] = None
+# Live device table kept current by the hotplug monitor (storage.hotplug)
+_device_table: Optional[Any] = None
 
 
 _error_handler = None
@@ -200,15 +215,88 @@ def get_human_device_label(
     return f"{size_str} {brand}".strip()
 
 
+def attach_device_table(table: Optional[Any]) -> None:
+    """Serve get_block_devices() from a live device table (None to detach).
+
+    The table must provide ``devices()`` returning the lsblk-shaped list.
+    """
+    global _device_table
+    _device_table = table
+
+
+def run_lsblk(device_nodes: Iterable[str] = ()) -> list[dict[str, Any]]:
+    """Run lsblk and return its blockdevices list.
+
+    Raises:
+        subprocess.CalledProcessError: If lsblk fails
+        json.JSONDecodeError: If lsblk output is not valid JSON
+    """
+    result = run_command(
+        ["lsblk", "-J", "-b", "-o", LSBLK_COLUMNS, *device_nodes],
+        log_output=False,
+        log_command=False,
+    )
+    return json.loads(result.stdout).get("blockdevices", [])
+
+
+def read_block_devices() -> list[dict[str, Any]]:
+    """Enumerate block devices from sysfs, falling back to lsblk.
+
+    Raises:
+        subprocess.CalledProcessError: If the lsblk fallback fails
+        json.JSONDecodeError: If lsblk output is not valid JSON
+    """
+    if sysfs_devices.sysfs_available():
+        try:
+            return sysfs_devices.enumerate_block_devices()
+        except OSError as error:
+            log.debug(f"sysfs enumeration failed, using lsblk: {error}")
+    return run_lsblk()
+
+
+def query_block_device(name: str) -> Optional[dict[str, Any]]:
+    """Return fresh data for a single device and its children.
+
+    Read from sysfs when available, otherwise from lsblk.
+
+    Returns:
+        The device dict, or None when the device node no longer exists
+
+    Raises:
+        subprocess.CalledProcessError: If lsblk fails for an existing device
+        json.JSONDecodeError: If lsblk output is not valid JSON
+    """
+    if sysfs_devices.sysfs_available():
+        return sysfs_devices.read_block_device(name)
+    node = f"/dev/{name}"
+    try:
+        found = run_lsblk([node])
+    except subprocess.CalledProcessError:
+        if not os.path.exists(node):  # noqa: PTH110
+            return None
+        raise
+    for device in found:
+        if device.get("name") == name:
+            return device
+    return None
+
+
 def get_block_devices(force_refresh: bool = False) -> list[dict[str, Any]]:
-    """Return block device data from lsblk with a short-lived cache.
+    """Return block device data with a short-lived cache.
 
-    When lsblk fails or returns invalid JSON, the previous cache remains intact
-    and is returned if available; otherwise an empty list is returned. When
-    force_refresh=True, errors return an empty list so callers do not receive
-    stale data.
+    While the hotplug monitor is running, its live device table is returned
+    unless force_refresh is set. Otherwise devices are enumerated from sysfs
+    (storage.sysfs_devices) when it is available and readable, and lsblk
+    only runs as the fallback when it is not.
+
+    When the lsblk fallback fails or returns invalid JSON, the previous cache
+    remains intact and is returned if available; otherwise an empty list is
+    returned. When force_refresh=True, errors return an empty list so callers
+    do not receive stale data.
     """
     global _last_lsblk_names, _lsblk_cache, _lsblk_cache_time
+    if _device_table is not None and not force_refresh:
+        return _device_table.devices()
     now = time.monotonic()
     if (
         not force_refresh
@@ -218,19 +306,7 @@ def get_block_devices(force_refresh: bool = False) -> list[dict[str, Any]]:
     ):
         return _lsblk_cache
     try:
-        result = run_command(
-            [
-                "lsblk",
-                "-J",
-                "-b",
-                "-o",
-                "NAME,TYPE,SIZE,MODEL,VENDOR,TRAN,RM,MOUNTPOINT,FSTYPE,LABEL,SERIAL,PTTYPE,ROTA,PTUUID",
-            ],
-            log_output=False,
-            log_command=False,
-        )
-        data = json.loads(result.stdout)
-        devices = data.get("blockdevices", [])
+        devices = read_block_devices()
         device_names = tuple(
             device.get("name") for device in devices if device.get("name")
         )
@@ -308,18 +384,6 @@ def list_usb_disks() -> list[dict[str, Any]]:
     return devices
 
 
-def _is_mountpoint_active(mountpoint: str) -> bool:
-    try:
-        with open("/proc/mounts", encoding="utf-8") as mounts_file:
-            for line in mounts_file:
-                parts = line.split()
-                if len(parts) > 1 and parts[1] == mountpoint:
-                    return True
-    except FileNotFoundError:
-        return os.path.ismount(mountpoint)
-    return False
-
-
 def _collect_device_mountpoints(device: dict) -> list[str]:
     mountpoints: list[str] = []
     for child in get_children(device):
@@ -358,7 +422,7 @@ def unmount_device(device: dict[str, Any], raise_on_failure: bool = False) -> bo
         except subprocess.CalledProcessError:
             failed_mounts.append(mountpoint)
 
-    failed_mounts = [mp for mp in failed_mounts if _is_mountpoint_active(mp)]
+    failed_mounts = [mp for mp in failed_mounts if is_mountpoint_active(mp)]
     if failed_mounts:
         log.debug(f"Failed to unmount mountpoints: {', '.join(failed_mounts)}")
         if _error_handler:
@@ -405,7 +469,7 @@ def unmount_device_with_retry(
     ) -> list[tuple[str, str]]:
         active = []
         for partition_name, mountpoint in mountpoint_list:
-            if _is_mountpoint_active(mountpoint):
+            if is_mountpoint_active(mountpoint):
                 active.append((partition_name, mountpoint))
             else:
                 log(f"{mountpoint} already unmounted")
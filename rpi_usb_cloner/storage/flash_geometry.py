@@ -0,0 +1,412 @@
+"""Erase-block geometry of flash media, for aligned partitioning and mkfs.
+
+USB sticks and SD cards write in erase blocks (allocation units) of 1-16 MiB.
+A partition or filesystem data area that straddles those boundaries makes
+every cluster write touch two blocks, which on cheap controllers can halve
+write speed for the lifetime of the format. This module works out the erase
+block size and turns it into a partition start/end and mkfs parameters.
+
+The size comes from the first source that knows it:
+
+1. sysfs hints: ``device/preferred_erase_size`` (SD/MMC, from the card's AU
+   size) and ``queue/discard_granularity``. ``queue/optimal_io_size`` is
+   not used: USB bridges fill it with transfer limits, not erase blocks
+2. the SD/MMC CSD register (``device/csd``)
+3. a short read-timing probe in the style of ``flashbench -a``: reads that
+   straddle an erase block boundary are measurably slower than reads next to
+   it, and the difference stops growing once the candidate alignment reaches
+   the erase block size
+4. a 4 MiB default, which is a multiple of most sticks' erase blocks
+
+Only power-of-two sizes up to 16 MiB are accepted from any source.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import mmap
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+
+log = LoggerFactory.for_clone()
+
+KIB = 1024
+MIB = 1024 * KIB
+
+DEFAULT_ERASE_BLOCK_BYTES = 4 * MIB
+MIN_ERASE_BLOCK_BYTES = 64 * KIB
+MAX_ERASE_BLOCK_BYTES = 16 * MIB
+# Partitions never start before 1 MiB, as parted's optimal alignment does
+MIN_PARTITION_ALIGNMENT_BYTES = 1 * MIB
+# Larger alignments fall back to the default erase block
+MAX_PARTITION_ALIGNMENT_BYTES = 16 * MIB
+
+SOURCE_SYSFS = "sysfs"
+SOURCE_CSD = "csd"
+SOURCE_PROBE = "probe"
+SOURCE_DEFAULT = "default"
+
+# Read-timing probe
+PROBE_MIN_ALIGNMENT_BYTES = 16 * KIB
+PROBE_BOUNDARIES = 6
+PROBE_REPEATS = 3
+# Fraction of the largest boundary penalty an alignment must reach to count
+PROBE_PLATEAU_FRACTION = 0.75
+# Smallest boundary penalty, relative to a plain read, treated as real
+PROBE_MIN_SIGNAL = 0.1
+
+# FAT32 and exFAT cluster sizes recommended by the SD Association formatter
+FAT32_CLUSTER_BYTES = 32 * KIB
+EXFAT_SMALL_CLUSTER_BYTES = 32 * KIB
+EXFAT_LARGE_CLUSTER_BYTES = 128 * KIB
+EXFAT_LARGE_VOLUME_BYTES = 32 * 1024 * MIB
+FAT32_MIN_CLUSTERS = 65525
+FAT32_MIN_RESERVED_SECTORS = 32
+FAT32_MAX_RESERVED_SECTORS = 0xFFFF
+EXT4_BLOCK_BYTES = 4096
+
+SYS_BLOCK_DIR = Path("/sys/class/block")
+
+# (pre, on, post) read times in seconds around boundaries of one alignment
+ProbeTimings = Dict[int, Tuple[float, float, float]]
+
+
+@dataclass(frozen=True)
+class FlashGeometry:
+    """Erase-block geometry of a device and where it was learned from."""
+
+    erase_block_bytes: int
+    source: str
+    logical_sector_bytes: int = 512
+    device_bytes: int = 0
+
+    @property
+    def alignment_bytes(self) -> int:
+        """Partition alignment: the erase block, and never below 1 MiB.
+
+        An alignment above ``MAX_PARTITION_ALIGNMENT_BYTES`` would waste a
+        large part of the device, so the default erase block is used instead.
+        """
+        erase = self.erase_block_bytes
+        alignment = (
+            erase
+            * MIN_PARTITION_ALIGNMENT_BYTES
+            // math.gcd(erase, MIN_PARTITION_ALIGNMENT_BYTES)
+        )
+        if alignment > MAX_PARTITION_ALIGNMENT_BYTES:
+            return DEFAULT_ERASE_BLOCK_BYTES
+        return alignment
+
+    def partition_bounds(self) -> tuple[int, int] | None:
+        """Return (start, inclusive end) in bytes of one aligned partition.
+
+        Both the start and the end fall on erase block boundaries. Returns
+        None when the device size is unknown or too small to align.
+        """
+        alignment = self.alignment_bytes
+        end = self.device_bytes // alignment * alignment
+        if end - alignment < alignment:
+            return None
+        return alignment, end - 1
+
+    @property
+    def partition_bytes(self) -> int | None:
+        bounds = self.partition_bounds()
+        if bounds is None:
+            return None
+        return bounds[1] + 1 - bounds[0]
+
+
+def _valid_erase_size(value: int | None) -> bool:
+    return (
+        value is not None
+        and MIN_ERASE_BLOCK_BYTES <= value <= MAX_ERASE_BLOCK_BYTES
+        and value & (value - 1) == 0
+    )
+
+
+def _read_int(path: Path) -> int | None:
+    try:
+        return int(path.read_text().strip(), 0)
+    except (OSError, ValueError):
+        return None
+
+
+def read_sysfs_erase_size(device_name: str) -> int | None:
+    """Return the largest erase-size hint sysfs gives for a whole disk."""
+    block_dir = SYS_BLOCK_DIR / device_name
+    hints = [
+        _read_int(block_dir / "device" / "preferred_erase_size"),
+        _read_int(block_dir / "queue" / "discard_granularity"),
+    ]
+    valid = [hint for hint in hints if _valid_erase_size(hint)]
+    return max(valid) if valid else None
+
+
+def _csd_bits(csd: int, high: int, low: int) -> int:
+    return (csd >> low) & ((1 << (high - low + 1)) - 1)
+
+
+def parse_csd_erase_size(csd_hex: str, card_type: str = "SD") -> int | None:
+    """Return the erase unit in bytes encoded in an SD/MMC CSD register.
+
+    Args:
+        csd_hex: The 128-bit register as printed in sysfs (32 hex digits)
+        card_type: "SD" or "MMC" (``device/type`` in sysfs)
+
+    Returns:
+        The erase unit, or None when the register does not describe one
+        (SDHC/SDXC cards report a fixed 64 KiB and keep the real AU size in
+        the SD status register instead)
+    """
+    try:
+        csd = int(csd_hex.strip(), 16)
+    except ValueError:
+        return None
+    write_block = 1 << _csd_bits(csd, 25, 22)
+    if card_type.upper() == "MMC":
+        group_size = _csd_bits(csd, 46, 42) + 1
+        group_mult = _csd_bits(csd, 41, 37) + 1
+        size = group_size * group_mult * write_block
+    else:
+        if _csd_bits(csd, 127, 126) != 0:
+            return None
+        size = (_csd_bits(csd, 45, 39) + 1) * write_block
+    return size if _valid_erase_size(size) else None
+
+
+def read_csd_erase_size(device_name: str) -> int | None:
+    """Return the erase unit from the CSD register of an SD/MMC card."""
+    device_dir = SYS_BLOCK_DIR / device_name / "device"
+    try:
+        csd_hex = (device_dir / "csd").read_text()
+    except OSError:
+        return None
+    try:
+        card_type = (device_dir / "type").read_text().strip()
+    except OSError:
+        card_type = "SD"
+    return parse_csd_erase_size(csd_hex, card_type)
+
+
+def estimate_erase_block(timings: ProbeTimings) -> int | None:
+    """Pick the erase block size from boundary read timings.
+
+    For each candidate alignment the penalty is the time of a read that
+    straddles a boundary minus the mean of the reads just before and after
+    it. Odd multiples of an alignment below the erase block never land on an
+    erase block boundary, so the penalty jumps once the alignment reaches the
+    erase block and then stays flat. The erase block is the smallest
+    alignment whose penalty is on that plateau.
+    """
+    if not timings:
+        return None
+    penalties = {}
+    for alignment, (pre, on, post) in timings.items():
+        penalties[alignment] = on - (pre + post) / 2
+    largest = max(timings)
+    plateau = penalties[largest]
+    pre, _on, post = timings[largest]
+    baseline = (pre + post) / 2
+    if plateau <= 0 or baseline <= 0 or plateau < baseline * PROBE_MIN_SIGNAL:
+        return None
+    for alignment in sorted(penalties):
+        if penalties[alignment] >= plateau * PROBE_PLATEAU_FRACTION:
+            return alignment if _valid_erase_size(alignment) else None
+    return None
+
+
+def _time_read(fd: int, buffer: mmap.mmap, offset: int) -> float:
+    best = math.inf
+    for _ in range(PROBE_REPEATS):
+        start = time.perf_counter()
+        os.preadv(fd, [buffer], offset)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def probe_erase_block(
+    device_node: str,
+    device_bytes: int,
+    sector_bytes: int = 512,
+    timer: Callable[[int, mmap.mmap, int], float] | None = None,
+) -> int | None:
+    """Estimate the erase block size of a device from read timings.
+
+    Only reads are issued (with ``O_DIRECT`` so the page cache does not hide
+    the device), so the probe is safe on a drive with data.
+
+    Returns:
+        The estimated erase block size, or None if the device cannot be read
+        directly or the timings show no clear boundary
+    """
+    direct = getattr(os, "O_DIRECT", 0)
+    if not direct or not hasattr(os, "preadv"):
+        return None
+    timer = timer or _time_read
+    read_bytes = 2 * sector_bytes
+    try:
+        fd = os.open(device_node, os.O_RDONLY | direct | getattr(os, "O_CLOEXEC", 0))
+    except OSError:
+        return None
+    timings: ProbeTimings = {}
+    try:
+        # O_DIRECT needs an aligned buffer; anonymous mmaps are page aligned
+        with mmap.mmap(-1, read_bytes) as buffer:
+            alignment = PROBE_MIN_ALIGNMENT_BYTES
+            while alignment <= MAX_ERASE_BLOCK_BYTES:
+                # Odd multiples are boundaries of this alignment only
+                boundaries = [
+                    alignment * (2 * index + 1)
+                    for index in range(PROBE_BOUNDARIES)
+                    if alignment * (2 * index + 1) + 2 * read_bytes <= device_bytes
+                ]
+                if not boundaries:
+                    break
+                pre = on = post = 0.0
+                for boundary in boundaries:
+                    pre += timer(fd, buffer, boundary - 2 * read_bytes)
+                    on += timer(fd, buffer, boundary - sector_bytes)
+                    post += timer(fd, buffer, boundary + read_bytes)
+                count = len(boundaries)
+                timings[alignment] = (pre / count, on / count, post / count)
+                alignment *= 2
+    except OSError as error:
+        log.debug(
+            f"Erase block probe of {device_node} failed: {error}",
+            device=device_node,
+            tags=["format", "geometry"],
+        )
+        return None
+    finally:
+        os.close(fd)
+    return estimate_erase_block(timings)
+
+
+def _device_size(device_node: str) -> int:
+    with contextlib.suppress(OSError):
+        fd = os.open(device_node, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        try:
+            return os.lseek(fd, 0, os.SEEK_END)
+        finally:
+            os.close(fd)
+    return 0
+
+
+def detect_flash_geometry(
+    device_node: str,
+    *,
+    device_bytes: int | None = None,
+    probe: bool = True,
+) -> FlashGeometry:
+    """Work out the erase block geometry of a whole-disk device.
+
+    Args:
+        device_node: Whole-device node (e.g., "/dev/sda")
+        device_bytes: Device size if already known (otherwise read from the
+            device)
+        probe: Allow the read-timing probe when sysfs and the CSD say nothing
+
+    Returns:
+        The detected geometry; ``source`` is "default" when nothing was found
+    """
+    device_name = Path(device_node).name
+    block_dir = SYS_BLOCK_DIR / device_name
+    sector_bytes = _read_int(block_dir / "queue" / "logical_block_size") or 512
+    try:
+        device_bytes = int(device_bytes or 0)
+    except (TypeError, ValueError):
+        device_bytes = 0
+    if not device_bytes:
+        device_bytes = _device_size(device_node)
+        if not device_bytes:
+            sectors = _read_int(block_dir / "size")
+            device_bytes = sectors * 512 if sectors else 0
+
+    erase_bytes = read_sysfs_erase_size(device_name)
+    source = SOURCE_SYSFS
+    if erase_bytes is None:
+        erase_bytes = read_csd_erase_size(device_name)
+        source = SOURCE_CSD
+    if erase_bytes is None and probe and device_bytes:
+        erase_bytes = probe_erase_block(device_node, device_bytes, sector_bytes)
+        source = SOURCE_PROBE
+    if erase_bytes is None:
+        erase_bytes = DEFAULT_ERASE_BLOCK_BYTES
+        source = SOURCE_DEFAULT
+
+    geometry = FlashGeometry(
+        erase_block_bytes=erase_bytes,
+        source=source,
+        logical_sector_bytes=sector_bytes,
+        device_bytes=device_bytes,
+    )
+    log.info(
+        f"Flash geometry for {device_node}: erase block "
+        f"{erase_bytes // KIB} KiB ({source})",
+        device=device_node,
+        erase_block_bytes=erase_bytes,
+        source=source,
+        tags=["format", "geometry"],
+    )
+    return geometry
+
+
+def _fat32_fat_sectors(
+    total: int, reserved: int, cluster_sectors: int, sector: int
+) -> int:
+    # Same sizing as mkfs.fat for FAT32 with two FATs and alignment disabled
+    data = total - reserved
+    clusters = (data * sector + 2 * 8) // (cluster_sectors * sector + 2 * 4)
+    return -(-((clusters + 2) * 4) // sector)
+
+
+def fat32_layout(geometry: FlashGeometry) -> tuple[int, int | None] | None:
+    """Return (sectors per cluster, reserved sectors) for an aligned FAT32.
+
+    The reserved area is padded so the data area (and therefore every
+    cluster) starts on an erase block boundary. Reserved sectors are None
+    when no padding makes that work, in which case mkfs.fat's own layout is
+    kept.
+    """
+    partition_bytes = geometry.partition_bytes
+    sector = geometry.logical_sector_bytes
+    if not partition_bytes:
+        return None
+    cluster = min(FAT32_CLUSTER_BYTES, geometry.erase_block_bytes)
+    while cluster > sector and partition_bytes // cluster < FAT32_MIN_CLUSTERS:
+        cluster //= 2
+    cluster_sectors = max(1, cluster // sector)
+    total = partition_bytes // sector
+    align = geometry.erase_block_bytes // sector
+    reserved = FAT32_MIN_RESERVED_SECTORS
+    while reserved <= FAT32_MAX_RESERVED_SECTORS:
+        fat = _fat32_fat_sectors(total, reserved, cluster_sectors, sector)
+        padding = -(reserved + 2 * fat) % align
+        if padding == 0:
+            return cluster_sectors, reserved
+        reserved += padding
+    return cluster_sectors, None
+
+
+def exfat_layout(geometry: FlashGeometry) -> tuple[int, int]:
+    """Return (cluster bytes, boundary alignment bytes) for exFAT."""
+    partition_bytes = geometry.partition_bytes or geometry.device_bytes
+    if partition_bytes > EXFAT_LARGE_VOLUME_BYTES:
+        cluster = EXFAT_LARGE_CLUSTER_BYTES
+    else:
+        cluster = EXFAT_SMALL_CLUSTER_BYTES
+    return min(cluster, geometry.erase_block_bytes), geometry.erase_block_bytes
+
+
+def ext4_extended_options(geometry: FlashGeometry) -> str:
+    """Return the mkfs.ext4 ``-E`` stride/stripe-width for the erase block."""
+    blocks = max(1, geometry.erase_block_bytes // EXT4_BLOCK_BYTES)
+    return f"stride={blocks},stripe_width={blocks}"
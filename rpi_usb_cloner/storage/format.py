@@ -16,10 +16,14 @@ Format Modes:
 Partitioning:
     - Uses MBR (Master Boot Record) partition table by default
     - Creates a single primary partition using full device capacity
-    - Partition starts at 1MiB offset for proper alignment
+    - Partition start and end are aligned to the flash erase block (see
+      flash_geometry), never less than 1MiB
+    - FAT32 cluster size and reserved area, exFAT cluster/boundary and ext4
+      stride/stripe-width are chosen so clusters do not straddle erase blocks
 
 Operations:
     - format_device(): Main entry point for formatting
+    - format_devices(): Format several drives concurrently
     - _create_partition_table(): Creates MBR partition table
     - _create_partition(): Creates single primary partition
     - _format_filesystem(): Formats partition with chosen filesystem
@@ -48,7 +52,7 @@ import select
 import shutil
 import subprocess
 import time
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Sequence
 
 from rpi_usb_cloner.logging import LoggerFactory
 from rpi_usb_cloner.storage.device_lock import device_operation
@@ -57,6 +61,19 @@ from rpi_usb_cloner.storage.devices import (
     run_command,
     unmount_device,
 )
+from rpi_usb_cloner.storage.flash_geometry import (
+    FlashGeometry,
+    detect_flash_geometry,
+    exfat_layout,
+    ext4_extended_options,
+    fat32_layout,
+)
+from rpi_usb_cloner.storage.mount_table import mountpoint_of
+from rpi_usb_cloner.storage.parallel_jobs import (
+    DeviceJobResult,
+    run_parallel_device_jobs,
+)
+from rpi_usb_cloner.storage.validation import validate_format_operation
 
 
 # Create logger for format operations
@@ -82,15 +99,7 @@ def _get_partition_path(device_path: str) -> str:
 
 def _get_live_partition_mountpoint(partition_path: str) -> Optional[str]:
     """Return live mountpoint for a partition if currently mounted."""
-    try:
-        with open("/proc/mounts", encoding="utf-8") as mounts_file:
-            for line in mounts_file:
-                parts = line.split()
-                if len(parts) > 1 and parts[0] == partition_path:
-                    return parts[1]
-    except FileNotFoundError:
-        return None
-    return None
+    return mountpoint_of(partition_path)
 
 
 def _ensure_partition_unmounted(partition_path: str) -> bool:
@@ -158,19 +167,41 @@ def _wait_for_partition_device(
     return False
 
 
-def _create_partition(device_path: str) -> bool:
+def _create_partition(
+    device_path: str, geometry: Optional[FlashGeometry] = None
+) -> bool:
     """Create single primary partition using full device.
 
     Args:
         device_path: Device path (e.g., /dev/sda)
+        geometry: Flash geometry to align the partition to; without it the
+            partition spans 1MiB to the end of the device
 
     Returns:
         True on success, False on failure
     """
     try:
         log.debug(f"Creating primary partition on {device_path}")
-        # Create partition from 1MiB to 100% (proper alignment)
-        run_command(["parted", "-s", device_path, "mkpart", "primary", "1MiB", "100%"])
+        bounds = geometry.partition_bounds() if geometry else None
+        if bounds:
+            # Start and end on erase block boundaries
+            start, end = bounds
+            run_command(
+                [
+                    "parted",
+                    "-s",
+                    device_path,
+                    "mkpart",
+                    "primary",
+                    f"{start}B",
+                    f"{end}B",
+                ]
+            )
+        else:
+            # Create partition from 1MiB to 100% (proper alignment)
+            run_command(
+                ["parted", "-s", device_path, "mkpart", "primary", "1MiB", "100%"]
+            )
         partition_path = _get_partition_path(device_path)
         if shutil.which("sync"):
             run_command(["sync"], check=False, log_command=False)
@@ -180,12 +211,28 @@ def _create_partition(device_path: str) -> bool:
         return False
 
 
+def _mkfs_exfat_supports_layout() -> bool:
+    """Return True if mkfs.exfat is from exfatprogs (has -c and -b)."""
+    try:
+        result = subprocess.run(
+            ["mkfs.exfat", "-V"],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return "exfatprogs" in (result.stdout + result.stderr)
+
+
 def _format_filesystem(
     partition_path: str,
     filesystem: str,
     mode: str,
     label: Optional[str],
     progress_callback: Optional[Callable[[List[str], Optional[float]], None]],
+    geometry: Optional[FlashGeometry] = None,
 ) -> bool:
     """Format partition with chosen filesystem.
 
@@ -195,6 +242,7 @@ def _format_filesystem(
         mode: Format mode (quick or full)
         label: Optional volume label
         progress_callback: Optional callback for progress updates
+        geometry: Optional flash geometry used to align filesystem structures
 
     Returns:
         True on success, False on failure
@@ -213,18 +261,30 @@ def _format_filesystem(
         command = ["mkfs.ext4", "-F"]
         if mode == "full":
             command.append("-c")  # Check for bad blocks
+        if geometry:
+            command.extend(["-E", ext4_extended_options(geometry)])
         if label:
             command.extend(["-L", label])
         command.append(partition_path)
 
     elif filesystem == "vfat":
         command = ["mkfs.vfat", "-F", "32"]
+        layout = fat32_layout(geometry) if geometry else None
+        if layout:
+            cluster_sectors, reserved_sectors = layout
+            command.extend(["-s", str(cluster_sectors)])
+            if reserved_sectors is not None:
+                # -a stops mkfs.fat re-aligning and moving the data area
+                command.extend(["-a", "-R", str(reserved_sectors)])
         if label:
             command.extend(["-n", label])
         command.append(partition_path)
 
     elif filesystem == "exfat":
         command = ["mkfs.exfat"]
+        if geometry and _mkfs_exfat_supports_layout():
+            cluster_bytes, boundary_bytes = exfat_layout(geometry)
+            command.extend(["-c", str(cluster_bytes), "-b", str(boundary_bytes)])
         if label:
             command.extend(["-n", label])
         command.append(partition_path)
@@ -361,6 +421,9 @@ def format_device(
             log.error(f"Failed to unmount device: {error}")
             return False
 
+        # Erase block geometry drives partition alignment and mkfs layout
+        geometry = detect_flash_geometry(device_path, device_bytes=device.get("size"))
+
         # Create partition table
         if progress_callback:
             progress_callback(["Creating partition table..."], 0.1)
@@ -375,7 +438,7 @@ def format_device(
         if progress_callback:
             progress_callback(["Creating partition..."], 0.3)
 
-        if not _create_partition(device_path):
+        if not _create_partition(device_path, geometry=geometry):
             log.warning(f"Format aborted: failed to create partition on {device_label}")
             return False
 
@@ -385,10 +448,58 @@ def format_device(
 
         # Format filesystem
         if not _format_filesystem(
-            partition_path, filesystem, mode, label, progress_callback
+            partition_path,
+            filesystem,
+            mode,
+            label,
+            progress_callback,
+            geometry=geometry,
         ):
             log.warning(f"Format aborted: filesystem format failed on {device_label}")
             return False
 
         log.info(f"Format completed successfully for {device_label}")
         return True
+
+
+def format_devices(
+    devices: Sequence[dict],
+    filesystem: str,
+    mode: str,
+    label: Optional[str] = None,
+    progress_callback: Optional[
+        Callable[[str, List[str], Optional[float]], None]
+    ] = None,
+    max_workers: Optional[int] = None,
+) -> List[DeviceJobResult]:
+    """Format several USB drives concurrently with the same settings.
+
+    Each device is checked with ``validate_format_operation`` and then
+    formatted by ``format_device`` on its own worker; concurrency is limited
+    per USB root hub.
+
+    Args:
+        devices: Device dicts from lsblk with 'name' field
+        filesystem: Filesystem type (ext4, vfat, exfat, ntfs)
+        mode: Format mode (quick or full)
+        label: Optional volume label applied to every drive
+        progress_callback: Optional callback(device_name, lines, progress_ratio)
+        max_workers: Optional overall concurrency cap
+
+    Returns:
+        List of DeviceJobResult, one per device in input order
+    """
+
+    def run(device: dict, progress) -> bool:
+        # Unmounting happens inside format_device
+        validate_format_operation(device, check_unmounted=False)
+        return format_device(
+            device, filesystem, mode, label=label, progress_callback=progress
+        )
+
+    return run_parallel_device_jobs(
+        devices,
+        run,
+        max_workers=max_workers,
+        progress_callback=progress_callback,
+    )
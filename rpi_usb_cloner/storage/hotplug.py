@@ -0,0 +1,368 @@
+"""Netlink hotplug monitor feeding a live block device table.
+
+Polling ``lsblk`` every couple of seconds from the main loop and again from
+the web UI costs a fork per poll and still sees inserts late. Instead, one
+background thread listens for block uevents on a netlink socket and keeps a
+single in-memory device table (the lsblk-shaped dicts of
+``storage.devices.read_block_devices()``):
+
+- add/change of a disk or one of its partitions re-reads just that disk
+- removal of a disk drops it from the table
+- a change to the mount table (``storage.mount_table``, whose mountinfo
+  descriptor is polled alongside the socket) reloads the whole table, since
+  mounting does not produce block uevents
+
+Each effective change bumps the table's generation counter and notifies
+subscribers, so consumers can compare generations or wait for a change
+instead of polling. Events are read from udev's netlink group when udevd is
+running (they arrive after udev has probed filesystems and labels) and from
+the kernel group otherwise. Where netlink is unavailable the monitor falls
+back to reloading the table on a timer; consumers see the same interface.
+
+While the monitor runs, ``storage.devices.get_block_devices()`` is served from
+the table and devices are only re-enumerated for forced refreshes.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import json
+import select
+import socket
+import struct
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.storage import devices as storage_devices
+from rpi_usb_cloner.storage import mount_table
+
+
+log = LoggerFactory.for_usb()
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP_KERNEL = 1
+UEVENT_GROUP_UDEV = 2
+UDEV_CONTROL_PATH = "/run/udev/control"
+UDEV_MONITOR_PREFIX = b"libudev\0"
+UDEV_MONITOR_MAGIC = 0xFEEDCAFE
+RECEIVE_BUFFER_BYTES = 1024 * 1024
+
+POLL_TIMEOUT_SECONDS = 1.0
+FALLBACK_POLL_SECONDS = 2.0
+
+Uevent = Dict[str, str]
+DeviceLoader = Callable[[], List[Dict[str, Any]]]
+SingleDeviceLoader = Callable[[str], Optional[Dict[str, Any]]]
+
+_LOAD_ERRORS = (subprocess.CalledProcessError, json.JSONDecodeError, OSError)
+
+
+def parse_uevent(data: bytes) -> Uevent | None:
+    """Parse a kernel or udev netlink uevent message into its properties.
+
+    Returns:
+        The KEY=VALUE properties, or None if the message is not a uevent
+    """
+    if data.startswith(UDEV_MONITOR_PREFIX):
+        # struct udev_monitor_netlink_header: the magic is big-endian, the
+        # offsets that follow are native
+        if len(data) < 24:
+            return None
+        (magic,) = struct.unpack_from(">I", data, 8)
+        if magic != UDEV_MONITOR_MAGIC:
+            return None
+        _header_size, offset, length = struct.unpack_from("=III", data, 12)
+        payload = data[offset : offset + length]
+    else:
+        header, _, payload = data.partition(b"\0")
+        if b"@" not in header:
+            return None
+    event: Uevent = {}
+    for field in payload.split(b"\0"):
+        key, sep, value = field.partition(b"=")
+        if sep:
+            event[key.decode(errors="replace")] = value.decode(errors="replace")
+    if "ACTION" not in event or "DEVPATH" not in event:
+        return None
+    return event
+
+
+def _event_disk(event: Uevent) -> tuple[str, bool] | None:
+    """Return (disk name, event is for the whole disk) for a block uevent."""
+    if event.get("SUBSYSTEM") != "block":
+        return None
+    parts = [part for part in event.get("DEVPATH", "").split("/") if part]
+    name = Path(event.get("DEVNAME") or (parts[-1] if parts else "")).name
+    if not name:
+        return None
+    if event.get("DEVTYPE") == "partition" and len(parts) >= 2:
+        return parts[-2], False
+    return name, True
+
+
+class DeviceTable:
+    """In-memory lsblk-shaped device list with a generation counter."""
+
+    def __init__(
+        self,
+        load_all: DeviceLoader | None = None,
+        load_one: SingleDeviceLoader | None = None,
+    ) -> None:
+        self._load_all = load_all or storage_devices.read_block_devices
+        self._load_one = load_one or storage_devices.query_block_device
+        self._devices: dict[str, dict[str, Any]] = {}
+        self._generation = 0
+        self._changed = threading.Condition()
+        self._subscribers: list[Callable[[int], None]] = []
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def devices(self) -> list[dict[str, Any]]:
+        """Return the current devices (treat the dicts as read-only)."""
+        with self._changed:
+            return list(self._devices.values())
+
+    def reload(self) -> bool:
+        """Re-read every device; returns True if the table changed."""
+        try:
+            found = self._load_all()
+        except _LOAD_ERRORS as error:
+            log.debug(f"Device table reload failed: {error}", tags=["hotplug"])
+            return False
+        return self._replace(
+            {device["name"]: device for device in found if device.get("name")}
+        )
+
+    def apply_events(self, events: Iterable[Uevent]) -> bool:
+        """Apply a batch of uevents, re-reading each affected disk once.
+
+        Returns:
+            True if the table changed
+        """
+        # Last action per disk wins: a disk removed at the end of the batch
+        # is dropped, anything else is re-read
+        pending: dict[str, bool] = {}
+        for event in events:
+            target = _event_disk(event)
+            if target is None:
+                continue
+            disk, whole_disk = target
+            removed = whole_disk and event.get("ACTION") == "remove"
+            pending.pop(disk, None)
+            pending[disk] = removed
+        if not pending:
+            return False
+        with self._changed:
+            updated = dict(self._devices)
+        for disk, removed in pending.items():
+            if removed:
+                updated.pop(disk, None)
+                continue
+            try:
+                device = self._load_one(disk)
+            except _LOAD_ERRORS as error:
+                log.debug(f"Could not re-read {disk}: {error}", tags=["hotplug"])
+                continue
+            if device is None:
+                updated.pop(disk, None)
+            else:
+                updated[disk] = device
+        return self._replace(updated)
+
+    def subscribe(self, callback: Callable[[int], None]) -> Callable[[], None]:
+        """Call ``callback(generation)`` after each change.
+
+        Callbacks run on the monitor thread and must not block.
+
+        Returns:
+            A function that removes the subscription
+        """
+        with self._changed:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._changed, contextlib.suppress(ValueError):
+                self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def wait_for_change(self, generation: int, timeout: float | None = None) -> int:
+        """Block until the generation differs from ``generation``.
+
+        Returns:
+            The current generation (unchanged if the timeout expired)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._generation != generation, timeout)
+            return self._generation
+
+    def _replace(self, devices: dict[str, dict[str, Any]]) -> bool:
+        with self._changed:
+            if devices == self._devices:
+                return False
+            self._devices = devices
+            self._generation += 1
+            generation = self._generation
+            subscribers = list(self._subscribers)
+            self._changed.notify_all()
+        log.debug(
+            f"Device table generation {generation}: {', '.join(devices) or 'empty'}",
+            tags=["hotplug"],
+        )
+        for callback in subscribers:
+            try:
+                callback(generation)
+            except Exception as error:  # noqa: BLE001 - isolate subscribers
+                log.debug(f"Device table subscriber failed: {error}", tags=["hotplug"])
+        return True
+
+
+def open_uevent_socket() -> socket.socket | None:
+    """Open a non-blocking netlink socket for block uevents, or None."""
+    family = getattr(socket, "AF_NETLINK", None)
+    if family is None:
+        return None
+    group = (
+        UEVENT_GROUP_UDEV if Path(UDEV_CONTROL_PATH).exists() else UEVENT_GROUP_KERNEL
+    )
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    except OSError as error:
+        log.debug(f"Netlink uevents unavailable: {error}", tags=["hotplug"])
+        return None
+    try:
+        with contextlib.suppress(OSError):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_BYTES)
+        sock.bind((0, group))
+        sock.setblocking(False)
+    except OSError as error:
+        sock.close()
+        log.debug(f"Netlink uevents unavailable: {error}", tags=["hotplug"])
+        return None
+    return sock
+
+
+class HotplugMonitor:
+    """Background thread keeping a DeviceTable current."""
+
+    def __init__(
+        self,
+        table: DeviceTable,
+        *,
+        fallback_interval: float = FALLBACK_POLL_SECONDS,
+    ) -> None:
+        self.table = table
+        self.fallback_interval = fallback_interval
+        self.live = False
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        # Open the socket before the initial load so no event is missed
+        sock = open_uevent_socket()
+        self.live = sock is not None
+        self.table.reload()
+        self._thread = threading.Thread(
+            target=self._run, args=(sock,), name="hotplug-monitor", daemon=True
+        )
+        self._thread.start()
+        log.info(
+            "Hotplug monitor started"
+            + ("" if self.live else f" (polling every {self.fallback_interval}s)"),
+            tags=["hotplug"],
+        )
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self, sock: socket.socket | None) -> None:
+        if sock is None:
+            while not self._stop.wait(self.fallback_interval):
+                self.table.reload()
+            return
+        mounts = mount_table.get_mount_table()
+        mounts_fd = mounts.fileno()
+        mounts_generation = mounts.generation
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        if mounts_fd is not None:
+            poller.register(mounts_fd, select.POLLPRI | select.POLLERR)
+        try:
+            while not self._stop.is_set():
+                for fd, _mask in poller.poll(POLL_TIMEOUT_SECONDS * 1000):
+                    if fd == sock.fileno():
+                        self.table.apply_events(self._drain(sock))
+                    else:
+                        # Polling consumed the kernel's change flag, so the
+                        # shared table has to re-read now
+                        mounts.refresh()
+                # Lookups elsewhere may have picked up a change first
+                if mounts_fd is not None and mounts.generation != mounts_generation:
+                    mounts_generation = mounts.generation
+                    self.table.reload()
+        except Exception as error:  # noqa: BLE001 - keep serving via polling
+            log.error(f"Hotplug monitor failed: {error}", tags=["hotplug"])
+            self.live = False
+            while not self._stop.wait(self.fallback_interval):
+                self.table.reload()
+        finally:
+            sock.close()
+
+    def _drain(self, sock: socket.socket) -> list[Uevent]:
+        events: list[Uevent] = []
+        while True:
+            try:
+                data = sock.recv(RECEIVE_BUFFER_BYTES)
+            except BlockingIOError:
+                return events
+            except OSError as error:
+                if error.errno != errno.ENOBUFS:
+                    raise
+                # Events were dropped; resynchronise from scratch
+                log.debug("Uevent buffer overrun, reloading", tags=["hotplug"])
+                self.table.reload()
+                continue
+            event = parse_uevent(data)
+            if event is not None:
+                events.append(event)
+
+
+_monitor: HotplugMonitor | None = None
+_monitor_lock = threading.Lock()
+
+
+def start_hotplug_monitor() -> DeviceTable:
+    """Start the shared monitor (once) and serve device listings from it."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            monitor = HotplugMonitor(DeviceTable())
+            monitor.start()
+            storage_devices.attach_device_table(monitor.table)
+            _monitor = monitor
+        return _monitor.table
+
+
+def stop_hotplug_monitor() -> None:
+    """Stop the shared monitor and return device listings to lsblk."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            return
+        storage_devices.attach_device_table(None)
+        _monitor.stop()
+        _monitor = None
+
+
+def get_device_table() -> DeviceTable | None:
+    """Return the live device table, or None when the monitor is not running."""
+    monitor = _monitor
+    return monitor.table if monitor is not None else None
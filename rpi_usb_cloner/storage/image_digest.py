@@ -0,0 +1,301 @@
+"""Sidecar digest cache for raw images (ISO and ImageUSB .BIN).
+
+Verifying a raw image write naively means hashing the whole image file and the
+whole target every time. The image side never changes between writes, so its
+SHA256 is stored next to the image in a small JSON sidecar
+(``<image>.sha256.json``) keyed on the file size, mtime and payload offset. Once
+the sidecar exists, write-verify only has to read the target.
+
+The digest is computed at most once per image version: in a background thread
+alongside the first write (the write and the hash share the page cache, so the
+image is effectively read once) or on demand when verification needs it.
+
+ImageUSB files carry a 512-byte header in front of the raw disk, so their
+digest covers the payload only; callers pass ``offset`` for that.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.storage.devices import human_size
+
+
+log = get_logger(source=__name__, tags=["verify"])
+
+DIGEST_SIDECAR_SUFFIX = ".sha256.json"
+DIGEST_ALGORITHM = "sha256"
+DIGEST_CHUNK_SIZE = 4 * 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+_pending_lock = threading.Lock()
+_pending: dict[tuple[str, int], threading.Thread] = {}
+
+
+def get_sidecar_path(image_path: Path) -> Path:
+    """Return the digest sidecar path for an image."""
+    return image_path.with_name(f"{image_path.name}{DIGEST_SIDECAR_SUFFIX}")
+
+
+def load_cached_digest(image_path: Path, offset: int = 0) -> str | None:
+    """Return the cached digest if the sidecar still matches the image.
+
+    The sidecar is ignored when the image size or mtime changed since it was
+    written, or when it was computed for a different payload offset.
+    """
+    try:
+        stat = image_path.stat()
+        record = json.loads(get_sidecar_path(image_path).read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    if (
+        record.get("algorithm") != DIGEST_ALGORITHM
+        or record.get("size") != stat.st_size
+        or record.get("mtime_ns") != stat.st_mtime_ns
+        or record.get("offset") != offset
+    ):
+        return None
+    digest = record.get("digest")
+    return digest if isinstance(digest, str) and digest else None
+
+
+def store_digest(
+    image_path: Path,
+    digest: str,
+    offset: int = 0,
+    *,
+    stat_result: os.stat_result | None = None,
+) -> bool:
+    """Write the digest sidecar atomically.
+
+    Args:
+        image_path: Image the digest belongs to
+        digest: Hex digest of the image payload
+        offset: Payload offset the digest was computed from
+        stat_result: Image stat taken before hashing; a later mtime means the
+            image changed while it was being hashed and nothing is stored
+
+    Returns:
+        True if the sidecar was written, False otherwise (e.g. read-only repo)
+    """
+    sidecar = get_sidecar_path(image_path)
+    try:
+        stat = image_path.stat()
+        if stat_result is not None and (
+            stat.st_size != stat_result.st_size
+            or stat.st_mtime_ns != stat_result.st_mtime_ns
+        ):
+            log.warning(f"Image changed while hashing, not caching: {image_path}")
+            return False
+        record = {
+            "algorithm": DIGEST_ALGORITHM,
+            "digest": digest,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "offset": offset,
+        }
+        temp_path = sidecar.with_name(f".{sidecar.name}.tmp")
+        temp_path.write_text(json.dumps(record))
+        temp_path.replace(sidecar)
+    except OSError as error:
+        log.warning(f"Unable to write digest sidecar {sidecar}: {error}")
+        return False
+    return True
+
+
+def _hash_stream(
+    handle,
+    length: int | None,
+    *,
+    title: str,
+    progress_callback: Callable[[list[str], float | None], None] | None,
+) -> str:
+    hasher = hashlib.sha256()
+    buffer = bytearray(DIGEST_CHUNK_SIZE)
+    view = memoryview(buffer)
+    done = 0
+    last_emit = 0.0
+    while length is None or done < length:
+        want = (
+            DIGEST_CHUNK_SIZE
+            if length is None
+            else min(DIGEST_CHUNK_SIZE, length - done)
+        )
+        count = handle.readinto(view[:want])
+        if not count:
+            break
+        hasher.update(view[:count])
+        done += count
+        now = time.monotonic()
+        if progress_callback and now - last_emit >= PROGRESS_INTERVAL_SECONDS:
+            last_emit = now
+            ratio = done / length if length else None
+            percent = f" {ratio * 100:.1f}%" if ratio is not None else ""
+            progress_callback([title, f"{human_size(done)}{percent}"], ratio)
+    if length is not None and done < length:
+        raise RuntimeError(f"Short read: {done} of {length} bytes")
+    if progress_callback:
+        progress_callback([title, "Complete"], 1.0)
+    return hasher.hexdigest()
+
+
+def compute_image_digest(
+    image_path: Path,
+    offset: int = 0,
+    *,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> str:
+    """Hash an image payload (from ``offset`` to EOF) and cache the result.
+
+    Raises:
+        RuntimeError: If the image cannot be read
+    """
+    try:
+        stat_result = image_path.stat()
+        with image_path.open("rb", buffering=0) as handle:
+            handle.seek(offset)
+            digest = _hash_stream(
+                handle,
+                stat_result.st_size - offset,
+                title="HASH IMAGE",
+                progress_callback=progress_callback,
+            )
+    except OSError as error:
+        raise RuntimeError(f"Cannot read image {image_path}: {error}") from error
+    store_digest(image_path, digest, offset, stat_result=stat_result)
+    log.debug(f"Computed digest for {image_path.name}: {digest}")
+    return digest
+
+
+def get_image_digest(
+    image_path: Path,
+    offset: int = 0,
+    *,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> str:
+    """Return the image digest, from the sidecar when possible.
+
+    Waits for a background hash of the same image if one is running, so the
+    image is never hashed twice concurrently.
+    """
+    key = (str(image_path), offset)
+    with _pending_lock:
+        pending = _pending.get(key)
+    if pending is not None:
+        if progress_callback:
+            progress_callback(["HASH IMAGE", "Finishing..."], None)
+        pending.join()
+    cached = load_cached_digest(image_path, offset)
+    if cached:
+        return cached
+    return compute_image_digest(image_path, offset, progress_callback=progress_callback)
+
+
+def start_background_digest(
+    image_path: Path, offset: int = 0
+) -> threading.Thread | None:
+    """Hash an image in the background unless a valid sidecar already exists.
+
+    Intended to run alongside the first write of an image. Errors are logged
+    and leave no sidecar behind; verification then hashes on demand.
+
+    Returns:
+        The worker thread, or None if no hashing was needed or one is running
+    """
+    if load_cached_digest(image_path, offset):
+        return None
+    key = (str(image_path), offset)
+
+    def worker() -> None:
+        try:
+            compute_image_digest(image_path, offset)
+        except RuntimeError as error:
+            log.warning(f"Background digest failed for {image_path.name}: {error}")
+        finally:
+            with _pending_lock:
+                _pending.pop(key, None)
+
+    with _pending_lock:
+        if key in _pending:
+            return None
+        thread = threading.Thread(target=worker, daemon=True)
+        _pending[key] = thread
+        thread.start()
+    return thread
+
+
+def hash_device_range(
+    device_node: str,
+    length: int,
+    *,
+    title: str = "VERIFY DST",
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> str:
+    """Hash the first ``length`` bytes of a device.
+
+    Cached pages for the device are dropped first so the hash reflects what
+    actually reached the media rather than what is still in the page cache.
+
+    Raises:
+        RuntimeError: If the device cannot be read or is shorter than ``length``
+    """
+    try:
+        with open(device_node, "rb", buffering=0) as handle:
+            fadvise = getattr(os, "posix_fadvise", None)
+            if fadvise is not None:
+                with contextlib.suppress(OSError):
+                    fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            return _hash_stream(
+                handle, length, title=title, progress_callback=progress_callback
+            )
+    except OSError as error:
+        raise RuntimeError(f"Cannot read {device_node}: {error}") from error
+
+
+def verify_image_write(
+    image_path: Path,
+    target_node: str,
+    offset: int = 0,
+    *,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> bool:
+    """Verify that a target device starts with the image payload.
+
+    Uses the cached image digest, so with a valid sidecar only the target is
+    read.
+
+    Args:
+        image_path: Image that was written
+        target_node: Device node that was written to
+        offset: Payload offset inside the image (512 for ImageUSB files)
+        progress_callback: Optional callback for progress updates
+
+    Returns:
+        True if the target matches the image, False otherwise
+    """
+    try:
+        length = image_path.stat().st_size - offset
+        image_digest = get_image_digest(
+            image_path, offset, progress_callback=progress_callback
+        )
+        target_digest = hash_device_range(
+            target_node, length, progress_callback=progress_callback
+        )
+    except (OSError, RuntimeError) as error:
+        log.error(f"Verify failed: {error}")
+        return False
+    if image_digest != target_digest:
+        log.error(f"Verify mismatch for {image_path.name} -> {target_node}")
+        return False
+    log.info(f"Verify complete: {target_node} matches {image_path.name}")
+    return True
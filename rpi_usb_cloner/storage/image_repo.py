@@ -6,8 +6,17 @@ from typing import Iterable
 
 from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
 from rpi_usb_cloner.logging import LoggerFactory
-from rpi_usb_cloner.storage import clonezilla, devices, imageusb, mount
+from rpi_usb_cloner.storage import (
+    block_index,
+    clonezilla,
+    compressed_image,
+    devices,
+    image_size_index,
+    imageusb,
+    mount,
+)
 from rpi_usb_cloner.storage.imageusb.detection import get_imageusb_metadata
+from rpi_usb_cloner.storage.mount_table import mountpoint_of
 
 
 REPO_FLAG_FILENAME = ".rpi-usb-cloner-image-repo"
@@ -24,13 +33,15 @@ def _iter_partitions(device: dict) -> Iterable[dict]:
 
 
 def _resolve_mountpoint(partition: dict) -> Path | None:
-    mountpoint = partition.get("mountpoint")
-    if mountpoint:
-        return Path(mountpoint)
     name = partition.get("name")
     if not name:
-        return None
+        mountpoint = partition.get("mountpoint")
+        return Path(mountpoint) if mountpoint else None
     partition_node = f"/dev/{name}"
+    # The live mount table is current even when the device listing is not
+    mountpoint = mountpoint_of(partition_node) or partition.get("mountpoint")
+    if mountpoint:
+        return Path(mountpoint)
 
     # Attempt to mount the partition, handle new exceptions
     try:
@@ -40,17 +51,7 @@ def _resolve_mountpoint(partition: dict) -> Path | None:
         # Returning None will cause this partition to be skipped
         return None
 
-    mounted_partition = None
-    for device in devices.list_usb_disks():
-        for child in _iter_partitions(device):
-            if child.get("name") == name:
-                mounted_partition = child
-                break
-        if mounted_partition:
-            break
-    if not mounted_partition:
-        return None
-    mountpoint = mounted_partition.get("mountpoint")
+    mountpoint = mountpoint_of(partition_node)
     if not mountpoint:
         return None
     return Path(mountpoint)
@@ -97,14 +98,15 @@ def find_image_repos(flag_filename: str = REPO_FLAG_FILENAME) -> list[ImageRepo]
 
 
 def list_clonezilla_images(repo_root: Path) -> list[DiskImage]:
-    """List all Clonezilla images, ISO files, and ImageUSB .BIN files in a repository.
+    """List all Clonezilla images, ISO, ImageUSB .BIN and compressed raw images in a repository.
 
     Searches for Clonezilla image directories in common locations:
     - {repo_root}/clonezilla/
     - {repo_root}/images/
     - {repo_root}/
 
-    Also includes ISO files and ImageUSB .BIN files found in the repository root.
+    Also includes ISO files, ImageUSB .BIN files and compressed raw images
+    (.img.xz, .img.gz, .img.zst, .zip) found in the repository root.
 
     Args:
         repo_root: Root path of the image repository
@@ -112,7 +114,7 @@ def list_clonezilla_images(repo_root: Path) -> list[DiskImage]:
     Returns:
         List of DiskImage objects sorted by name
     """
-    candidates = [repo_root / "clonezilla", repo_root / "images", repo_root]
+    candidates = repo_candidate_dirs(repo_root)
     images: list[DiskImage] = []
     seen: set[Path] = set()
 
@@ -170,11 +172,65 @@ def list_clonezilla_images(repo_root: Path) -> list[DiskImage]:
             images.append(image)
             seen.add(bin_file)
 
+    # Also include compressed raw images (.img.xz, .zip, ...) from the repo root
+    for entry in _iter_repo_root(repo_root):
+        if entry in seen or not compressed_image.is_compressed_image_file(entry):
+            continue
+        try:
+            size_bytes = entry.stat().st_size
+        except OSError:
+            size_bytes = None
+
+        image = DiskImage(
+            name=entry.name,
+            path=entry,
+            image_type=ImageType.COMPRESSED_RAW,
+            size_bytes=size_bytes,
+        )
+        images.append(image)
+        seen.add(entry)
+
     return sorted(images, key=lambda img: img.name)
 
 
+def repo_candidate_dirs(repo_root: Path) -> list[Path]:
+    """Directories whose subdirectories may be Clonezilla images."""
+    return [repo_root / "clonezilla", repo_root / "images", repo_root]
+
+
+def classify_repo_entry(repo_root: Path, path: Path) -> DiskImage | None:
+    """Return the image a single repo entry represents, or None.
+
+    Applies the same rules as list_clonezilla_images() to one path, so a
+    catalog can re-check only the entries that changed.
+    """
+    try:
+        if path.parent in repo_candidate_dirs(repo_root) and path.is_dir():
+            if not clonezilla.is_clonezilla_image_dir(path):
+                return None
+            return DiskImage(
+                name=path.name, path=path, image_type=ImageType.CLONEZILLA_DIR
+            )
+        if path.parent != repo_root or not path.is_file():
+            return None
+        if path.suffix == ".iso":
+            image_type = ImageType.ISO
+        elif path.suffix == ".bin" and imageusb.is_imageusb_file(path):
+            image_type = ImageType.IMAGEUSB_BIN
+        elif compressed_image.is_compressed_image_file(path):
+            image_type = ImageType.COMPRESSED_RAW
+        else:
+            return None
+        size_bytes: int | None = path.stat().st_size
+    except OSError:
+        return None
+    return DiskImage(
+        name=path.name, path=path, image_type=image_type, size_bytes=size_bytes
+    )
+
+
 def _iter_clonezilla_image_dirs(repo_root: Path) -> Iterable[Path]:
-    candidates = [repo_root / "clonezilla", repo_root / "images", repo_root]
+    candidates = repo_candidate_dirs(repo_root)
     seen: set[Path] = set()
     for candidate in candidates:
         for image_dir in clonezilla.list_clonezilla_image_dirs(candidate):
@@ -184,6 +240,13 @@ def _iter_clonezilla_image_dirs(repo_root: Path) -> Iterable[Path]:
             yield image_dir
 
 
+def _iter_repo_root(repo_root: Path) -> list[Path]:
+    try:
+        return list(repo_root.iterdir())
+    except OSError:
+        return []
+
+
 def _is_temp_clonezilla_path(path: Path) -> bool:
     lowered = path.name.lower()
     if lowered.startswith("."):
@@ -214,15 +277,52 @@ def _sum_tree_bytes(root: Path) -> int:
     return total
 
 
+def _size_index_for(repo_root: Path) -> image_size_index.ImageSizeIndex:
+    # Only write sidecars into real repos
+    persist = (repo_root / REPO_FLAG_FILENAME).exists()
+    return image_size_index.get_size_index(repo_root, persist=persist)
+
+
+def _repo_root_of(image_dir: Path) -> Path:
+    for candidate in (image_dir.parent, image_dir.parent.parent):
+        if (candidate / REPO_FLAG_FILENAME).exists():
+            return candidate
+    return image_dir.parent
+
+
 def get_image_size_bytes(image: DiskImage) -> int | None:
-    """Return size for a disk image, computing Clonezilla directory sizes."""
+    """Return size for a disk image, computing Clonezilla directory sizes.
+
+    Clonezilla directory sizes come from the repo's size index and are only
+    re-measured when the directory changed.
+    """
     if image.size_bytes is not None:
         return image.size_bytes
     if image.image_type == ImageType.CLONEZILLA_DIR:
-        return _sum_tree_bytes(image.path)
+        index = _size_index_for(_repo_root_of(image.path))
+        size_bytes = index.tree_bytes(image.path, _sum_tree_bytes)
+        index.save()
+        return size_bytes
     return None
 
 
+def get_repo_free_bytes(repo: ImageRepo) -> int:
+    """Return the free space of a repo's filesystem, without measuring images."""
+    return _get_repo_space_bytes(repo.path)[2]
+
+
+def get_repo_block_index(repo_root: Path) -> block_index.BlockIndex:
+    """Return the block digest index of a repo."""
+    # Only write sidecars into real repos
+    persist = (repo_root / REPO_FLAG_FILENAME).exists()
+    return block_index.get_block_index(repo_root, persist=persist)
+
+
+def get_image_block_index(image: DiskImage) -> block_index.BlockIndex:
+    """Return the block digest index of the repo holding an image."""
+    return get_repo_block_index(_repo_root_of(image.path))
+
+
 def _get_repo_space_bytes(repo_root: Path) -> tuple[int, int, int]:
     try:
         stats = os.statvfs(repo_root)
@@ -234,16 +334,71 @@ def _get_repo_space_bytes(repo_root: Path) -> tuple[int, int, int]:
     return total_bytes, used_bytes, free_bytes
 
 
-def get_repo_usage(repo: ImageRepo) -> dict[str, dict[str, int] | int]:
-    """Compute repository usage statistics and image size aggregates."""
+def _imageusb_data_bytes(bin_file: Path) -> int:
+    metadata = get_imageusb_metadata(bin_file)
+    size_bytes = metadata.get("data_size_bytes") or metadata.get("size_bytes") or 0
+    return max(0, int(size_bytes))
+
+
+def get_repo_usage(
+    repo: ImageRepo, images: Iterable[DiskImage] | None = None
+) -> dict[str, dict[str, int] | int]:
+    """Compute repository usage statistics and image size aggregates.
+
+    Args:
+        repo: Repository to measure
+        images: The repo's images if already known (e.g. from the repo
+            catalog); otherwise they are discovered here
+
+    Clonezilla directory and ImageUSB sizes come from the repo's size index,
+    so only images that changed since the last call are re-measured.
+    """
     total_bytes, used_bytes, free_bytes = _get_repo_space_bytes(repo.path)
+    index = _size_index_for(repo.path)
+
+    if images is None:
+        image_dirs = list(_iter_clonezilla_image_dirs(repo.path))
+        iso_files = list(repo.path.glob("*.iso"))
+        bin_files = [
+            bin_file
+            for bin_file in repo.path.glob("*.bin")
+            if bin_file.is_file()
+            and not bin_file.is_symlink()
+            and imageusb.is_imageusb_file(bin_file)
+        ]
+        compressed_files = [
+            entry
+            for entry in _iter_repo_root(repo.path)
+            if compressed_image.is_compressed_image_file(entry)
+        ]
+    else:
+        images = list(images)
+        image_dirs = [
+            image.path
+            for image in images
+            if image.image_type == ImageType.CLONEZILLA_DIR
+        ]
+        iso_files = [
+            image.path for image in images if image.image_type == ImageType.ISO
+        ]
+        bin_files = [
+            image.path
+            for image in images
+            if image.image_type == ImageType.IMAGEUSB_BIN
+            and not image.path.is_symlink()
+        ]
+        compressed_files = [
+            image.path
+            for image in images
+            if image.image_type == ImageType.COMPRESSED_RAW
+        ]
 
     clonezilla_bytes = 0
-    for image_dir in _iter_clonezilla_image_dirs(repo.path):
-        clonezilla_bytes += _sum_tree_bytes(image_dir)
+    for image_dir in image_dirs:
+        clonezilla_bytes += index.tree_bytes(image_dir, _sum_tree_bytes)
 
     iso_bytes = 0
-    for iso_file in repo.path.glob("*.iso"):
+    for iso_file in iso_files:
         try:
             if iso_file.is_file() and not iso_file.is_symlink():
                 iso_bytes += iso_file.stat().st_size
@@ -251,16 +406,23 @@ def get_repo_usage(repo: ImageRepo) -> dict[str, dict[str, int] | int]:
             continue
 
     imageusb_bytes = 0
-    for bin_file in repo.path.glob("*.bin"):
-        if not bin_file.is_file() or bin_file.is_symlink():
-            continue
-        if not imageusb.is_imageusb_file(bin_file):
+    for bin_file in bin_files:
+        imageusb_bytes += index.file_bytes(bin_file, _imageusb_data_bytes)
+
+    compressed_bytes = 0
+    for compressed_file in compressed_files:
+        try:
+            if not compressed_file.is_symlink():
+                compressed_bytes += compressed_file.stat().st_size
+        except OSError:
             continue
-        metadata = get_imageusb_metadata(bin_file)
-        size_bytes = metadata.get("data_size_bytes") or metadata.get("size_bytes") or 0
-        imageusb_bytes += max(0, int(size_bytes))
 
-    other_bytes = max(0, used_bytes - (clonezilla_bytes + iso_bytes + imageusb_bytes))
+    index.save()
+
+    other_bytes = max(
+        0,
+        used_bytes - (clonezilla_bytes + iso_bytes + imageusb_bytes + compressed_bytes),
+    )
 
     return {
         "total_bytes": total_bytes,
@@ -270,6 +432,7 @@ def get_repo_usage(repo: ImageRepo) -> dict[str, dict[str, int] | int]:
             "clonezilla": clonezilla_bytes,
             "iso": iso_bytes,
             "imageusb": imageusb_bytes,
+            "compressed": compressed_bytes,
             "other": other_bytes,
         },
     }
@@ -0,0 +1,150 @@
+"""Persistent size index for image repos.
+
+Sizing a Clonezilla image means walking and stat-ing every file in its
+directory, and sizing an ImageUSB .BIN means opening it to read its header.
+The web UI does both for every image every 30 seconds. The size index
+remembers each result in a JSON sidecar on the repo
+(``.rpi-usb-cloner-size-index.json``) together with a stamp of what it was
+computed from:
+
+- Clonezilla directories: inode, size and mtime of the image directory and
+  of everything in it. Directory mtimes change whenever a file is added,
+  removed or renamed; file sizes and mtimes catch volumes that grow in place
+- files: inode, size and mtime
+
+A lookup only re-stats the stamp, so answering repo usage costs one metadata
+lookup per file; only images whose stamp changed are re-measured.
+Like git's racy index entries, results for anything modified within the last
+couple of seconds are not stored, since writes may still be in flight.
+Repos that cannot be written to keep the index in memory only (see
+storage.sidecar_index).
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any, Callable, List
+
+from rpi_usb_cloner.storage.sidecar_index import (
+    IndexRegistry,
+    SidecarIndex,
+    is_settled,
+)
+
+
+SIZE_INDEX_FILENAME = ".rpi-usb-cloner-size-index.json"
+SIZE_INDEX_VERSION = 2
+
+# [relative path, inode, size, mtime_ns] per directory and file of a tree,
+# or [inode, size, mtime_ns] for a single file
+Stamp = List[Any]
+
+
+def _tree_stamp(image_dir: Path) -> Stamp | None:
+    stamp: Stamp = []
+    try:
+        for current, dirnames, files in os.walk(image_dir):
+            dirnames.sort()
+            directory = Path(current)
+            for path in (directory, *(directory / name for name in sorted(files))):
+                stat = path.stat()
+                relative = str(path.relative_to(image_dir))
+                stamp.append([relative, stat.st_ino, stat.st_size, stat.st_mtime_ns])
+    except OSError:
+        return None
+    return stamp or None
+
+
+def _tree_stamp_matches(image_dir: Path, stamp: Stamp) -> bool:
+    for item in stamp:
+        try:
+            relative, inode, size, mtime_ns = item
+            stat = (image_dir / relative).stat()
+        except (OSError, TypeError, ValueError):
+            return False
+        if (stat.st_ino, stat.st_size, stat.st_mtime_ns) != (inode, size, mtime_ns):
+            return False
+    return True
+
+
+def _file_stamp(path: Path) -> Stamp | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def _newest_mtime_ns(stamp: Stamp, *, tree: bool) -> int:
+    if tree:
+        return max(entry[3] for entry in stamp)
+    return stamp[2]
+
+
+class ImageSizeIndex(SidecarIndex):
+    """Sizes of the images in one repo, re-measured only when they change."""
+
+    FILENAME = SIZE_INDEX_FILENAME
+    VERSION = SIZE_INDEX_VERSION
+    DESCRIPTION = "size index"
+
+    def tree_bytes(self, image_dir: Path, measure: Callable[[Path], int]) -> int:
+        """Return the size of an image directory, measuring it only if changed."""
+        key = self._key(image_dir)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry.get("kind") == "tree"
+                and _tree_stamp_matches(image_dir, entry["stamp"])
+            ):
+                return int(entry["bytes"])
+        # Stamp before measuring so a change during the walk is seen next time
+        stamp = _tree_stamp(image_dir)
+        size_bytes = measure(image_dir)
+        self._store(key, "tree", stamp, size_bytes)
+        return size_bytes
+
+    def file_bytes(self, path: Path, measure: Callable[[Path], int]) -> int:
+        """Return a value derived from a file, re-measuring only if it changed."""
+        key = self._key(path)
+        stamp = _file_stamp(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry.get("kind") == "file"
+                and stamp is not None
+                and entry.get("stamp") == stamp
+            ):
+                return int(entry["bytes"])
+        size_bytes = measure(path)
+        self._store(key, "file", stamp, size_bytes)
+        return size_bytes
+
+    def _store(self, key: str, kind: str, stamp: Stamp | None, size_bytes: int) -> None:
+        if stamp is None:
+            return
+        if not is_settled(_newest_mtime_ns(stamp, tree=kind == "tree")):
+            # Still being written; measure again next time
+            return
+        self._put(key, {"kind": kind, "stamp": stamp, "bytes": size_bytes})
+
+    def _valid_entry(self, entry: dict[str, Any]) -> bool:
+        return isinstance(entry.get("stamp"), list) and isinstance(
+            entry.get("bytes"), int
+        )
+
+
+_indexes: IndexRegistry[ImageSizeIndex] = IndexRegistry(ImageSizeIndex)
+
+
+def get_size_index(repo_root: Path, *, persist: bool = True) -> ImageSizeIndex:
+    """Return the shared size index for a repo, loading its sidecar once."""
+    return _indexes.get(repo_root, persist=persist)
+
+
+def clear_size_indexes() -> None:
+    """Forget all loaded indexes; sidecars are re-read on next use."""
+    _indexes.clear()
@@ -10,11 +10,12 @@ Format structure:
 The first 16 bytes contain the UTF-16LE signature "imageUSB".
 """
 
-from .detection import is_imageusb_file, validate_imageusb_file
+from .detection import IMAGEUSB_HEADER_SIZE, is_imageusb_file, validate_imageusb_file
 from .restore import restore_imageusb_file
 
 
 __all__ = [
+    "IMAGEUSB_HEADER_SIZE",
     "is_imageusb_file",
     "validate_imageusb_file",
     "restore_imageusb_file",
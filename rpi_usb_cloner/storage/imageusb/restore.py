@@ -9,7 +9,7 @@ from pathlib import Path
 from typing import Callable
 
 from rpi_usb_cloner.logging import get_logger
-from rpi_usb_cloner.storage import devices
+from rpi_usb_cloner.storage import devices, image_digest
 from rpi_usb_cloner.storage.clone.command_runners import (
     run_checked_with_streaming_progress,
 )
@@ -120,6 +120,9 @@ def restore_imageusb_file(
         if progress_callback:
             progress_callback([title, subtitle], 0.0)
 
+        # Hash the payload alongside the write for later verification
+        image_digest.start_background_digest(image_path, IMAGEUSB_HEADER_SIZE)
+
         # Use the clone module's progress tracking
         run_checked_with_streaming_progress(
             command,
@@ -1,6 +1,9 @@
 """ISO image writing functionality.
 
 This module provides support for writing ISO files directly to USB devices.
+The image digest is cached alongside the first write so a later verify only
+needs to read the target (see ``image_digest``). ISO files staged from a
+network repo are streamed into ``dd`` instead (see ``remote_repo``).
 """
 
 from __future__ import annotations
@@ -11,7 +14,7 @@ import subprocess
 from pathlib import Path
 from typing import Callable
 
-from rpi_usb_cloner.storage import clone, devices
+from rpi_usb_cloner.storage import clone, devices, image_digest, remote_repo
 from rpi_usb_cloner.storage.clone import resolve_device_node
 
 
@@ -42,7 +45,7 @@ def restore_iso_image(
         raise RuntimeError("Failed to unmount target device before ISO restore")
 
     # Get ISO size
-    iso_size = iso_path.stat().st_size
+    iso_size = remote_repo.file_size(iso_path)
     target_size = _get_device_size_bytes(target_info, target_node)
 
     if target_size and iso_size > target_size:
@@ -64,6 +67,13 @@ def restore_iso_image(
         "conv=fsync",
     ]
 
+    if remote_repo.staged_file(iso_path) is not None:
+        _write_streamed_iso(
+            iso_path, command, iso_size, progress_callback=progress_callback
+        )
+        return
+
+    image_digest.start_background_digest(iso_path)
     clone.run_checked_with_streaming_progress(
         command,
         title=f"Writing {iso_path.name}",
@@ -72,6 +82,39 @@ def restore_iso_image(
     )
 
 
+def _write_streamed_iso(
+    iso_path: Path,
+    command: list[str],
+    iso_size: int,
+    *,
+    progress_callback: Callable[[list[str], float | None], None] | None = None,
+) -> None:
+    """Feed a network ISO to dd on stdin while it downloads."""
+    # Read stdin instead of the placeholder, in full blocks despite the pipe
+    command = [arg for arg in command if not arg.startswith("if=")]
+    command.append("iflag=fullblock")
+    feeder = remote_repo.open_volumes([iso_path])
+    error: Exception | None = None
+    try:
+        clone.run_checked_with_streaming_progress(
+            command,
+            title=f"Writing {iso_path.name}",
+            total_bytes=iso_size,
+            stdin_source=feeder.stdout,
+            progress_callback=progress_callback,
+        )
+    except Exception as exc:
+        error = exc
+    finally:
+        if feeder.stdout:
+            feeder.stdout.close()
+        feeder.wait()
+    if error:
+        raise error
+    if feeder.returncode != 0:
+        raise RuntimeError("Image stream failed")
+
+
 def _get_blockdev_size_bytes(device_node: str) -> int | None:
     """Get device size using blockdev command."""
     blockdev = shutil.which("blockdev")
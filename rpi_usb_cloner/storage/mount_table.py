@@ -0,0 +1,243 @@
+"""Indexed, change-driven view of the kernel mount table.
+
+Checking whether a mountpoint is still active used to mean re-reading and
+scanning ``/proc/mounts`` for every mountpoint checked, inside unmount retry
+loops. The mount table here parses ``/proc/self/mountinfo`` once into three
+indexes (mountpoint, source device node and major:minor number) and keeps the
+file open: the kernel flags an open mountinfo file with POLLPRI whenever
+anything is mounted or unmounted, so each lookup costs a zero-timeout poll
+and the file is only re-read after a real change.
+
+Consumers share one table through ``get_mount_table()`` or the
+``is_mountpoint_active()`` / ``mountpoint_of()`` shortcuts. Where mountinfo
+cannot be opened, lookups fall back to ``os.path.ismount`` and an empty table.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import select
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+
+log = LoggerFactory.for_usb()
+
+MOUNTINFO_PATH = Path("/proc/self/mountinfo")
+
+
+@dataclass(frozen=True)
+class MountEntry:
+    """One line of /proc/self/mountinfo."""
+
+    devno: str
+    root: str
+    mountpoint: str
+    fstype: str
+    source: str
+
+
+def _decode_octal_escapes(value: str) -> str:
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), value)
+
+
+def parse_mountinfo(text: str) -> list[MountEntry]:
+    """Parse mountinfo text into entries, in mount order."""
+    entries: list[MountEntry] = []
+    for line in text.splitlines():
+        fields = line.split()
+        # Optional fields end with "-", followed by fstype and source
+        if len(fields) < 7 or "-" not in fields[6:]:
+            continue
+        separator = fields.index("-", 6)
+        if len(fields) < separator + 3:
+            continue
+        entries.append(
+            MountEntry(
+                devno=fields[2],
+                root=_decode_octal_escapes(fields[3]),
+                mountpoint=_decode_octal_escapes(fields[4]),
+                fstype=fields[separator + 1],
+                source=_decode_octal_escapes(fields[separator + 2]),
+            )
+        )
+    return entries
+
+
+def _device_number(node: str) -> str | None:
+    try:
+        rdev = Path(node).stat().st_rdev
+    except OSError:
+        return None
+    if not rdev:
+        return None
+    return f"{os.major(rdev)}:{os.minor(rdev)}"
+
+
+class MountTable:
+    """Mount table indexes refreshed when the kernel signals a change."""
+
+    def __init__(self, path: Path = MOUNTINFO_PATH) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._file: IO[str] | None = None
+        self._poller: select.poll | None = None
+        self._loaded = False
+        self._generation = 0
+        self._entries: list[MountEntry] = []
+        self._by_mountpoint: dict[str, MountEntry] = {}
+        self._by_source: dict[str, list[MountEntry]] = {}
+        self._by_devno: dict[str, list[MountEntry]] = {}
+
+    @property
+    def available(self) -> bool:
+        """True when lookups are served from mountinfo."""
+        self.refresh_if_changed()
+        return self._file is not None
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped each time the mount table content changes."""
+        self.refresh_if_changed()
+        return self._generation
+
+    def fileno(self) -> int | None:
+        """The watched mountinfo descriptor, for callers' own poll loops."""
+        self.refresh_if_changed()
+        return self._file.fileno() if self._file is not None else None
+
+    def refresh_if_changed(self) -> bool:
+        """Re-read mountinfo if the kernel flagged a change since the last read.
+
+        Returns:
+            True if the table content changed
+        """
+        with self._lock:
+            if not self._loaded:
+                self._open()
+                return self._reload()
+            if self._poller is None or not self._poller.poll(0):
+                return False
+            return self._reload()
+
+    def refresh(self) -> bool:
+        """Re-read mountinfo unconditionally; returns True if it changed."""
+        with self._lock:
+            if not self._loaded:
+                self._open()
+            return self._reload()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._poller = None
+            self._loaded = False
+
+    def entries(self) -> list[MountEntry]:
+        self.refresh_if_changed()
+        return list(self._entries)
+
+    def is_mountpoint_active(self, mountpoint: str) -> bool:
+        self.refresh_if_changed()
+        if self._file is None:
+            return os.path.ismount(mountpoint)
+        return mountpoint in self._by_mountpoint
+
+    def entry_for_mountpoint(self, mountpoint: str) -> MountEntry | None:
+        self.refresh_if_changed()
+        return self._by_mountpoint.get(mountpoint)
+
+    def mounts_of(self, device: str) -> list[MountEntry]:
+        """Return the mounts of a device node (``/dev/sda1``) or "major:minor"."""
+        self.refresh_if_changed()
+        if ":" in device and not device.startswith("/"):
+            return list(self._by_devno.get(device, []))
+        found = self._by_source.get(device)
+        if found:
+            return list(found)
+        # Mounted under another name (by-uuid link, mapper path): match numbers
+        devno = _device_number(device)
+        return list(self._by_devno.get(devno, [])) if devno else []
+
+    def mountpoint_of(self, device: str) -> str | None:
+        """Return the first mountpoint of a device, preferring full mounts."""
+        mounts = self.mounts_of(device)
+        return self._preferred(mounts).mountpoint if mounts else None
+
+    def mountpoints_by_devno(self) -> dict[str, str]:
+        """Map "major:minor" to its first mountpoint, as lsblk reports it."""
+        self.refresh_if_changed()
+        return {
+            devno: self._preferred(entries).mountpoint
+            for devno, entries in self._by_devno.items()
+        }
+
+    @staticmethod
+    def _preferred(entries: list[MountEntry]) -> MountEntry:
+        for entry in entries:
+            if entry.root == "/":
+                return entry
+        return entries[0]
+
+    def _open(self) -> None:
+        self._loaded = True
+        try:
+            self._file = self._path.open(encoding="utf-8", errors="replace")
+        except OSError as error:
+            log.debug(f"Mount table unavailable: {error}", tags=["mounts"])
+            self._file = None
+            return
+        self._poller = select.poll()
+        self._poller.register(self._file, select.POLLPRI | select.POLLERR)
+
+    def _reload(self) -> bool:
+        if self._file is None:
+            return False
+        self._file.seek(0)
+        entries = parse_mountinfo(self._file.read())
+        if entries == self._entries and self._generation:
+            return False
+        by_mountpoint: dict[str, MountEntry] = {}
+        by_source: dict[str, list[MountEntry]] = {}
+        by_devno: dict[str, list[MountEntry]] = {}
+        for entry in entries:
+            # Later mounts on the same path shadow earlier ones
+            by_mountpoint[entry.mountpoint] = entry
+            by_source.setdefault(entry.source, []).append(entry)
+            by_devno.setdefault(entry.devno, []).append(entry)
+        self._entries = entries
+        self._by_mountpoint = by_mountpoint
+        self._by_source = by_source
+        self._by_devno = by_devno
+        self._generation += 1
+        return True
+
+
+_mount_table: MountTable | None = None
+_mount_table_lock = threading.Lock()
+
+
+def get_mount_table() -> MountTable:
+    """Return the shared mount table, opening it on first use."""
+    global _mount_table
+    with _mount_table_lock:
+        if _mount_table is None:
+            _mount_table = MountTable()
+        return _mount_table
+
+
+def is_mountpoint_active(mountpoint: str) -> bool:
+    """Check if a mountpoint is currently active."""
+    return get_mount_table().is_mountpoint_active(mountpoint)
+
+
+def mountpoint_of(device: str) -> str | None:
+    """Return where a device node is mounted, or None."""
+    return get_mount_table().mountpoint_of(device)
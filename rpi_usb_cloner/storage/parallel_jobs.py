@@ -0,0 +1,174 @@
+"""Run a per-device operation (erase, format) on several drives at once.
+
+Erasing or formatting is I/O-bound, so a tray of drives finishes in about the
+time of the slowest one when the work runs concurrently. What limits that is
+the USB link the drives share: a USB 2.0 root hub saturates with a couple of
+sticks writing, while a USB 3 hub can feed several. Each job therefore takes a
+slot on its root hub's semaphore, sized from the hub speed, and an overall
+worker cap still applies.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from rpi_usb_cloner.logging import LoggerFactory
+
+
+log = LoggerFactory.for_clone()
+
+MAX_PARALLEL_DEVICE_JOBS = 8
+
+# (max root hub speed in Mb/s, concurrent jobs allowed on that hub)
+BUS_WORKER_LIMITS = ((480, 2), (5000, 4))
+FAST_BUS_WORKER_LIMIT = 6
+UNKNOWN_BUS_WORKER_LIMIT = 2
+
+ProgressCallback = Callable[[str, List[str], Optional[float]], None]
+DeviceOperation = Callable[[dict, Callable[[List[str], Optional[float]], None]], bool]
+
+
+@dataclass
+class DeviceJobResult:
+    """Outcome of one device's job in a parallel run."""
+
+    device: str
+    success: bool
+    error: str | None = None
+    duration_seconds: float = 0.0
+
+
+def _read_sysfs(path: Path) -> str | None:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def get_usb_bus(device_name: str) -> tuple[str, int] | None:
+    """Return (bus number, root hub speed in Mb/s) for a block device.
+
+    Returns:
+        None when the device is not on USB or sysfs is unavailable
+    """
+    block_dir = Path("/sys/class/block") / device_name
+    try:
+        current = block_dir.resolve()
+    except OSError:
+        return None
+    for directory in (current, *current.parents):
+        busnum = _read_sysfs(directory / "busnum")
+        if busnum is None:
+            continue
+        root_speed = _read_sysfs(
+            Path("/sys/bus/usb/devices") / f"usb{busnum}" / "speed"
+        )
+        try:
+            return busnum, int(float(root_speed or 0))
+        except ValueError:
+            return busnum, 0
+    return None
+
+
+def bus_worker_limit(speed_mbps: int) -> int:
+    """Concurrent jobs a root hub of the given speed can sustain."""
+    if speed_mbps <= 0:
+        return UNKNOWN_BUS_WORKER_LIMIT
+    for max_speed, limit in BUS_WORKER_LIMITS:
+        if speed_mbps <= max_speed:
+            return limit
+    return FAST_BUS_WORKER_LIMIT
+
+
+def run_parallel_device_jobs(
+    devices: Sequence[dict],
+    operation: DeviceOperation,
+    *,
+    max_workers: int | None = None,
+    progress_callback: ProgressCallback | None = None,
+) -> list[DeviceJobResult]:
+    """Run ``operation(device, progress)`` on every device concurrently.
+
+    Args:
+        devices: Device dicts with a unique 'name'
+        operation: Per-device work returning True on success; it receives a
+            progress callback taking (lines, ratio)
+        max_workers: Overall concurrency cap (defaults to
+            MAX_PARALLEL_DEVICE_JOBS)
+        progress_callback: Receives (device_name, lines, ratio) updates
+
+    Returns:
+        One result per device, in input order
+
+    Raises:
+        ValueError: If a device has no name or appears twice
+    """
+    names = [device.get("name") for device in devices]
+    if not all(names):
+        raise ValueError("Every device needs a name")
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate devices in parallel job")
+
+    overall = threading.BoundedSemaphore(
+        max(1, min(max_workers or MAX_PARALLEL_DEVICE_JOBS, len(devices) or 1))
+    )
+    bus_slots: dict[str, threading.BoundedSemaphore] = {}
+    device_buses: dict[str, str] = {}
+    for name in names:
+        # Devices with unknown topology get a slot of their own, so only the
+        # overall cap applies to them
+        bus_key, speed = get_usb_bus(name) or (f"unknown:{name}", 0)
+        if bus_key not in bus_slots:
+            bus_slots[bus_key] = threading.BoundedSemaphore(bus_worker_limit(speed))
+        device_buses[name] = bus_key
+
+    results: dict[str, DeviceJobResult] = {}
+
+    def run(device: dict) -> None:
+        name = device["name"]
+
+        def report(lines: list[str], ratio: float | None) -> None:
+            if progress_callback:
+                progress_callback(name, lines, ratio)
+
+        report(["Waiting..."], 0.0)
+        with bus_slots[device_buses[name]], overall:
+            start = time.monotonic()
+            try:
+                success = bool(operation(device, report))
+                error = None if success else "failed"
+            except Exception as exc:  # noqa: BLE001 - reported per device
+                success = False
+                error = str(exc) or type(exc).__name__
+                log.error(
+                    f"Parallel job failed on {name}: {error}",
+                    device=name,
+                    tags=["parallel"],
+                )
+        results[name] = DeviceJobResult(
+            device=name,
+            success=success,
+            error=error,
+            duration_seconds=round(time.monotonic() - start, 3),
+        )
+        report(["Done" if success else "Failed"], 1.0 if success else None)
+
+    threads = [
+        threading.Thread(target=run, args=(device,), daemon=True) for device in devices
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    log.info(
+        f"Parallel job finished: "
+        f"{sum(result.success for result in results.values())}/{len(devices)} ok",
+        devices=names,
+        tags=["parallel"],
+    )
+    return [results[name] for name in names]
@@ -0,0 +1,487 @@
+"""Network image repositories, read over HTTP range requests.
+
+Images on another machine can be restored without first copying them onto
+a local repo drive. The repo is served read-only over HTTP: the peer
+transfer server does this under ``/repo`` (see
+services.peer_transfer_server), and any static web server serving the repo
+directory works too once ``write_manifest()`` has put an ``index.json`` at
+its root.
+
+``RemoteRepo.list_images()`` reads the manifest. ``staged_image()`` makes a
+local stand-in for one image in a temporary directory: small files
+(partition tables, ``parts`` and the other Clonezilla metadata) are
+downloaded, and each image volume becomes an empty placeholder registered
+with its URL. The stand-in goes through the usual restore code, which opens
+volumes with ``open_volumes()``: local volumes are read by ``cat`` as
+before, while staged ones are streamed from the network straight into the
+restore pipeline.
+
+Streams fetch ahead on their own thread, so the download continues while
+the target drive is written, and resume from the last byte received with a
+``Range`` request when the connection drops.
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from rpi_usb_cloner.domain import DiskImage, ImageType
+from rpi_usb_cloner.logging import get_logger
+
+
+log = get_logger(source=__name__)
+
+MANIFEST_FILENAME = "index.json"
+MANIFEST_VERSION = 1
+# Image types that can be restored straight from the network
+STREAMABLE_TYPES = (ImageType.CLONEZILLA_DIR, ImageType.ISO)
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+READ_AHEAD_CHUNKS = 16
+# Consecutive failed requests before a stream gives up
+FETCH_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 1.0
+REQUEST_TIMEOUT_SECONDS = 30
+
+# Partition image volumes; the other files of an image are small metadata
+_VOLUME_PATTERN = re.compile(r"-ptcl-img|-dd-img|\.img")
+# Partial uploads (see services.resumable_transfer) are not part of an image
+_PARTIAL_SUFFIXES = (".part", ".part.blocks")
+
+
+class RemoteRepoError(Exception):
+    """Raised when a network repo cannot be read."""
+
+
+@dataclass
+class RemoteFile:
+    """A file of a network repo."""
+
+    url: str
+    size: int
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class RemoteImage:
+    """An image listed in a network repo's manifest."""
+
+    name: str
+    image_type: ImageType
+    path: str  # Relative to the repo root
+    size_bytes: int
+    files: tuple[tuple[str, int], ...]  # (name within the image, size)
+
+
+def _is_within(path: Path, root: Path) -> bool:
+    try:
+        path.relative_to(root)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_published(path: Path) -> bool:
+    return not path.name.startswith(".") and not path.name.endswith(_PARTIAL_SUFFIXES)
+
+
+def published_path(repo_root: Path, name: str) -> Path | None:
+    """The file ``name`` of a local repo that may be served, or None."""
+    path = repo_root / name
+    if (
+        not _is_within(path.resolve(), repo_root.resolve())
+        or not _is_published(path)
+        or not path.is_file()
+    ):
+        return None
+    return path
+
+
+def build_manifest(repo_root: Path) -> dict:
+    """Describe every image of a local repo for network clients.
+
+    Files of a directory image are named by their path within it; a
+    single-file image has one file named ``""``.
+    """
+    # Imported here: image_repo imports the Clonezilla package, which
+    # opens volumes through this module
+    from rpi_usb_cloner.storage import image_repo
+
+    images = []
+    for image in image_repo.list_clonezilla_images(repo_root):
+        if image.image_type == ImageType.CLONEZILLA_DIR:
+            files = [
+                (path.relative_to(image.path).as_posix(), path.stat().st_size)
+                for path in sorted(image.path.rglob("*"))
+                if path.is_file() and _is_published(path)
+            ]
+        else:
+            files = [("", image.path.stat().st_size)]
+        images.append(
+            {
+                "name": image.name,
+                "type": image.image_type.value,
+                "path": image.path.relative_to(repo_root).as_posix(),
+                "size_bytes": sum(size for _name, size in files),
+                "files": [{"name": name, "size": size} for name, size in files],
+            }
+        )
+    return {"version": MANIFEST_VERSION, "images": images}
+
+
+def write_manifest(repo_root: Path) -> Path:
+    """Write the manifest, so a static web server can serve the repo."""
+    path = repo_root / MANIFEST_FILENAME
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_text(json.dumps(build_manifest(repo_root)))
+    temp_path.replace(path)
+    return path
+
+
+def _open(
+    url: str, headers: dict[str, str], start: int = 0
+) -> http.client.HTTPResponse:
+    request = urllib.request.Request(url, headers=headers)
+    if start:
+        request.add_header("Range", f"bytes={start}-")
+    return urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS)
+
+
+class RemoteStream:
+    """Read remote files one after the other, fetching ahead on a thread.
+
+    A dropped connection is resumed from the last byte received; the stream
+    only fails after FETCH_ATTEMPTS requests in a row made no progress.
+    """
+
+    def __init__(
+        self,
+        files: list[RemoteFile],
+        *,
+        chunk_bytes: int = STREAM_CHUNK_BYTES,
+        read_ahead: int = READ_AHEAD_CHUNKS,
+    ) -> None:
+        self.files = files
+        self.chunk_bytes = chunk_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=read_ahead)
+        self._stop = threading.Event()
+        self._buffer = b""
+        self._eof = False
+        self._thread = threading.Thread(
+            target=self._run, name="remote-read-ahead", daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item: object) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            for remote in self.files:
+                if not self._fetch(remote):
+                    return
+            self._put(None)
+        except RemoteRepoError as error:
+            self._put(error)
+
+    def _fetch(self, remote: RemoteFile) -> bool:
+        offset = 0
+        failures = 0
+        while offset < remote.size:
+            try:
+                with _open(remote.url, remote.headers, offset) as resp:
+                    if offset and resp.status != 206:
+                        raise RemoteRepoError(
+                            f"{remote.url} does not support range requests"
+                        )
+                    while offset < remote.size:
+                        chunk = resp.read(min(self.chunk_bytes, remote.size - offset))
+                        if not chunk:
+                            raise ConnectionError("Connection closed early")
+                        if not self._put(chunk):
+                            return False
+                        offset += len(chunk)
+                        failures = 0
+            except urllib.error.HTTPError as error:
+                error.close()
+                if error.code < 500:
+                    raise RemoteRepoError(
+                        f"{remote.url}: HTTP {error.code} {error.reason}"
+                    ) from error
+                failures = self._retry(remote, offset, failures, error)
+            except (OSError, http.client.HTTPException) as error:
+                failures = self._retry(remote, offset, failures, error)
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _retry(
+        self, remote: RemoteFile, offset: int, failures: int, error: Exception
+    ) -> int:
+        failures += 1
+        if failures >= FETCH_ATTEMPTS:
+            raise RemoteRepoError(
+                f"Reading {remote.url} failed at byte {offset}: {error}"
+            ) from error
+        log.warning(
+            f"Stream of {remote.url} dropped at byte {offset}, resuming: {error}"
+        )
+        self._stop.wait(RETRY_DELAY_SECONDS * failures)
+        return failures
+
+    def _next(self) -> bytes:
+        if self._eof:
+            return b""
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    self._eof = True
+                    raise RemoteRepoError("Stream closed") from None
+        if item is None or isinstance(item, Exception):
+            self._eof = True
+            if item is not None:
+                raise item
+            return b""
+        return item
+
+    def chunks(self) -> Iterator[bytes]:
+        """Yield the data as it arrives."""
+        if self._buffer:
+            yield self._buffer
+            self._buffer = b""
+        while chunk := self._next():
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """Read ``size`` bytes (everything if negative); fewer only at the end.
+
+        Raises:
+            RemoteRepoError: The data could not be fetched
+        """
+        parts = []
+        while size < 0 or size > 0:
+            if not self._buffer:
+                self._buffer = self._next()
+                if not self._buffer:
+                    break
+            piece = self._buffer if size < 0 else self._buffer[:size]
+            self._buffer = self._buffer[len(piece) :]
+            parts.append(piece)
+            if size > 0:
+                size -= len(piece)
+        return b"".join(parts)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=REQUEST_TIMEOUT_SECONDS)
+
+    def __enter__(self) -> RemoteStream:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class VolumeFeeder:
+    """Stream staged volumes into a pipe, as ``cat`` does for local ones.
+
+    Offers the parts of ``subprocess.Popen`` the restore code uses: the data
+    is read from ``stdout``, and ``poll()``/``wait()`` give 0 once all of it
+    was written or 1 if the download failed or the reader went away.
+    """
+
+    def __init__(self, files: list[RemoteFile]) -> None:
+        read_fd, self._write_fd = os.pipe()
+        self.stdout = os.fdopen(read_fd, "rb")
+        self.returncode: int | None = None
+        self.error: Exception | None = None
+        self._stream = RemoteStream(files)
+        self._thread = threading.Thread(
+            target=self._run, name="remote-volume-feeder", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        code = 0
+        try:
+            for chunk in self._stream.chunks():
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(self._write_fd, view) :]
+        except (RemoteRepoError, OSError) as error:
+            if not isinstance(error, BrokenPipeError):
+                log.error(f"Network image stream failed: {error}")
+            self.error = error
+            code = 1
+        finally:
+            os.close(self._write_fd)
+            self._stream.close()
+            self.returncode = code
+
+    def poll(self) -> int | None:
+        return None if self._thread.is_alive() else self.returncode
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        self._thread.join(timeout)
+        return self.poll()
+
+    def terminate(self) -> None:
+        self._stream.close()
+
+
+# Placeholder path -> the remote file it stands for
+_staged: dict[Path, RemoteFile] = {}
+_staged_lock = threading.Lock()
+
+
+def staged_file(path: Path) -> RemoteFile | None:
+    """The remote file a staged placeholder stands for, or None if local."""
+    with _staged_lock:
+        return _staged.get(Path(path))
+
+
+def file_size(path: Path) -> int:
+    """Size of a local file, or of the remote file a placeholder stands for."""
+    remote = staged_file(path)
+    return remote.size if remote is not None else path.stat().st_size
+
+
+def open_volumes(image_files: list[Path]) -> subprocess.Popen | VolumeFeeder:
+    """Start reading ``image_files`` in order as one stream on ``.stdout``.
+
+    Staged volumes are streamed from the network; local ones are read by
+    ``cat``.
+    """
+    remote = [staged_file(path) for path in image_files]
+    if any(remote):
+        if not all(remote):
+            raise RuntimeError("Cannot mix local and network image volumes")
+        return VolumeFeeder([file for file in remote if file is not None])
+    return subprocess.Popen(
+        ["cat", *[str(path) for path in image_files]], stdout=subprocess.PIPE
+    )
+
+
+class RemoteRepo:
+    """An image repo served over HTTP."""
+
+    def __init__(self, base_url: str, token: str | None = None) -> None:
+        """Initialize network repo.
+
+        Args:
+            base_url: URL of the repo root, e.g. ``http://10.0.0.2:8765/repo``
+            token: Optional bearer token for the peer transfer server
+        """
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def url_for(self, path: str) -> str:
+        return f"{self.base_url}/{urllib.parse.quote(path)}"
+
+    def list_images(self) -> list[RemoteImage]:
+        """Read the repo manifest.
+
+        Raises:
+            RemoteRepoError: The manifest could not be read
+        """
+        url = self.url_for(MANIFEST_FILENAME)
+        try:
+            with _open(url, self.headers) as resp:
+                manifest = json.load(resp)
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"unsupported version {manifest.get('version')}")
+            return [
+                RemoteImage(
+                    name=entry["name"],
+                    image_type=ImageType(entry["type"]),
+                    path=entry["path"],
+                    size_bytes=int(entry["size_bytes"]),
+                    files=tuple(
+                        (file["name"], int(file["size"])) for file in entry["files"]
+                    ),
+                )
+                for entry in manifest["images"]
+            ]
+        except urllib.error.HTTPError as e:
+            e.close()
+            raise RemoteRepoError(f"Cannot read {url}: {e}") from e
+        except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+            raise RemoteRepoError(f"Cannot read {url}: {e}") from e
+
+    def remote_file(self, image: RemoteImage, name: str, size: int) -> RemoteFile:
+        path = f"{image.path}/{name}" if name else image.path
+        return RemoteFile(url=self.url_for(path), size=size, headers=self.headers)
+
+    def stage(self, image: RemoteImage, root: Path) -> DiskImage:
+        """Make a local stand-in for ``image`` under ``root``.
+
+        Raises:
+            RemoteRepoError: A metadata file could not be downloaded
+        """
+        dest = root / image.path
+        if not _is_within(dest.resolve(), root.resolve()):
+            raise RemoteRepoError(f"Invalid image path: {image.path}")
+        for name, size in image.files:
+            local = dest / name if name else dest
+            if not _is_within(local.resolve(), dest.resolve()):
+                raise RemoteRepoError(f"Invalid file name: {name}")
+            local.parent.mkdir(parents=True, exist_ok=True)
+            remote = self.remote_file(image, name, size)
+            if image.image_type != ImageType.CLONEZILLA_DIR or _VOLUME_PATTERN.search(
+                name
+            ):
+                local.touch()
+                with _staged_lock:
+                    _staged[local] = remote
+            else:
+                with RemoteStream([remote]) as stream:
+                    local.write_bytes(stream.read())
+        log.info(f"Staged network image {image.name} from {self.base_url}")
+        return DiskImage(
+            name=image.name,
+            path=dest,
+            image_type=image.image_type,
+            size_bytes=image.size_bytes,
+        )
+
+
+def unstage(root: Path) -> None:
+    """Forget the placeholders under ``root``."""
+    with _staged_lock:
+        for path in [path for path in _staged if _is_within(path, root)]:
+            del _staged[path]
+
+
+@contextmanager
+def staged_image(repo: RemoteRepo, image: RemoteImage) -> Iterator[DiskImage]:
+    """Stage ``image`` in a temporary directory for as long as it is used."""
+    root = Path(tempfile.mkdtemp(prefix="rpi-usb-cloner-net-"))
+    try:
+        yield repo.stage(image, root)
+    finally:
+        unstage(root)
+        shutil.rmtree(root, ignore_errors=True)
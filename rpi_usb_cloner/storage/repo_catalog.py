@@ -0,0 +1,369 @@
+"""Persistent catalog of image repos and their images.
+
+``find_image_repos()`` and ``list_clonezilla_images()`` re-stat flag files,
+glob candidate directories and probe every subdirectory on each call, and
+the web UI, OLED menus and drive filters call them every few seconds. With
+hundreds of images that keeps the repo drive busy while clone jobs run.
+
+The catalog scans each repo once and then only re-checks what changed:
+
+- inotify watches on each repo root, its ``clonezilla/`` and ``images/``
+  directories and every image directory below them report the entries that
+  were created, removed, renamed or finished writing; only those entries are
+  re-classified (``image_repo.classify_repo_entry``)
+- the repo list itself is rediscovered when block devices change (hotplug
+  table generation), the mount table changes, a repo root goes away or its
+  flag file is created or removed
+
+Events are drained whenever a snapshot is requested, so there is no thread.
+Without inotify the catalog rescans a repo's images at most every few
+seconds instead. ``snapshot()`` returns an immutable, versioned view; the
+version only changes when the repos or images do, so consumers can skip
+work when it is unchanged.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Tuple
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo
+from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.storage import devices, hotplug, image_repo, mount_table
+
+
+log = LoggerFactory.for_clone()
+
+FALLBACK_RESCAN_SECONDS = 5.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+# The watched directory itself is gone or no longer reachable
+_GONE_EVENTS = IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT | IN_IGNORED
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# wd, mask, name
+InotifyEvent = Tuple[int, int, str]
+TopologyKey = Tuple[object, int]
+
+
+class Inotify:
+    """Minimal non-blocking inotify wrapper over libc."""
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: Path, mask: int = WATCH_MASK) -> int | None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                log.warning(
+                    "inotify watch limit reached, repo changes may be missed",
+                    tags=["repo", "catalog"],
+                )
+            return None
+        return wd
+
+    def remove_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> list[InotifyEvent]:
+        events: list[InotifyEvent] = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                raw_name = data[offset : offset + length].split(b"\0", 1)[0]
+                offset += length
+                events.append((wd, mask, os.fsdecode(raw_name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_inotify() -> Inotify | None:
+    try:
+        return Inotify()
+    except (OSError, AttributeError) as error:
+        log.debug(f"inotify unavailable: {error}", tags=["repo", "catalog"])
+        return None
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable view of the repos and their images at one version."""
+
+    version: int
+    repos: tuple[ImageRepo, ...] = ()
+    images: dict[Path, tuple[DiskImage, ...]] = field(default_factory=dict)
+
+    def images_for(self, repo_path: Path) -> list[DiskImage]:
+        return list(self.images.get(repo_path, ()))
+
+    def all_images(self) -> list[DiskImage]:
+        return [image for repo in self.repos for image in self.images_for(repo.path)]
+
+
+@dataclass
+class _RepoState:
+    repo: ImageRepo
+    entries: dict[Path, DiskImage] = field(default_factory=dict)
+    watches: dict[int, Path] = field(default_factory=dict)
+    dirty: set[Path] = field(default_factory=set)
+    full_rescan: bool = True
+    scanned_at: float = 0.0
+
+    def images(self) -> tuple[DiskImage, ...]:
+        return tuple(sorted(self.entries.values(), key=lambda image: image.name))
+
+
+class RepoCatalog:
+    """Image repos and images, rescanned only where the filesystem changed."""
+
+    def __init__(self, inotify: Inotify | None = None, *, watch: bool = True) -> None:
+        self._lock = threading.Lock()
+        self._inotify = inotify if inotify is not None or not watch else open_inotify()
+        self._repos: dict[Path, _RepoState] = {}
+        self._watch_owner: dict[int, Path] = {}
+        self._repos_dirty = True
+        self._topology: TopologyKey | None = None
+        self._snapshot = CatalogSnapshot(version=0)
+
+    @property
+    def watching(self) -> bool:
+        return self._inotify is not None
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Return the current catalog, re-checking only what changed."""
+        with self._lock:
+            self._drain_events()
+            topology = self._topology_key()
+            if self._repos_dirty or topology != self._topology:
+                self._rediscover_repos()
+                # Discovery mounts partitions itself; key on the result
+                self._topology = self._topology_key()
+            now = time.monotonic()
+            for state in self._repos.values():
+                if (
+                    not self.watching
+                    and now - state.scanned_at >= FALLBACK_RESCAN_SECONDS
+                ):
+                    state.full_rescan = True
+                self._update_repo(state, now)
+            return self._publish()
+
+    def invalidate(self, repo_path: Path | None = None) -> None:
+        """Force a rescan of one repo's images, or of the repo list."""
+        with self._lock:
+            if repo_path is None:
+                self._repos_dirty = True
+            elif repo_path in self._repos:
+                self._repos[repo_path].full_rescan = True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _topology_key(self) -> TopologyKey:
+        table = hotplug.get_device_table()
+        if table is not None:
+            devices_key: object = table.generation
+        else:
+            devices_key = tuple(
+                device.get("name") for device in devices.get_block_devices()
+            )
+        return devices_key, mount_table.get_mount_table().generation
+
+    def _rediscover_repos(self) -> None:
+        self._repos_dirty = False
+        found = {repo.path: repo for repo in image_repo.find_image_repos()}
+        for path in list(self._repos):
+            if path not in found or found[path] != self._repos[path].repo:
+                self._drop_repo(path)
+        for path, repo in found.items():
+            if path not in self._repos:
+                self._repos[path] = _RepoState(repo=repo)
+        log.debug(
+            f"Image repo catalog: {len(found)} repo(s)",
+            repos=[str(path) for path in found],
+            tags=["repo", "catalog"],
+        )
+
+    def _drop_repo(self, path: Path) -> None:
+        state = self._repos.pop(path)
+        for wd in state.watches:
+            self._watch_owner.pop(wd, None)
+            if self._inotify is not None:
+                self._inotify.remove_watch(wd)
+
+    def _watch(self, state: _RepoState, directory: Path) -> None:
+        if self._inotify is None:
+            return
+        # Re-adding a watched directory returns its existing descriptor
+        wd = self._inotify.add_watch(directory)
+        if wd is not None:
+            state.watches[wd] = directory
+            self._watch_owner[wd] = state.repo.path
+
+    def _update_repo(self, state: _RepoState, now: float) -> None:
+        root = state.repo.path
+        candidates = image_repo.repo_candidate_dirs(root)
+        if state.full_rescan:
+            state.full_rescan = False
+            state.dirty.clear()
+            state.scanned_at = now
+            state.entries = {}
+            for candidate in candidates:
+                if not candidate.is_dir():
+                    continue
+                # Watch before listing so nothing written meanwhile is missed
+                self._watch(state, candidate)
+                try:
+                    children = list(candidate.iterdir())
+                except OSError:
+                    continue
+                for child in children:
+                    self._classify(state, child, candidates)
+            return
+        dirty, state.dirty = state.dirty, set()
+        for path in dirty:
+            self._classify(state, path, candidates)
+
+    def _classify(self, state: _RepoState, path: Path, candidates: list[Path]) -> None:
+        if path.parent in candidates and path.is_dir():
+            self._watch(state, path)
+        image = image_repo.classify_repo_entry(state.repo.path, path)
+        if image is None:
+            state.entries.pop(path, None)
+        else:
+            state.entries[path] = image
+
+    def _drain_events(self) -> None:
+        if self._inotify is None:
+            return
+        try:
+            events = self._inotify.read_events()
+        except OSError as error:
+            log.debug(f"inotify read failed: {error}", tags=["repo", "catalog"])
+            events = []
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                for state in self._repos.values():
+                    state.full_rescan = True
+                continue
+            owner = self._watch_owner.get(wd)
+            state = self._repos.get(owner) if owner is not None else None
+            if state is None:
+                continue
+            self._apply_event(state, wd, mask, name)
+
+    def _apply_event(self, state: _RepoState, wd: int, mask: int, name: str) -> None:
+        directory = state.watches.get(wd)
+        if directory is None:
+            return
+        root = state.repo.path
+        if mask & _GONE_EVENTS:
+            state.watches.pop(wd, None)
+            self._watch_owner.pop(wd, None)
+            if directory == root:
+                # Unmounted or removed: the repo list has to be rediscovered
+                self._repos_dirty = True
+            else:
+                state.dirty.add(directory)
+            return
+        candidates = image_repo.repo_candidate_dirs(root)
+        if directory == root and name == image_repo.REPO_FLAG_FILENAME:
+            self._repos_dirty = True
+        if directory == root and root / name in candidates[:2]:
+            # clonezilla/ or images/ appeared or went away
+            state.full_rescan = True
+            return
+        if directory in candidates:
+            if name:
+                state.dirty.add(directory / name)
+        elif directory.parent in candidates:
+            # A file inside an image directory changed its validity
+            state.dirty.add(directory)
+
+    def _publish(self) -> CatalogSnapshot:
+        repos = tuple(state.repo for state in self._repos.values())
+        images = {path: state.images() for path, state in self._repos.items()}
+        previous = self._snapshot
+        if repos != previous.repos or images != previous.images:
+            self._snapshot = CatalogSnapshot(
+                version=previous.version + 1, repos=repos, images=images
+            )
+        return self._snapshot
+
+
+_catalog: RepoCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_repo_catalog() -> RepoCatalog:
+    """Return the shared repo catalog, creating it on first use."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RepoCatalog()
+        return _catalog
+
+
+def reset_repo_catalog() -> None:
+    """Close the shared catalog; the next use starts a fresh scan."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is not None:
+            _catalog.close()
+        _catalog = None
+
+
+def list_image_repos() -> list[ImageRepo]:
+    """Return the image repos from the shared catalog."""
+    return list(get_repo_catalog().snapshot().repos)
+
+
+def list_repo_images(repo_path: Path) -> list[DiskImage]:
+    """Return a repo's images from the shared catalog."""
+    return get_repo_catalog().snapshot().images_for(repo_path)
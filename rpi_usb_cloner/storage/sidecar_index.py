@@ -0,0 +1,137 @@
+"""JSON sidecar indexes kept on image repos.
+
+The size index and the block index both remember values derived from repo
+files in a JSON file at the repo root, keyed by path relative to the repo,
+so they do not have to be recomputed on every start. This module holds what
+they share: loading and validating the sidecar, writing it atomically,
+pruning entries for deleted files, the settle check for files that may still
+be being written, and one shared instance per repo.
+
+Repos that cannot be written to keep the index in memory only.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Generic, TypeVar
+
+from rpi_usb_cloner.logging import get_logger
+
+
+log = get_logger(source=__name__, tags=["repo"])
+
+# Like git's racy index entries, anything modified this recently may still
+# be being written and is not stored
+SETTLE_SECONDS = 2.0
+
+
+def is_settled(mtime_ns: int) -> bool:
+    """Whether a file last modified at ``mtime_ns`` is old enough to store."""
+    return time.time() - mtime_ns / 1e9 >= SETTLE_SECONDS
+
+
+class SidecarIndex:
+    """Entries derived from the files of one repo, kept in a JSON sidecar.
+
+    Subclasses set ``FILENAME``, ``VERSION`` and ``DESCRIPTION`` and check
+    loaded entries in ``_valid_entry()``.
+    """
+
+    FILENAME = ""
+    VERSION = 1
+    DESCRIPTION = "index"
+
+    def __init__(self, repo_root: Path, *, persist: bool = True) -> None:
+        self.repo_root = repo_root
+        self.path = repo_root / self.FILENAME
+        self._persist = persist
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = self._load() if persist else {}
+        self._dirty = False
+
+    def save(self) -> bool:
+        """Write the sidecar if anything changed; returns True if written."""
+        with self._lock:
+            if not self._dirty or not self._persist:
+                return False
+            # Forget files that were deleted or renamed since they were indexed
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if (self.repo_root / key).exists()
+            }
+            self._entries_changed()
+            record = {"version": self.VERSION, "entries": self._entries}
+            temp_path = self.path.with_name(f".{self.path.name}.tmp")
+            try:
+                temp_path.write_text(json.dumps(record, sort_keys=True))
+                temp_path.replace(self.path)
+            except OSError as error:
+                # Read-only repo: keep serving from memory
+                log.debug(f"Unable to write {self.DESCRIPTION} {self.path}: {error}")
+                self._persist = False
+                return False
+            self._dirty = False
+            return True
+
+    def _key(self, path: Path) -> str:
+        try:
+            return str(path.relative_to(self.repo_root))
+        except ValueError:
+            return str(path)
+
+    def _put(self, key: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries_changed()
+            self._dirty = True
+
+    def _entries_changed(self) -> None:
+        """Called with the lock held whenever the entries change."""
+
+    def _valid_entry(self, entry: dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        try:
+            record = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(record, dict) or record.get("version") != self.VERSION:
+            return {}
+        entries = record.get("entries")
+        if not isinstance(entries, dict):
+            return {}
+        return {
+            key: entry
+            for key, entry in entries.items()
+            if isinstance(entry, dict) and self._valid_entry(entry)
+        }
+
+
+IndexT = TypeVar("IndexT", bound=SidecarIndex)
+
+
+class IndexRegistry(Generic[IndexT]):
+    """One shared index per repo, each sidecar loaded once."""
+
+    def __init__(self, factory: Callable[..., IndexT]) -> None:
+        self._factory = factory
+        self._indexes: dict[tuple[Path, bool], IndexT] = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_root: Path, *, persist: bool = True) -> IndexT:
+        key = (repo_root, persist)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._factory(repo_root, persist=persist)
+                self._indexes[key] = index
+            return index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,428 @@
+"""Native block device enumeration from sysfs, without forking lsblk.
+
+``lsblk`` builds its table from the same sources this module reads, so the
+result has the same shape as ``lsblk -J -b -o`` with ``LSBLK_COLUMNS``
+(name, type, size, model, vendor, tran, rm, mountpoint, fstype, label,
+serial, pttype, rota, ptuuid and a ``children`` list of partitions):
+
+- ``/sys/block/<disk>``: size, removable and rotational flags, model, vendor,
+  transport (from the device's position in the sysfs tree) and partitions
+- ``/proc/self/mountinfo`` (via ``storage.mount_table``): mountpoints,
+  matched by major:minor number
+- ``/run/udev/data/b<major>:<minor>``: filesystem type and label, partition
+  table and serial number as probed by udev
+- where udev has no record, a small blkid-compatible probe of the device's
+  first 65 KiB recognises the partition table (dos, gpt) and vfat, exfat,
+  ntfs, ext2/3/4, btrfs, iso9660, squashfs and swap
+
+Like lsblk, RAM disks and empty devices (unused loop devices, card readers
+without a card) are left out. Probe results are cached for a few seconds so
+repeated listings at UI refresh rates do not re-read the media.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from rpi_usb_cloner.logging import LoggerFactory
+from rpi_usb_cloner.storage.mount_table import get_mount_table
+
+
+log = LoggerFactory.for_usb()
+
+SYS_BLOCK_DIR = Path("/sys/block")
+UDEV_DATA_DIR = Path("/run/udev/data")
+DEV_DIR = Path("/dev")
+
+SECTOR_BYTES = 512
+RAM_DISK_MAJOR = 1
+# Covers the btrfs superblock at 64 KiB, the furthest signature probed
+PROBE_READ_BYTES = 0x10400
+PROBE_CACHE_TTL_SECONDS = 5.0
+SCSI_TYPE_ROM = "5"
+
+Reader = Callable[[int, int], bytes]
+ProbeResult = Dict[str, Optional[str]]
+
+_probe_cache: dict[tuple[str, str, int], tuple[float, ProbeResult]] = {}
+_probe_cache_lock = threading.Lock()
+
+_EXT_COMPAT_HAS_JOURNAL = 0x4
+# extents, 64bit, flex_bg: any of them means the filesystem is ext4
+_EXT4_INCOMPAT_FEATURES = 0x40 | 0x80 | 0x200
+_EXFAT_LABEL_ENTRY = 0x83
+_NTFS_VOLUME_NAME_ATTRIBUTE = 0x60
+_NTFS_END_OF_ATTRIBUTES = 0xFFFFFFFF
+
+
+def sysfs_available() -> bool:
+    """Return True when sysfs block devices can be enumerated."""
+    return SYS_BLOCK_DIR.is_dir()
+
+
+def _read_text(path: Path) -> str | None:
+    try:
+        value = path.read_text(errors="replace").strip()
+    except OSError:
+        return None
+    return value or None
+
+
+def _natural_key(name: str) -> list[Any]:
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def _decode_hex_escapes(value: str) -> str:
+    raw = re.sub(
+        rb"\\x([0-9a-fA-F]{2})",
+        lambda match: bytes([int(match.group(1), 16)]),
+        value.encode("utf-8", errors="surrogateescape"),
+    )
+    return raw.decode("utf-8", errors="replace")
+
+
+def read_mountinfo() -> dict[str, str]:
+    """Map "major:minor" to mountpoint from the shared mount table."""
+    return get_mount_table().mountpoints_by_devno()
+
+
+def read_udev_properties(devno: str) -> dict[str, str] | None:
+    """Return the udev database properties of a device, or None if unknown."""
+    try:
+        text = (UDEV_DATA_DIR / f"b{devno}").read_text(errors="replace")
+    except OSError:
+        return None
+    properties: dict[str, str] = {}
+    for line in text.splitlines():
+        if line.startswith("E:"):
+            key, _, value = line[2:].partition("=")
+            properties[key] = value
+    return properties
+
+
+def _cstring(data: bytes) -> str | None:
+    value = data.split(b"\0", 1)[0].decode("utf-8", errors="replace").strip()
+    return value or None
+
+
+def _exfat_label(read: Reader, boot: bytes) -> str | None:
+    sector_bytes = 1 << boot[108]
+    cluster_bytes = sector_bytes << boot[109]
+    heap_sectors, root_cluster = struct.unpack_from("<I4xI", boot, 88)
+    offset = (heap_sectors * sector_bytes) + (root_cluster - 2) * cluster_bytes
+    directory = read(offset, min(cluster_bytes, 64 * 1024))
+    for start in range(0, len(directory) - 31, 32):
+        entry_type = directory[start]
+        if entry_type == 0:
+            break
+        if entry_type == _EXFAT_LABEL_ENTRY:
+            length = min(directory[start + 1], 11)
+            raw = directory[start + 2 : start + 2 + length * 2]
+            return raw.decode("utf-16-le", errors="replace") or None
+    return None
+
+
+def _ntfs_label(read: Reader, boot: bytes) -> str | None:
+    sector_bytes = struct.unpack_from("<H", boot, 11)[0]
+    cluster_sectors = boot[13]
+    if cluster_sectors > 0x80:
+        cluster_sectors = 1 << (256 - cluster_sectors)
+    cluster_bytes = sector_bytes * cluster_sectors
+    mft_cluster = struct.unpack_from("<Q", boot, 0x30)[0]
+    (record_clusters,) = struct.unpack_from("<b", boot, 0x40)
+    record_bytes = (
+        1 << -record_clusters
+        if record_clusters < 0
+        else record_clusters * cluster_bytes
+    )
+    if not sector_bytes or not record_bytes:
+        return None
+    # $Volume is MFT record 3
+    record = bytearray(
+        read(mft_cluster * cluster_bytes + 3 * record_bytes, record_bytes)
+    )
+    if len(record) < record_bytes or record[:4] != b"FILE":
+        return None
+    usa_offset, usa_count = struct.unpack_from("<HH", record, 4)
+    for index in range(1, usa_count):
+        end = index * sector_bytes
+        fixup = usa_offset + index * 2
+        if end > len(record) or fixup + 2 > len(record):
+            break
+        record[end - 2 : end] = record[fixup : fixup + 2]
+    position = struct.unpack_from("<H", record, 0x14)[0]
+    while position + 8 <= len(record):
+        attribute_type, length = struct.unpack_from("<II", record, position)
+        if attribute_type == _NTFS_END_OF_ATTRIBUTES or length == 0:
+            break
+        if attribute_type == _NTFS_VOLUME_NAME_ATTRIBUTE and record[position + 8] == 0:
+            value_length, value_offset = struct.unpack_from(
+                "<IH", record, position + 0x10
+            )
+            start = position + value_offset
+            raw = bytes(record[start : start + value_length])
+            return raw.decode("utf-16-le", errors="replace") or None
+        position += length
+    return None
+
+
+def probe_filesystem(read: Reader) -> tuple[str, str | None] | None:
+    """Identify the filesystem at the start of a device.
+
+    Args:
+        read: ``read(offset, length)`` returning bytes from the device
+
+    Returns:
+        (fstype, label) with blkid's type names, or None if unrecognised
+    """
+    data = read(0, PROBE_READ_BYTES)
+    if data[0x10040:0x10048] == b"_BHRfS_M":
+        return "btrfs", _cstring(data[0x1012B : 0x1012B + 256])
+    if len(data) >= 1024 + 0x88 and data[1080:1082] == b"\x53\xef":
+        compat, incompat = struct.unpack_from("<II", data, 1024 + 0x5C)
+        if incompat & _EXT4_INCOMPAT_FEATURES:
+            fstype = "ext4"
+        elif compat & _EXT_COMPAT_HAS_JOURNAL:
+            fstype = "ext3"
+        else:
+            fstype = "ext2"
+        return fstype, _cstring(data[1024 + 0x78 : 1024 + 0x88])
+    if data[0x8001:0x8006] == b"CD001":
+        return "iso9660", _cstring(data[0x8028:0x8048])
+    if data[4086:4096] in (b"SWAPSPACE2", b"SWAP-SPACE"):
+        return "swap", _cstring(data[1024 + 28 : 1024 + 44])
+    if data[:4] == b"hsqs":
+        return "squashfs", None
+    if data[3:11] == b"EXFAT   ":
+        return "exfat", _exfat_label(read, data)
+    if data[3:11] == b"NTFS    ":
+        return "ntfs", _ntfs_label(read, data)
+    if data[510:512] == b"\x55\xaa" and (
+        data[82:87] == b"FAT32" or data[54:59] in (b"FAT12", b"FAT16", b"FAT  ")
+    ):
+        label_offset = 71 if data[82:87] == b"FAT32" else 43
+        label = _cstring(data[label_offset : label_offset + 11])
+        return "vfat", None if label == "NO NAME" else label
+    return None
+
+
+def probe_partition_table(read: Reader) -> tuple[str, str] | None:
+    """Identify a dos or gpt partition table.
+
+    Returns:
+        (pttype, ptuuid) as lsblk reports them, or None
+    """
+    mbr = read(0, SECTOR_BYTES)
+    if len(mbr) < SECTOR_BYTES or mbr[510:512] != b"\x55\xaa":
+        return None
+    if any(mbr[446 + index * 16] not in (0x00, 0x80) for index in range(4)):
+        return None
+    # The GPT header sits in LBA 1 of 512-byte or 4 KiB sector devices
+    for header_offset in (SECTOR_BYTES, 4096):
+        header = read(header_offset, 92)
+        if header[:8] == b"EFI PART":
+            return "gpt", str(uuid.UUID(bytes_le=bytes(header[56:72])))
+    signature = struct.unpack_from("<I", mbr, 440)[0]
+    return "dos", f"{signature:08x}"
+
+
+def _probe_node(name: str, devno: str, size: int, whole_disk: bool) -> ProbeResult:
+    key = (name, devno, size)
+    now = time.monotonic()
+    with _probe_cache_lock:
+        cached = _probe_cache.get(key)
+        if cached is not None and now - cached[0] <= PROBE_CACHE_TTL_SECONDS:
+            return cached[1]
+    result: ProbeResult = {
+        "fstype": None,
+        "label": None,
+        "pttype": None,
+        "ptuuid": None,
+    }
+    try:
+        fd = os.open(DEV_DIR / name, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError as error:
+        log.debug(f"Cannot probe {name}: {error}", tags=["devices"])
+        return result
+    try:
+
+        def read(offset: int, length: int) -> bytes:
+            return os.pread(fd, length, offset)
+
+        filesystem = probe_filesystem(read)
+        if filesystem is not None:
+            result["fstype"], result["label"] = filesystem
+        elif whole_disk:
+            table = probe_partition_table(read)
+            if table is not None:
+                result["pttype"], result["ptuuid"] = table
+    except (OSError, struct.error, ValueError) as error:
+        log.debug(f"Probe of {name} failed: {error}", tags=["devices"])
+    finally:
+        os.close(fd)
+    with _probe_cache_lock:
+        _probe_cache[key] = (now, result)
+    return result
+
+
+def _identify(name: str, devno: str, size: int, whole_disk: bool) -> ProbeResult:
+    properties = read_udev_properties(devno)
+    if properties is None:
+        return _probe_node(name, devno, size, whole_disk)
+    label = properties.get("ID_FS_LABEL_ENC")
+    return {
+        "fstype": properties.get("ID_FS_TYPE") or None,
+        "label": (
+            _decode_hex_escapes(label) if label else properties.get("ID_FS_LABEL")
+        )
+        or None,
+        "pttype": properties.get("ID_PART_TABLE_TYPE") or None,
+        "ptuuid": properties.get("ID_PART_TABLE_UUID") or None,
+        "serial": properties.get("ID_SERIAL_SHORT") or None,
+    }
+
+
+def _transport(block_dir: Path, name: str) -> str | None:
+    if name.startswith("nvme"):
+        return "nvme"
+    if name.startswith("mmcblk"):
+        return "mmc"
+    try:
+        sys_path = str(block_dir.resolve())
+    except OSError:
+        return None
+    if "/usb" in sys_path:
+        return "usb"
+    if "/ata" in sys_path:
+        return "sata"
+    return None
+
+
+def _device_type(block_dir: Path, name: str) -> str:
+    if name.startswith("loop"):
+        return "loop"
+    if name.startswith("md"):
+        return _read_text(block_dir / "md" / "level") or "md"
+    if name.startswith("dm-"):
+        dm_uuid = _read_text(block_dir / "dm" / "uuid") or ""
+        prefix = dm_uuid.split("-", 1)[0].lower()
+        return prefix if prefix in ("lvm", "crypt") else "dm"
+    if _read_text(block_dir / "device" / "type") == SCSI_TYPE_ROM:
+        return "rom"
+    return "disk"
+
+
+def _read_entry(
+    block_dir: Path,
+    name: str,
+    mounts: dict[str, str],
+    parent: dict[str, Any] | None = None,
+) -> dict[str, Any] | None:
+    devno = _read_text(block_dir / "dev")
+    size_sectors = _read_text(block_dir / "size")
+    if devno is None or size_sectors is None:
+        return None
+    size = int(size_sectors) * SECTOR_BYTES
+    identity = _identify(name, devno, size, whole_disk=parent is None)
+    if parent is not None:
+        return {
+            "name": name,
+            "type": "part",
+            "size": size,
+            "model": None,
+            "vendor": None,
+            "tran": None,
+            "rm": parent["rm"],
+            "mountpoint": mounts.get(devno),
+            "fstype": identity["fstype"],
+            "label": identity["label"],
+            "serial": None,
+            "pttype": parent["pttype"],
+            "rota": parent["rota"],
+            "ptuuid": parent["ptuuid"],
+        }
+    device_dir = block_dir / "device"
+    return {
+        "name": name,
+        "type": _device_type(block_dir, name),
+        "size": size,
+        "model": _read_text(device_dir / "model") or _read_text(device_dir / "name"),
+        "vendor": _read_text(device_dir / "vendor"),
+        "tran": _transport(block_dir, name),
+        "rm": _read_text(block_dir / "removable") == "1",
+        "mountpoint": mounts.get(devno),
+        "fstype": identity["fstype"],
+        "label": identity["label"],
+        "serial": identity.get("serial") or _read_text(device_dir / "serial"),
+        "pttype": identity["pttype"],
+        "rota": _read_text(block_dir / "queue" / "rotational") == "1",
+        "ptuuid": identity["ptuuid"],
+    }
+
+
+def _partition_dirs(block_dir: Path) -> list[tuple[int, Path]]:
+    partitions = []
+    for child in block_dir.iterdir():
+        number = _read_text(child / "partition")
+        if number is not None and number.isdigit():
+            partitions.append((int(number), child))
+    return sorted(partitions)
+
+
+def read_block_device(
+    name: str, mounts: dict[str, str] | None = None
+) -> dict[str, Any] | None:
+    """Return the lsblk-shaped dict for one disk and its partitions.
+
+    Returns:
+        The device dict, or None when the disk is gone, empty or a RAM disk
+    """
+    block_dir = SYS_BLOCK_DIR / name
+    devno = _read_text(block_dir / "dev")
+    if devno is None or devno.split(":", 1)[0] == str(RAM_DISK_MAJOR):
+        return None
+    if mounts is None:
+        mounts = read_mountinfo()
+    try:
+        device = _read_entry(block_dir, name, mounts)
+        if device is None or not device["size"]:
+            return None
+        children = []
+        for _number, partition_dir in _partition_dirs(block_dir):
+            child = _read_entry(partition_dir, partition_dir.name, mounts, device)
+            if child is not None:
+                children.append(child)
+    except FileNotFoundError:
+        # Removed while it was being read
+        return None
+    if children:
+        device["children"] = children
+    return device
+
+
+def enumerate_block_devices() -> list[dict[str, Any]]:
+    """Return every non-empty block device, as ``lsblk -J`` lists them.
+
+    Raises:
+        OSError: If the sysfs block directory cannot be listed
+    """
+    mounts = read_mountinfo()
+    names = sorted((entry.name for entry in SYS_BLOCK_DIR.iterdir()), key=_natural_key)
+    devices = []
+    for name in names:
+        device = read_block_device(name, mounts)
+        if device is not None:
+            devices.append(device)
+    return devices
+
+
+def clear_probe_cache() -> None:
+    with _probe_cache_lock:
+        _probe_cache.clear()
@@ -0,0 +1,347 @@
+"""Share drive, USB bus and network bandwidth between concurrent jobs.
+
+Every bulk data mover registers a job here for as long as it runs: repo
+copies, peer uploads, and the clones, restores and backups started from the
+menus. A job names what it uses: drives (by device name or by a path on
+them), the USB root hubs those drives hang off, and network links to
+peers. Jobs that share any of these compete for it.
+
+Priorities:
+
+- ``INTERACTIVE``: the user is waiting at the device (clone, restore,
+  backup). These jobs run subprocesses and are never slowed down, but they
+  hold a large share of every resource they use.
+- ``TRANSFER``: copies and uploads started by the user.
+- ``BACKGROUND``: fleet replication and the relays forwarding it (see
+  services.chain_replication), and repo copies made with
+  ``priority=BACKGROUND``. They yield to any other job that shares a
+  resource with them, trickling along at ``PREEMPTED_BYTES_PER_SECOND`` so
+  open connections survive, and run at full speed when nothing else needs
+  the resource.
+
+Capacity is split by priority weight, so jobs of the same priority share
+fairly and a copy on the bus of a running restore gets a fifth of the bus.
+A resource has a capacity when a cap is set for it (``set_cap()``, or the
+``transfer_device_cap_mbps`` and ``transfer_link_cap_mbps`` settings for
+every drive and link), and a USB bus is also given one from its root hub
+speed while two or more jobs use it. A job alone on uncapped resources is
+not slowed down at all.
+
+Jobs that can pace themselves call ``Job.consume()`` with each chunk moved;
+it blocks for as long as the job is over its share.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from rpi_usb_cloner.config import settings
+from rpi_usb_cloner.logging import get_logger
+from rpi_usb_cloner.storage.parallel_jobs import get_usb_bus
+
+
+log = get_logger(source=__name__, tags=["transfer"])
+
+MB = 1_000_000
+# Preempted jobs still move this much, so open requests do not time out
+PREEMPTED_BYTES_PER_SECOND = 1024 * 1024
+# A job may run this far ahead of its rate before consume() blocks
+BURST_SECONDS = 0.5
+# Longest single wait in consume(), so rate changes are picked up
+WAIT_SLICE_SECONDS = 0.25
+
+# (max root hub speed in Mb/s, usable bytes per second), as in
+# parallel_jobs.BUS_WORKER_LIMITS
+BUS_CAPACITIES = ((480, 40 * MB), (5000, 400 * MB))
+FAST_BUS_CAPACITY = 800 * MB
+
+
+class Priority(IntEnum):
+    """Job priority; lower values win."""
+
+    INTERACTIVE = 0
+    TRANSFER = 1
+    BACKGROUND = 2
+
+
+PRIORITY_WEIGHTS = {
+    Priority.INTERACTIVE: 4,
+    Priority.TRANSFER: 1,
+    Priority.BACKGROUND: 1,
+}
+
+BusLookup = Callable[[str], Optional[Tuple[str, int]]]
+
+
+def device_of(path: Path) -> str | None:
+    """Name of the drive holding ``path`` (e.g. "sda"), or None if unknown."""
+    try:
+        st_dev = Path(path).stat().st_dev
+        block_dir = Path(
+            f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+        ).resolve()
+    except OSError:
+        return None
+    if not block_dir.exists():
+        return None
+    # Partitions sit in their disk's sysfs directory
+    if (block_dir / "partition").exists():
+        return block_dir.parent.name
+    return block_dir.name
+
+
+def bus_capacity(speed_mbps: int) -> float | None:
+    """Usable bytes per second of a USB root hub, or None if unknown."""
+    if speed_mbps <= 0:
+        return None
+    for max_speed, capacity in BUS_CAPACITIES:
+        if speed_mbps <= max_speed:
+            return capacity
+    return FAST_BUS_CAPACITY
+
+
+def _setting_cap(key: str) -> float | None:
+    value = settings.get_setting(key)
+    try:
+        return float(value) * MB if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class JobStatus:
+    """A registered job as shown to the UI."""
+
+    job_id: int
+    name: str
+    priority: Priority
+    resources: tuple[str, ...]
+    moved_bytes: int
+    bytes_per_second: float | None  # Current allowance; None is unlimited
+    preempted: bool
+
+
+class Job:
+    """A registered job. Create with ``TransferScheduler.job()``."""
+
+    def __init__(
+        self,
+        scheduler: TransferScheduler,
+        job_id: int,
+        name: str,
+        priority: Priority,
+        resources: frozenset[str],
+    ) -> None:
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.name = name
+        self.priority = priority
+        self.resources = resources
+        self.moved_bytes = 0
+        self.released = False
+        self._debt = 0.0
+        self._paid_at = time.monotonic()
+
+    @property
+    def weight(self) -> int:
+        return PRIORITY_WEIGHTS[self.priority]
+
+    def consume(self, count: int) -> None:
+        """Account for ``count`` bytes moved, waiting while over the share.
+
+        Safe to call from several threads of the same job.
+        """
+        self.scheduler._consume(self, count)
+
+
+class TransferScheduler:
+    """Registry of running jobs and the resources they share."""
+
+    def __init__(self, bus_lookup: BusLookup | None = None) -> None:
+        self._bus_lookup = bus_lookup or get_usb_bus
+        self._jobs: dict[int, Job] = {}
+        self._caps: dict[str, float] = {}
+        self._bus_capacities: dict[str, float | None] = {}
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+
+    def set_cap(self, resource: str, bytes_per_second: float | None) -> None:
+        """Cap a resource ("device:sda", "bus:1", "link:pi2"); None removes it."""
+        with self._changed:
+            if bytes_per_second:
+                self._caps[resource] = float(bytes_per_second)
+            else:
+                self._caps.pop(resource, None)
+            self._changed.notify_all()
+
+    @contextlib.contextmanager
+    def job(
+        self,
+        name: str,
+        priority: Priority,
+        *,
+        devices: Iterable[str | None] = (),
+        paths: Iterable[Path] = (),
+        links: Iterable[str] = (),
+    ) -> Iterator[Job]:
+        """Register a job for the duration of the ``with`` block.
+
+        Args:
+            name: Shown in logs and the UI
+            priority: Job priority
+            devices: Drive names the job reads or writes
+            paths: Files or directories the job reads or writes; their drives
+                are looked up
+            links: Peers the job sends to or receives from
+        """
+        job = self.register(name, priority, devices=devices, paths=paths, links=links)
+        try:
+            yield job
+        finally:
+            self.release(job)
+
+    def register(
+        self,
+        name: str,
+        priority: Priority,
+        *,
+        devices: Iterable[str | None] = (),
+        paths: Iterable[Path] = (),
+        links: Iterable[str] = (),
+    ) -> Job:
+        """Register a job; call ``release()`` when it ends."""
+        names = {device for device in devices if device}
+        names.update(device for device in (device_of(path) for path in paths) if device)
+        resources = {f"link:{link}" for link in links if link}
+        bus_capacities = {}
+        for device in names:
+            resources.add(f"device:{device}")
+            bus = self._bus_lookup(device)
+            if bus is not None:
+                bus_key, speed = bus
+                resources.add(f"bus:{bus_key}")
+                bus_capacities[f"bus:{bus_key}"] = bus_capacity(speed)
+        with self._changed:
+            self._bus_capacities.update(bus_capacities)
+            job = Job(self, next(self._ids), name, priority, frozenset(resources))
+            self._jobs[job.job_id] = job
+            self._changed.notify_all()
+        log.info(
+            f"Job started: {name} ({priority.name.lower()}) on "
+            f"{', '.join(sorted(resources)) or 'no shared resources'}"
+        )
+        return job
+
+    def release(self, job: Job) -> None:
+        with self._changed:
+            job.released = True
+            self._jobs.pop(job.job_id, None)
+            self._changed.notify_all()
+        log.info(f"Job finished: {job.name}")
+
+    def jobs(self) -> list[JobStatus]:
+        """Running jobs, highest priority first."""
+        with self._changed:
+            return [
+                JobStatus(
+                    job_id=job.job_id,
+                    name=job.name,
+                    priority=job.priority,
+                    resources=tuple(sorted(job.resources)),
+                    moved_bytes=job.moved_bytes,
+                    bytes_per_second=self._rate_locked(job),
+                    preempted=self._preempted_locked(job),
+                )
+                for job in sorted(
+                    self._jobs.values(), key=lambda job: (job.priority, job.job_id)
+                )
+            ]
+
+    def rate_for(self, job: Job) -> float | None:
+        """Bytes per second ``job`` may move now; None is unlimited."""
+        with self._changed:
+            return self._rate_locked(job)
+
+    def _sharing_locked(self, resource: str) -> list[Job]:
+        return [job for job in self._jobs.values() if resource in job.resources]
+
+    def _preempted_locked(self, job: Job) -> bool:
+        if job.priority != Priority.BACKGROUND:
+            return False
+        return any(
+            other.priority < Priority.BACKGROUND and other.resources & job.resources
+            for other in self._jobs.values()
+        )
+
+    def _capacity_locked(self, resource: str, sharing: int) -> float | None:
+        if resource in self._caps:
+            return self._caps[resource]
+        kind = resource.split(":", 1)[0]
+        if kind == "device":
+            return _setting_cap("transfer_device_cap_mbps")
+        if kind == "link":
+            return _setting_cap("transfer_link_cap_mbps")
+        if kind == "bus" and sharing > 1:
+            return self._bus_capacities.get(resource)
+        return None
+
+    def _rate_locked(self, job: Job) -> float | None:
+        if self._preempted_locked(job):
+            return PREEMPTED_BYTES_PER_SECOND
+        rates = []
+        for resource in job.resources:
+            sharing = self._sharing_locked(resource)
+            capacity = self._capacity_locked(resource, len(sharing))
+            if capacity is None:
+                continue
+            total = sum(
+                other.weight for other in sharing if not self._preempted_locked(other)
+            )
+            rates.append(capacity * job.weight / total)
+        return min(rates) if rates else None
+
+    def _consume(self, job: Job, count: int) -> None:
+        with self._changed:
+            job.moved_bytes += count
+            job._debt += count
+            while not job.released:
+                rate = self._rate_locked(job)
+                now = time.monotonic()
+                if rate is None:
+                    job._debt = 0.0
+                else:
+                    job._debt = max(0.0, job._debt - (now - job._paid_at) * rate)
+                job._paid_at = now
+                if rate is None or job._debt <= rate * BURST_SECONDS:
+                    return
+                self._changed.wait(
+                    min(WAIT_SLICE_SECONDS, (job._debt - rate * BURST_SECONDS) / rate)
+                )
+
+
+_scheduler = TransferScheduler()
+
+
+def get_scheduler() -> TransferScheduler:
+    """Return the shared scheduler."""
+    return _scheduler
+
+
+def job(
+    name: str,
+    priority: Priority,
+    *,
+    devices: Iterable[str | None] = (),
+    paths: Iterable[Path] = (),
+    links: Iterable[str] = (),
+) -> contextlib.AbstractContextManager[Job]:
+    """Register a job with the shared scheduler (see ``TransferScheduler.job``)."""
+    return _scheduler.job(name, priority, devices=devices, paths=paths, links=links)
@@ -22,6 +22,7 @@ Example:
 
 from pathlib import Path
 
+from .device_snapshot import DeviceSnapshot
 from .devices import get_children, get_device_by_name
 from .exceptions import (
     DeviceNotFoundError,
@@ -30,15 +31,27 @@ from .exceptions import (
     MountVerificationError,
     SourceDestinationSameError,
 )
+from .mount_table import is_mountpoint_active
 
 
 def _get_device_name(device) -> str:
-    """Extract device name from device dict or string."""
+    """Extract device name from device snapshot, dict or string."""
+    if isinstance(device, DeviceSnapshot):
+        return device.name
     if isinstance(device, dict):
         return device.get("name", "")
     return str(device)
 
 
+def _get_device_size(device):
+    """Get device size from a device snapshot or dict, None if unknown."""
+    if isinstance(device, DeviceSnapshot):
+        return device.size
+    if isinstance(device, dict):
+        return device.get("size")
+    return None
+
+
 def _get_device_path(device) -> str:
     """Get device path (/dev/xxx) from device dict or string."""
     name = _get_device_name(device)
@@ -47,28 +60,18 @@ def _get_device_path(device) -> str:
     return f"/dev/{name}"
 
 
-def _is_mountpoint_active(mountpoint: str) -> bool:
-    """Check if a mountpoint is currently active."""
-    try:
-        with open("/proc/mounts", encoding="utf-8") as mounts_file:
-            for line in mounts_file:
-                parts = line.split()
-                if len(parts) > 1 and parts[1] == mountpoint:
-                    return True
-    except FileNotFoundError:
-        return Path(mountpoint).is_mount()
-    return False
-
-
 def validate_device_exists(device) -> None:
     """Validate that a device exists.
 
     Args:
-        device: Device dict or device name string
+        device: Device snapshot, dict or device name string
 
     Raises:
         DeviceNotFoundError: If device does not exist
     """
+    if isinstance(device, DeviceSnapshot):
+        # Snapshots are only captured for devices that exist
+        return
     device_name = _get_device_name(device)
     if not device_name:
         raise DeviceNotFoundError("(empty name)")
@@ -133,7 +136,7 @@ def validate_device_unmounted(device) -> None:
     """Validate that a device and all its partitions are unmounted.
 
     Args:
-        device: Device dict or device name
+        device: Device snapshot, dict or device name
 
     Raises:
         DeviceBusyError: If device or any partition is mounted
@@ -141,6 +144,13 @@ def validate_device_unmounted(device) -> None:
     """
     device_name = _get_device_name(device)
 
+    if isinstance(device, DeviceSnapshot):
+        # Mountpoints recorded in the snapshot must no longer be active
+        for mountpoint in device.mountpoints():
+            if is_mountpoint_active(mountpoint):
+                raise MountVerificationError(device_name, mountpoint)
+        return
+
     # Get device dict if we only have a name
     device_dict = (
         device if isinstance(device, dict) else get_device_by_name(device_name)
@@ -152,14 +162,14 @@ def validate_device_unmounted(device) -> None:
 
     # Check main device mountpoint
     main_mountpoint = device_dict.get("mountpoint")
-    if main_mountpoint and _is_mountpoint_active(main_mountpoint):
+    if main_mountpoint and is_mountpoint_active(main_mountpoint):
         raise MountVerificationError(device_name, main_mountpoint)
 
     # Check all partition mountpoints
     for child in get_children(device_dict):
         child.get("name", "")
         child_mountpoint = child.get("mountpoint")
-        if child_mountpoint and _is_mountpoint_active(child_mountpoint):
+        if child_mountpoint and is_mountpoint_active(child_mountpoint):
             raise MountVerificationError(device_name, child_mountpoint)
 
 
@@ -167,8 +177,8 @@ def validate_sufficient_space(source, destination) -> None:
     """Validate that destination has sufficient space for source data.
 
     Args:
-        source: Source device dict
-        destination: Destination device dict
+        source: Source device snapshot or dict
+        destination: Destination device snapshot or dict
 
     Raises:
         InsufficientSpaceError: If destination is too small
@@ -177,14 +187,8 @@ def validate_sufficient_space(source, destination) -> None:
     source_name = _get_device_name(source)
     dest_name = _get_device_name(destination)
 
-    # Get sizes from device dicts
-    source_size = None
-    dest_size = None
-
-    if isinstance(source, dict):
-        source_size = source.get("size")
-    if isinstance(destination, dict):
-        dest_size = destination.get("size")
+    source_size = _get_device_size(source)
+    dest_size = _get_device_size(destination)
 
     # If we don't have sizes, we can't validate
     if source_size is None:
@@ -211,8 +215,8 @@ def validate_clone_operation(
     correct order.
 
     Args:
-        source: Source device dict or name
-        destination: Destination device dict or name
+        source: Source device snapshot, dict or name
+        destination: Destination device snapshot, dict or name
         check_space: Whether to validate sufficient space (default True)
         check_unmounted: Whether to validate destination unmounted (default True)
 
@@ -231,11 +235,10 @@ def validate_clone_operation(
         validate_device_unmounted(destination)
 
     # 4. Check sufficient space (optional, can be skipped for exact mode)
-    # Only validate if both devices are dicts AND both have size information
-    if check_space and isinstance(source, dict) and isinstance(destination, dict):
-        source_size = source.get("size")
-        dest_size = destination.get("size")
-        # Only validate space if we have size info for both devices
+    # Only validate if we have size information for both devices
+    if check_space:
+        source_size = _get_device_size(source)
+        dest_size = _get_device_size(destination)
         if source_size is not None and dest_size is not None:
             validate_sufficient_space(source, destination)
 
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import json
 import pkgutil
 import threading
@@ -19,7 +20,8 @@ from typing_extensions import TypeAlias
 from rpi_usb_cloner.app.context import AppContext, LogEntry
 from rpi_usb_cloner.hardware import gpio, virtual_gpio
 from rpi_usb_cloner.logging import LoggerFactory
-from rpi_usb_cloner.storage import image_repo
+from rpi_usb_cloner.services import link_benchmark
+from rpi_usb_cloner.storage import hotplug, image_repo, repo_catalog
 from rpi_usb_cloner.storage.device_lock import is_operation_active
 from rpi_usb_cloner.ui import display
 from rpi_usb_cloner.web.system_health import (
@@ -262,6 +264,7 @@ def _build_health_payload(health: SystemHealth) -> dict[str, object]:
             "status": get_usage_status(health.disk_percent),
         },
         "temperature": None,
+        "link_benchmark": None,
     }
 
     if health.temperature_celsius is not None:
@@ -269,6 +272,9 @@ def _build_health_payload(health: SystemHealth) -> dict[str, object]:
             "celsius": round(health.temperature_celsius, 1),
             "status": get_temperature_status(health.temperature_celsius),
         }
+    benchmark = link_benchmark.get_last_result()
+    if benchmark is not None:
+        response["link_benchmark"] = benchmark.as_dict()
     return response
 
 
@@ -425,16 +431,55 @@ async def _logs_broadcaster(app: web.Application) -> None:
         last_snapshot = current
 
 
+async def _wait_for_device_change(
+    generation: int | None, timeout: float
+) -> int | None:
+    """Sleep until the hotplug device table changes or ``timeout`` passes.
+
+    Without a running hotplug monitor this is a plain sleep.
+
+    Returns:
+        The device table generation afterwards, or None without a monitor
+    """
+    table = hotplug.get_device_table()
+    if table is None:
+        await asyncio.sleep(timeout)
+        return None
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def on_change(_generation: int) -> None:
+        # Runs on the monitor thread; the loop may already be closed
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(changed.set)
+
+    unsubscribe = table.subscribe(on_change)
+    try:
+        if table.generation == generation:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(changed.wait(), timeout)
+    finally:
+        unsubscribe()
+    return table.generation
+
+
 async def _devices_broadcaster(app: web.Application) -> None:
-    """Background task: Broadcast USB device info every 2 seconds."""
+    """Background task: Broadcast USB device info when devices change.
+
+    With the hotplug monitor running, the list is rebuilt only when the
+    device table generation changes and re-sent every 2 seconds otherwise;
+    without it, the list is rebuilt every 2 seconds.
+    """
     from rpi_usb_cloner.services.drives import list_usb_disks_filtered
     from rpi_usb_cloner.storage.devices import get_children, human_size
 
     stop_event = app.get(DISPLAY_STOP_EVENT_KEY, threading.Event())
     cached_device_list: list[dict] = []
+    generation: int | None = None
+    built_generation: int | None = None
 
     while not stop_event.is_set():
-        await asyncio.sleep(2.0)
+        generation = await _wait_for_device_change(generation, 2.0)
 
         # Skip if operation is active
         if is_operation_active():
@@ -443,6 +488,13 @@ async def _devices_broadcaster(app: web.Application) -> None:
                 "devices",
                 {"type": "devices", "devices": cached_device_list, "operation_active": True},
             )
+            built_generation = None
+            continue
+
+        if generation is not None and generation == built_generation:
+            await _send_to_subscribers(
+                app, "devices", {"type": "devices", "devices": cached_device_list}
+            )
             continue
 
         devices = list_usb_disks_filtered()
@@ -489,6 +541,7 @@ async def _devices_broadcaster(app: web.Application) -> None:
             )
 
         cached_device_list = device_list
+        built_generation = generation
         await _send_to_subscribers(
             app, "devices", {"type": "devices", "devices": device_list}
         )
@@ -514,20 +567,15 @@ async def _images_broadcaster(app: web.Application) -> None:
             )
             continue
 
-        repos = image_repo.find_image_repos()
+        snapshot = repo_catalog.get_repo_catalog().snapshot()
+        repos = list(snapshot.repos)
         image_list = []
-        repo_images: dict[Path, list[image_repo.DiskImage]] = {}
-        all_images: list[image_repo.DiskImage] = []
-
-        for repo in repos:
-            images = image_repo.list_clonezilla_images(repo.path)
-            repo_images[repo.path] = images
-            all_images.extend(images)
+        all_images = snapshot.all_images()
 
         now = time.monotonic()
         if now >= next_repo_stats_refresh:
             try:
-                repo_stats = _build_repo_stats(repos)
+                repo_stats = _build_repo_stats(snapshot)
             except Exception:
                 pass
             next_repo_stats_refresh = now + REPO_STATS_REFRESH_SECONDS
@@ -540,7 +588,7 @@ async def _images_broadcaster(app: web.Application) -> None:
             next_image_sizes_refresh = now + REPO_STATS_REFRESH_SECONDS
 
         for repo in repos:
-            for image in repo_images.get(repo.path, []):
+            for image in snapshot.images_for(repo.path):
                 size_bytes = image.size_bytes
                 if size_bytes is None:
                     size_bytes = image_sizes.get(str(image.path))
@@ -1016,6 +1064,7 @@ async def handle_devices_ws(request: web.Request) -> web.WebSocketResponse:
     try:
         # Cache for when operations are in progress
         cached_device_list: list[dict] = []
+        generation: int | None = None
 
         while not ws.closed:
             # Skip filesystem scanning if a device operation is in progress
@@ -1083,7 +1132,8 @@ async def handle_devices_ws(request: web.Request) -> web.WebSocketResponse:
             cached_device_list = device_list
 
             await ws.send_json({"devices": device_list})
-            await asyncio.sleep(2.0)  # Update every 2 seconds
+            # Update on device changes, or every 2 seconds
+            generation = await _wait_for_device_change(generation, 2.0)
 
     except asyncio.CancelledError:
         # Server shutdown - close gracefully
@@ -1145,20 +1195,15 @@ async def handle_images_ws(request: web.Request) -> web.WebSocketResponse:
                 await asyncio.sleep(2.0)
                 continue
 
-            repos = image_repo.find_image_repos()
+            snapshot = repo_catalog.get_repo_catalog().snapshot()
+            repos = list(snapshot.repos)
             image_list = []
-            repo_images: dict[Path, list[image_repo.DiskImage]] = {}
-            all_images: list[image_repo.DiskImage] = []
-
-            for repo in repos:
-                images = image_repo.list_clonezilla_images(repo.path)
-                repo_images[repo.path] = images
-                all_images.extend(images)
+            all_images = snapshot.all_images()
 
             now = time.monotonic()
             if now >= next_repo_stats_refresh and repo_stats_task is None:
                 repo_stats_task = asyncio.create_task(
-                    asyncio.to_thread(_build_repo_stats, repos)
+                    asyncio.to_thread(_build_repo_stats, snapshot)
                 )
                 next_repo_stats_refresh = now + REPO_STATS_REFRESH_SECONDS
 
@@ -1191,7 +1236,7 @@ async def handle_images_ws(request: web.Request) -> web.WebSocketResponse:
                 image_sizes_task = None
 
             for repo in repos:
-                for image in repo_images.get(repo.path, []):
+                for image in snapshot.images_for(repo.path):
                     size_bytes = image.size_bytes
                     if size_bytes is None:
                         size_bytes = image_sizes.get(str(image.path))
@@ -1234,11 +1279,13 @@ async def handle_images_ws(request: web.Request) -> web.WebSocketResponse:
 
 
 def _build_repo_stats(
-    repos: list[image_repo.ImageRepo],
+    snapshot: repo_catalog.CatalogSnapshot,
 ) -> dict[str, dict[str, dict[str, int] | int]]:
     stats: dict[str, dict[str, dict[str, int] | int]] = {}
-    for repo in repos:
-        stats[str(repo.path)] = image_repo.get_repo_usage(repo)
+    for repo in snapshot.repos:
+        stats[str(repo.path)] = image_repo.get_repo_usage(
+            repo, snapshot.images_for(repo.path)
+        )
     return stats
 
 
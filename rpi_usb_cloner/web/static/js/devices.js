@@ -148,12 +148,13 @@ class DeviceManager {
         acc.clonezilla += typeBytes.clonezilla || 0;
         acc.iso += typeBytes.iso || 0;
         acc.imageusb += typeBytes.imageusb || 0;
+        acc.compressed += typeBytes.compressed || 0;
         acc.other += typeBytes.other || 0;
         acc.total += entry.total_bytes || 0;
         acc.free += entry.free_bytes || 0;
         return acc;
       },
-      { clonezilla: 0, iso: 0, imageusb: 0, other: 0, total: 0, free: 0 }
+      { clonezilla: 0, iso: 0, imageusb: 0, compressed: 0, other: 0, total: 0, free: 0 }
     );
 
     if (totals.total === 0) {
@@ -170,6 +171,7 @@ class DeviceManager {
       { key: 'clonezilla', bytes: totals.clonezilla, color: 'primary' },
       { key: 'iso', bytes: totals.iso, color: 'info' },
       { key: 'imageusb', bytes: totals.imageusb, color: 'warning' },
+      { key: 'compressed', bytes: totals.compressed, color: 'success' },
       { key: 'other', bytes: totals.other, color: 'secondary' },
       { key: 'free', bytes: totals.free, color: 'secondary-lt' }
     ];
@@ -187,6 +189,7 @@ class DeviceManager {
       clonezilla: 'Clonezilla',
       iso: 'ISO',
       imageusb: 'BIN',
+      compressed: 'Compressed',
       other: 'Other',
       free: 'Free'
     };
@@ -23,10 +23,38 @@ class HealthManager {
         value: document.getElementById(options.tempValueId || 'temp-value'),
         bar: document.getElementById(options.tempBarId || 'temp-bar'),
         detail: document.getElementById(options.tempDetailId || 'temp-detail')
+      },
+      benchmark: {
+        container: document.getElementById('link-benchmark'),
+        peer: document.getElementById('link-benchmark-peer'),
+        bottleneck: document.getElementById('link-benchmark-bottleneck'),
+        link: document.getElementById('link-benchmark-link'),
+        rtt: document.getElementById('link-benchmark-rtt'),
+        upload: document.getElementById('link-benchmark-upload'),
+        disk: document.getElementById('link-benchmark-disk')
       }
     };
   }
 
+  static formatSpeed(bytesPerSecond) {
+    return `${(bytesPerSecond / 1e6).toFixed(1)} MB/s`;
+  }
+
+  updateBenchmark(benchmark) {
+    const el = this.elements.benchmark;
+    if (!el.container || !benchmark) return;
+
+    el.container.classList.remove('d-none');
+    el.peer.textContent = benchmark.peer;
+    el.bottleneck.textContent = `Limited by ${benchmark.bottleneck}`;
+    el.link.textContent =
+      `${HealthManager.formatSpeed(benchmark.upload_bytes_per_second)} up / ` +
+      `${HealthManager.formatSpeed(benchmark.download_bytes_per_second)} down`;
+    el.rtt.textContent = `${(benchmark.rtt_seconds * 1000).toFixed(1)} ms round trip`;
+    el.upload.textContent = HealthManager.formatSpeed(benchmark.upload_path_bytes_per_second);
+    el.disk.textContent = HealthManager.formatSpeed(benchmark.disk_write_bytes_per_second);
+  }
+
   update(health) {
     if (!health) return;
 
@@ -85,6 +113,8 @@ class HealthManager {
         }
       }
     }
+
+    this.updateBenchmark(health.link_benchmark);
   }
 }
 
@@ -487,7 +487,25 @@ def reset_global_state():
     """
     # This will run before each test
     yield
-    # Cleanup after test (if needed)
+    # Drop the shared image repo catalog so scans never leak between tests
+    repo_catalog = sys.modules.get("rpi_usb_cloner.storage.repo_catalog")
+    if repo_catalog is not None:
+        repo_catalog.reset_repo_catalog()
+
+
+@pytest.fixture
+def unchanged_device_refresh(mocker):
+    """
+    Make DeviceSnapshot.refresh() return the snapshot itself.
+
+    Clone jobs re-read the target after writing its partition table; with
+    lsblk mocked out there is nothing to re-read, so keep it unchanged.
+    """
+    from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot
+
+    return mocker.patch.object(
+        DeviceSnapshot, "refresh", autospec=True, side_effect=lambda self: self
+    )
 
 
 @pytest.fixture
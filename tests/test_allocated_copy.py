@@ -0,0 +1,302 @@
+"""Tests for allocated-block-only partition copies.
+
+Covers:
+- get_allocated_ranges for FAT12/16, exFAT and ext* images
+- copy_allocated_ranges sparse copy and gap zeroing
+- clone_partclone using the allocated copy when partclone is missing
+"""
+
+from __future__ import annotations
+
+import struct
+from unittest.mock import patch
+
+import pytest
+
+from rpi_usb_cloner.storage.clone import allocated_copy, operations
+from rpi_usb_cloner.storage.clone.allocated_copy import (
+    copy_allocated_ranges,
+    get_allocated_ranges,
+)
+
+
+SECTOR = 512
+
+
+def _build_fat(path, *, fat_sectors, total_sectors, used, fat12=False):
+    """Write a FAT12/16 image (1 sector clusters) with the given clusters used."""
+    boot = bytearray(SECTOR)
+    struct.pack_into("<HBHBHH", boot, 11, SECTOR, 1, 1, 2, 512, total_sectors)
+    struct.pack_into("<H", boot, 22, fat_sectors)
+    boot[510:512] = b"\x55\xaa"
+    fat = bytearray(fat_sectors * SECTOR)
+    for cluster in used:
+        if fat12:
+            offset = cluster * 3 // 2
+            value = struct.unpack_from("<H", fat, offset)[0]
+            value |= 0xFFF0 if cluster & 1 else 0x0FFF
+            struct.pack_into("<H", fat, offset, value)
+        else:
+            struct.pack_into("<H", fat, cluster * 2, 0xFFFF)
+    with path.open("wb") as handle:
+        handle.truncate(total_sectors * SECTOR)
+        handle.write(bytes(boot))
+        handle.write(bytes(fat))
+        handle.write(bytes(fat))
+    # reserved + FATs + 32 root directory sectors
+    return (1 + 2 * fat_sectors + 32) * SECTOR
+
+
+class TestFatRanges:
+    """Test FAT allocation maps."""
+
+    def test_fat16_used_clusters(self, tmp_path):
+        image = tmp_path / "fat16.img"
+        data_start = _build_fat(
+            image, fat_sectors=20, total_sectors=4273, used=[2, 3, 10]
+        )
+
+        ranges = get_allocated_ranges(str(image), "vfat")
+
+        assert ranges == [
+            (0, data_start + 2 * SECTOR),
+            (data_start + 8 * SECTOR, SECTOR),
+        ]
+
+    def test_fat12_used_clusters(self, tmp_path):
+        image = tmp_path / "fat12.img"
+        data_start = _build_fat(
+            image, fat_sectors=1, total_sectors=300, used=[3, 4, 7], fat12=True
+        )
+
+        ranges = get_allocated_ranges(str(image), "vfat")
+
+        assert ranges == [
+            (0, data_start),
+            (data_start + SECTOR, 2 * SECTOR),
+            (data_start + 5 * SECTOR, SECTOR),
+        ]
+
+    def test_invalid_boot_sector_returns_none(self, tmp_path):
+        image = tmp_path / "blank.img"
+        image.write_bytes(bytes(SECTOR * 4))
+        assert get_allocated_ranges(str(image), "vfat") is None
+
+
+class TestExfatRanges:
+    """Test exFAT allocation bitmap parsing."""
+
+    HEAP = 32
+    CLUSTERS = 64
+
+    def _build(self, path, used):
+        boot = bytearray(SECTOR)
+        boot[3:11] = b"EXFAT   "
+        struct.pack_into("<IIIII", boot, 80, 24, 8, self.HEAP, self.CLUSTERS, 3)
+        boot[108], boot[109] = 9, 0
+        fat = bytearray(8 * SECTOR)
+        struct.pack_into("<I", fat, 3 * 4, 0xFFFFFFFF)  # root directory
+        bitmap = bytearray(self.CLUSTERS // 8)
+        for cluster in [2, 3, *used]:
+            index = cluster - 2
+            bitmap[index // 8] |= 1 << (index % 8)
+        root = bytearray(SECTOR)
+        root[0] = 0x83  # volume label precedes the bitmap entry
+        root[32] = 0x81
+        struct.pack_into("<IQ", root, 32 + 20, 2, len(bitmap))
+        with path.open("wb") as handle:
+            handle.truncate((self.HEAP + self.CLUSTERS) * SECTOR)
+            handle.write(bytes(boot))
+            handle.seek(24 * SECTOR)
+            handle.write(bytes(fat))
+            handle.seek(self.HEAP * SECTOR)
+            handle.write(bytes(bitmap).ljust(SECTOR, b"\x00"))
+            handle.write(bytes(root))
+
+    def test_bitmap_clusters(self, tmp_path):
+        image = tmp_path / "exfat.img"
+        self._build(image, used=[4, 5, 20])
+        heap = self.HEAP * SECTOR
+
+        ranges = get_allocated_ranges(str(image), "exfat")
+
+        assert ranges == [(0, heap + 4 * SECTOR), (heap + 18 * SECTOR, SECTOR)]
+
+    def test_missing_bitmap_returns_none(self, tmp_path):
+        image = tmp_path / "exfat.img"
+        self._build(image, used=[])
+        with image.open("r+b") as handle:
+            handle.seek((self.HEAP + 1) * SECTOR + 32)
+            handle.write(b"\x00")
+        assert get_allocated_ranges(str(image), "exfat") is None
+
+
+class TestExtRanges:
+    """Test ext block bitmap parsing."""
+
+    BLOCK = 1024
+
+    def _build(self, path, *, uninit_group1=True, incompat=0x242, ro_compat=0x47B):
+        superblock = bytearray(1024)
+        struct.pack_into("<I", superblock, 4, 513)
+        struct.pack_into("<II", superblock, 20, 1, 0)
+        struct.pack_into("<I", superblock, 32, 256)
+        struct.pack_into("<H", superblock, 56, 0xEF53)
+        # ext4 defaults but 64bit: filetype, extents, flex_bg; sparse_super,
+        # large_file, huge_file, dir_nlink, extra_isize, metadata_csum
+        struct.pack_into("<II", superblock, 96, incompat, ro_compat)
+        descriptors = bytearray(64)
+        struct.pack_into("<I", descriptors, 0, 3)
+        struct.pack_into("<I", descriptors, 32, 4)
+        if uninit_group1:
+            struct.pack_into("<H", descriptors, 32 + 0x12, 0x0002)
+        bitmap0 = bytearray(self.BLOCK)
+        bitmap0[0] = 0x1F  # blocks 1-5
+        bitmap0[12] = 0x70  # blocks 101-103
+        bitmap1 = bytearray(self.BLOCK)
+        bitmap1[0] = 0x01  # block 257
+        with path.open("wb") as handle:
+            handle.truncate(513 * self.BLOCK)
+            handle.seek(1024)
+            handle.write(bytes(superblock))
+            handle.write(bytes(descriptors).ljust(self.BLOCK, b"\x00"))
+            handle.write(bytes(bitmap0))
+            handle.write(bytes(bitmap1))
+
+    def test_uninit_group_copied_whole(self, tmp_path):
+        image = tmp_path / "ext4.img"
+        self._build(image)
+
+        ranges = get_allocated_ranges(str(image), "ext4")
+
+        assert ranges == [
+            (0, 6 * self.BLOCK),
+            (101 * self.BLOCK, 3 * self.BLOCK),
+            (257 * self.BLOCK, 256 * self.BLOCK),
+        ]
+
+    def test_initialised_groups_use_bitmaps(self, tmp_path):
+        image = tmp_path / "ext2.img"
+        self._build(image, uninit_group1=False)
+
+        ranges = get_allocated_ranges(str(image), "ext2")
+
+        assert ranges[-1] == (257 * self.BLOCK, self.BLOCK)
+
+    @pytest.mark.parametrize(
+        ("incompat", "ro_compat"),
+        [
+            (0x242, 0x47B | 0x200),  # bigalloc: the bitmaps track clusters
+            (0x242 | 0x10, 0x47B),  # meta_bg: descriptors are scattered
+            (0x242 | 0x01, 0x47B),  # compression
+        ],
+        ids=["bigalloc", "meta_bg", "compression"],
+    )
+    def test_unsupported_features_return_none(self, tmp_path, incompat, ro_compat):
+        image = tmp_path / "ext4.img"
+        self._build(image, incompat=incompat, ro_compat=ro_compat)
+
+        assert get_allocated_ranges(str(image), "ext4") is None
+
+    def test_unsupported_fstype_returns_none(self, tmp_path):
+        image = tmp_path / "ntfs.img"
+        image.write_bytes(bytes(4096))
+        assert get_allocated_ranges(str(image), "ntfs") is None
+
+
+class TestCopyAllocatedRanges:
+    """Test copy_allocated_ranges function."""
+
+    @pytest.fixture
+    def devices(self, tmp_path):
+        source = tmp_path / "source.img"
+        target = tmp_path / "target.img"
+        source.write_bytes(bytes(range(256)) * 64)
+        target.write_bytes(b"\xee" * (256 * 64))
+        return source, target
+
+    def test_copies_only_ranges(self, devices, mocker):
+        source, target = devices
+        mocker.patch.object(
+            allocated_copy, "get_write_zeroes_max_bytes", return_value=0
+        )
+        updates = []
+
+        copied = copy_allocated_ranges(
+            str(source),
+            str(target),
+            [(0, 1024), (8192, 512)],
+            progress_callback=lambda lines, ratio: updates.append(ratio),
+        )
+
+        assert copied == 1536
+        data = target.read_bytes()
+        expected = source.read_bytes()
+        assert data[:1024] == expected[:1024]
+        assert data[1024:8192] == b"\xee" * 7168
+        assert data[8192:8704] == expected[8192:8704]
+        assert data[8704:] == b"\xee" * (len(data) - 8704)
+        assert updates[-1] == 1.0
+
+    def test_zeroes_gaps_when_offloaded(self, devices, mocker):
+        source, target = devices
+        mocker.patch.object(
+            allocated_copy, "get_write_zeroes_max_bytes", return_value=1 << 20
+        )
+        zero = mocker.patch.object(allocated_copy, "zero_out_range", return_value=True)
+
+        copy_allocated_ranges(
+            str(source),
+            str(target),
+            [(0, 1024), (8192, 512)],
+            progress_callback=lambda lines, ratio: None,
+        )
+
+        gaps = [call.args[1:] for call in zero.call_args_list]
+        assert gaps == [(1024, 7168), (8704, 256 * 64 - 8704)]
+
+    def test_missing_source_raises(self, tmp_path):
+        with pytest.raises(RuntimeError, match="Cannot open"):
+            copy_allocated_ranges(
+                str(tmp_path / "missing"),
+                str(tmp_path / "target"),
+                [(0, 512)],
+                progress_callback=lambda lines, ratio: None,
+            )
+
+
+class TestClonePartcloneFallback:
+    """Test clone_partclone choosing the allocated copy."""
+
+    @patch("rpi_usb_cloner.storage.clone.operations.clone_dd")
+    @patch("rpi_usb_cloner.storage.clone.operations.copy_allocated_ranges")
+    @patch("rpi_usb_cloner.storage.clone.operations.get_children")
+    @patch("rpi_usb_cloner.storage.clone.operations.get_device_by_name")
+    @patch("rpi_usb_cloner.storage.clone.operations.shutil.which", return_value=None)
+    def test_uses_allocated_copy_without_partclone(
+        self, mock_which, mock_get_device, mock_get_children, mock_copy, mock_dd
+    ):
+        source = {"name": "sda", "size": 32000000000}
+        target = {"name": "sdb", "size": 32000000000}
+        mock_get_device.side_effect = [source, target]
+        mock_get_children.side_effect = [
+            [
+                {"name": "sda1", "type": "part", "fstype": "vfat", "size": 1 << 30},
+                {"name": "sda2", "type": "part", "fstype": "zfs", "size": 1 << 30},
+            ],
+            [
+                {"name": "sdb1", "type": "part", "size": 1 << 30},
+                {"name": "sdb2", "type": "part", "size": 1 << 30},
+            ],
+        ]
+        ranges = [(0, 1 << 20)]
+
+        with patch.object(
+            operations,
+            "get_allocated_ranges",
+            side_effect=lambda node, fstype: ranges if fstype == "vfat" else None,
+        ):
+            operations.clone_partclone(source, target)
+
+        assert mock_copy.call_args.args == ("/dev/sda1", "/dev/sdb1", ranges)
+        assert mock_dd.call_args.args[:2] == ("/dev/sda2", "/dev/sdb2")
@@ -0,0 +1,111 @@
+"""Tests for hardware-offloaded erase ioctls.
+
+Covers:
+- probe_offload_capabilities sysfs parsing
+- offload_erase_range chunking, progress and unsupported fallback
+"""
+
+from __future__ import annotations
+
+import errno
+import struct
+
+import pytest
+
+from rpi_usb_cloner.storage.clone import block_offload
+from rpi_usb_cloner.storage.clone.block_offload import (
+    BLKDISCARD,
+    BLKZEROOUT,
+    OffloadCapabilities,
+    offload_erase_range,
+    probe_offload_capabilities,
+)
+
+
+class TestProbeCapabilities:
+    """Test probe_offload_capabilities function."""
+
+    def test_reads_queue_attributes(self, mocker):
+        values = {
+            "discard_max_bytes": "2147450880",
+            "write_zeroes_max_bytes": "0",
+            "discard_zeroes_data": "0",
+        }
+        mocker.patch.object(
+            block_offload,
+            "read_queue_attribute",
+            side_effect=lambda node, attr: values[attr],
+        )
+
+        caps = probe_offload_capabilities("/dev/sda")
+
+        assert caps == OffloadCapabilities(2147450880, 0, False)
+        assert caps.known and caps.can_discard and not caps.can_zero_out
+
+    def test_missing_sysfs_is_unknown(self, mocker):
+        mocker.patch.object(block_offload, "read_queue_attribute", return_value=None)
+
+        caps = probe_offload_capabilities("/dev/sda")
+
+        assert not caps.known
+        assert not caps.can_discard
+
+
+class TestOffloadEraseRange:
+    """Test offload_erase_range function."""
+
+    @pytest.fixture
+    def device(self, tmp_path):
+        path = tmp_path / "device.img"
+        path.write_bytes(bytes(5 * 1024 * 1024))
+        return path
+
+    def test_issues_chunked_requests(self, device, mocker):
+        mocker.patch.object(block_offload, "OFFLOAD_CHUNK_BYTES", 2 * 1024 * 1024)
+        ioctl = mocker.patch.object(block_offload.fcntl, "ioctl")
+        updates = []
+
+        result = offload_erase_range(
+            str(device),
+            "zeroout",
+            progress_callback=lambda lines, ratio: updates.append(ratio),
+        )
+
+        assert result is True
+        requests = [
+            (c.args[1], struct.unpack("QQ", c.args[2])) for c in ioctl.call_args_list
+        ]
+        mib = 1024 * 1024
+        assert requests == [
+            (BLKZEROOUT, (0, 2 * mib)),
+            (BLKZEROOUT, (2 * mib, 2 * mib)),
+            (BLKZEROOUT, (4 * mib, mib)),
+        ]
+        assert updates[0] == 0.0
+        assert updates[-1] == 1.0
+
+    def test_unsupported_first_request_returns_false(self, device, mocker):
+        mocker.patch.object(
+            block_offload.fcntl,
+            "ioctl",
+            side_effect=OSError(errno.EOPNOTSUPP, "Operation not supported"),
+        )
+
+        assert offload_erase_range(str(device), "discard", 0, 4096) is False
+
+    def test_failure_after_progress_raises(self, device, mocker):
+        mocker.patch.object(block_offload, "OFFLOAD_CHUNK_BYTES", 4096)
+        ioctl = mocker.patch.object(block_offload.fcntl, "ioctl")
+        ioctl.side_effect = [None, OSError(errno.EIO, "I/O error")]
+
+        with pytest.raises(RuntimeError, match="BLKDISCARD failed at 4096"):
+            offload_erase_range(str(device), "discard", 0, 8192)
+        assert ioctl.call_args.args[1] == BLKDISCARD
+
+    def test_unaligned_range_rejected(self, device):
+        with pytest.raises(ValueError, match="Unaligned"):
+            offload_erase_range(str(device), "zeroout", 100, 512)
+
+    def test_unknown_operation_rejected(self, device):
+        with pytest.raises(ValueError, match="Unknown offload operation"):
+            offload_erase_range(str(device), "shred")
@@ -0,0 +1,384 @@
+"""Tests for chain replication to many peers.
+
+Covers:
+- planning replication chains and trees
+- relaying uploads through a chain of peers
+- recovering from failed hops
+- keeping one relay per transfer until it ends
+- replication yielding to other jobs as a background job
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+import time
+
+import pytest
+from aiohttp import web
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import (
+    chain_replication,
+    peer_transfer_client,
+    peer_transfer_server,
+    resumable_transfer,
+)
+from rpi_usb_cloner.services.chain_replication import ChainReplicator
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.storage import block_index, transfer_scheduler
+from rpi_usb_cloner.storage.transfer_scheduler import Priority
+
+
+BLOCK = 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(resumable_transfer, "BLOCK_BYTES", BLOCK)
+    monkeypatch.setattr(peer_transfer_client, "MIN_RANGE_BYTES", 2 * BLOCK)
+    monkeypatch.setattr(peer_transfer_client, "RETRY_DELAY_SECONDS", 0)
+    block_index.clear_block_indexes()
+    yield
+    block_index.clear_block_indexes()
+
+
+def make_peer(name, port=8765):
+    return PeerDevice(
+        hostname=name,
+        address="127.0.0.1",
+        port=port,
+        device_id=f"id-{name}",
+        txt_records={},
+    )
+
+
+class TestPlanChain:
+    """Test arranging peers for replication."""
+
+    def test_chain(self):
+        root = chain_replication.plan_chain(
+            [make_peer("c"), make_peer("a"), make_peer("b")]
+        )
+
+        assert root.peer.hostname == "a"
+        assert [child.peer.hostname for child in root.children] == ["b"]
+        assert root.children[0].children[0].peer.hostname == "c"
+        assert root.children[0].children[0].children == []
+
+    def test_tree(self):
+        root = chain_replication.plan_chain(
+            [make_peer(name) for name in "abcdef"], fanout=2
+        )
+
+        assert [child.peer.hostname for child in root.children] == ["b", "c"]
+        assert [child.peer.hostname for child in root.children[0].children] == [
+            "d",
+            "e",
+        ]
+        assert [child.peer.hostname for child in root.children[1].children] == ["f"]
+
+    def test_failed_peers_go_last(self):
+        root = chain_replication.plan_chain(
+            [make_peer("a"), make_peer("b")], failures={"id-a": 1}
+        )
+
+        assert root.peer.hostname == "b"
+        assert root.children[0].peer.hostname == "a"
+
+    def test_no_peers(self):
+        assert chain_replication.plan_chain([]) is None
+
+
+@pytest.fixture
+def fleet(tmp_path, aiohttp_client):
+    """Start receiving peers, each with its own repo."""
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+    servers = {}
+
+    async def start(*names, wrap=None):
+        peers = []
+        for name in names:
+            repo_path = tmp_path / name
+            repo_path.mkdir()
+            server = peer_transfer_server.TransferServer(
+                ImageRepo(path=repo_path, drive_name="sdb")
+            )
+            if wrap is not None and name in wrap:
+                server._handle_resumable_upload = wrap[name](
+                    server._handle_resumable_upload
+                )
+            _session, base_url = await aiohttp_client(server._build_app())
+            servers[name] = server
+            peers.append(make_peer(name, int(base_url.rsplit(":", 1)[1])))
+        replicator = ChainReplicator(peers)
+        replicator.tokens = {peer.device_id: token for peer in peers}
+        return replicator, servers
+
+    yield start
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+@pytest.fixture
+def images(tmp_path):
+    iso = tmp_path / "source" / "debian.iso"
+    image_dir = tmp_path / "source" / "clonezilla" / "backup"
+    image_dir.mkdir(parents=True)
+    iso.write_bytes(os.urandom(5 * BLOCK + 9))
+    (image_dir / "parts").write_text("sda1\n")
+    (image_dir / "sda1.ext4-ptcl-img.gz.aa").write_bytes(os.urandom(3 * BLOCK))
+    return [
+        DiskImage(name="debian.iso", path=iso, image_type=ImageType.ISO),
+        DiskImage(name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR),
+    ]
+
+
+def assert_received(server, images):
+    repo = server.destination_repo.path
+    iso, image_dir = images
+    assert (repo / "debian.iso").read_bytes() == iso.path.read_bytes()
+    for name in ("parts", "sda1.ext4-ptcl-img.gz.aa"):
+        assert (repo / "clonezilla" / "backup" / name).read_bytes() == (
+            image_dir.path / name
+        ).read_bytes()
+    assert not list(repo.rglob("*.part*"))
+
+
+class TestChainReplication:
+    """Test replicating images through a chain of peers."""
+
+    @pytest.mark.asyncio
+    async def test_source_sends_once(self, fleet, images, mocker):
+        replicator, servers = await fleet("a", "b", "c")
+        send_images = mocker.spy(peer_transfer_client.TransferClient, "send_images")
+        send_range = mocker.spy(peer_transfer_client.TransferClient, "_send_range")
+        progress = {}
+
+        result = await replicator.replicate(
+            images,
+            lambda peer, ratio: progress.setdefault(peer.hostname, []).append(ratio),
+        )
+
+        assert result == {"id-a": True, "id-b": True, "id-c": True}
+        for server in servers.values():
+            assert_received(server, images)
+        assert send_images.call_count == 1
+        # Each range left the source once: 3 for the 6-block ISO, 2 for the
+        # 3-block volume and 1 for "parts"
+        assert send_range.call_count == 6
+        for name in "abc":
+            # Ranges relayed down the chain were reported per hop
+            assert len(progress[name]) > 1
+            assert progress[name][-1] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_failed_hop_recovered(self, fleet, images, mocker):
+        calls = []
+
+        def failing_once(handle_upload):
+            async def handle(request, image_name):
+                calls.append(image_name)
+                if len(calls) == 1:
+                    await request.read()
+                    return web.json_response({"error": "I/O error"}, status=500)
+                return await handle_upload(request, image_name)
+
+            return handle
+
+        replicator, servers = await fleet("a", "b", "c", wrap={"b": failing_once})
+        send_images = mocker.spy(peer_transfer_client.TransferClient, "send_images")
+
+        result = await replicator.replicate(images)
+
+        assert result == {"id-a": True, "id-b": True, "id-c": True}
+        for server in servers.values():
+            assert_received(server, images)
+        # b and c were finished in a second round, started at b
+        assert send_images.call_count == 2
+        assert send_images.call_args.args[0].peer.hostname == "b"
+
+    @pytest.mark.asyncio
+    async def test_tokens_renewed_between_rounds(
+        self, fleet, images, mocker, monkeypatch
+    ):
+        monkeypatch.setattr(peer_transfer_server, "_current_pin", "1234")
+        replicator = None
+        expired = []
+
+        def expiring_once(handle_upload):
+            async def handle(request, image_name):
+                if not expired:
+                    # The round ran past the session timeout
+                    expired.append(image_name)
+                    await request.read()
+                    for token in replicator.tokens.values():
+                        peer_transfer_server._active_sessions.pop(token, None)
+                    monkeypatch.setattr(chain_replication, "TOKEN_REFRESH_SECONDS", 0)
+                    return web.json_response({"error": "I/O error"}, status=500)
+                return await handle_upload(request, image_name)
+
+            return handle
+
+        replicator, servers = await fleet("a", "b", wrap={"b": expiring_once})
+        assert await replicator.authenticate({"id-a": "1234", "id-b": "1234"}) == []
+        first_tokens = dict(replicator.tokens)
+        send_images = mocker.spy(peer_transfer_client.TransferClient, "send_images")
+
+        result = await replicator.replicate(images)
+
+        assert result == {"id-a": True, "id-b": True}
+        for server in servers.values():
+            assert_received(server, images)
+        assert send_images.call_count == 2
+        assert all(replicator.tokens[key] != first_tokens[key] for key in first_tokens)
+        for token in replicator.tokens.values():
+            peer_transfer_server._active_sessions.pop(token, None)
+
+    @pytest.mark.asyncio
+    async def test_unreachable_peer_skipped(self, fleet, images, unused_tcp_port):
+        replicator, servers = await fleet("a", "c")
+        dead = make_peer("b", unused_tcp_port)
+        replicator.peers.append(dead)
+        replicator.tokens[dead.device_id] = "token"
+
+        result = await replicator.replicate(images)
+
+        assert result == {"id-a": True, "id-b": False, "id-c": True}
+        for server in servers.values():
+            assert_received(server, images)
+
+
+class TestRelayInit:
+    """Test what a relaying peer reports at transfer init."""
+
+    @pytest.mark.asyncio
+    async def test_present_only_if_every_hop_has_it(self, fleet, tmp_path):
+        replicator, servers = await fleet("a", "b")
+        data = os.urandom(2 * BLOCK)
+        for name in ("a", "b"):
+            (servers[name].destination_repo.path / "shared.iso").write_bytes(data)
+        (servers["a"].destination_repo.path / "only-a.iso").write_bytes(data)
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "shared.iso").write_bytes(data)
+        (source / "only-a.iso").write_bytes(data)
+        images = [
+            DiskImage(name=name, path=source / name, image_type=ImageType.ISO)
+            for name in ("shared.iso", "only-a.iso")
+        ]
+        head = replicator._client(replicator.peers[0])
+        images_meta = await head._images_meta(images)
+        b = replicator._relay_spec(chain_replication.ReplicaNode(replicator.peers[1]))
+        offline = dict(b, name="id-x", url="http://127.0.0.1:9")
+        headers = {"Authorization": f"Bearer {head.session_token}"}
+
+        async with peer_transfer_client.aiohttp.ClientSession() as session:
+            reply = await head._init_transfer(
+                session, headers, images_meta, relay=[b, offline]
+            )
+
+        assert reply["present"] == {"shared.iso": [""]}
+        assert reply["relay_failed"] == ["id-x"]
+        assert reply["compression"] == "deflate"
+        await servers["a"]._close_relays()
+
+
+class TestRelayLifetime:
+    """Test that relays are kept per transfer and dropped when it ends."""
+
+    @pytest.mark.asyncio
+    async def test_relays_ended_with_transfer(self, fleet, images):
+        replicator, servers = await fleet("a", "b", "c")
+
+        result = await replicator.replicate(images)
+
+        assert all(result.values())
+        assert servers["a"]._relays == {}
+        assert servers["b"]._relays == {}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_relayed_transfers(self, fleet, images):
+        replicator, servers = await fleet("a", "b", "c")
+        head, b, c = replicator.peers
+        iso, image_dir = images
+
+        # Two senders relay through a at once, each to a different hop
+        await asyncio.gather(
+            replicator._client(head).send_images(
+                [iso],
+                relay=[replicator._relay_spec(chain_replication.ReplicaNode(b))],
+            ),
+            replicator._client(head).send_images(
+                [image_dir],
+                relay=[replicator._relay_spec(chain_replication.ReplicaNode(c))],
+            ),
+        )
+
+        b_repo = servers["b"].destination_repo.path
+        c_repo = servers["c"].destination_repo.path
+        assert (b_repo / "debian.iso").read_bytes() == iso.path.read_bytes()
+        assert not (b_repo / "clonezilla").exists()
+        assert (c_repo / "clonezilla" / "backup" / "parts").exists()
+        assert not (c_repo / "debian.iso").exists()
+        assert servers["a"]._relays == {}
+
+    @pytest.mark.asyncio
+    async def test_abandoned_relay_dropped(self, fleet, images, monkeypatch):
+        replicator, servers = await fleet("a", "b")
+        head, b = replicator.peers
+        client = replicator._client(head)
+        images_meta = await client._images_meta(images)
+        headers = {"Authorization": f"Bearer {client.session_token}"}
+        spec = replicator._relay_spec(chain_replication.ReplicaNode(b))
+
+        async with peer_transfer_client.aiohttp.ClientSession() as session:
+            await client._init_transfer(session, headers, images_meta, relay=[spec])
+            assert len(servers["a"]._relays) == 1
+            # The sender went away; the next transfer drops its relay
+            monkeypatch.setattr(chain_replication, "RELAY_IDLE_SECONDS", 0)
+            await client._init_transfer(session, headers, images_meta)
+
+        assert servers["a"]._relays == {}
+
+
+class TestScheduling:
+    """Test replication running as a background job."""
+
+    @pytest.fixture
+    def shared(self, monkeypatch):
+        scheduler = transfer_scheduler.TransferScheduler(bus_lookup=lambda device: None)
+        monkeypatch.setattr(transfer_scheduler, "_scheduler", scheduler)
+        return scheduler
+
+    @pytest.mark.asyncio
+    async def test_yields_to_interactive_job(self, fleet, images, shared, monkeypatch):
+        monkeypatch.setattr(transfer_scheduler, "PREEMPTED_BYTES_PER_SECOND", 4 * BLOCK)
+        replicator, servers = await fleet("a", "b")
+        seen = {}
+
+        def progress(peer, ratio):
+            seen.update((status.name, status) for status in shared.jobs())
+
+        # A restore streams over the link to the first peer meanwhile
+        with shared.job("restore", Priority.INTERACTIVE, links=["a"]):
+            started = time.monotonic()
+            result = await replicator.replicate(images, progress)
+            elapsed = time.monotonic() - started
+
+        assert result == {"id-a": True, "id-b": True}
+        for server in servers.values():
+            assert_received(server, images)
+        send, relay = seen["send to a"], seen["relay to id-b"]
+        assert send.priority == relay.priority == Priority.BACKGROUND
+        assert send.preempted
+        # The relay's own link is not in use, so it was not held back
+        assert not relay.preempted
+        # About 8 KiB at the preempted rate of 4 KiB/s, after a short burst
+        assert elapsed >= 1.0
+        assert shared.jobs() == []
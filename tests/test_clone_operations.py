@@ -11,6 +11,7 @@ from rpi_usb_cloner.storage.clone.operations import (
     clone_partclone,
     copy_partition_table,
 )
+from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot
 
 
 class TestCopyPartitionTable:
@@ -386,6 +387,7 @@ class TestClonePartclone:
             clone_partclone(source, target)
 
 
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneDeviceSmart:
     """Tests for clone_device_smart function."""
 
@@ -403,7 +405,9 @@ class TestCloneDeviceSmart:
         result = clone_device_smart(source, target)
 
         assert result is True
-        mock_unmount.assert_called_once_with(target)
+        mock_unmount.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(target).to_dict()
+        )
         mock_copy_table.assert_called_once()
         mock_clone_partclone.assert_called_once()
 
@@ -444,6 +448,7 @@ class TestCloneDeviceSmart:
         assert result is False
 
 
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneDevice:
     """Tests for clone_device function."""
 
@@ -458,7 +463,9 @@ class TestCloneDevice:
         result = clone_device(source, target, mode="smart")
 
         assert result is True
-        mock_smart.assert_called_once_with(source, target)
+        mock_smart.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(source), DeviceSnapshot.from_lsblk(target)
+        )
 
     @patch("rpi_usb_cloner.storage.clone.verification.verify_clone")
     @patch("rpi_usb_cloner.storage.clone.operations.clone_device_smart")
@@ -474,7 +481,9 @@ class TestCloneDevice:
 
         assert result is True
         mock_smart.assert_called_once()
-        mock_verify.assert_called_once_with(source, target)
+        mock_verify.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(source), DeviceSnapshot.from_lsblk(target)
+        )
 
     @patch("rpi_usb_cloner.storage.clone.verification.verify_clone")
     @patch("rpi_usb_cloner.storage.clone.operations.clone_device_smart")
@@ -498,7 +507,9 @@ class TestCloneDevice:
         result = clone_device(source, target, mode="exact")
 
         assert result is True
-        mock_unmount.assert_called_once_with(target)
+        mock_unmount.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(target).to_dict()
+        )
         mock_dd.assert_called_once()
 
     @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
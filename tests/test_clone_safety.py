@@ -9,6 +9,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from rpi_usb_cloner.storage.clone.operations import clone_device, clone_device_smart
+from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot
 from rpi_usb_cloner.storage.exceptions import (
     InsufficientSpaceError,
     MountVerificationError,
@@ -40,6 +41,7 @@ def mock_validation():
         yield mock
 
 
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneDeviceSafety:
     """Test safety checks in clone_device function."""
 
@@ -100,7 +102,9 @@ class TestCloneDeviceSafety:
 
         assert result is True
         mock_validation.assert_called_once()
-        mock_clone_smart.assert_called_once_with(source, dest)
+        mock_clone_smart.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(source), DeviceSnapshot.from_lsblk(dest)
+        )
 
     def test_validation_checks_space_by_default(self, mock_display, mock_validation):
         """Test that space validation is enabled by default."""
@@ -137,6 +141,7 @@ class TestCloneDeviceSafety:
         assert mock_validation.called
 
 
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneDeviceSmartSafety:
     """Test safety checks in clone_device_smart function."""
 
@@ -287,7 +292,7 @@ class TestEraseSafety:
     """Test safety checks in erase operations."""
 
     @patch("rpi_usb_cloner.storage.validation.validate_device_exists")
-    @patch("rpi_usb_cloner.storage.validation._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.validation.is_mountpoint_active")
     @patch("rpi_usb_cloner.storage.clone.erase.unmount_device")
     def test_mounted_device_rejected_erase(
         self, mock_unmount, mock_is_active, mock_validate_exists
@@ -322,7 +327,7 @@ class TestUnmountWithRaiseOnFailure:
 
     @patch("rpi_usb_cloner.storage.devices.run_command")
     @patch("rpi_usb_cloner.storage.devices._collect_device_mountpoints")
-    @patch("rpi_usb_cloner.storage.devices._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.devices.is_mountpoint_active")
     def test_unmount_raises_on_failure(
         self, mock_is_active, mock_collect, mock_run_cmd
     ):
@@ -347,7 +352,7 @@ class TestUnmountWithRaiseOnFailure:
 
     @patch("rpi_usb_cloner.storage.devices.run_command")
     @patch("rpi_usb_cloner.storage.devices._collect_device_mountpoints")
-    @patch("rpi_usb_cloner.storage.devices._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.devices.is_mountpoint_active")
     def test_unmount_returns_false_without_raise(
         self, mock_is_active, mock_collect, mock_run_cmd
     ):
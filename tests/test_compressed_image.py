@@ -0,0 +1,251 @@
+"""Tests for compressed raw image support.
+
+Covers:
+- Compression format detection and discovery helpers
+- Uncompressed size from container metadata (xz, gzip, zstd, zip)
+- open_decompressed_stream
+- restore_compressed_image
+
+Platform-specific notes:
+- Tests requiring os.geteuid() are skipped on Windows
+"""
+
+from __future__ import annotations
+
+import gzip
+import lzma
+import struct
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from rpi_usb_cloner.storage import compressed_image
+from rpi_usb_cloner.storage.compressed_image import (
+    get_compression_format,
+    get_uncompressed_size,
+    is_compressed_image_file,
+    open_decompressed_stream,
+    restore_compressed_image,
+)
+
+
+skip_windows = pytest.mark.skipif(
+    sys.platform == "win32",
+    reason="Requires POSIX features (geteuid)",
+)
+
+PAYLOAD = b"\x00" * 8192 + b"bootloader" * 100 + b"\x00" * 4096
+
+
+def _zstd_raw_frame(data: bytes) -> bytes:
+    """Build a minimal zstd frame with one raw block and a 4-byte content size."""
+    magic = struct.pack("<I", 0xFD2FB528)
+    descriptor = bytes([0xA0])  # FCS 4 bytes, single segment, no checksum
+    fcs = struct.pack("<I", len(data))
+    block_header = ((len(data) << 3) | 0x01).to_bytes(3, "little")
+    return magic + descriptor + fcs + block_header + data
+
+
+class TestDetection:
+    """Test format detection helpers."""
+
+    @pytest.mark.parametrize(
+        ("name", "expected"),
+        [
+            ("os.img.xz", "xz"),
+            ("OS.IMG.GZ", "gzip"),
+            ("os.img.zst", "zstd"),
+            ("os.zip", "zip"),
+            ("os.iso", None),
+            ("notes.txt.xz", None),
+        ],
+    )
+    def test_get_compression_format(self, name, expected):
+        assert get_compression_format(Path(name)) == expected
+
+    def test_zip_without_image_member_is_not_image(self, tmp_path):
+        archive_path = tmp_path / "docs.zip"
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("readme.txt", b"hello")
+        assert not is_compressed_image_file(archive_path)
+
+    def test_missing_file_is_not_image(self, tmp_path):
+        assert not is_compressed_image_file(tmp_path / "missing.img.xz")
+
+
+class TestUncompressedSize:
+    """Test get_uncompressed_size for each container format."""
+
+    def test_xz_single_stream(self, tmp_path):
+        path = tmp_path / "os.img.xz"
+        path.write_bytes(lzma.compress(PAYLOAD))
+        assert get_uncompressed_size(path) == len(PAYLOAD)
+
+    def test_xz_multi_stream_with_padding(self, tmp_path):
+        path = tmp_path / "os.img.xz"
+        path.write_bytes(
+            lzma.compress(PAYLOAD) + b"\x00" * 8 + lzma.compress(b"more" * 50)
+        )
+        assert get_uncompressed_size(path) == len(PAYLOAD) + 200
+
+    def test_xz_corrupt_returns_none(self, tmp_path):
+        path = tmp_path / "os.img.xz"
+        path.write_bytes(b"not xz at all" * 10)
+        assert get_uncompressed_size(path) is None
+
+    def test_gzip_isize(self, tmp_path):
+        path = tmp_path / "os.img.gz"
+        path.write_bytes(gzip.compress(PAYLOAD))
+        assert get_uncompressed_size(path) == len(PAYLOAD)
+
+    def test_zstd_frame_content_size(self, tmp_path):
+        path = tmp_path / "os.img.zst"
+        path.write_bytes(_zstd_raw_frame(PAYLOAD) + _zstd_raw_frame(b"x" * 10))
+        assert get_uncompressed_size(path) == len(PAYLOAD) + 10
+
+    def test_zip_member_size(self, tmp_path):
+        path = tmp_path / "os.zip"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("readme.txt", b"hi")
+            archive.writestr("os.img", PAYLOAD)
+        assert get_uncompressed_size(path) == len(PAYLOAD)
+
+
+class TestOpenDecompressedStream:
+    """Test open_decompressed_stream."""
+
+    def test_xz_stdlib_fallback(self, tmp_path, mocker):
+        path = tmp_path / "os.img.xz"
+        path.write_bytes(lzma.compress(PAYLOAD))
+        mocker.patch.object(compressed_image.shutil, "which", return_value=None)
+        with open_decompressed_stream(path) as stream:
+            assert stream.read() == PAYLOAD
+
+    def test_gzip_external_tool(self, tmp_path):
+        path = tmp_path / "os.img.gz"
+        path.write_bytes(gzip.compress(PAYLOAD))
+        if not (compressed_image.shutil.which("gzip")):
+            pytest.skip("gzip not installed")
+        with open_decompressed_stream(path) as stream:
+            assert stream.read() == PAYLOAD
+
+    def test_gzip_corrupt_raises(self, tmp_path):
+        path = tmp_path / "os.img.gz"
+        path.write_bytes(b"\x1f\x8b" + b"garbage" * 10)
+        if not (compressed_image.shutil.which("gzip")):
+            pytest.skip("gzip not installed")
+        with pytest.raises(
+            RuntimeError, match="decompression failed"
+        ), open_decompressed_stream(path) as stream:
+            stream.read()
+
+    def test_zip_member(self, tmp_path):
+        path = tmp_path / "os.zip"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("os.img", PAYLOAD)
+        with open_decompressed_stream(path) as stream:
+            assert stream.read() == PAYLOAD
+
+    def test_zstd_without_tool_raises(self, tmp_path, mocker):
+        path = tmp_path / "os.img.zst"
+        path.write_bytes(_zstd_raw_frame(PAYLOAD))
+        mocker.patch.object(compressed_image.shutil, "which", return_value=None)
+        with pytest.raises(
+            RuntimeError, match="zstd not found"
+        ), open_decompressed_stream(path):
+            pass
+
+
+class TestRestoreCompressedImage:
+    """Test restore_compressed_image function."""
+
+    @pytest.fixture
+    def xz_image(self, tmp_path):
+        path = tmp_path / "os.img.xz"
+        path.write_bytes(lzma.compress(PAYLOAD))
+        return path
+
+    @skip_windows
+    def test_not_root_raises(self, xz_image):
+        with patch("os.geteuid", return_value=1000), pytest.raises(
+            RuntimeError, match="Run as root"
+        ):
+            restore_compressed_image(xz_image, "sda")
+
+    @skip_windows
+    def test_missing_image_raises(self, tmp_path):
+        with patch("os.geteuid", return_value=0), pytest.raises(
+            RuntimeError, match="Compressed image not found"
+        ):
+            restore_compressed_image(tmp_path / "missing.img.xz", "sda")
+
+    @skip_windows
+    def test_target_too_small_uses_uncompressed_size(self, xz_image, mocker):
+        mocker.patch("os.geteuid", return_value=0)
+        mocker.patch.object(
+            compressed_image.devices,
+            "get_device_by_name",
+            return_value={"name": "sda", "size": 1024},
+        )
+        mocker.patch.object(
+            compressed_image.devices, "unmount_device", return_value=True
+        )
+        with pytest.raises(RuntimeError, match="Target device too small"):
+            restore_compressed_image(xz_image, "sda")
+
+    @skip_windows
+    def test_target_size_falls_back_to_blockdev(self, xz_image, mocker):
+        mocker.patch("os.geteuid", return_value=0)
+        mocker.patch.object(
+            compressed_image.devices, "get_device_by_name", return_value=None
+        )
+        mocker.patch.object(
+            compressed_image.iso, "_get_blockdev_size_bytes", return_value=1024
+        )
+        with pytest.raises(RuntimeError, match="Target device too small"):
+            restore_compressed_image(xz_image, "sda")
+
+    @skip_windows
+    def test_unmount_failure_raises(self, xz_image, mocker):
+        mocker.patch("os.geteuid", return_value=0)
+        mocker.patch.object(
+            compressed_image.devices,
+            "get_device_by_name",
+            return_value={"name": "sda", "size": 10**9},
+        )
+        mocker.patch.object(
+            compressed_image.devices, "unmount_device", return_value=False
+        )
+        with pytest.raises(RuntimeError, match="Failed to unmount"):
+            restore_compressed_image(xz_image, "sda")
+
+    @skip_windows
+    def test_streams_into_writer_with_uncompressed_total(self, xz_image, mocker):
+        mocker.patch("os.geteuid", return_value=0)
+        mocker.patch.object(
+            compressed_image.devices, "get_device_by_name", return_value=None
+        )
+        mocker.patch.object(
+            compressed_image.iso, "_get_device_size_bytes", return_value=None
+        )
+        captured = {}
+
+        def fake_writer(stream, target_node, **kwargs):
+            captured["data"] = stream.read()
+            captured["target"] = target_node
+            captured.update(kwargs)
+            return len(captured["data"])
+
+        mocker.patch.object(
+            compressed_image, "write_stream_to_device", side_effect=fake_writer
+        )
+
+        restore_compressed_image(xz_image, "sda")
+
+        assert captured["data"] == PAYLOAD
+        assert captured["target"] == "/dev/sda"
+        assert captured["total_bytes"] == len(PAYLOAD)
+        assert "os.img.xz" in captured["title"]
@@ -0,0 +1,211 @@
+"""Tests for immutable device snapshots.
+
+Covers:
+- building snapshots from lsblk dicts and converting back
+- immutability and compact storage
+- capture_device for snapshots, dicts, names and missing devices
+- validation helpers accepting snapshots
+- clone jobs resolving each device once and refreshing only after
+  the partition table write
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from unittest.mock import patch
+
+import pytest
+
+from rpi_usb_cloner.storage import device_snapshot, validation
+from rpi_usb_cloner.storage.clone import operations
+from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot, capture_device
+from rpi_usb_cloner.storage.exceptions import (
+    DeviceNotFoundError,
+    InsufficientSpaceError,
+    MountVerificationError,
+)
+
+
+@pytest.fixture
+def source_dict():
+    return {
+        "name": "sda",
+        "type": "disk",
+        "size": 8000000000,
+        "rm": True,
+        "tran": "usb",
+        "model": "Cruzer",
+        "pttype": "dos",
+        "children": [
+            {
+                "name": "sda1",
+                "type": "part",
+                "size": 500000000,
+                "fstype": "vfat",
+                "label": "BOOT",
+                "mountpoint": "/media/boot",
+            },
+            {"name": "sda2", "type": "part", "size": 7000000000, "fstype": "ext4"},
+        ],
+    }
+
+
+@pytest.fixture
+def target_dict():
+    return {"name": "sdb", "type": "disk", "size": 16000000000, "rm": True}
+
+
+class TestDeviceSnapshot:
+    """Test snapshot construction and conversion."""
+
+    def test_from_lsblk(self, source_dict):
+        snapshot = DeviceSnapshot.from_lsblk(source_dict)
+
+        assert snapshot.name == "sda"
+        assert snapshot.node == "/dev/sda"
+        assert snapshot.size == 8000000000
+        assert snapshot.removable is True
+        assert [part.name for part in snapshot.partitions] == ["sda1", "sda2"]
+        assert snapshot.mountpoints() == ["/media/boot"]
+
+    def test_to_dict_round_trip(self, source_dict):
+        snapshot = DeviceSnapshot.from_lsblk(source_dict)
+        assert DeviceSnapshot.from_lsblk(snapshot.to_dict()) == snapshot
+        assert snapshot.to_dict()["children"][0]["label"] == "BOOT"
+        assert "children" not in snapshot.partitions[0].to_dict()
+
+    def test_immutable_and_slotted(self, source_dict):
+        snapshot = DeviceSnapshot.from_lsblk(source_dict)
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            snapshot.size = 1
+        assert not hasattr(snapshot, "__dict__")
+
+    def test_refresh(self, target_dict):
+        snapshot = DeviceSnapshot.from_lsblk(target_dict)
+        repartitioned = dict(
+            target_dict, children=[{"name": "sdb1", "type": "part", "size": 1}]
+        )
+        with patch.object(
+            device_snapshot, "query_block_device", return_value=repartitioned
+        ) as query:
+            refreshed = snapshot.refresh()
+        query.assert_called_once_with("sdb")
+        assert [part.name for part in refreshed.partitions] == ["sdb1"]
+        assert snapshot.partitions == ()
+
+        with patch.object(device_snapshot, "query_block_device", return_value=None):
+            assert snapshot.refresh() is None
+
+
+class TestCaptureDevice:
+    """Test capture_device for each kind of device reference."""
+
+    def test_snapshot_and_dict_not_reread(self, source_dict):
+        with patch.object(device_snapshot, "query_block_device") as query:
+            snapshot = capture_device(source_dict)
+            assert capture_device(snapshot) is snapshot
+        query.assert_not_called()
+
+    def test_name_read_once(self, source_dict):
+        with patch.object(
+            device_snapshot, "query_block_device", return_value=source_dict
+        ) as query:
+            snapshot = capture_device("/dev/sda")
+        query.assert_called_once_with("sda")
+        assert snapshot == DeviceSnapshot.from_lsblk(source_dict)
+
+    def test_missing_device(self):
+        with patch.object(
+            device_snapshot, "query_block_device", return_value=None
+        ), pytest.raises(DeviceNotFoundError):
+            capture_device("sdz")
+
+
+class TestValidationWithSnapshots:
+    """Test that validation uses snapshots without looking devices up."""
+
+    def test_clone_validation(self, source_dict, target_dict):
+        source = DeviceSnapshot.from_lsblk(source_dict)
+        target = DeviceSnapshot.from_lsblk(target_dict)
+        with patch.object(validation, "get_device_by_name") as lookup:
+            validation.validate_clone_operation(source, target, check_unmounted=False)
+            with pytest.raises(InsufficientSpaceError):
+                validation.validate_clone_operation(
+                    target, source, check_unmounted=False
+                )
+        lookup.assert_not_called()
+
+    def test_unmounted_checks_captured_mountpoints(self, source_dict):
+        snapshot = DeviceSnapshot.from_lsblk(source_dict)
+        with patch.object(
+            validation, "is_mountpoint_active", return_value=True
+        ), pytest.raises(MountVerificationError):
+            validation.validate_device_unmounted(snapshot)
+        with patch.object(validation, "is_mountpoint_active", return_value=False):
+            validation.validate_device_unmounted(snapshot)
+
+
+class TestCloneJobSnapshots:
+    """Test that a smart clone resolves devices once per job."""
+
+    @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
+    @patch("rpi_usb_cloner.storage.clone.operations.clone_partclone")
+    @patch("rpi_usb_cloner.storage.clone.operations.copy_partition_table")
+    @patch("rpi_usb_cloner.storage.clone.operations.unmount_device", return_value=True)
+    def test_refreshes_target_only_after_partition_table(
+        self, mock_unmount, mock_copy_table, mock_partclone, mock_display, source_dict
+    ):
+        target_dict = {"name": "sdb", "type": "disk", "size": 16000000000}
+        partitioned = dict(
+            target_dict,
+            children=[
+                {"name": "sdb1", "type": "part", "size": 500000000},
+                {"name": "sdb2", "type": "part", "size": 7000000000},
+            ],
+        )
+        reads = []
+
+        def query(name):
+            reads.append(name)
+            return partitioned
+
+        with patch.object(
+            device_snapshot, "query_block_device", side_effect=query
+        ), patch.object(operations, "get_device_by_name") as lookup, patch.object(
+            validation, "get_device_by_name"
+        ) as validation_lookup, patch.object(
+            validation, "is_mountpoint_active", return_value=False
+        ):
+            result = operations.clone_device_smart(source_dict, target_dict)
+
+        assert result is True
+        assert reads == ["sdb"]
+        lookup.assert_not_called()
+        validation_lookup.assert_not_called()
+        source, target = mock_partclone.call_args[0]
+        assert source == DeviceSnapshot.from_lsblk(source_dict)
+        assert [part.name for part in target.partitions] == ["sdb1", "sdb2"]
+
+    @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
+    @patch("rpi_usb_cloner.storage.clone.operations.clone_partclone")
+    @patch("rpi_usb_cloner.storage.clone.operations.copy_partition_table")
+    @patch("rpi_usb_cloner.storage.clone.operations.unmount_device", return_value=True)
+    def test_target_gone_after_partition_table(
+        self, mock_unmount, mock_copy_table, mock_partclone, mock_display, source_dict
+    ):
+        with patch.object(
+            device_snapshot, "query_block_device", return_value=None
+        ), patch.object(validation, "is_mountpoint_active", return_value=False):
+            result = operations.clone_device_smart(
+                source_dict, {"name": "sdb", "type": "disk", "size": 16000000000}
+            )
+
+        assert result is False
+        mock_partclone.assert_not_called()
+        mock_display.assert_called_with(["FAILED", "Target missing"])
+
+    @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
+    def test_missing_named_device(self, mock_display):
+        with patch.object(device_snapshot, "query_block_device", return_value=None):
+            assert operations.clone_device("sdy", "sdz", mode="smart") is False
+        mock_display.assert_called_with(["FAILED", "Device missing"])
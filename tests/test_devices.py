@@ -9,6 +9,7 @@ This test suite covers:
 - Human-readable formatting functions
 """
 
+import itertools
 import json
 import subprocess
 from unittest.mock import Mock, patch
@@ -19,7 +20,11 @@ from rpi_usb_cloner.storage import devices
 
 
 @pytest.fixture(autouse=True)
-def reset_lsblk_cache():
+def reset_lsblk_cache(tmp_path, monkeypatch):
+    # Exercise the lsblk path; sysfs enumeration has its own tests
+    monkeypatch.setattr(
+        devices.sysfs_devices, "SYS_BLOCK_DIR", tmp_path / "no-sysfs-block"
+    )
     devices._lsblk_cache = None
     devices._lsblk_cache_time = None
     devices._last_lsblk_names = None
@@ -560,14 +565,9 @@ class TestUnmountDeviceWithRetry:
         }
 
         # Mock the check - simulate device becoming unmounted after retries
-
-        def mock_proc_mounts(*args, **kwargs):
-            # Return empty to simulate no mounts
-            from io import StringIO
-
-            return StringIO("")
-
-        mocker.patch("builtins.open", side_effect=mock_proc_mounts)
+        mocker.patch(
+            "rpi_usb_cloner.storage.devices.is_mountpoint_active", return_value=False
+        )
 
         success, used_lazy = devices.unmount_device_with_retry(device)
 
@@ -600,16 +600,14 @@ class TestUnmountDeviceWithRetry:
             "children": [{"name": "sda1", "mountpoint": "/media/usb"}],
         }
 
-        with patch("builtins.open", create=True) as mock_open:
-            # Simulate /proc/mounts showing device mounted, then unmounted
-            mount_data = [
-                "/dev/sda1 /media/usb vfat rw 0 0\n",  # First check: mounted
-                "",  # After lazy unmount: unmounted
-            ]
-            mock_open.return_value.__enter__.return_value = iter(mount_data)
-
-            with patch("time.sleep"):  # Speed up test
-                success, used_lazy = devices.unmount_device_with_retry(device)
+        # Simulate the mount table showing device mounted, then unmounted
+        with patch(
+            "rpi_usb_cloner.storage.devices.is_mountpoint_active",
+            side_effect=itertools.chain([True], itertools.repeat(False)),
+        ), patch(
+            "time.sleep"
+        ):  # Speed up test
+            success, used_lazy = devices.unmount_device_with_retry(device)
 
         # Should succeed with lazy unmount
         assert success is True or used_lazy is True
@@ -625,13 +623,13 @@ class TestUnmountDeviceWithRetry:
             "children": [{"name": "sda1", "mountpoint": "/media/usb"}],
         }
 
-        with patch("builtins.open", create=True) as mock_open:
-            # Simulate device staying mounted
-            mount_data = "/dev/sda1 /media/usb vfat rw 0 0\n"
-            mock_open.return_value.__enter__.return_value = [mount_data] * 10
-
-            with patch("time.sleep"):  # Speed up test
-                success, used_lazy = devices.unmount_device_with_retry(device)
+        # Simulate device staying mounted
+        with patch(
+            "rpi_usb_cloner.storage.devices.is_mountpoint_active", return_value=True
+        ), patch(
+            "time.sleep"
+        ):  # Speed up test
+            success, used_lazy = devices.unmount_device_with_retry(device)
 
         assert success is False
 
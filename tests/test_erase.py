@@ -4,6 +4,7 @@ from unittest.mock import Mock, patch
 
 import pytest
 
+from rpi_usb_cloner.storage.clone.block_offload import OffloadCapabilities
 from rpi_usb_cloner.storage.clone.erase import erase_device
 
 
@@ -33,7 +34,18 @@ class TestEraseDevice:
             "rpi_usb_cloner.storage.clone.erase.run_checked_with_streaming_progress"
         ) as mock_run, patch(
             "rpi_usb_cloner.storage.clone.erase.display_lines"
-        ) as mock_display:
+        ) as mock_display, patch(
+            "rpi_usb_cloner.storage.clone.erase.probe_offload_capabilities",
+            return_value=OffloadCapabilities(None, None),
+        ) as mock_probe, patch(
+            "rpi_usb_cloner.storage.clone.erase.offload_erase_range"
+        ) as mock_offload, patch(
+            "rpi_usb_cloner.storage.clone.erase.secure_erase_device"
+        ) as mock_secure, patch(
+            "rpi_usb_cloner.storage.clone.erase.verify_discarded_device"
+        ) as mock_verify_discard:
+            mock_secure.return_value.verified = True
+            mock_verify_discard.return_value.verified = True
             yield {
                 "which": mock_which,
                 "unmount": mock_unmount,
@@ -41,32 +53,30 @@ class TestEraseDevice:
                 "validate_unmounted": mock_validate_unmounted,
                 "run": mock_run,
                 "display": mock_display,
+                "probe": mock_probe,
+                "offload": mock_offload,
+                "secure": mock_secure,
+                "verify_discard": mock_verify_discard,
             }
 
     def test_erase_secure_mode(self, mock_target_device, setup_mocks):
-        """Test secure erase mode using shred."""
+        """Test secure erase mode uses the in-process engine."""
         mocks = setup_mocks
-        mocks["which"].return_value = "/usr/bin/shred"
-        mocks["run"].return_value = Mock()
 
         result = erase_device(mock_target_device, "secure")
 
         assert result is True
         mocks["unmount"].assert_called_once_with(mock_target_device)
-        mocks["run"].assert_called_once()
-        # Verify shred command
-        call_args = mocks["run"].call_args
-        assert call_args[0][0][0] == "/usr/bin/shred"
-        assert "-v" in call_args[0][0]
-        assert "-n" in call_args[0][0]
-        assert "1" in call_args[0][0]
-        assert "-z" in call_args[0][0]
-        assert "/dev/sdb" in call_args[0][0]
-
-    def test_erase_secure_mode_no_shred(self, mock_target_device, setup_mocks):
-        """Test secure erase fails gracefully when shred is not available."""
+        mocks["run"].assert_not_called()
+        call_args = mocks["secure"].call_args
+        assert call_args[0][0] == "/dev/sdb"
+        assert call_args[1]["zero_pass"] is False
+        assert call_args[1]["verify"] == "sampled"
+
+    def test_erase_secure_mode_verify_failure(self, mock_target_device, setup_mocks):
+        """Test secure erase fails when read-back verification finds data."""
         mocks = setup_mocks
-        mocks["which"].return_value = None
+        mocks["secure"].return_value.verified = False
 
         result = erase_device(mock_target_device, "secure")
 
@@ -75,6 +85,16 @@ class TestEraseDevice:
         error_calls = [c for c in mocks["display"].call_args_list if "ERROR" in str(c)]
         assert len(error_calls) > 0
 
+    def test_erase_secure_mode_settings(self, mock_target_device, setup_mocks):
+        """Test secure erase honours zero pass and full verify settings."""
+        mocks = setup_mocks
+        with patch("rpi_usb_cloner.storage.clone.erase.get_bool", return_value=True):
+            assert erase_device(mock_target_device, "secure") is True
+
+        call_args = mocks["secure"].call_args
+        assert call_args[1]["zero_pass"] is True
+        assert call_args[1]["verify"] == "full"
+
     def test_erase_discard_mode(self, mock_target_device, setup_mocks):
         """Test discard/TRIM mode for SSDs."""
         mocks = setup_mocks
@@ -252,10 +272,10 @@ class TestEraseDevice:
     def test_erase_command_failure(self, mock_target_device, setup_mocks):
         """Test handling of command execution failure."""
         mocks = setup_mocks
-        mocks["which"].return_value = "/usr/bin/shred"
+        mocks["which"].return_value = "/usr/bin/dd"
         mocks["run"].side_effect = Exception("Command failed")
 
-        result = erase_device(mock_target_device, "secure")
+        result = erase_device(mock_target_device, "zero")
 
         assert result is False
 
@@ -337,3 +357,108 @@ class TestEraseDevice:
         dd_calls = [c for c in mocks["run"].call_args_list if "dd" in c[0][0][0]]
         for dd_call in dd_calls:
             assert "count=50" in dd_call[0][0]
+
+    def test_erase_zero_mode_uses_zeroout_offload(
+        self, mock_target_device, setup_mocks
+    ):
+        """Test zero mode issues BLKZEROOUT instead of dd when supported."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(0, 1 << 30)
+        mocks["offload"].return_value = True
+
+        result = erase_device(mock_target_device, "zero")
+
+        assert result is True
+        assert mocks["offload"].call_args[0][:2] == ("/dev/sdb", "zeroout")
+        mocks["run"].assert_not_called()
+
+    def test_erase_zero_mode_falls_back_when_rejected(
+        self, mock_target_device, setup_mocks
+    ):
+        """Test zero mode streams zeros when the device rejects BLKZEROOUT."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(0, 1 << 30)
+        mocks["offload"].return_value = False
+        mocks["which"].return_value = "/usr/bin/dd"
+
+        result = erase_device(mock_target_device, "zero")
+
+        assert result is True
+        assert mocks["run"].call_args[0][0][0] == "/usr/bin/dd"
+
+    def test_erase_discard_mode_uses_ioctl(self, mock_target_device, setup_mocks):
+        """Test discard mode issues BLKDISCARD instead of blkdiscard."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(1 << 30, 0)
+        mocks["offload"].return_value = True
+
+        assert erase_device(mock_target_device, "discard") is True
+        assert mocks["offload"].call_args[0][1] == "discard"
+        mocks["run"].assert_not_called()
+
+    def test_erase_discard_unsupported_zero_fills(
+        self, mock_target_device, setup_mocks
+    ):
+        """Test discard mode zero fills a device that reports no discard."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(0, 0)
+        mocks["which"].return_value = "/usr/bin/dd"
+
+        assert erase_device(mock_target_device, "discard") is True
+        assert "if=/dev/zero" in mocks["run"].call_args[0][0]
+        mocks["offload"].assert_not_called()
+
+    def test_erase_secure_mode_prefers_secdiscard(
+        self, mock_target_device, setup_mocks
+    ):
+        """Test secure mode uses BLKSECDISCARD and falls back to overwriting."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(1 << 30, 0)
+        mocks["offload"].return_value = False
+
+        assert erase_device(mock_target_device, "secure") is True
+        assert mocks["offload"].call_args[0][1] == "secdiscard"
+        mocks["secure"].assert_called_once()
+
+    def test_erase_secure_secdiscard_is_verified(self, mock_target_device, setup_mocks):
+        """Test BLKSECDISCARD is followed by a read-back check."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(1 << 30, 0)
+        mocks["offload"].return_value = True
+
+        assert erase_device(mock_target_device, "secure") is True
+        assert mocks["verify_discard"].call_args[0][0] == "/dev/sdb"
+        assert mocks["verify_discard"].call_args[1]["verify"] == "sampled"
+        mocks["secure"].assert_not_called()
+
+    def test_erase_secure_secdiscard_fails_when_not_cleared(
+        self, mock_target_device, setup_mocks
+    ):
+        """Test secure mode fails when sampled blocks survived BLKSECDISCARD."""
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(1 << 30, 0)
+        mocks["offload"].return_value = True
+        mocks["verify_discard"].return_value.verified = False
+
+        assert erase_device(mock_target_device, "secure") is False
+        mocks["secure"].assert_not_called()
+
+    @patch("rpi_usb_cloner.storage.clone.erase.app_state")
+    def test_erase_quick_mode_offloads_head_and_tail(
+        self, mock_state, mock_target_device, setup_mocks
+    ):
+        """Test quick mode zeroes the start and end with BLKZEROOUT."""
+        mock_state.QUICK_WIPE_MIB = 8
+        mocks = setup_mocks
+        mocks["probe"].return_value = OffloadCapabilities(0, 1 << 30)
+        mocks["offload"].return_value = True
+        mocks["which"].side_effect = lambda cmd: f"/usr/bin/{cmd}"
+
+        assert erase_device(mock_target_device, "quick") is True
+
+        # Only wipefs runs as a command
+        assert mocks["run"].call_count == 1
+        mib = 1024 * 1024
+        size_mib = mock_target_device["size"] // mib
+        ranges = [c[0][2:4] for c in mocks["offload"].call_args_list]
+        assert ranges == [(0, 8 * mib), ((size_mib - 8) * mib, 8 * mib)]
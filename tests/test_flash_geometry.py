@@ -0,0 +1,212 @@
+"""Tests for flash erase-block geometry detection.
+
+Covers:
+- FlashGeometry alignment and aligned partition bounds
+- sysfs and CSD erase size sources
+- read-timing estimate of the erase block
+- FAT32, exFAT and ext4 layout parameters
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from rpi_usb_cloner.storage import flash_geometry
+from rpi_usb_cloner.storage.flash_geometry import (
+    DEFAULT_ERASE_BLOCK_BYTES,
+    FlashGeometry,
+    detect_flash_geometry,
+    estimate_erase_block,
+    exfat_layout,
+    ext4_extended_options,
+    fat32_layout,
+    parse_csd_erase_size,
+    read_sysfs_erase_size,
+)
+
+
+KIB = 1024
+MIB = 1024 * KIB
+GIB = 1024 * MIB
+
+
+@pytest.fixture
+def sys_block(tmp_path, monkeypatch):
+    monkeypatch.setattr(flash_geometry, "SYS_BLOCK_DIR", tmp_path)
+
+    def write(device, relative, value):
+        path = tmp_path / device / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"{value}\n")
+
+    return write
+
+
+def _csd(fields: dict[tuple[int, int], int]) -> str:
+    value = 0
+    for (_high, low), field in fields.items():
+        value |= field << low
+    return f"{value:032x}"
+
+
+class TestFlashGeometry:
+    """Test alignment helpers of FlashGeometry."""
+
+    def test_alignment_is_at_least_one_mib(self):
+        assert FlashGeometry(512 * KIB, "sysfs").alignment_bytes == MIB
+
+    def test_alignment_handles_non_power_of_two_erase_blocks(self):
+        assert FlashGeometry(3 * MIB, "sysfs").alignment_bytes == 3 * MIB
+        assert FlashGeometry(1536 * KIB, "sysfs").alignment_bytes == 3 * MIB
+
+    def test_oversized_alignment_falls_back_to_default(self):
+        geometry = FlashGeometry(24 * MIB, "sysfs", device_bytes=256 * GIB)
+        assert geometry.alignment_bytes == DEFAULT_ERASE_BLOCK_BYTES
+        assert geometry.partition_bounds()[0] == DEFAULT_ERASE_BLOCK_BYTES
+
+    def test_partition_bounds_are_aligned(self):
+        geometry = FlashGeometry(4 * MIB, "sysfs", device_bytes=1 * GIB + 123)
+        start, end = geometry.partition_bounds()
+        assert start == 4 * MIB
+        assert (end + 1) % (4 * MIB) == 0
+        assert geometry.partition_bytes == 1 * GIB - 4 * MIB
+
+    def test_partition_bounds_unknown_without_size(self):
+        assert FlashGeometry(4 * MIB, "default").partition_bounds() is None
+
+
+class TestSysfsAndCsd:
+    """Test sysfs hints and CSD parsing."""
+
+    def test_sysfs_prefers_largest_valid_hint(self, sys_block):
+        sys_block("mmcblk0", "device/preferred_erase_size", 4 * MIB)
+        sys_block("mmcblk0", "queue/optimal_io_size", 0)
+        sys_block("mmcblk0", "queue/discard_granularity", 512)
+        assert read_sysfs_erase_size("mmcblk0") == 4 * MIB
+
+    def test_sysfs_ignores_bridge_optimal_io_size(self, sys_block):
+        # A USB bridge reporting its transfer limit, not an erase block
+        sys_block("sda", "queue/optimal_io_size", 33553920)
+        sys_block("sda", "queue/discard_granularity", 512)
+        assert read_sysfs_erase_size("sda") is None
+
+        geometry = detect_flash_geometry(
+            "/dev/sda", device_bytes=256 * GIB, probe=False
+        )
+        assert geometry.erase_block_bytes == DEFAULT_ERASE_BLOCK_BYTES
+        assert geometry.partition_bounds()[0] == DEFAULT_ERASE_BLOCK_BYTES
+
+    @pytest.mark.parametrize("value", [3 * MIB, 33553920, 32 * MIB])
+    def test_sysfs_rejects_odd_or_huge_erase_sizes(self, sys_block, value):
+        sys_block("mmcblk0", "device/preferred_erase_size", value)
+        assert read_sysfs_erase_size("mmcblk0") is None
+
+    def test_sysfs_ignores_sector_sized_hints(self, sys_block):
+        sys_block("sda", "queue/discard_granularity", 512)
+        sys_block("sda", "queue/optimal_io_size", 0)
+        assert read_sysfs_erase_size("sda") is None
+
+    def test_sd_v1_csd_erase_sector(self):
+        # SECTOR_SIZE=127 (128 blocks) of 2^10 byte write blocks
+        csd = _csd({(45, 39): 127, (25, 22): 10})
+        assert parse_csd_erase_size(csd, "SD") == 128 * KIB
+
+    def test_sdhc_csd_has_no_erase_size(self):
+        csd = _csd({(127, 126): 1, (45, 39): 127, (25, 22): 9})
+        assert parse_csd_erase_size(csd, "SD") is None
+
+    def test_mmc_csd_erase_group(self):
+        # (31 + 1) * (15 + 1) groups of 512-byte write blocks = 256 KiB
+        csd = _csd({(46, 42): 31, (41, 37): 15, (25, 22): 9})
+        assert parse_csd_erase_size(csd, "MMC") == 256 * KIB
+
+    def test_invalid_csd(self):
+        assert parse_csd_erase_size("not hex") is None
+
+
+class TestEstimateEraseBlock:
+    """Test the read-timing estimate."""
+
+    @staticmethod
+    def _timings(erase_block: int, penalty: float = 0.5e-3):
+        timings = {}
+        alignment = 16 * KIB
+        while alignment <= 64 * MIB:
+            on = 1e-3 + (penalty if alignment >= erase_block else 0.02e-3)
+            timings[alignment] = (1e-3, on, 1e-3)
+            alignment *= 2
+        return timings
+
+    def test_finds_plateau_start(self):
+        assert estimate_erase_block(self._timings(4 * MIB)) == 4 * MIB
+
+    def test_no_signal_returns_none(self):
+        assert estimate_erase_block(self._timings(4 * MIB, penalty=0.0)) is None
+
+    def test_empty_timings(self):
+        assert estimate_erase_block({}) is None
+
+
+class TestDetectFlashGeometry:
+    """Test source selection in detect_flash_geometry."""
+
+    def test_uses_sysfs(self, sys_block, mocker):
+        sys_block("mmcblk0", "device/preferred_erase_size", 8 * MIB)
+        probe = mocker.patch.object(flash_geometry, "probe_erase_block")
+        geometry = detect_flash_geometry("/dev/mmcblk0", device_bytes=GIB)
+        assert geometry.erase_block_bytes == 8 * MIB
+        assert geometry.source == "sysfs"
+        assert geometry.device_bytes == GIB
+        probe.assert_not_called()
+
+    def test_uses_probe_then_default(self, sys_block, mocker):
+        sys_block("sda", "queue/logical_block_size", 512)
+        probe = mocker.patch.object(
+            flash_geometry, "probe_erase_block", return_value=2 * MIB
+        )
+        geometry = detect_flash_geometry("/dev/sda", device_bytes="1073741824")
+        assert (geometry.erase_block_bytes, geometry.source) == (2 * MIB, "probe")
+        probe.assert_called_once_with("/dev/sda", GIB, 512)
+
+        probe.return_value = None
+        geometry = detect_flash_geometry("/dev/sda", device_bytes=GIB)
+        assert geometry.erase_block_bytes == DEFAULT_ERASE_BLOCK_BYTES
+        assert geometry.source == "default"
+
+
+class TestFilesystemLayouts:
+    """Test mkfs parameter helpers."""
+
+    @pytest.mark.parametrize("erase_block", [1 * MIB, 4 * MIB, 3 * MIB])
+    @pytest.mark.parametrize("size", [4 * GIB, 16 * GIB + 7 * MIB, 31 * GIB])
+    def test_fat32_data_area_starts_on_erase_block(self, erase_block, size):
+        geometry = FlashGeometry(erase_block, "sysfs", 512, size)
+        cluster_sectors, reserved = fat32_layout(geometry)
+        assert cluster_sectors == 64
+        assert reserved is not None
+        total = geometry.partition_bytes // 512
+        fat = flash_geometry._fat32_fat_sectors(total, reserved, cluster_sectors, 512)
+        assert ((reserved + 2 * fat) * 512) % erase_block == 0
+
+    def test_fat32_small_volume_reduces_cluster_size(self):
+        geometry = FlashGeometry(4 * MIB, "sysfs", 512, 512 * MIB)
+        cluster_sectors, _reserved = fat32_layout(geometry)
+        total_clusters = geometry.partition_bytes // (cluster_sectors * 512)
+        assert total_clusters >= 65525
+
+    def test_fat32_unknown_size(self):
+        assert fat32_layout(FlashGeometry(4 * MIB, "default")) is None
+
+    def test_exfat_layout(self):
+        assert exfat_layout(FlashGeometry(4 * MIB, "sysfs", 512, 16 * GIB)) == (
+            32 * KIB,
+            4 * MIB,
+        )
+        assert exfat_layout(FlashGeometry(16 * MIB, "sysfs", 512, 128 * GIB)) == (
+            128 * KIB,
+            16 * MIB,
+        )
+
+    def test_ext4_extended_options(self):
+        geometry = FlashGeometry(8 * MIB, "sysfs")
+        assert ext4_extended_options(geometry) == "stride=2048,stripe_width=2048"
@@ -15,6 +15,7 @@ import subprocess
 from unittest.mock import Mock, patch
 
 from rpi_usb_cloner.storage import format as format_module
+from rpi_usb_cloner.storage.flash_geometry import FlashGeometry
 
 
 class TestValidateDevicePath:
@@ -93,6 +94,37 @@ class TestCreatePartition:
             (["parted", "-s", "/dev/sda", "mkpart", "primary", "1MiB", "100%"],),
         )
 
+    @patch("rpi_usb_cloner.storage.format.os.path.exists")
+    @patch("rpi_usb_cloner.storage.format.shutil.which")
+    @patch("rpi_usb_cloner.storage.format.time.sleep")
+    @patch("rpi_usb_cloner.storage.format.run_command")
+    def test_create_partition_aligned_to_erase_block(
+        self, mock_run, mock_sleep, mock_which, mock_exists
+    ):
+        """Test partition start and end follow the flash erase block."""
+        mock_run.return_value = Mock(returncode=0)
+        mock_which.return_value = "/usr/bin/sync"
+        mock_exists.return_value = True
+        mib = 1024 * 1024
+        geometry = FlashGeometry(8 * mib, "sysfs", 512, 1000 * mib + 12345)
+
+        result = format_module._create_partition("/dev/sda", geometry=geometry)
+
+        assert result is True
+        assert mock_run.call_args_list[0] == (
+            (
+                [
+                    "parted",
+                    "-s",
+                    "/dev/sda",
+                    "mkpart",
+                    "primary",
+                    f"{8 * mib}B",
+                    f"{1000 * mib - 1}B",
+                ],
+            ),
+        )
+
     @patch("rpi_usb_cloner.storage.format.time.sleep")
     @patch("rpi_usb_cloner.storage.format.run_command")
     def test_create_partition_failure(self, mock_run, mock_sleep):
@@ -407,9 +439,67 @@ class TestFormatFilesystem:
         assert result is False
 
 
+class TestFormatFilesystemGeometry:
+    """Tests for erase-block aware mkfs parameters."""
+
+    GEOMETRY = FlashGeometry(4 * 1024 * 1024, "sysfs", 512, 16 * 1024**3)
+
+    def _run(self, filesystem, **kwargs):
+        with patch(
+            "rpi_usb_cloner.storage.format._ensure_partition_unmounted",
+            return_value=True,
+        ), patch("rpi_usb_cloner.storage.format.subprocess.Popen") as mock_popen:
+            mock_proc = Mock()
+            mock_proc.poll.return_value = 0
+            mock_proc.wait.return_value = 0
+            mock_proc.stderr = Mock()
+            mock_popen.return_value = mock_proc
+            with patch(
+                "rpi_usb_cloner.storage.format.select.select",
+                return_value=([], [], []),
+            ):
+                result = format_module._format_filesystem(
+                    "/dev/sda1",
+                    filesystem,
+                    "quick",
+                    None,
+                    None,
+                    geometry=self.GEOMETRY,
+                    **kwargs,
+                )
+        assert result is True
+        return mock_popen.call_args[0][0]
+
+    def test_vfat_uses_aligned_layout(self):
+        cmd = self._run("vfat")
+        assert cmd[cmd.index("-s") + 1] == "64"
+        assert "-a" in cmd
+        reserved = int(cmd[cmd.index("-R") + 1])
+        assert reserved >= 32
+
+    def test_ext4_sets_stride_and_stripe_width(self):
+        cmd = self._run("ext4")
+        assert cmd[cmd.index("-E") + 1] == "stride=1024,stripe_width=1024"
+
+    @patch("rpi_usb_cloner.storage.format._mkfs_exfat_supports_layout")
+    def test_exfat_sets_cluster_and_boundary(self, mock_supports):
+        mock_supports.return_value = True
+        cmd = self._run("exfat")
+        assert cmd[cmd.index("-c") + 1] == str(32 * 1024)
+        assert cmd[cmd.index("-b") + 1] == str(4 * 1024 * 1024)
+
+    @patch("rpi_usb_cloner.storage.format._mkfs_exfat_supports_layout")
+    def test_exfat_without_exfatprogs_keeps_defaults(self, mock_supports):
+        mock_supports.return_value = False
+        cmd = self._run("exfat")
+        assert "-b" not in cmd
+        assert "-c" not in cmd
+
+
 class TestFormatDevice:
     """Tests for format_device() main function."""
 
+    @patch("rpi_usb_cloner.storage.format.detect_flash_geometry")
     @patch("rpi_usb_cloner.storage.format._get_live_partition_mountpoint")
     @patch("rpi_usb_cloner.storage.format.os.path.exists")
     @patch("rpi_usb_cloner.storage.format._format_filesystem")
@@ -424,9 +514,12 @@ class TestFormatDevice:
         mock_format_fs,
         mock_exists,
         mock_live_mountpoint,
+        mock_detect,
     ):
         """Test complete format workflow."""
         device = {"name": "sda", "size": "16106127360"}
+        geometry = FlashGeometry(4 * 1024 * 1024, "sysfs", 512, 16106127360)
+        mock_detect.return_value = geometry
 
         mock_unmount.return_value = True
         mock_create_table.return_value = True
@@ -442,8 +535,10 @@ class TestFormatDevice:
         # Verify workflow steps
         mock_unmount.assert_called_once()
         mock_create_table.assert_called_once_with("/dev/sda")
-        mock_create_part.assert_called_once_with("/dev/sda")
+        mock_detect.assert_called_once_with("/dev/sda", device_bytes="16106127360")
+        mock_create_part.assert_called_once_with("/dev/sda", geometry=geometry)
         mock_format_fs.assert_called_once()
+        assert mock_format_fs.call_args.kwargs["geometry"] is geometry
 
     @patch("rpi_usb_cloner.storage.format.unmount_device")
     def test_format_device_unmount_returns_false(self, mock_unmount):
@@ -0,0 +1,248 @@
+"""Tests for the netlink hotplug monitor and live device table.
+
+Covers:
+- kernel and udev uevent parsing
+- incremental DeviceTable updates, generations and subscriptions
+- HotplugMonitor event and fallback polling loops
+- get_block_devices served from the attached table
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+import threading
+
+import pytest
+
+from rpi_usb_cloner.storage import devices as storage_devices
+from rpi_usb_cloner.storage import hotplug
+from rpi_usb_cloner.storage.hotplug import (
+    DeviceTable,
+    HotplugMonitor,
+    parse_uevent,
+)
+
+
+def kernel_event(action: str, devpath: str, **properties: str) -> bytes:
+    fields = {"ACTION": action, "DEVPATH": devpath, "SUBSYSTEM": "block"}
+    fields.update(properties)
+    body = b"\0".join(f"{key}={value}".encode() for key, value in fields.items())
+    return f"{action}@{devpath}".encode() + b"\0" + body + b"\0"
+
+
+def udev_event(**properties: str) -> bytes:
+    body = b"\0".join(f"{key}={value}".encode() for key, value in properties.items())
+    header_size = 40
+    header = b"libudev\0" + struct.pack(">I", hotplug.UDEV_MONITOR_MAGIC)
+    header += struct.pack("=III", header_size, header_size, len(body))
+    header += b"\0" * (header_size - len(header))
+    return header + body
+
+
+SDB_PATH = "/devices/platform/usb/1-1/host0/target0:0:0/0:0:0:0/block/sdb"
+
+
+class FakeLoader:
+    def __init__(self, disks):
+        self.disks = disks
+        self.loads: list[str] = []
+
+    def load_all(self):
+        return [dict(device) for device in self.disks.values()]
+
+    def load_one(self, name):
+        self.loads.append(name)
+        device = self.disks.get(name)
+        return dict(device) if device else None
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader({"sda": {"name": "sda", "type": "disk"}})
+
+
+@pytest.fixture
+def table(loader):
+    device_table = DeviceTable(loader.load_all, loader.load_one)
+    device_table.reload()
+    return device_table
+
+
+class TestParseUevent:
+    """Test parse_uevent function."""
+
+    def test_kernel_message(self):
+        event = parse_uevent(kernel_event("add", SDB_PATH, DEVNAME="sdb"))
+        assert event["ACTION"] == "add"
+        assert event["DEVNAME"] == "sdb"
+        assert event["SUBSYSTEM"] == "block"
+
+    def test_udev_message(self):
+        event = parse_uevent(
+            udev_event(
+                ACTION="change",
+                DEVPATH=SDB_PATH,
+                SUBSYSTEM="block",
+                DEVNAME="/dev/sdb",
+                ID_FS_TYPE="vfat",
+            )
+        )
+        assert event["ACTION"] == "change"
+        assert event["ID_FS_TYPE"] == "vfat"
+
+    def test_rejects_bad_magic(self):
+        data = bytearray(udev_event(ACTION="add", DEVPATH=SDB_PATH))
+        data[8:12] = b"\0\0\0\0"
+        assert parse_uevent(bytes(data)) is None
+
+    def test_rejects_garbage(self):
+        assert parse_uevent(b"not a uevent") is None
+
+
+class TestDeviceTable:
+    """Test incremental DeviceTable updates."""
+
+    def test_reload_sets_generation(self, table):
+        assert table.generation == 1
+        assert [device["name"] for device in table.devices()] == ["sda"]
+        # Unchanged data does not bump the generation
+        assert table.reload() is False
+        assert table.generation == 1
+
+    def test_add_events_coalesce_per_disk(self, table, loader):
+        loader.disks["sdb"] = {
+            "name": "sdb",
+            "type": "disk",
+            "children": [{"name": "sdb1", "type": "part"}],
+        }
+        events = [
+            parse_uevent(kernel_event("add", SDB_PATH, DEVNAME="sdb", DEVTYPE="disk")),
+            parse_uevent(
+                kernel_event(
+                    "add", f"{SDB_PATH}/sdb1", DEVNAME="sdb1", DEVTYPE="partition"
+                )
+            ),
+        ]
+
+        assert table.apply_events(events) is True
+        assert loader.loads == ["sdb"]
+        assert [device["name"] for device in table.devices()] == ["sda", "sdb"]
+        assert table.generation == 2
+
+    def test_remove_event_drops_disk(self, table, loader):
+        loader.disks.pop("sda")
+        event = parse_uevent(
+            kernel_event("remove", "/devices/x/block/sda", DEVNAME="sda")
+        )
+        assert table.apply_events([event]) is True
+        assert table.devices() == []
+        assert loader.loads == []
+
+    def test_ignores_other_subsystems(self, table, loader):
+        event = {"ACTION": "add", "DEVPATH": "/devices/x/tty/ttyS0", "SUBSYSTEM": "tty"}
+        assert table.apply_events([event]) is False
+        assert loader.loads == []
+
+    def test_failed_reload_keeps_devices(self, loader):
+        calls = {"count": 0}
+
+        def flaky_load_all():
+            calls["count"] += 1
+            if calls["count"] > 1:
+                raise OSError("lsblk failed")
+            return loader.load_all()
+
+        device_table = DeviceTable(flaky_load_all, loader.load_one)
+        device_table.reload()
+        assert device_table.reload() is False
+        assert [device["name"] for device in device_table.devices()] == ["sda"]
+        assert device_table.generation == 1
+
+    def test_subscribers_and_wait(self, table, loader):
+        seen: list[int] = []
+        unsubscribe = table.subscribe(seen.append)
+        loader.disks["sdb"] = {"name": "sdb", "type": "disk"}
+
+        timer = threading.Timer(0.05, table.reload)
+        timer.start()
+        assert table.wait_for_change(1, timeout=2.0) == 2
+        timer.join()
+        assert seen == [2]
+
+        unsubscribe()
+        loader.disks.pop("sdb")
+        table.reload()
+        assert seen == [2]
+
+    def test_wait_times_out(self, table):
+        assert table.wait_for_change(table.generation, timeout=0.01) == 1
+
+
+class TestHotplugMonitor:
+    """Test the monitor thread."""
+
+    def test_netlink_events_update_table(self, table, loader, monkeypatch, tmp_path):
+        receiver, sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.setblocking(False)
+        monkeypatch.setattr(hotplug, "open_uevent_socket", lambda: receiver)
+        monkeypatch.setattr(
+            hotplug.mount_table,
+            "_mount_table",
+            hotplug.mount_table.MountTable(tmp_path / "missing-mountinfo"),
+        )
+        monkeypatch.setattr(hotplug, "POLL_TIMEOUT_SECONDS", 0.05)
+        monitor = HotplugMonitor(table)
+        monitor.start()
+        try:
+            assert monitor.live is True
+            generation = table.generation
+            loader.disks["sdb"] = {"name": "sdb", "type": "disk"}
+            sender.send(kernel_event("add", SDB_PATH, DEVNAME="sdb", DEVTYPE="disk"))
+            assert table.wait_for_change(generation, timeout=2.0) == generation + 1
+            assert "sdb" in [device["name"] for device in table.devices()]
+        finally:
+            monitor.stop()
+            sender.close()
+
+    def test_falls_back_to_polling(self, table, loader, monkeypatch):
+        monkeypatch.setattr(hotplug, "open_uevent_socket", lambda: None)
+        monitor = HotplugMonitor(table, fallback_interval=0.02)
+        monitor.start()
+        try:
+            assert monitor.live is False
+            generation = table.generation
+            loader.disks["sdc"] = {"name": "sdc", "type": "disk"}
+            assert table.wait_for_change(generation, timeout=2.0) == generation + 1
+        finally:
+            monitor.stop()
+
+
+class TestSharedMonitor:
+    """Test start/stop of the shared monitor."""
+
+    def test_get_block_devices_uses_table(self, loader, monkeypatch):
+        monkeypatch.setattr(hotplug, "open_uevent_socket", lambda: None)
+        monkeypatch.setattr(
+            hotplug,
+            "DeviceTable",
+            lambda: DeviceTable(loader.load_all, loader.load_one),
+        )
+        monkeypatch.setattr(
+            storage_devices,
+            "run_command",
+            lambda *args, **kwargs: pytest.fail("lsblk should not run"),
+        )
+        try:
+            table = hotplug.start_hotplug_monitor()
+            assert hotplug.start_hotplug_monitor() is table
+            assert hotplug.get_device_table() is table
+            assert storage_devices.get_block_devices() == table.devices()
+        finally:
+            hotplug.stop_hotplug_monitor()
+        assert hotplug.get_device_table() is None
+        assert storage_devices._device_table is None
+
+    def test_stop_without_start(self):
+        hotplug.stop_hotplug_monitor()
+        assert hotplug.get_device_table() is None
@@ -0,0 +1,140 @@
+"""Tests for the raw image digest sidecar cache.
+
+Covers:
+- Sidecar round trip and invalidation on size/mtime/offset changes
+- get_image_digest reuse of the cached value
+- start_background_digest
+- verify_image_write (including the ImageUSB header offset)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+
+import pytest
+
+from rpi_usb_cloner.storage import image_digest
+from rpi_usb_cloner.storage.image_digest import (
+    get_image_digest,
+    get_sidecar_path,
+    load_cached_digest,
+    start_background_digest,
+    store_digest,
+    verify_image_write,
+)
+
+
+PAYLOAD = b"boot sector" * 200 + bytes(4096)
+
+
+@pytest.fixture
+def iso_file(tmp_path):
+    path = tmp_path / "test.iso"
+    path.write_bytes(PAYLOAD)
+    return path
+
+
+@pytest.fixture
+def bin_file(tmp_path):
+    path = tmp_path / "test.bin"
+    path.write_bytes(b"H" * 512 + PAYLOAD)
+    return path
+
+
+class TestSidecar:
+    """Test sidecar storage and invalidation."""
+
+    def test_round_trip(self, iso_file):
+        assert store_digest(iso_file, "abc")
+        assert load_cached_digest(iso_file) == "abc"
+        record = json.loads(get_sidecar_path(iso_file).read_text())
+        assert record["size"] == len(PAYLOAD)
+        assert record["offset"] == 0
+
+    def test_missing_sidecar(self, iso_file):
+        assert load_cached_digest(iso_file) is None
+
+    def test_mtime_change_invalidates(self, iso_file):
+        store_digest(iso_file, "abc")
+        stat = iso_file.stat()
+        os.utime(iso_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert load_cached_digest(iso_file) is None
+
+    def test_size_change_invalidates(self, iso_file):
+        store_digest(iso_file, "abc")
+        with iso_file.open("ab") as handle:
+            handle.write(b"x")
+        assert load_cached_digest(iso_file) is None
+
+    def test_offset_mismatch_invalidates(self, bin_file):
+        store_digest(bin_file, "abc", 0)
+        assert load_cached_digest(bin_file, 512) is None
+
+    def test_corrupt_sidecar_ignored(self, iso_file):
+        get_sidecar_path(iso_file).write_text("{not json")
+        assert load_cached_digest(iso_file) is None
+
+    def test_changed_during_hash_not_stored(self, iso_file):
+        stale = iso_file.stat()
+        iso_file.write_bytes(PAYLOAD + b"more")
+        assert not store_digest(iso_file, "abc", stat_result=stale)
+        assert not get_sidecar_path(iso_file).exists()
+
+
+class TestGetImageDigest:
+    """Test get_image_digest caching behaviour."""
+
+    def test_computes_and_caches(self, iso_file, mocker):
+        digest = get_image_digest(iso_file)
+        assert digest == hashlib.sha256(PAYLOAD).hexdigest()
+
+        spy = mocker.spy(image_digest, "compute_image_digest")
+        assert get_image_digest(iso_file) == digest
+        spy.assert_not_called()
+
+    def test_offset_skips_imageusb_header(self, bin_file):
+        assert get_image_digest(bin_file, 512) == hashlib.sha256(PAYLOAD).hexdigest()
+
+    def test_background_digest_writes_sidecar(self, iso_file):
+        thread = start_background_digest(iso_file)
+        assert thread is not None
+        thread.join()
+        assert load_cached_digest(iso_file) == hashlib.sha256(PAYLOAD).hexdigest()
+        # Nothing to do once the sidecar is valid
+        assert start_background_digest(iso_file) is None
+
+
+class TestVerifyImageWrite:
+    """Test verify_image_write function."""
+
+    def test_matching_target(self, iso_file, tmp_path):
+        target = tmp_path / "target"
+        target.write_bytes(PAYLOAD + b"\xff" * 1024)
+        assert verify_image_write(iso_file, str(target))
+
+    def test_matching_target_reads_only_target_when_cached(
+        self, iso_file, tmp_path, mocker
+    ):
+        get_image_digest(iso_file)
+        target = tmp_path / "target"
+        target.write_bytes(PAYLOAD)
+        spy = mocker.spy(image_digest, "compute_image_digest")
+        assert verify_image_write(iso_file, str(target))
+        spy.assert_not_called()
+
+    def test_mismatch(self, iso_file, tmp_path):
+        target = tmp_path / "target"
+        target.write_bytes(b"Z" + PAYLOAD[1:])
+        assert not verify_image_write(iso_file, str(target))
+
+    def test_short_target_fails(self, iso_file, tmp_path):
+        target = tmp_path / "target"
+        target.write_bytes(PAYLOAD[:100])
+        assert not verify_image_write(iso_file, str(target))
+
+    def test_imageusb_offset(self, bin_file, tmp_path):
+        target = tmp_path / "target"
+        target.write_bytes(PAYLOAD)
+        assert verify_image_write(bin_file, str(target), 512)
@@ -126,28 +126,32 @@ class TestResolvesMountpoint:
             "rpi_usb_cloner.storage.image_repo.mount.mount_partition",
             return_value=None,
         )
+        # Not mounted before, mounted at /media/usb afterwards
+        mountpoint_of = mocker.patch(
+            "rpi_usb_cloner.storage.image_repo.mountpoint_of",
+            side_effect=[None, "/media/usb"],
+        )
 
-        # Mock list_usb_disks to return the newly mounted partition
-        mocker.patch(
-            "rpi_usb_cloner.storage.image_repo.devices.list_usb_disks",
-            return_value=[
-                {
-                    "name": "sda",
-                    "type": "disk",
-                    "children": [
-                        {"name": "sda1", "type": "part", "mountpoint": "/media/usb"}
-                    ],
-                }
-            ],
+        partition = {"name": "sda1", "mountpoint": None}
+        result = _resolve_mountpoint(partition)
+        assert result == Path("/media/usb")
+        mountpoint_of.assert_called_with("/dev/sda1")
+
+    def test_resolve_mountpoint_prefers_live_mount_table(self, mocker):
+        """Test a stale device listing is corrected by the mount table."""
+        from rpi_usb_cloner.storage.image_repo import _resolve_mountpoint
+
+        mount_partition = mocker.patch(
+            "rpi_usb_cloner.storage.image_repo.mount.mount_partition"
         )
         mocker.patch(
-            "rpi_usb_cloner.storage.image_repo.devices.get_children",
-            return_value=[{"name": "sda1", "type": "part", "mountpoint": "/media/usb"}],
+            "rpi_usb_cloner.storage.image_repo.mountpoint_of",
+            return_value="/media/sda1",
         )
 
         partition = {"name": "sda1", "mountpoint": None}
-        result = _resolve_mountpoint(partition)
-        assert result == Path("/media/usb")
+        assert _resolve_mountpoint(partition) == Path("/media/sda1")
+        mount_partition.assert_not_called()
 
     def test_resolve_mountpoint_partition_not_found_after_mount(self, mocker):
         """Test resolving mountpoint when partition not found after mount."""
@@ -158,8 +162,8 @@ class TestResolvesMountpoint:
             return_value=None,
         )
         mocker.patch(
-            "rpi_usb_cloner.storage.image_repo.devices.list_usb_disks",
-            return_value=[],
+            "rpi_usb_cloner.storage.image_repo.mountpoint_of",
+            return_value=None,
         )
 
         partition = {"name": "sda1", "mountpoint": None}
@@ -381,6 +385,34 @@ class TestListClonezillaImages:
         assert bin_images[0].name == "backup.bin"
         assert bin_images[0].size_bytes == 500
 
+    def test_list_clonezilla_images_with_compressed_raw(self, mocker, tmp_path):
+        """Test listing compressed raw images (.img.xz, .zip) in repository."""
+        import zipfile
+
+        from rpi_usb_cloner.storage.image_repo import list_clonezilla_images
+
+        xz_file = tmp_path / "raspios.img.xz"
+        xz_file.write_bytes(b"x" * 300)
+        zip_file = tmp_path / "os.zip"
+        with zipfile.ZipFile(zip_file, "w") as archive:
+            archive.writestr("os.img", b"\x00" * 1024)
+        not_image_zip = tmp_path / "docs.zip"
+        with zipfile.ZipFile(not_image_zip, "w") as archive:
+            archive.writestr("readme.txt", b"hello")
+
+        mocker.patch(
+            "rpi_usb_cloner.storage.image_repo.clonezilla.list_clonezilla_image_dirs",
+            return_value=[],
+        )
+
+        images = list_clonezilla_images(tmp_path)
+        compressed = [
+            img for img in images if img.image_type == ImageType.COMPRESSED_RAW
+        ]
+        assert [img.name for img in compressed] == ["os.zip", "raspios.img.xz"]
+        assert compressed[1].size_bytes == 300
+        assert all(img.is_compressed_raw for img in compressed)
+
     def test_list_clonezilla_images_non_imageusb_bin_skipped(self, mocker, tmp_path):
         """Test that non-ImageUSB .BIN files are skipped."""
         from rpi_usb_cloner.storage.image_repo import list_clonezilla_images
@@ -773,6 +805,35 @@ class TestGetRepoUsage:
 
         assert usage["type_bytes"]["imageusb"] == 500
 
+    def test_get_repo_usage_with_compressed_images(self, mocker, tmp_path):
+        """Test usage stats with compressed raw images."""
+        from rpi_usb_cloner.storage.image_repo import get_repo_usage
+
+        (tmp_path / "raspios.img.xz").write_bytes(b"c" * 300)
+        (tmp_path / "debian.iso").write_bytes(b"x" * 1000)
+
+        mocker.patch(
+            "rpi_usb_cloner.storage.image_repo.clonezilla.list_clonezilla_image_dirs",
+            return_value=[],
+        )
+
+        repo = ImageRepo(path=tmp_path, drive_name="sda")
+        usage = get_repo_usage(repo)
+        listed = get_repo_usage(
+            repo,
+            [
+                DiskImage(
+                    name="raspios.img.xz",
+                    path=tmp_path / "raspios.img.xz",
+                    image_type=ImageType.COMPRESSED_RAW,
+                )
+            ],
+        )
+
+        assert usage["type_bytes"]["compressed"] == 300
+        assert usage["type_bytes"]["iso"] == 1000
+        assert listed["type_bytes"]["compressed"] == 300
+
     def test_get_repo_usage_calculates_other(self, mocker, tmp_path):
         """Test that 'other' is calculated from remaining used space."""
         from rpi_usb_cloner.storage.image_repo import get_repo_usage
@@ -0,0 +1,231 @@
+"""Tests for the persistent image size index.
+
+Covers:
+- Clonezilla directory sizes cached until the directory changes
+- file-derived values cached until the file changes
+- sidecar persistence, pruning and racy-entry handling
+- get_repo_usage served from the index
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.storage import image_repo, image_size_index, sidecar_index
+from rpi_usb_cloner.storage.image_size_index import ImageSizeIndex
+
+
+@pytest.fixture(autouse=True)
+def settled(monkeypatch):
+    """Treat freshly written test files as settled."""
+    monkeypatch.setattr(sidecar_index, "SETTLE_SECONDS", 0.0)
+    yield
+    image_size_index.clear_size_indexes()
+
+
+@pytest.fixture
+def repo_root(tmp_path):
+    root = tmp_path / "repo"
+    image_dir = root / "clonezilla" / "backup"
+    (image_dir / "sub").mkdir(parents=True)
+    (image_dir / "parts").write_text("sda1\n")
+    (image_dir / "sda1.ext4-ptcl-img.gz.aa").write_bytes(b"x" * 100)
+    (image_dir / "sub" / "extra").write_bytes(b"y" * 20)
+    (root / image_repo.REPO_FLAG_FILENAME).touch()
+    return root
+
+
+class TestTreeBytes:
+    """Test Clonezilla directory sizes."""
+
+    def test_measured_once_until_changed(self, repo_root):
+        image_dir = repo_root / "clonezilla" / "backup"
+        index = ImageSizeIndex(repo_root)
+        measure = Mock(side_effect=image_repo._sum_tree_bytes)
+
+        assert index.tree_bytes(image_dir, measure) == 125
+        assert index.tree_bytes(image_dir, measure) == 125
+        assert measure.call_count == 1
+
+        (image_dir / "sub" / "more").write_bytes(b"z" * 5)
+        assert index.tree_bytes(image_dir, measure) == 130
+        assert measure.call_count == 2
+
+    def test_remeasured_when_volume_grows_in_place(self, repo_root):
+        image_dir = repo_root / "clonezilla" / "backup"
+        volume = image_dir / "sda1.ext4-ptcl-img.gz.aa"
+        index = ImageSizeIndex(repo_root)
+        measure = Mock(side_effect=image_repo._sum_tree_bytes)
+        assert index.tree_bytes(image_dir, measure) == 125
+        index.save()
+        directory_mtime = image_dir.stat().st_mtime_ns
+
+        # Appending leaves the directory's mtime alone
+        with volume.open("ab") as handle:
+            handle.write(b"x" * 5_000_000)
+        assert image_dir.stat().st_mtime_ns == directory_mtime
+
+        assert index.tree_bytes(image_dir, measure) == 5_000_125
+        index.save()
+        image_size_index.clear_size_indexes()
+        reloaded = ImageSizeIndex(repo_root)
+        assert reloaded.tree_bytes(image_dir, Mock(return_value=0)) == 5_000_125
+
+    def test_recently_written_file_not_stored(self, repo_root, monkeypatch):
+        image_dir = repo_root / "clonezilla" / "backup"
+        index = ImageSizeIndex(repo_root)
+        old = 1_000_000_000
+        for path in (image_dir, image_dir / "sub", *image_dir.rglob("*")):
+            os.utime(path, (old, old))
+        monkeypatch.setattr(sidecar_index, "SETTLE_SECONDS", 60.0)
+        # A volume still being appended to; the directories are long settled
+        with (image_dir / "sda1.ext4-ptcl-img.gz.aa").open("ab") as handle:
+            handle.write(b"x")
+        measure = Mock(return_value=126)
+
+        index.tree_bytes(image_dir, measure)
+        index.tree_bytes(image_dir, measure)
+
+        assert measure.call_count == 2
+        assert index.save() is False
+
+    def test_recent_changes_not_stored(self, repo_root, monkeypatch):
+        monkeypatch.setattr(sidecar_index, "SETTLE_SECONDS", 60.0)
+        image_dir = repo_root / "clonezilla" / "backup"
+        index = ImageSizeIndex(repo_root)
+        measure = Mock(return_value=125)
+
+        index.tree_bytes(image_dir, measure)
+        index.tree_bytes(image_dir, measure)
+
+        assert measure.call_count == 2
+        assert index.save() is False
+
+
+class TestFileBytes:
+    """Test values derived from single files."""
+
+    def test_remeasured_when_file_changes(self, repo_root):
+        bin_file = repo_root / "backup.bin"
+        bin_file.write_bytes(b"a" * 10)
+        index = ImageSizeIndex(repo_root)
+        measure = Mock(side_effect=lambda path: path.stat().st_size * 2)
+
+        assert index.file_bytes(bin_file, measure) == 20
+        assert index.file_bytes(bin_file, measure) == 20
+        bin_file.write_bytes(b"a" * 30)
+        assert index.file_bytes(bin_file, measure) == 60
+        assert measure.call_count == 2
+
+
+class TestSidecar:
+    """Test sidecar persistence."""
+
+    def test_reloaded_without_measuring(self, repo_root):
+        image_dir = repo_root / "clonezilla" / "backup"
+        first = ImageSizeIndex(repo_root)
+        first.tree_bytes(image_dir, image_repo._sum_tree_bytes)
+        assert first.save() is True
+        assert first.save() is False
+
+        record = json.loads(
+            (repo_root / image_size_index.SIZE_INDEX_FILENAME).read_text()
+        )
+        assert record["entries"]["clonezilla/backup"]["bytes"] == 125
+
+        measure = Mock()
+        assert ImageSizeIndex(repo_root).tree_bytes(image_dir, measure) == 125
+        measure.assert_not_called()
+
+    def test_prunes_deleted_images(self, repo_root):
+        iso = repo_root / "a.iso"
+        iso.write_bytes(b"x")
+        index = ImageSizeIndex(repo_root)
+        index.file_bytes(iso, lambda path: 1)
+        index.tree_bytes(
+            repo_root / "clonezilla" / "backup", image_repo._sum_tree_bytes
+        )
+        index.save()
+        iso.unlink()
+        other = repo_root / "b.iso"
+        other.write_bytes(b"y")
+        index.file_bytes(other, lambda path: 1)
+        index.save()
+
+        record = json.loads(
+            (repo_root / image_size_index.SIZE_INDEX_FILENAME).read_text()
+        )
+        assert sorted(record["entries"]) == ["b.iso", "clonezilla/backup"]
+
+    def test_corrupt_sidecar_ignored(self, repo_root):
+        (repo_root / image_size_index.SIZE_INDEX_FILENAME).write_text("{not json")
+        index = ImageSizeIndex(repo_root)
+        assert (
+            index.tree_bytes(
+                repo_root / "clonezilla" / "backup", image_repo._sum_tree_bytes
+            )
+            == 125
+        )
+
+    def test_memory_only_index(self, repo_root):
+        index = ImageSizeIndex(repo_root, persist=False)
+        index.tree_bytes(
+            repo_root / "clonezilla" / "backup", image_repo._sum_tree_bytes
+        )
+        assert index.save() is False
+        assert not (repo_root / image_size_index.SIZE_INDEX_FILENAME).exists()
+
+
+class TestRepoUsage:
+    """Test image_repo functions served from the index."""
+
+    @pytest.fixture(autouse=True)
+    def check_platform(self):
+        import os
+
+        if not hasattr(os, "statvfs"):
+            pytest.skip("statvfs not available on this platform")
+
+    def test_repo_usage_from_catalog_images(self, repo_root, mocker):
+        image_dir = repo_root / "clonezilla" / "backup"
+        iso = repo_root / "debian.iso"
+        iso.write_bytes(b"i" * 40)
+        images = [
+            DiskImage(
+                name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR
+            ),
+            DiskImage(
+                name="debian.iso", path=iso, image_type=ImageType.ISO, size_bytes=40
+            ),
+        ]
+        repo = ImageRepo(path=repo_root, drive_name="sdb")
+        discover = mocker.spy(image_repo, "_iter_clonezilla_image_dirs")
+        walk = mocker.spy(image_repo, "_sum_tree_bytes")
+
+        first = image_repo.get_repo_usage(repo, images)
+        second = image_repo.get_repo_usage(repo, images)
+
+        assert first["type_bytes"]["clonezilla"] == 125
+        assert first["type_bytes"]["iso"] == 40
+        assert second["type_bytes"]["clonezilla"] == 125
+        assert walk.call_count == 1
+        discover.assert_not_called()
+        assert (repo_root / image_size_index.SIZE_INDEX_FILENAME).exists()
+
+    def test_image_size_uses_repo_index(self, repo_root, mocker):
+        image = DiskImage(
+            name="backup",
+            path=repo_root / "clonezilla" / "backup",
+            image_type=ImageType.CLONEZILLA_DIR,
+        )
+        walk = mocker.spy(image_repo, "_sum_tree_bytes")
+
+        assert image_repo.get_image_size_bytes(image) == 125
+        assert image_repo.get_image_size_bytes(image) == 125
+        assert walk.call_count == 1
+        assert (repo_root / image_size_index.SIZE_INDEX_FILENAME).exists()
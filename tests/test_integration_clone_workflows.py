@@ -6,9 +6,11 @@ import pytest
 
 from rpi_usb_cloner.storage.clone import clone_device
 from rpi_usb_cloner.storage.clone.erase import erase_device
+from rpi_usb_cloner.storage.device_snapshot import DeviceSnapshot
 
 
 @pytest.mark.integration
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneWorkflow:
     """Integration tests for complete clone workflows."""
 
@@ -81,7 +83,9 @@ class TestCloneWorkflow:
 
         assert result is True
         # Verify workflow steps
-        mock_unmount.assert_called_once_with(target)
+        mock_unmount.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(target).to_dict()
+        )
         mock_copy_table.assert_called_once()
         mock_clone_partclone.assert_called_once()
 
@@ -101,7 +105,9 @@ class TestCloneWorkflow:
         result = clone_device(source, target, mode="exact")
 
         assert result is True
-        mock_unmount.assert_called_once_with(target)
+        mock_unmount.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(target).to_dict()
+        )
         mock_clone_dd.assert_called_once()
 
     @patch("rpi_usb_cloner.storage.clone.verification.verify_clone")
@@ -121,7 +127,9 @@ class TestCloneWorkflow:
 
         assert result is True
         mock_smart.assert_called_once()
-        mock_verify.assert_called_once_with(source, target)
+        mock_verify.assert_called_once_with(
+            DeviceSnapshot.from_lsblk(source), DeviceSnapshot.from_lsblk(target)
+        )
 
     @patch("rpi_usb_cloner.storage.clone.verification.verify_clone")
     @patch("rpi_usb_cloner.storage.clone.operations.clone_device_smart")
@@ -220,26 +228,26 @@ class TestEraseWorkflow:
     @patch("rpi_usb_cloner.storage.clone.erase.validate_device_unmounted")
     @patch("rpi_usb_cloner.storage.clone.erase.get_device_by_name")
     @patch("rpi_usb_cloner.storage.clone.erase.unmount_device")
-    @patch("rpi_usb_cloner.storage.clone.erase.shutil.which")
+    @patch("rpi_usb_cloner.storage.clone.erase.secure_erase_device")
     @patch("rpi_usb_cloner.storage.clone.erase.run_checked_with_streaming_progress")
     def test_secure_erase_workflow(
         self,
         mock_run,
-        mock_which,
+        mock_secure,
         mock_unmount,
         mock_get_device,
         mock_validate_unmounted,
         mock_target,
     ):
         """Test complete secure erase workflow."""
-        mock_which.return_value = "/usr/bin/shred"
-        mock_run.return_value = Mock()
+        mock_secure.return_value.verified = True
 
         result = erase_device(mock_target, "secure")
 
         assert result is True
         mock_unmount.assert_called_once_with(mock_target)
-        mock_run.assert_called_once()
+        mock_secure.assert_called_once()
+        mock_run.assert_not_called()
 
     @patch("rpi_usb_cloner.storage.clone.erase.validate_device_unmounted")
     @patch("rpi_usb_cloner.storage.clone.erase.get_device_by_name")
@@ -275,6 +283,7 @@ class TestEraseWorkflow:
 
 
 @pytest.mark.integration
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestCloneAndVerifyWorkflow:
     """Integration tests for clone + verify workflows."""
 
@@ -352,6 +361,7 @@ class TestCloneAndVerifyWorkflow:
 
 
 @pytest.mark.integration
+@pytest.mark.usefixtures("unchanged_device_refresh")
 class TestEndToEndCloneScenarios:
     """End-to-end integration tests for realistic clone scenarios."""
 
@@ -407,5 +417,5 @@ class TestEndToEndCloneScenarios:
         mock_dd.assert_called_once()
         # Verify dd was called with correct devices
         call_args = mock_dd.call_args
-        assert source in call_args[0]
-        assert target in call_args[0]
+        assert DeviceSnapshot.from_lsblk(source) in call_args[0]
+        assert DeviceSnapshot.from_lsblk(target) in call_args[0]
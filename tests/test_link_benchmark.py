@@ -0,0 +1,251 @@
+"""Tests for the peer link benchmark.
+
+Covers:
+- the benchmark result and its bottleneck
+- the server's benchmark endpoints
+- the client-side benchmark runner
+"""
+
+from __future__ import annotations
+
+import secrets
+import time
+
+import aiohttp
+import pytest
+
+from rpi_usb_cloner.domain import ImageRepo
+from rpi_usb_cloner.services import link_benchmark, peer_transfer_server
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.services.link_benchmark import HashingSink, LinkBenchmark
+from rpi_usb_cloner.services.peer_transfer_client import TransferClient, TransferError
+from rpi_usb_cloner.web import server as web_server
+from rpi_usb_cloner.web.system_health import SystemHealth
+
+
+MB = 1_000_000
+
+
+def make_client(base_url=None):
+    client = TransferClient(
+        PeerDevice(
+            hostname="pi2",
+            address="127.0.0.1",
+            port=0,
+            device_id="id-pi2",
+            txt_records={},
+        )
+    )
+    if base_url is not None:
+        client.base_url = base_url
+    return client
+
+
+def make_result(link=100 * MB, path=90 * MB, disk=50 * MB):
+    return LinkBenchmark(
+        peer="pi2",
+        rtt_seconds=0.002,
+        download_bytes_per_second=link,
+        upload_bytes_per_second=link,
+        upload_path_bytes_per_second=path,
+        disk_write_bytes_per_second=disk,
+        finished_at=time.time(),
+    )
+
+
+class TestLinkBenchmark:
+    """Test benchmark results."""
+
+    @pytest.mark.parametrize(
+        ("link", "path", "disk", "expected"),
+        [
+            (100, 90, 50, "disk"),
+            (100, 40, 80, "upload path"),
+            (10, 9, 80, "link"),
+        ],
+    )
+    def test_bottleneck(self, link, path, disk, expected):
+        result = make_result(link * MB, path * MB, disk * MB)
+
+        assert result.bottleneck == expected
+        assert result.as_dict()["bottleneck"] == expected
+
+    def test_hashing_sink_counts_whole_blocks(self):
+        sink = HashingSink(4096)
+        data = bytes(10_000)
+        for start in range(0, len(data), 1000):
+            sink.write(data[start : start + 1000])
+
+        assert sink.received == 10_000
+        assert sink.blocks == 2
+
+    def test_write_test_file_cleans_up(self, tmp_path):
+        written, seconds = link_benchmark.write_test_file(tmp_path, 3 * 1024 * 1024)
+
+        assert written == 3 * 1024 * 1024
+        assert seconds > 0
+        assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def peer_server(tmp_path, aiohttp_client):
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir()
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+
+    async def start():
+        session, base_url = await aiohttp_client(server._build_app())
+        return session, base_url, {"Authorization": f"Bearer {token}"}
+
+    yield server, start
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+class TestBenchmarkEndpoints:
+    """Test the transfer server's benchmark endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_require_session(self, peer_server):
+        _server, start = peer_server
+        session, base_url, _headers = await start()
+
+        async with session.get(f"{base_url}/bench/source") as resp:
+            assert resp.status == 401
+        async with session.post(f"{base_url}/bench/sink", data=b"x") as resp:
+            assert resp.status == 401
+        async with session.post(f"{base_url}/bench/disk") as resp:
+            assert resp.status == 401
+
+    @pytest.mark.asyncio
+    async def test_source(self, peer_server):
+        _server, start = peer_server
+        session, base_url, headers = await start()
+
+        async with session.get(
+            f"{base_url}/bench/source", params={"bytes": "300000"}, headers=headers
+        ) as resp:
+            assert len(await resp.read()) == 300000
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("path", ["raw", "upload"])
+    async def test_sink_writes_nothing(self, peer_server, path):
+        server, start = peer_server
+        session, base_url, headers = await start()
+
+        async with session.post(
+            f"{base_url}/bench/sink",
+            params={"path": path},
+            data=bytes(500_000),
+            headers=headers,
+        ) as resp:
+            reply = await resp.json()
+
+        assert reply["bytes"] == 500_000
+        assert reply["seconds"] > 0
+        assert list(server.destination_repo.path.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_sink_rejects_unknown_path(self, peer_server):
+        _server, start = peer_server
+        session, base_url, headers = await start()
+
+        async with session.post(
+            f"{base_url}/bench/sink",
+            params={"path": "disk"},
+            data=b"x",
+            headers=headers,
+        ) as resp:
+            assert resp.status == 400
+
+    @pytest.mark.asyncio
+    async def test_disk(self, peer_server, monkeypatch):
+        monkeypatch.setattr(link_benchmark, "MAX_BENCH_BYTES", 2 * 1024 * 1024)
+        server, start = peer_server
+        session, base_url, headers = await start()
+
+        async with session.post(
+            f"{base_url}/bench/disk", params={"bytes": str(10**9)}, headers=headers
+        ) as resp:
+            reply = await resp.json()
+
+        assert reply["bytes"] == 2 * 1024 * 1024
+        assert list(server.destination_repo.path.iterdir()) == []
+
+
+class TestBenchmarkRunner:
+    """Test the client-side benchmark runner."""
+
+    @pytest.mark.asyncio
+    async def test_benchmark_link(self, peer_server):
+        _server, start = peer_server
+        _session, base_url, headers = await start()
+        client = make_client(base_url)
+        client.session_token = headers["Authorization"][len("Bearer ") :]
+        stages = []
+
+        result = await client.benchmark_link(
+            bench_bytes=8 * 1024 * 1024, seconds=5.0, on_stage=stages.append
+        )
+
+        assert stages == ["download", "upload", "upload path", "disk"]
+        assert result.peer == "pi2"
+        assert result.rtt_seconds > 0
+        for speed in (
+            result.download_bytes_per_second,
+            result.upload_bytes_per_second,
+            result.upload_path_bytes_per_second,
+            result.disk_write_bytes_per_second,
+        ):
+            assert speed > 0
+        assert result.bottleneck in ("link", "upload path", "disk")
+
+    @pytest.mark.asyncio
+    async def test_download_stops_after_time_limit(self, peer_server):
+        _server, start = peer_server
+        _session, base_url, headers = await start()
+        client = make_client(base_url)
+
+        async with aiohttp.ClientSession() as session:
+            speed = await client._bench_download(
+                session, headers, 512 * 1024 * 1024, seconds=0.0
+            )
+
+        assert speed > 0
+
+    @pytest.mark.asyncio
+    async def test_requires_session(self):
+        client = make_client()
+
+        with pytest.raises(TransferError, match="Not authenticated"):
+            await client.benchmark_link()
+
+    def test_last_result_in_health_payload(self, monkeypatch):
+        monkeypatch.setattr(link_benchmark, "_last_result", None)
+        health = SystemHealth(
+            cpu_percent=1.0,
+            memory_percent=1.0,
+            memory_used_mb=1,
+            memory_total_mb=100,
+            disk_percent=1.0,
+            disk_used_gb=1.0,
+            disk_total_gb=100.0,
+            temperature_celsius=None,
+        )
+        assert web_server._build_health_payload(health)["link_benchmark"] is None
+
+        result = make_result()
+        link_benchmark.record_result(result)
+
+        assert link_benchmark.get_last_result() is result
+        payload = web_server._build_health_payload(health)["link_benchmark"]
+        assert payload["peer"] == "pi2"
+        assert payload["disk_write_bytes_per_second"] == 50 * MB
+        assert payload["bottleneck"] == "disk"
@@ -294,6 +294,8 @@ def setup_main_mocks(
     monkeypatch.setattr(
         main.wifi, "configure_wifi_helpers", lambda *args, **kwargs: None
     )
+    monkeypatch.setattr(main.hotplug, "start_hotplug_monitor", lambda: None)
+    monkeypatch.setattr(main.hotplug, "stop_hotplug_monitor", lambda: None)
 
     drive_calls = {"media": 0, "raw": 0, "invalidate": 0}
 
@@ -404,6 +406,42 @@ class TestMainLoopIntegration:
         assert drive_calls["raw"] >= 2
         assert drive_calls["invalidate"] >= 1
 
+    def test_device_table_generation_triggers_refresh(self, monkeypatch):
+        fake_gpio = FakeGPIO([{}])
+        fake_time = FakeTime(start=0.0, gpio=fake_gpio, max_sleeps=3)
+        drive_calls = setup_main_mocks(
+            monkeypatch,
+            fake_time=fake_time,
+            fake_gpio=fake_gpio,
+            settings={"screensaver_enabled": False, "web_server_enabled": False},
+            drives_list=[["sda"], ["sda", "sdb"]],
+            raw_list=["sda"],
+        )
+        monkeypatch.setattr(
+            main.app_state, "AppState", build_fake_state(FakeDateTime.now())
+        )
+        # Polling alone would never trigger a refresh
+        monkeypatch.setattr(main.app_state, "USB_REFRESH_INTERVAL", 99.0)
+
+        class FakeDeviceTable:
+            def __init__(self):
+                self.reads = 0
+
+            @property
+            def generation(self):
+                # Changes once, after start-up
+                self.reads += 1
+                return 1 if self.reads > 1 else 0
+
+        monkeypatch.setattr(
+            main.hotplug, "start_hotplug_monitor", lambda: FakeDeviceTable()
+        )
+
+        main.main([])
+
+        # One snapshot at start-up, one for the generation change
+        assert drive_calls["media"] == 2
+
     def test_screensaver_activation(self, monkeypatch):
         fake_gpio = FakeGPIO([{}])
         fake_time = FakeTime(start=0.0, gpio=fake_gpio, max_sleeps=2)
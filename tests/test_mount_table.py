@@ -0,0 +1,110 @@
+"""Tests for the indexed mount table.
+
+Covers:
+- mountinfo parsing, including escapes and optional fields
+- mountpoint, device node and major:minor lookups
+- change-driven refresh and the os.path.ismount fallback
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from rpi_usb_cloner.storage import mount_table
+from rpi_usb_cloner.storage.mount_table import (
+    MountEntry,
+    MountTable,
+    parse_mountinfo,
+)
+
+
+MOUNTINFO = (
+    "23 28 0:22 / /proc rw,relatime - proc proc rw\n"
+    "30 28 8:17 / /media/usb\\040stick rw shared:5 - vfat /dev/sdb1 rw\n"
+    "31 28 8:17 /photos /srv/photos rw - vfat /dev/sdb1 rw\n"
+    "32 28 179:2 /var /mnt/var rw - ext4 /dev/mmcblk0p2 rw\n"
+)
+
+
+@pytest.fixture
+def table(tmp_path):
+    path = tmp_path / "mountinfo"
+    path.write_text(MOUNTINFO)
+    mounts = MountTable(path)
+    yield mounts
+    mounts.close()
+
+
+class TestParseMountinfo:
+    """Test parse_mountinfo function."""
+
+    def test_fields_and_escapes(self):
+        entries = parse_mountinfo(MOUNTINFO)
+        assert entries[1] == MountEntry(
+            devno="8:17",
+            root="/",
+            mountpoint="/media/usb stick",
+            fstype="vfat",
+            source="/dev/sdb1",
+        )
+        assert [entry.fstype for entry in entries] == ["proc", "vfat", "vfat", "ext4"]
+
+    def test_skips_malformed_lines(self):
+        assert parse_mountinfo("garbage\n23 28 0:22 / /proc rw\n") == []
+
+
+class TestMountTable:
+    """Test MountTable lookups and refresh."""
+
+    def test_lookups(self, table):
+        assert table.is_mountpoint_active("/media/usb stick") is True
+        assert table.is_mountpoint_active("/media/other") is False
+        assert table.entry_for_mountpoint("/mnt/var").source == "/dev/mmcblk0p2"
+        assert [entry.mountpoint for entry in table.mounts_of("8:17")] == [
+            "/media/usb stick",
+            "/srv/photos",
+        ]
+        # The filesystem root mount wins over a bind of a subdirectory
+        assert table.mountpoint_of("/dev/sdb1") == "/media/usb stick"
+        assert table.mountpoint_of("/dev/mmcblk0p2") == "/mnt/var"
+        assert table.mountpoint_of("/dev/sdz9") is None
+        assert table.mountpoints_by_devno()["8:17"] == "/media/usb stick"
+
+    def test_reads_once_until_refreshed(self, table, tmp_path):
+        assert table.generation == 1
+        # A regular file never signals a change, so the table keeps its view
+        (tmp_path / "mountinfo").write_text("")
+        assert table.is_mountpoint_active("/proc") is True
+        assert table.refresh() is True
+        assert table.is_mountpoint_active("/proc") is False
+        assert table.generation == 2
+        assert table.refresh() is False
+        assert table.generation == 2
+
+    def test_missing_mountinfo_falls_back_to_ismount(self, tmp_path, mocker):
+        mounts = MountTable(tmp_path / "missing")
+        ismount = mocker.patch.object(mount_table.os.path, "ismount", return_value=True)
+        assert mounts.available is False
+        assert mounts.is_mountpoint_active("/media/usb") is True
+        ismount.assert_called_once_with("/media/usb")
+        assert mounts.mountpoint_of("/dev/sda1") is None
+        assert mounts.fileno() is None
+
+    def test_kernel_mountinfo_is_pollable(self):
+        mounts = MountTable()
+        try:
+            if not mounts.available:
+                pytest.skip("no /proc/self/mountinfo")
+            assert mounts.fileno() is not None
+            # No mount changes between two lookups: nothing to re-read
+            assert mounts.refresh_if_changed() is False
+            assert mounts.is_mountpoint_active("/proc") is True
+        finally:
+            mounts.close()
+
+
+def test_shared_table_helpers(table, monkeypatch):
+    monkeypatch.setattr(mount_table, "_mount_table", table)
+    assert mount_table.get_mount_table() is table
+    assert mount_table.is_mountpoint_active("/srv/photos") is True
+    assert mount_table.mountpoint_of("/dev/mmcblk0p2") == "/mnt/var"
@@ -4,7 +4,7 @@ This module tests the action handlers in rpi_usb_cloner.actions.network_transfer
 which handle peer-to-peer image transfers over the network.
 """
 
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
@@ -113,6 +113,81 @@ class TestCopyImagesNetwork:
         mock_sleep.assert_called_once_with(1.5)
 
 
+class TestReplicateImagesNetwork:
+    """Test the fleet transfer flow."""
+
+    @patch.object(network_transfer_actions, "_execute_replication")
+    @patch.object(network_transfer_actions, "_enter_pin")
+    @patch.object(network_transfer_actions, "_select_peers")
+    @patch.object(network_transfer_actions, "_select_source_images")
+    def test_asks_pin_of_each_peer(
+        self,
+        mock_select_images,
+        mock_select_peers,
+        mock_enter_pin,
+        mock_execute,
+        mock_disk_images,
+        mock_peer_devices,
+    ):
+        """Test that every selected peer is authenticated with its own PIN."""
+        mock_select_images.return_value = mock_disk_images
+        mock_select_peers.return_value = mock_peer_devices
+        mock_enter_pin.side_effect = ["1111", "2222"]
+
+        network_transfer_actions.replicate_images_network(app_context=Mock())
+
+        assert [c.args for c in mock_enter_pin.call_args_list] == [("pi1",), ("pi2",)]
+        mock_execute.assert_called_once_with(
+            mock_disk_images, mock_peer_devices, {"dev1": "1111", "dev2": "2222"}
+        )
+
+    @patch.object(network_transfer_actions, "_execute_replication")
+    @patch.object(network_transfer_actions, "_enter_pin", return_value=None)
+    @patch.object(network_transfer_actions, "_select_peers")
+    @patch.object(network_transfer_actions, "_select_source_images")
+    def test_cancelled_pin_stops(
+        self,
+        mock_select_images,
+        mock_select_peers,
+        mock_enter_pin,
+        mock_execute,
+        mock_disk_images,
+        mock_peer_devices,
+    ):
+        """Test that cancelling a PIN entry sends nothing."""
+        mock_select_images.return_value = mock_disk_images
+        mock_select_peers.return_value = mock_peer_devices
+
+        network_transfer_actions.replicate_images_network(app_context=Mock())
+
+        mock_enter_pin.assert_called_once_with("pi1")
+        mock_execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_rejected_peers_left_out(self, mock_disk_images, mock_peer_devices):
+        """Test that peers refusing the PIN are reported as not replicated."""
+        replicator = Mock()
+        replicator.authenticate = AsyncMock(return_value=[mock_peer_devices[1]])
+        replicator.replicate = AsyncMock(return_value={"dev1": True})
+        progress = Mock()
+
+        with patch.object(
+            network_transfer_actions.chain_replication,
+            "ChainReplicator",
+            return_value=replicator,
+        ) as replicator_class:
+            result = await network_transfer_actions._async_replicate(
+                mock_disk_images,
+                mock_peer_devices,
+                {"dev1": "1111", "dev2": "0000"},
+                progress,
+            )
+
+        replicator_class.assert_called_once_with(mock_peer_devices)
+        replicator.replicate.assert_awaited_once_with(mock_disk_images, progress)
+        assert result == {"dev1": True, "dev2": False}
+
+
 # =============================================================================
 # Peer Selection Tests
 # =============================================================================
@@ -121,6 +196,30 @@ class TestCopyImagesNetwork:
 class TestPeerSelection:
     """Test peer selection flow."""
 
+    def test_picked_peer_listed_first(self, mock_peer_devices):
+        """Test that the peer the registry picks for the transfer leads."""
+        entries = [Mock(peer=peer) for peer in mock_peer_devices]
+        registry = Mock()
+        registry.peers.return_value = entries
+        registry.pick.return_value = entries[1]
+
+        peers = network_transfer_actions._ranked_peers(registry, 5000)
+
+        registry.pick.assert_called_once_with(5000)
+        assert [p.hostname for p in peers] == ["pi2", "pi1"]
+
+    def test_registry_refreshed_after_sending(self):
+        """Test that peers are probed again once a transfer is over."""
+        registry = Mock()
+        with patch.object(
+            network_transfer_actions.peer_registry,
+            "get_peer_registry",
+            return_value=registry,
+        ):
+            network_transfer_actions._refresh_peer_registry()
+
+        registry.probe_now.assert_called_once_with()
+
     def test_peer_discovery_returns_list(self, mock_peer_devices):
         """Test that peer discovery returns a list of peers."""
         # Just verify the fixture creates valid peers
@@ -0,0 +1,179 @@
+"""Tests for parallel multi-device erase/format jobs.
+
+Covers:
+- run_parallel_device_jobs concurrency, per-bus limits and error capture
+- bus_worker_limit sizing
+- erase_devices / format_devices per-device validation
+- select_target_devices multi-select helper
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from rpi_usb_cloner.actions.drives import _utils
+from rpi_usb_cloner.storage import format as format_module
+from rpi_usb_cloner.storage import parallel_jobs
+from rpi_usb_cloner.storage.clone import erase as erase_module
+from rpi_usb_cloner.storage.exceptions import DeviceNotFoundError
+from rpi_usb_cloner.storage.parallel_jobs import (
+    bus_worker_limit,
+    run_parallel_device_jobs,
+)
+
+
+DEVICES = [{"name": "sdb"}, {"name": "sdc"}, {"name": "sdd"}]
+
+
+def _tracking_operation(delay=0.05):
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def operation(device, progress):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        progress(["Working"], 0.5)
+        time.sleep(delay)
+        with lock:
+            state["active"] -= 1
+        return True
+
+    return operation, state
+
+
+class TestRunParallelDeviceJobs:
+    """Test run_parallel_device_jobs function."""
+
+    def test_runs_concurrently_and_reports_progress(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=None)
+        operation, state = _tracking_operation()
+        updates = []
+
+        results = run_parallel_device_jobs(
+            DEVICES,
+            operation,
+            progress_callback=lambda name, lines, ratio: updates.append((name, ratio)),
+        )
+
+        assert [r.device for r in results] == ["sdb", "sdc", "sdd"]
+        assert all(r.success for r in results)
+        assert state["peak"] == 3
+        assert ("sdc", 0.5) in updates
+        assert ("sdd", 1.0) in updates
+
+    def test_shared_usb2_bus_is_limited(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=("1", 480))
+        operation, state = _tracking_operation()
+
+        run_parallel_device_jobs(DEVICES, operation)
+
+        assert state["peak"] == 2
+
+    def test_overall_cap(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=None)
+        operation, state = _tracking_operation()
+
+        run_parallel_device_jobs(DEVICES, operation, max_workers=1)
+
+        assert state["peak"] == 1
+
+    def test_failures_are_per_device(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=None)
+
+        def operation(device, progress):
+            if device["name"] == "sdc":
+                raise RuntimeError("write error")
+            return device["name"] == "sdb"
+
+        results = run_parallel_device_jobs(DEVICES, operation)
+
+        assert [(r.success, r.error) for r in results] == [
+            (True, None),
+            (False, "write error"),
+            (False, "failed"),
+        ]
+
+    def test_duplicate_devices_rejected(self):
+        with pytest.raises(ValueError, match="Duplicate"):
+            run_parallel_device_jobs(
+                [{"name": "sdb"}, {"name": "sdb"}], lambda d, p: True
+            )
+
+
+class TestBusWorkerLimit:
+    """Test bus_worker_limit function."""
+
+    @pytest.mark.parametrize(
+        "speed,expected", [(0, 2), (12, 2), (480, 2), (5000, 4), (10000, 6)]
+    )
+    def test_limits(self, speed, expected):
+        assert bus_worker_limit(speed) == expected
+
+
+class TestBatchWrappers:
+    """Test erase_devices and format_devices."""
+
+    def test_erase_devices_runs_erase_device_per_target(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=None)
+        erase = mocker.patch.object(erase_module, "erase_device", return_value=True)
+
+        results = erase_module.erase_devices(DEVICES[:2], "zero")
+
+        assert all(r.success for r in results)
+        erased = sorted(call.args[0]["name"] for call in erase.call_args_list)
+        assert erased == ["sdb", "sdc"]
+        assert all(call.args[1] == "zero" for call in erase.call_args_list)
+
+    def test_format_devices_validates_each_device(self, mocker):
+        mocker.patch.object(parallel_jobs, "get_usb_bus", return_value=None)
+
+        def validate(device, check_unmounted=True):
+            if device["name"] == "sdc":
+                raise DeviceNotFoundError("sdc")
+
+        mocker.patch.object(
+            format_module, "validate_format_operation", side_effect=validate
+        )
+        fmt = mocker.patch.object(format_module, "format_device", return_value=True)
+
+        results = format_module.format_devices(DEVICES[:2], "vfat", "quick")
+
+        assert [r.success for r in results] == [True, False]
+        assert [call.args[0]["name"] for call in fmt.call_args_list] == ["sdb"]
+
+
+class TestSelectTargetDevices:
+    """Test select_target_devices helper."""
+
+    def test_single_device_skips_selection(self, mocker):
+        select = mocker.patch.object(_utils.menus, "select_menu_screen_list")
+        assert _utils.select_target_devices("T", [DEVICES[0]], DEVICES[0]) == [
+            DEVICES[0]
+        ]
+        select.assert_not_called()
+
+    def test_toggle_and_continue(self, mocker):
+        mocker.patch.object(
+            _utils, "format_device_label", side_effect=lambda d: d["name"]
+        )
+        # Tick sdd, untick sdb, then CONTINUE
+        select = mocker.patch.object(
+            _utils.menus, "select_menu_screen_list", side_effect=[2, 0, 3]
+        )
+
+        chosen = _utils.select_target_devices("T", DEVICES, DEVICES[0])
+
+        assert [d["name"] for d in chosen] == ["sdd"]
+        first_items = select.call_args_list[0].args[1]
+        assert first_items == ["[x] sdb", "[ ] sdc", "[ ] sdd", "CONTINUE (1)"]
+
+    def test_cancel_returns_none(self, mocker):
+        mocker.patch.object(
+            _utils, "format_device_label", side_effect=lambda d: d["name"]
+        )
+        mocker.patch.object(_utils.menus, "select_menu_screen_list", return_value=None)
+        assert _utils.select_target_devices("T", DEVICES, DEVICES[0]) is None
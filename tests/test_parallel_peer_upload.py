@@ -0,0 +1,244 @@
+"""Tests for parallel peer uploads and the threaded server write path.
+
+Covers:
+- out-of-order blocks in partial files
+- planning byte ranges for parallel streams
+- the bounded writer queue on the server
+- concurrent ranged uploads end to end
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+import threading
+import time
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import (
+    peer_transfer_client,
+    peer_transfer_server,
+    resumable_transfer,
+)
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.services.resumable_transfer import PartialFile
+
+
+BLOCK = 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(resumable_transfer, "BLOCK_BYTES", BLOCK)
+    monkeypatch.setattr(peer_transfer_client, "MIN_RANGE_BYTES", 2 * BLOCK)
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    repo_path = tmp_path / "receiver"
+    repo_path.mkdir()
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+    yield server, token
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+class TestOutOfOrderBlocks:
+    """Test partial files filled in any order."""
+
+    def test_sparse_blocks_survive_restart(self, tmp_path):
+        data = os.urandom(4 * BLOCK + 10)
+        dest = tmp_path / "debian.iso"
+        partial = PartialFile.open(dest, len(data), "id")
+        writer = partial.writer(3, 5)
+        writer.write(data[3 * BLOCK :])
+        writer.close()
+        writer = partial.writer(0, 1)
+        writer.write(data[:BLOCK])
+        writer.close()
+        partial.close()
+
+        resumed = PartialFile.open(dest, len(data), "id")
+        assert resumed.missing() == [1, 2]
+        assert resumed.received == BLOCK
+        assert resumed.received_bytes == 2 * BLOCK + 10
+        writer = resumed.writer(1, 3)
+        writer.write(data[BLOCK : 3 * BLOCK])
+        writer.close()
+        resumed.commit()
+
+        assert dest.read_bytes() == data
+
+    def test_range_writer_stops_at_range_end(self, tmp_path):
+        partial = PartialFile.open(tmp_path / "dest", 4 * BLOCK, "id")
+        writer = partial.writer(1, 2)
+        try:
+            with pytest.raises(ValueError):
+                writer.write(b"x" * (BLOCK + 1))
+        finally:
+            writer.close()
+            partial.close()
+
+
+class TestPlanRanges:
+    """Test splitting missing blocks over upload streams."""
+
+    def test_splits_across_streams(self):
+        assert peer_transfer_client._plan_ranges(list(range(12)), 4, 1) == [
+            (0, 3),
+            (3, 6),
+            (6, 9),
+            (9, 12),
+        ]
+
+    def test_small_files_stay_whole(self):
+        assert peer_transfer_client._plan_ranges([0, 1, 2], 4, 16) == [(0, 3)]
+
+    def test_gaps_start_new_ranges(self):
+        assert peer_transfer_client._plan_ranges([0, 1, 5, 6, 9], 1, 16) == [
+            (0, 2),
+            (5, 7),
+            (9, 10),
+        ]
+
+
+class BlockingWriter:
+    def __init__(self, fail_on=None):
+        self.written = []
+        self.release = threading.Event()
+        self.fail_on = fail_on
+        self.closed = False
+
+    def write(self, data):
+        self.release.wait(5)
+        if data == self.fail_on:
+            raise OSError("No space left on device")
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class TestQueuedWriter:
+    """Test the server's bounded, thread-backed writer."""
+
+    @pytest.mark.asyncio
+    async def test_waits_only_when_queue_full(self):
+        target = BlockingWriter()
+        sink = peer_transfer_server._QueuedWriter(target, depth=2)
+
+        await asyncio.wait_for(sink.write(b"a"), 1)
+        await asyncio.wait_for(sink.write(b"b"), 1)
+        third = asyncio.ensure_future(sink.write(b"c"))
+        await asyncio.sleep(0.05)
+        assert not third.done()
+
+        target.release.set()
+        await asyncio.wait_for(third, 1)
+        await sink.close()
+
+        assert target.written == [b"a", b"b", b"c"]
+        assert target.closed
+
+    @pytest.mark.asyncio
+    async def test_failure_drops_later_chunks(self):
+        target = BlockingWriter(fail_on=b"b")
+        target.release.set()
+        sink = peer_transfer_server._QueuedWriter(target, depth=4)
+
+        with pytest.raises(OSError, match="No space"):
+            for chunk in (b"a", b"b", b"c", b"d"):
+                await sink.write(chunk)
+            await sink.close()
+
+        await sink.close()
+        assert target.written == [b"a"]
+        assert target.closed
+
+
+class TestParallelUploads:
+    """Test concurrent ranged uploads between a client and server."""
+
+    @pytest.mark.asyncio
+    async def test_ranges_sent_concurrently(self, aiohttp_client, receiver, tmp_path):
+        server, token = receiver
+        ranges = []
+        active = [0, 0]
+        handle_upload = server._handle_resumable_upload
+
+        async def track(request, image_name):
+            ranges.append(
+                (
+                    int(request.headers["X-Upload-Offset"]),
+                    int(request.headers["X-Upload-End"]),
+                )
+            )
+            active[0] += 1
+            active[1] = max(active)
+            try:
+                await asyncio.sleep(0.05)
+                return await handle_upload(request, image_name)
+            finally:
+                active[0] -= 1
+
+        server._handle_resumable_upload = track
+        _session, base_url = await aiohttp_client(server._build_app())
+        client = peer_transfer_client.TransferClient(
+            PeerDevice(
+                hostname="peer",
+                address="127.0.0.1",
+                port=0,
+                device_id="test",
+                txt_records={},
+            ),
+            streams=3,
+        )
+        client.base_url = base_url
+        client.session_token = token
+        source = tmp_path / "debian.iso"
+        source.write_bytes(os.urandom(9 * BLOCK + 3))
+
+        result = await client.send_images(
+            [DiskImage(name="debian.iso", path=source, image_type=ImageType.ISO)]
+        )
+
+        assert result == (1, 0)
+        # 10 blocks over 3 streams
+        assert sorted(ranges) == [
+            (0, 4 * BLOCK),
+            (4 * BLOCK, 8 * BLOCK),
+            (8 * BLOCK, 9 * BLOCK + 3),
+        ]
+        assert active[1] == 3
+        received = server.destination_repo.path / "debian.iso"
+        assert received.read_bytes() == source.read_bytes()
+        assert server._partials == {}
+
+    @pytest.mark.asyncio
+    async def test_misaligned_range_rejected(self, aiohttp_client, receiver):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "X-Image-Type": "iso",
+            "X-Upload-Size": str(4 * BLOCK),
+            "X-Upload-Source": "s",
+            "X-Upload-Offset": str(BLOCK + 1),
+        }
+
+        async with session.post(
+            f"{base_url}/upload/debian.iso", data=b"x", headers=headers
+        ) as resp:
+            assert resp.status == 409
+            assert (await resp.json())["block_bytes"] == BLOCK
+        assert server._partials == {}
@@ -0,0 +1,273 @@
+"""Tests for the native partclone image reader.
+
+Covers:
+- parse_partclone_header validation
+- iter_used_block_runs / iter_bitmap_runs for bit and byte bitmaps
+- restore_partclone_stream / restore_partclone_image sparse restore
+- read_partclone_header on split compressed volumes
+- restore_partition_op fallback when partclone is missing
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import shutil
+import struct
+from pathlib import Path
+
+import pytest
+
+from rpi_usb_cloner.storage.clonezilla import partclone_image, restore
+from rpi_usb_cloner.storage.clonezilla.models import PartitionRestoreOp
+from rpi_usb_cloner.storage.clonezilla.partclone_image import (
+    BITMAP_MODE_BIT,
+    BITMAP_MODE_BYTE,
+    HEADER_SIZE,
+    iter_bitmap_runs,
+    iter_used_block_runs,
+    parse_partclone_header,
+    read_partclone_header,
+    restore_partclone_image,
+    restore_partclone_stream,
+)
+
+
+BLOCK = 512
+
+
+def _build_image(
+    used: list[int],
+    total_blocks: int = 20,
+    *,
+    bitmap_mode: int = BITMAP_MODE_BIT,
+    blocks_per_checksum: int = 1,
+    checksum_size: int = 4,
+) -> bytes:
+    """Build a v2 partclone image whose used blocks contain their index."""
+    header = struct.pack(
+        "<16s14s4sH16sQQQQIIHHHHIBBI",
+        b"partclone-image\x00",
+        b"0.3.27",
+        b"0002",
+        0xC0DE,
+        b"EXTFS",
+        total_blocks * BLOCK,
+        total_blocks,
+        len(used),
+        len(used),
+        BLOCK,
+        0,
+        2,
+        64,
+        0x20 if checksum_size else 0,
+        checksum_size,
+        blocks_per_checksum,
+        1,
+        bitmap_mode,
+        0,
+    )
+    if bitmap_mode == BITMAP_MODE_BIT:
+        bits = bytearray((total_blocks + 7) // 8)
+        for block in used:
+            bits[block // 8] |= 1 << (block % 8)
+        bitmap = bytes(bits) + b"CRC!"
+    else:
+        bitmap = bytes(1 if block in used else 0 for block in range(total_blocks))
+    data = bytearray()
+    for count, block in enumerate(sorted(used), start=1):
+        data += bytes([block + 1]) * BLOCK
+        if blocks_per_checksum and count % blocks_per_checksum == 0:
+            data += b"\xaa" * checksum_size
+    return header + bitmap + bytes(data)
+
+
+class TestParseHeader:
+    """Test parse_partclone_header function."""
+
+    def test_parses_fields(self):
+        header = parse_partclone_header(_build_image([1, 2, 3]))
+        assert header.fs == "EXTFS"
+        assert header.partclone_version == "0.3.27"
+        assert header.used_blocks == 3
+        assert header.used_bytes == 3 * BLOCK
+        assert header.device_size == 20 * BLOCK
+        assert header.bitmap_bytes == 3
+
+    def test_rejects_non_partclone(self):
+        with pytest.raises(ValueError, match="Not a partclone image"):
+            parse_partclone_header(b"\x00" * HEADER_SIZE)
+
+    def test_rejects_v1(self):
+        image = bytearray(_build_image([1]))
+        image[30:34] = b"0001"
+        with pytest.raises(ValueError, match="Unsupported partclone image version"):
+            parse_partclone_header(bytes(image))
+
+
+class TestUsedBlockRuns:
+    """Test iter_used_block_runs function."""
+
+    def test_bit_bitmap_runs(self):
+        image = _build_image([0, 1, 2, 7, 8, 15, 19])
+        stream = io.BytesIO(image)
+        header = parse_partclone_header(stream.read(HEADER_SIZE))
+
+        runs = list(iter_used_block_runs(stream, header))
+
+        assert runs == [(0, 3), (7, 2), (15, 1), (19, 1)]
+        # Bitmap and its CRC are consumed; data for block 0 follows
+        assert stream.read(1) == b"\x01"
+
+    def test_byte_bitmap_runs(self):
+        image = _build_image([3, 4, 10], bitmap_mode=BITMAP_MODE_BYTE)
+        stream = io.BytesIO(image)
+        header = parse_partclone_header(stream.read(HEADER_SIZE))
+
+        assert list(iter_used_block_runs(stream, header)) == [(3, 2), (10, 1)]
+
+    def test_runs_merge_across_chunks(self, monkeypatch):
+        monkeypatch.setattr(partclone_image, "BITMAP_CHUNK_BYTES", 1)
+        image = _build_image([6, 7, 8, 9])
+        stream = io.BytesIO(image)
+        header = parse_partclone_header(stream.read(HEADER_SIZE))
+
+        assert list(iter_used_block_runs(stream, header)) == [(6, 4)]
+
+    def test_runs_from_raw_bitmap_are_lazy(self):
+        image = _build_image([1, 4, 5, 12])
+        header = parse_partclone_header(image)
+        bitmap = image[HEADER_SIZE : HEADER_SIZE + header.bitmap_bytes]
+
+        runs = iter_bitmap_runs(bitmap, header)
+
+        assert next(runs) == (1, 1)
+        assert list(runs) == [(4, 2), (12, 1)]
+
+
+class TestRestoreStream:
+    """Test restore_partclone_stream function."""
+
+    @pytest.fixture
+    def target(self, tmp_path):
+        path = tmp_path / "part.img"
+        path.write_bytes(b"\xee" * (20 * BLOCK))
+        return path
+
+    @pytest.mark.parametrize("blocks_per_checksum", [0, 1, 2])
+    def test_writes_used_blocks_and_skips_unused(self, target, blocks_per_checksum):
+        used = [0, 1, 5, 6, 7, 19]
+        image = _build_image(used, blocks_per_checksum=blocks_per_checksum)
+        updates = []
+
+        written = restore_partclone_stream(
+            io.BytesIO(image),
+            str(target),
+            progress_callback=lambda lines, ratio: updates.append(ratio),
+        )
+
+        assert written == len(used) * BLOCK
+        data = target.read_bytes()
+        for block in range(20):
+            chunk = data[block * BLOCK : (block + 1) * BLOCK]
+            expected = bytes([block + 1]) if block in used else b"\xee"
+            assert chunk == expected * BLOCK
+        assert updates[-1] == 1.0
+
+    @pytest.mark.parametrize("buffer_blocks", [1, 2, 3])
+    @pytest.mark.parametrize("blocks_per_checksum", [0, 2])
+    def test_runs_split_across_write_buffers(
+        self, target, monkeypatch, buffer_blocks, blocks_per_checksum
+    ):
+        monkeypatch.setattr(
+            partclone_image, "WRITE_BUFFER_BYTES", buffer_blocks * BLOCK
+        )
+        used = [2, 3, 4, 5, 6, 10, 11, 18]
+        image = _build_image(used, blocks_per_checksum=blocks_per_checksum)
+
+        written = restore_partclone_stream(
+            io.BytesIO(image), str(target), progress_callback=lambda *args: None
+        )
+
+        assert written == len(used) * BLOCK
+        data = target.read_bytes()
+        for block in range(20):
+            chunk = data[block * BLOCK : (block + 1) * BLOCK]
+            expected = bytes([block + 1]) if block in used else b"\xee"
+            assert chunk == expected * BLOCK
+
+    def test_target_too_small_raises(self, tmp_path):
+        target = tmp_path / "small.img"
+        target.write_bytes(b"\x00" * BLOCK)
+        with pytest.raises(RuntimeError, match="Target partition too small"):
+            restore_partclone_stream(
+                io.BytesIO(_build_image([0])),
+                str(target),
+                progress_callback=lambda lines, ratio: None,
+            )
+
+    def test_truncated_image_raises(self, target):
+        image = _build_image([0, 1, 2])[:-BLOCK]
+        with pytest.raises(RuntimeError, match="Unexpected end"):
+            restore_partclone_stream(
+                io.BytesIO(image),
+                str(target),
+                progress_callback=lambda lines, ratio: None,
+            )
+
+
+needs_gzip = pytest.mark.skipif(
+    not (shutil.which("cat") and shutil.which("gzip")), reason="Requires cat and gzip"
+)
+
+
+@needs_gzip
+class TestImageFiles:
+    """Test reading split gzip image volumes."""
+
+    @pytest.fixture
+    def image_files(self, tmp_path) -> list[Path]:
+        compressed = gzip.compress(_build_image([2, 3, 4]))
+        middle = len(compressed) // 2
+        first = tmp_path / "sda1.ext4-ptcl-img.gz.aa"
+        second = tmp_path / "sda1.ext4-ptcl-img.gz.ab"
+        first.write_bytes(compressed[:middle])
+        second.write_bytes(compressed[middle:])
+        return [second, first]
+
+    def test_read_header(self, image_files):
+        header = read_partclone_header(image_files)
+        assert header is not None
+        assert header.used_bytes == 3 * BLOCK
+
+    def test_restore_image(self, image_files, tmp_path):
+        target = tmp_path / "part.img"
+        target.write_bytes(bytes(20 * BLOCK))
+
+        written = restore_partclone_image(
+            image_files, str(target), progress_callback=lambda lines, ratio: None
+        )
+
+        assert written == 3 * BLOCK
+        assert target.read_bytes()[2 * BLOCK : 3 * BLOCK] == b"\x03" * BLOCK
+
+    def test_restore_partition_op_without_tool(self, image_files, tmp_path, mocker):
+        mocker.patch.object(restore, "get_partclone_tool", return_value=None)
+        target = tmp_path / "part.img"
+        target.write_bytes(bytes(20 * BLOCK))
+        op = PartitionRestoreOp(
+            partition="sda1",
+            image_files=image_files,
+            tool="partclone",
+            fstype="ntfs",
+            compressed=True,
+        )
+
+        restore.restore_partition_op(
+            op,
+            str(target),
+            title="sda1",
+            progress_callback=lambda lines, ratio: None,
+        )
+
+        assert target.read_bytes()[4 * BLOCK : 5 * BLOCK] == b"\x05" * BLOCK
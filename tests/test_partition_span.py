@@ -0,0 +1,261 @@
+"""Tests for partitioned-span detection and GPT backup rebuilding.
+
+Covers:
+- read_partition_span for MBR, GPT and unpartitioned devices
+- write_gpt_backup on same-size, larger and too-small targets
+- Exact clone limiting dd to the partitioned span
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+from rpi_usb_cloner.storage.clone import operations
+from rpi_usb_cloner.storage.clone.partition_span import (
+    PartitionSpan,
+    read_partition_span,
+    write_gpt_backup,
+)
+
+
+SECTOR = 512
+ENTRY_COUNT = 128
+ENTRY_SIZE = 128
+ENTRY_SECTORS = ENTRY_COUNT * ENTRY_SIZE // SECTOR
+
+
+def _header(my_lba, alternate_lba, last_usable, entries_lba, entries_crc):
+    values = [
+        b"EFI PART",
+        0x00010000,
+        92,
+        0,
+        0,
+        my_lba,
+        alternate_lba,
+        34,
+        last_usable,
+        b"G" * 16,
+        entries_lba,
+        ENTRY_COUNT,
+        ENTRY_SIZE,
+        entries_crc,
+    ]
+    packed = bytearray(SECTOR)
+    struct.pack_into("<8sIIII QQQQ 16s QIII", packed, 0, *values)
+    struct.pack_into("<I", packed, 16, zlib.crc32(bytes(packed[:92])) & 0xFFFFFFFF)
+    return bytes(packed)
+
+
+def _build_gpt_disk(path, total_sectors, partitions):
+    """Write a minimal valid GPT disk (protective MBR, primary and backup)."""
+    entries = bytearray(ENTRY_COUNT * ENTRY_SIZE)
+    for index, (first, last) in enumerate(partitions):
+        offset = index * ENTRY_SIZE
+        entries[offset : offset + 16] = b"T" * 16
+        entries[offset + 16 : offset + 32] = bytes([index + 1]) * 16
+        struct.pack_into("<QQ", entries, offset + 32, first, last)
+    entries_crc = zlib.crc32(bytes(entries)) & 0xFFFFFFFF
+    last_lba = total_sectors - 1
+    last_usable = last_lba - ENTRY_SECTORS - 1
+
+    mbr = bytearray(SECTOR)
+    mbr[446 + 4] = 0xEE
+    struct.pack_into("<II", mbr, 446 + 8, 1, total_sectors - 1)
+    mbr[510:512] = b"\x55\xaa"
+
+    with path.open("wb") as handle:
+        handle.truncate(total_sectors * SECTOR)
+        handle.write(bytes(mbr))
+        handle.write(_header(1, last_lba, last_usable, 2, entries_crc))
+        handle.write(bytes(entries))
+        handle.seek((last_lba - ENTRY_SECTORS) * SECTOR)
+        handle.write(bytes(entries))
+        handle.write(
+            _header(last_lba, 1, last_usable, last_lba - ENTRY_SECTORS, entries_crc)
+        )
+
+
+def _build_mbr_disk(path, total_sectors, partitions):
+    mbr = bytearray(SECTOR)
+    for index, (part_type, start, count) in enumerate(partitions):
+        offset = 446 + index * 16
+        mbr[offset + 4] = part_type
+        struct.pack_into("<II", mbr, offset + 8, start, count)
+    mbr[510:512] = b"\x55\xaa"
+    with path.open("wb") as handle:
+        handle.truncate(total_sectors * SECTOR)
+        handle.write(bytes(mbr))
+
+
+class TestReadPartitionSpan:
+    """Test read_partition_span function."""
+
+    def test_gpt_span_ends_at_last_partition(self, tmp_path):
+        disk = tmp_path / "gpt.img"
+        _build_gpt_disk(disk, 16384, [(2048, 4095), (4096, 6143)])
+
+        span = read_partition_span(str(disk), sector_size=SECTOR)
+
+        assert span == PartitionSpan("gpt", SECTOR, 6144)
+        assert span.end_bytes == 6144 * SECTOR
+
+    def test_gpt_bad_crc_returns_none(self, tmp_path):
+        disk = tmp_path / "gpt.img"
+        _build_gpt_disk(disk, 16384, [(2048, 4095)])
+        with disk.open("r+b") as handle:
+            handle.seek(SECTOR + 40)
+            handle.write(b"\x01")
+        assert read_partition_span(str(disk), sector_size=SECTOR) is None
+
+    def test_mbr_span_uses_primary_entries(self, tmp_path):
+        disk = tmp_path / "mbr.img"
+        # FAT32 partition plus an extended container holding logical drives
+        _build_mbr_disk(disk, 20000, [(0x0C, 2048, 4096), (0x05, 6144, 8000)])
+
+        span = read_partition_span(str(disk), sector_size=SECTOR)
+
+        assert span == PartitionSpan("dos", SECTOR, 14144)
+
+    def test_empty_mbr_returns_none(self, tmp_path):
+        disk = tmp_path / "mbr.img"
+        _build_mbr_disk(disk, 20000, [])
+
+        assert read_partition_span(str(disk), sector_size=SECTOR) is None
+
+    @pytest.mark.parametrize(
+        ("offset", "fs_id"),
+        [(54, b"FAT16   "), (82, b"FAT32   "), (3, b"EXFAT   "), (3, b"NTFS    ")],
+    )
+    def test_superfloppy_boot_record_returns_none(self, tmp_path, offset, fs_id):
+        disk = tmp_path / "superfloppy.img"
+        boot = bytearray(SECTOR)
+        boot[0:3] = b"\xeb\x58\x90"
+        if offset != 3:
+            boot[3:11] = b"mkfs.fat"
+        boot[offset : offset + len(fs_id)] = fs_id
+        # Boot code bytes that happen to look like a partition entry
+        boot[446:462] = bytes(range(0x30, 0x40))
+        boot[510:512] = b"\x55\xaa"
+        with disk.open("wb") as handle:
+            handle.truncate(20000 * SECTOR)
+            handle.write(bytes(boot))
+
+        assert read_partition_span(str(disk), sector_size=SECTOR) is None
+
+    def test_mbr_with_jump_boot_code_is_still_read(self, tmp_path):
+        disk = tmp_path / "mbr.img"
+        _build_mbr_disk(disk, 20000, [(0x83, 2048, 4096)])
+        with disk.open("r+b") as handle:
+            # GRUB's boot code starts with a jump too
+            handle.write(b"\xeb\x63\x90")
+
+        span = read_partition_span(str(disk), sector_size=SECTOR)
+
+        assert span == PartitionSpan("dos", SECTOR, 6144)
+
+    def test_unpartitioned_returns_none(self, tmp_path):
+        disk = tmp_path / "blank.img"
+        disk.write_bytes(bytes(SECTOR * 8))
+        assert read_partition_span(str(disk), sector_size=SECTOR) is None
+
+    def test_missing_device_returns_none(self, tmp_path):
+        assert read_partition_span(str(tmp_path / "nope"), sector_size=SECTOR) is None
+
+
+class TestWriteGptBackup:
+    """Test write_gpt_backup function."""
+
+    def _copy_span(self, source, target, span_sectors, target_sectors):
+        data = source.read_bytes()[: span_sectors * SECTOR]
+        with target.open("wb") as handle:
+            handle.truncate(target_sectors * SECTOR)
+            handle.write(data)
+
+    def test_same_size_target_is_bit_exact(self, tmp_path):
+        source = tmp_path / "source.img"
+        target = tmp_path / "target.img"
+        _build_gpt_disk(source, 16384, [(2048, 4095)])
+        self._copy_span(source, target, 4096, 16384)
+
+        write_gpt_backup(str(target), sector_size=SECTOR)
+
+        source_data = source.read_bytes()
+        target_data = target.read_bytes()
+        tail = (ENTRY_SECTORS + 1) * SECTOR
+        assert target_data[: 4096 * SECTOR] == source_data[: 4096 * SECTOR]
+        assert target_data[-tail:] == source_data[-tail:]
+
+    def test_larger_target_relocates_backup(self, tmp_path):
+        source = tmp_path / "source.img"
+        target = tmp_path / "target.img"
+        _build_gpt_disk(source, 16384, [(2048, 4095)])
+        self._copy_span(source, target, 4096, 32768)
+
+        write_gpt_backup(str(target), sector_size=SECTOR)
+
+        data = target.read_bytes()
+        backup = data[-SECTOR:]
+        assert backup[:8] == b"EFI PART"
+        my_lba, alternate = struct.unpack_from("<QQ", backup, 24)
+        assert (my_lba, alternate) == (32767, 1)
+        assert struct.unpack_from("<Q", data, SECTOR + 32)[0] == 32767
+        # Both headers carry valid CRCs, so the table reads back cleanly
+        assert read_partition_span(str(target), sector_size=SECTOR) == PartitionSpan(
+            "gpt", SECTOR, 4096
+        )
+        for header in (data[SECTOR : SECTOR * 2], backup):
+            crc = struct.unpack_from("<I", header, 16)[0]
+            zeroed = header[:16] + bytes(4) + header[20:92]
+            assert zlib.crc32(zeroed) & 0xFFFFFFFF == crc
+
+    def test_target_too_small_raises(self, tmp_path):
+        source = tmp_path / "source.img"
+        target = tmp_path / "target.img"
+        _build_gpt_disk(source, 16384, [(2048, 12000)])
+        self._copy_span(source, target, 64, 8192)
+
+        with pytest.raises(RuntimeError, match="too small"):
+            write_gpt_backup(str(target), sector_size=SECTOR)
+
+
+class TestExactCloneSpan:
+    """Test exact clone_device limiting the copy to the partitioned span."""
+
+    @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
+    @patch("rpi_usb_cloner.storage.clone.operations.write_gpt_backup")
+    @patch("rpi_usb_cloner.storage.clone.operations.clone_dd")
+    @patch("rpi_usb_cloner.storage.clone.operations.unmount_device")
+    def test_exact_clone_copies_span_and_rebuilds_gpt(
+        self, mock_unmount, mock_dd, mock_backup, mock_display
+    ):
+        source = {"name": "sda", "size": 128 * 1024**3}
+        target = {"name": "sdb", "size": 128 * 1024**3}
+        span = PartitionSpan("gpt", SECTOR, 16 * 1024**2)
+
+        with patch.object(operations, "read_partition_span", return_value=span):
+            assert operations.clone_device(source, target, mode="exact")
+
+        assert mock_dd.call_args.kwargs["byte_count"] == span.end_bytes
+        assert mock_dd.call_args.kwargs["total_bytes"] == span.end_bytes
+        mock_backup.assert_called_once_with("/dev/sdb", sector_size=SECTOR)
+
+    @patch("rpi_usb_cloner.storage.clone.operations.display_lines")
+    @patch("rpi_usb_cloner.storage.clone.operations.write_gpt_backup")
+    @patch("rpi_usb_cloner.storage.clone.operations.clone_dd")
+    @patch("rpi_usb_cloner.storage.clone.operations.unmount_device")
+    def test_exact_clone_without_table_copies_whole_device(
+        self, mock_unmount, mock_dd, mock_backup, mock_display
+    ):
+        source = {"name": "sda", "size": 32000000000}
+        target = {"name": "sdb", "size": 32000000000}
+
+        with patch.object(operations, "read_partition_span", return_value=None):
+            assert operations.clone_device(source, target, mode="exact")
+
+        assert "byte_count" not in mock_dd.call_args.kwargs
+        mock_backup.assert_not_called()
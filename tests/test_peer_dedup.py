@@ -0,0 +1,300 @@
+"""Tests for deduplicated peer transfers.
+
+Covers:
+- the persistent block digest index of a repo
+- filling partial files from identical local blocks
+- skipping files and blocks the receiver already holds
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import secrets
+import time
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import (
+    peer_transfer_client,
+    peer_transfer_server,
+    resumable_transfer,
+)
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.services.resumable_transfer import PartialFile
+from rpi_usb_cloner.storage import block_index, image_repo, sidecar_index
+from rpi_usb_cloner.storage.block_index import BlockIndex
+
+
+BLOCK = 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(resumable_transfer, "BLOCK_BYTES", BLOCK)
+    monkeypatch.setattr(sidecar_index, "SETTLE_SECONDS", 0)
+    block_index.clear_block_indexes()
+    yield
+    block_index.clear_block_indexes()
+
+
+def age(path, seconds=60):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+class TestBlockIndex:
+    """Test the repo block digest index."""
+
+    def test_hashes_only_changed_files(self, tmp_path, mocker):
+        image = tmp_path / "debian.iso"
+        image.write_bytes(os.urandom(3 * BLOCK + 7))
+        hashed = mocker.spy(block_index, "hash_blocks")
+        index = BlockIndex(tmp_path)
+
+        blocks = index.file_blocks(image, BLOCK)
+        assert len(blocks) == 4
+        assert index.file_blocks(image, BLOCK) == blocks
+        assert hashed.call_count == 1
+
+        assert index.save()
+        reloaded = BlockIndex(tmp_path)
+        assert reloaded.file_blocks(image, BLOCK) == blocks
+        assert hashed.call_count == 1
+
+        image.write_bytes(os.urandom(BLOCK))
+        assert len(reloaded.file_blocks(image, BLOCK)) == 1
+        assert hashed.call_count == 2
+
+    def test_recent_files_not_stored(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sidecar_index, "SETTLE_SECONDS", 60)
+        image = tmp_path / "debian.iso"
+        image.write_bytes(b"x" * BLOCK)
+        index = BlockIndex(tmp_path)
+
+        index.file_blocks(image, BLOCK)
+        assert not index.save()
+
+        age(image)
+        index.file_blocks(image, BLOCK)
+        assert index.save()
+
+    def test_locate(self, tmp_path):
+        data = os.urandom(2 * BLOCK)
+        image = tmp_path / "sub" / "stick.bin"
+        image.parent.mkdir()
+        image.write_bytes(data)
+        index = BlockIndex(tmp_path, persist=False)
+        blocks = index.file_blocks(image, BLOCK)
+
+        assert index.locate(blocks[1], BLOCK) == (image, BLOCK)
+        assert index.locate(blocks[1], 2 * BLOCK) is None
+        assert index.locate("00" * 32, BLOCK) is None
+
+
+class TestFillFromLocal:
+    """Test copying identical blocks into partial files."""
+
+    def test_reuses_matching_blocks(self, tmp_path):
+        old = os.urandom(4 * BLOCK)
+        new = old[: 2 * BLOCK] + os.urandom(BLOCK) + old[3 * BLOCK :]
+        local = tmp_path / "old.iso"
+        local.write_bytes(old)
+        index = BlockIndex(tmp_path, persist=False)
+        index.file_blocks(local, BLOCK)
+        # Truncated since it was indexed, so the last block is not there
+        local.write_bytes(old[: 3 * BLOCK])
+        wanted = [
+            hashlib.sha256(new[start : start + BLOCK]).hexdigest()
+            for start in range(0, len(new), BLOCK)
+        ]
+
+        partial = PartialFile.open(tmp_path / "new.iso", len(new), "id")
+        filled = resumable_transfer.fill_from_local(
+            partial, wanted, lambda digest: index.locate(digest, BLOCK)
+        )
+
+        assert filled == 2
+        assert partial.missing() == [2, 3]
+        partial.close()
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    repo_path = tmp_path / "receiver"
+    repo_path.mkdir()
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+    yield server, token
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+@pytest.fixture
+def uploads(receiver):
+    """Byte ranges of every upload request the receiver gets."""
+    server, _token = receiver
+    ranges = []
+    handle_upload = server._handle_resumable_upload
+
+    async def record_range(request, image_name):
+        ranges.append(
+            (
+                request.headers["X-Upload-File"] or image_name,
+                int(request.headers["X-Upload-Offset"]),
+                int(request.headers["X-Upload-End"]),
+            )
+        )
+        return await handle_upload(request, image_name)
+
+    server._handle_resumable_upload = record_range
+    return ranges
+
+
+async def start_peer(aiohttp_client, server, token):
+    _session, base_url = await aiohttp_client(server._build_app())
+    client = peer_transfer_client.TransferClient(
+        PeerDevice(
+            hostname="peer",
+            address="127.0.0.1",
+            port=0,
+            device_id="test",
+            txt_records={},
+        )
+    )
+    client.base_url = base_url
+    client.session_token = token
+    return client
+
+
+@pytest.fixture
+def sender_repo(tmp_path):
+    repo = tmp_path / "sender"
+    repo.mkdir()
+    (repo / image_repo.REPO_FLAG_FILENAME).touch()
+    return repo
+
+
+class TestDedupedUploads:
+    """Test transfers to a peer that already holds some of the data."""
+
+    @pytest.mark.asyncio
+    async def test_identical_image_not_sent_again(
+        self, aiohttp_client, receiver, uploads, sender_repo
+    ):
+        server, token = receiver
+        client = await start_peer(aiohttp_client, server, token)
+        iso = sender_repo / "debian.iso"
+        iso.write_bytes(os.urandom(5 * BLOCK + 3))
+        image = DiskImage(name="debian.iso", path=iso, image_type=ImageType.ISO)
+
+        assert await client.send_images([image]) == (1, 0)
+        assert uploads
+        uploads.clear()
+        progress = []
+        assert await client.send_images(
+            [image], lambda name, ratio: progress.append(ratio)
+        ) == (1, 0)
+
+        assert uploads == []
+        assert progress[-1] == 1.0
+        assert (server.destination_repo.path / "debian.iso").read_bytes() == (
+            iso.read_bytes()
+        )
+        # The sender's digests were kept for the next transfer
+        assert (sender_repo / block_index.BLOCK_INDEX_FILENAME).exists()
+
+    @pytest.mark.asyncio
+    async def test_only_changed_blocks_sent(
+        self, aiohttp_client, receiver, uploads, sender_repo
+    ):
+        server, token = receiver
+        client = await start_peer(aiohttp_client, server, token)
+        image_dir = sender_repo / "clonezilla" / "backup"
+        image_dir.mkdir(parents=True)
+        volume = image_dir / "sda1.dd-ptcl-img.uncomp.aa"
+        volume.write_bytes(os.urandom(6 * BLOCK))
+        (image_dir / "parts").write_text("sda1\n")
+        image = DiskImage(
+            name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR
+        )
+        assert await client.send_images([image]) == (1, 0)
+        uploads.clear()
+
+        data = bytearray(volume.read_bytes())
+        data[2 * BLOCK + 10] ^= 0xFF
+        volume.write_bytes(bytes(data))
+        age(volume)
+        assert await client.send_images([image]) == (1, 0)
+
+        # "parts" was already there and only block 2 of the volume changed
+        assert uploads == [(volume.name, 2 * BLOCK, 3 * BLOCK)]
+        received = server.destination_repo.path / "clonezilla" / "backup"
+        assert (received / volume.name).read_bytes() == bytes(data)
+        assert not list(received.glob("*.part*"))
+
+    @pytest.mark.asyncio
+    async def test_copy_under_new_name_built_locally(
+        self, aiohttp_client, receiver, uploads, sender_repo
+    ):
+        server, token = receiver
+        client = await start_peer(aiohttp_client, server, token)
+        iso = sender_repo / "debian.iso"
+        iso.write_bytes(os.urandom(4 * BLOCK))
+        renamed = sender_repo / "debian-copy.iso"
+        renamed.write_bytes(iso.read_bytes())
+        assert await client.send_images(
+            [DiskImage(name="debian.iso", path=iso, image_type=ImageType.ISO)]
+        ) == (1, 0)
+        uploads.clear()
+
+        assert await client.send_images(
+            [DiskImage(name="debian-copy.iso", path=renamed, image_type=ImageType.ISO)]
+        ) == (1, 0)
+
+        assert uploads == []
+        assert (server.destination_repo.path / "debian-copy.iso").read_bytes() == (
+            iso.read_bytes()
+        )
+
+    @pytest.mark.asyncio
+    async def test_present_files_not_counted_against_space(
+        self, aiohttp_client, receiver, mocker
+    ):
+        server, token = receiver
+        existing = server.destination_repo.path / "debian.iso"
+        existing.write_bytes(os.urandom(2 * BLOCK))
+        age(existing)
+        blocks = block_index.hash_blocks(existing, BLOCK)
+        mocker.patch.object(
+            image_repo, "get_repo_usage", return_value={"free_bytes": 100}
+        )
+        session, base_url = await aiohttp_client(server._build_app())
+        entry = {
+            "file": "",
+            "size": 2 * BLOCK,
+            "source": "s",
+            "block_bytes": BLOCK,
+            "digest": resumable_transfer.digest_of_blocks(blocks),
+            "blocks": blocks,
+        }
+        images = [
+            {"name": "debian.iso", "type": "iso", "size_bytes": 2 * BLOCK},
+            {"name": "small.iso", "type": "iso", "size_bytes": 50},
+        ]
+        images[0]["files"] = [entry]
+
+        async with session.post(
+            f"{base_url}/transfer",
+            json={"images": images},
+            headers={"Authorization": f"Bearer {token}"},
+        ) as resp:
+            assert resp.status == 200
+            assert (await resp.json())["present"] == {"debian.iso": [""]}
@@ -0,0 +1,259 @@
+"""Tests for the live peer registry and link probing.
+
+Covers:
+- background browsing in the discovery service
+- the registry table, ranking and peer picking
+- probing peers from the probe thread
+- the probe endpoint and client-side link probe
+"""
+
+from __future__ import annotations
+
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+from zeroconf import ServiceStateChange
+
+from rpi_usb_cloner.domain import ImageRepo
+from rpi_usb_cloner.services import peer_registry, peer_transfer_server
+from rpi_usb_cloner.services.discovery import DiscoveryService, PeerDevice
+from rpi_usb_cloner.services.peer_registry import PeerRegistry
+from rpi_usb_cloner.services.peer_transfer_client import (
+    LinkProbe,
+    TransferClient,
+    TransferError,
+)
+
+
+def make_peer(name, device_id=None, **txt):
+    return PeerDevice(
+        hostname=name,
+        address="127.0.0.1",
+        port=8765,
+        device_id=device_id or f"id-{name}",
+        txt_records=txt,
+    )
+
+
+class FakeDiscovery:
+    def __init__(self):
+        self.on_added = None
+        self.on_removed = None
+        self.browsing = False
+
+    def start_browsing(self, on_added, on_removed):
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.browsing = True
+
+    def stop_browsing(self):
+        self.browsing = False
+
+
+class TestStartBrowsing:
+    """Test background browsing in the discovery service."""
+
+    def test_events_reported(self):
+        service = DiscoveryService()
+        added, removed = [], []
+        peer = make_peer("pi2")
+
+        with patch(
+            "rpi_usb_cloner.services.discovery.Zeroconf", return_value=MagicMock()
+        ), patch("rpi_usb_cloner.services.discovery.ServiceBrowser") as browser:
+            service.start_browsing(
+                lambda name, found: added.append((name, found)), removed.append
+            )
+            handler = browser.call_args.kwargs["handlers"][0]
+            zeroconf = Mock()
+            zeroconf.get_service_info.return_value = Mock()
+            with patch.object(service, "_parse_service_info", return_value=peer):
+                handler(zeroconf, "type", "pi2", ServiceStateChange.Added)
+                handler(zeroconf, "type", "pi2", ServiceStateChange.Updated)
+            handler(zeroconf, "type", "pi2", ServiceStateChange.Removed)
+            service.stop_browsing()
+
+        assert added == [("pi2", peer), ("pi2", peer)]
+        assert removed == ["pi2"]
+        browser.return_value.cancel.assert_called_once()
+
+    def test_self_filtered(self):
+        service = DiscoveryService()
+        added = []
+
+        with patch(
+            "rpi_usb_cloner.services.discovery.Zeroconf", return_value=MagicMock()
+        ), patch("rpi_usb_cloner.services.discovery.ServiceBrowser") as browser:
+            service.start_browsing(lambda *args: added.append(args), Mock())
+            handler = browser.call_args.kwargs["handlers"][0]
+            myself = make_peer("me", device_id=service.device_id)
+            with patch.object(service, "_parse_service_info", return_value=myself):
+                handler(Mock(), "type", "me", ServiceStateChange.Added)
+
+        assert added == []
+
+
+class TestPeerRegistry:
+    """Test the registry table."""
+
+    def test_added_updated_removed(self):
+        discovery = FakeDiscovery()
+        registry = PeerRegistry(discovery, prober=Mock())
+        registry.discovery.start_browsing(registry._on_added, registry._on_removed)
+        generations = []
+        registry.subscribe(generations.append)
+
+        discovery.on_added("pi2", make_peer("pi2", free_bytes="100"))
+        discovery.on_added("pi2", make_peer("pi2", free_bytes="50"))
+        assert [entry.advertised_free_bytes for entry in registry.peers()] == [50]
+        assert registry.get("id-pi2").peer.hostname == "pi2"
+
+        discovery.on_removed("pi2")
+        discovery.on_removed("pi2")
+        assert registry.peers() == []
+        assert generations == [1, 2, 3]
+
+    def test_restarted_peer_probed_again(self):
+        registry = PeerRegistry(
+            FakeDiscovery(), prober=lambda peer: LinkProbe(0.001, 1e6, None, 0)
+        )
+        registry._on_added("pi2", make_peer("pi2"))
+        registry._probe("pi2", registry.peers()[0])
+        assert registry.peers()[0].probed_at is not None
+
+        registry._on_added("pi2", make_peer("pi2", device_id="new-boot"))
+
+        assert registry.peers()[0].probed_at is None
+
+    def test_ranking_and_pick(self):
+        probes = {
+            "slow": LinkProbe(0.01, 1e6, 10**9, 0),
+            "fast": LinkProbe(0.001, 50e6, 10**9, 0),
+            "busy": LinkProbe(0.001, 90e6, 10**9, 1),
+            "full": LinkProbe(0.001, 99e6, 10, 0),
+        }
+        registry = PeerRegistry(
+            FakeDiscovery(), prober=lambda peer: probes[peer.hostname]
+        )
+        for name in ("slow", "fast", "busy", "full", "new"):
+            registry._on_added(name, make_peer(name))
+        for name, entry in registry._due(0):
+            if name in probes:
+                registry._probe(name, entry)
+
+        assert [entry.peer.hostname for entry in registry.peers()] == [
+            "full",
+            "fast",
+            "slow",
+            "new",
+            "busy",
+        ]
+        assert registry.pick().peer.hostname == "full"
+        assert registry.pick(min_free_bytes=1000).peer.hostname == "fast"
+        # Nobody is known to have room; try a peer whose space is unknown
+        assert registry.pick(min_free_bytes=10**12).peer.hostname == "new"
+
+    def test_failed_probe_retried_sooner(self):
+        def unreachable(peer):
+            raise TransferError("no route to host")
+
+        registry = PeerRegistry(FakeDiscovery(), prober=unreachable)
+        registry._on_added("pi2", make_peer("pi2"))
+        registry._probe("pi2", registry.peers()[0])
+        entry = registry.peers()[0]
+
+        assert entry.probe_failed
+        assert registry.pick() is None
+        probed_at = entry.probed_at
+        assert registry._due(probed_at + 1) == []
+        assert registry._due(probed_at + peer_registry.RETRY_PROBE_SECONDS)
+
+    def test_probe_thread(self):
+        discovery = FakeDiscovery()
+        probe = LinkProbe(0.002, 20e6, 4096, 0)
+        registry = PeerRegistry(discovery, prober=lambda peer: probe)
+        registry.start()
+        try:
+            assert discovery.browsing
+            generation = registry.generation
+            discovery.on_added("pi2", make_peer("pi2"))
+            for _ in range(50):
+                generation = registry.wait_for_change(generation, timeout=0.1)
+                if registry.peers()[0].probed_at is not None:
+                    break
+        finally:
+            registry.stop()
+
+        entry = registry.peers()[0]
+        assert entry.bytes_per_second == 20e6
+        assert entry.rtt_seconds == 0.002
+        assert entry.known_free_bytes == 4096
+        assert not discovery.browsing
+
+
+@pytest.fixture
+def server(tmp_path):
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir()
+    return peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+
+
+class TestLinkProbe:
+    """Test the probe endpoint and the client-side probe."""
+
+    @pytest.mark.asyncio
+    async def test_probe_endpoint_capped(self, aiohttp_client, server, monkeypatch):
+        monkeypatch.setattr(peer_transfer_server, "MAX_PROBE_BYTES", 100_000)
+        session, base_url = await aiohttp_client(server._build_app())
+
+        async with session.get(f"{base_url}/probe", params={"bytes": "70000"}) as r:
+            assert len(await r.read()) == 70000
+        async with session.get(f"{base_url}/probe", params={"bytes": "10**9"}) as r:
+            assert r.status == 400
+        async with session.get(f"{base_url}/probe", params={"bytes": "999999"}) as r:
+            assert len(await r.read()) == 100_000
+
+    @pytest.mark.asyncio
+    async def test_probe_endpoint_rate_limited(
+        self, aiohttp_client, server, monkeypatch
+    ):
+        monkeypatch.setattr(peer_transfer_server, "MAX_PROBES", 2)
+        session, base_url = await aiohttp_client(server._build_app())
+
+        for _ in range(2):
+            async with session.get(f"{base_url}/probe", params={"bytes": "10"}) as r:
+                assert r.status == 200
+        async with session.get(f"{base_url}/probe", params={"bytes": "10"}) as r:
+            assert r.status == 429
+            assert (await r.json())["retry_after"] == peer_transfer_server.PROBE_WINDOW
+
+        # Older probes leave the window
+        server._probes = {
+            ip: [ts - peer_transfer_server.PROBE_WINDOW for ts in times]
+            for ip, times in server._probes.items()
+        }
+        async with session.get(f"{base_url}/probe", params={"bytes": "10"}) as r:
+            assert r.status == 200
+
+    @pytest.mark.asyncio
+    async def test_client_probe(self, aiohttp_client, server):
+        _session, base_url = await aiohttp_client(server._build_app())
+        client = TransferClient(make_peer("pi2"))
+        client.base_url = base_url
+
+        probe = await client.probe_link(256 * 1024)
+
+        assert probe.rtt_seconds > 0
+        assert probe.bytes_per_second > 0
+        assert probe.free_bytes > 0
+        assert probe.active_uploads == 0
+
+    @pytest.mark.asyncio
+    async def test_unreachable_peer(self, unused_tcp_port):
+        client = TransferClient(make_peer("pi2"))
+        client.base_url = f"http://127.0.0.1:{unused_tcp_port}"
+
+        with pytest.raises(TransferError):
+            await client.probe_link()
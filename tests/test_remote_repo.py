@@ -0,0 +1,386 @@
+"""Tests for network image repositories.
+
+Covers:
+- the repo manifest
+- streaming with read-ahead and resume after a dropped connection
+- staging an image and streaming its volumes into the restore code
+- the transfer server's /repo endpoints
+"""
+
+from __future__ import annotations
+
+import asyncio
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from rpi_usb_cloner.domain import ImageRepo, ImageType
+from rpi_usb_cloner.services import peer_transfer_server
+from rpi_usb_cloner.storage import iso, remote_repo
+from rpi_usb_cloner.storage.clonezilla import restore
+from rpi_usb_cloner.storage.remote_repo import (
+    RemoteFile,
+    RemoteRepo,
+    RemoteRepoError,
+    RemoteStream,
+)
+
+
+VOLUME = bytes(range(256)) * 4096  # 1 MiB
+
+
+def make_repo(root):
+    image = root / "clonezilla" / "laptop"
+    image.mkdir(parents=True)
+    (image / "parts").write_text("sda1\n")
+    (image / "sda-pt.sf").write_text("label: dos\n")
+    (image / "sda1.ext4-ptcl-img.gz.aa").write_bytes(VOLUME[:700_000])
+    (image / "sda1.ext4-ptcl-img.gz.ab").write_bytes(VOLUME[700_000:])
+    (image / "sda1.ext4-ptcl-img.gz.ac.part").write_bytes(b"partial")
+    (image / ".hidden").write_bytes(b"x")
+    (root / "live.iso").write_bytes(VOLUME[:300_000])
+    return root
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve ``files`` with Range support, cutting off the first ``drops``."""
+
+    files: dict[str, bytes] = {}
+    drops = 0
+    requests: list[str | None] = []
+
+    def do_GET(self):
+        data = self.files.get(self.path.lstrip("/"))
+        if data is None:
+            self.send_error(404)
+            return
+        range_header = self.headers.get("Range")
+        type(self).requests.append(range_header)
+        start = int(range_header[6:-1]) if range_header else 0
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if type(self).drops:
+            type(self).drops -= 1
+            self.wfile.write(data[start : start + 100_000])
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    RangeHandler.files = {}
+    RangeHandler.drops = 0
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestManifest:
+    """Test the repo manifest."""
+
+    def test_lists_published_files(self, tmp_path):
+        manifest = remote_repo.build_manifest(make_repo(tmp_path))
+
+        assert manifest["version"] == remote_repo.MANIFEST_VERSION
+        by_name = {image["name"]: image for image in manifest["images"]}
+        laptop = by_name["laptop"]
+        assert laptop["type"] == ImageType.CLONEZILLA_DIR.value
+        assert laptop["path"] == "clonezilla/laptop"
+        assert [file["name"] for file in laptop["files"]] == [
+            "parts",
+            "sda-pt.sf",
+            "sda1.ext4-ptcl-img.gz.aa",
+            "sda1.ext4-ptcl-img.gz.ab",
+        ]
+        assert laptop["size_bytes"] == sum(f["size"] for f in laptop["files"])
+        assert by_name["live.iso"]["files"] == [{"name": "", "size": 300_000}]
+
+    def test_write_manifest(self, tmp_path):
+        path = remote_repo.write_manifest(make_repo(tmp_path))
+
+        assert path == tmp_path / remote_repo.MANIFEST_FILENAME
+        assert '"live.iso"' in path.read_text()
+
+    def test_published_path(self, tmp_path):
+        make_repo(tmp_path)
+
+        assert remote_repo.published_path(tmp_path, "live.iso") == (
+            tmp_path / "live.iso"
+        )
+        for name in (
+            "clonezilla/laptop/.hidden",
+            "clonezilla/laptop/sda1.ext4-ptcl-img.gz.ac.part",
+            "clonezilla/laptop",
+            "missing.iso",
+        ):
+            assert remote_repo.published_path(tmp_path, name) is None
+
+
+class TestRemoteStream:
+    """Test streaming remote files."""
+
+    def test_reads_files_in_order(self, http_server):
+        RangeHandler.files = {"a": VOLUME[:5000], "b": VOLUME[5000:9000]}
+        files = [
+            RemoteFile(f"{http_server}/a", 5000),
+            RemoteFile(f"{http_server}/b", 4000),
+        ]
+
+        with RemoteStream(files, chunk_bytes=1024, read_ahead=2) as stream:
+            assert stream.read(100) == VOLUME[:100]
+            assert stream.read() == VOLUME[100:9000]
+            assert stream.read(10) == b""
+
+    def test_resumes_dropped_connection(self, http_server, monkeypatch):
+        monkeypatch.setattr(remote_repo, "RETRY_DELAY_SECONDS", 0.0)
+        RangeHandler.files = {"vol": VOLUME}
+        RangeHandler.drops = 2
+
+        with RemoteStream([RemoteFile(f"{http_server}/vol", len(VOLUME))]) as stream:
+            assert b"".join(stream.chunks()) == VOLUME
+
+        assert RangeHandler.requests == [None, "bytes=100000-", "bytes=200000-"]
+
+    def test_gives_up_without_progress(self, http_server, monkeypatch):
+        monkeypatch.setattr(remote_repo, "RETRY_DELAY_SECONDS", 0.0)
+        monkeypatch.setattr(remote_repo, "FETCH_ATTEMPTS", 2)
+        RangeHandler.files = {"vol": b""}
+
+        stream = RemoteStream([RemoteFile(f"{http_server}/vol", 10)])
+        with stream, pytest.raises(RemoteRepoError, match="failed at byte 0"):
+            stream.read()
+
+    def test_client_errors_are_fatal(self, http_server):
+        stream = RemoteStream([RemoteFile(f"{http_server}/missing", 10)])
+        with stream, pytest.raises(RemoteRepoError, match="HTTP 404"):
+            stream.read()
+        assert len(RangeHandler.requests) == 0
+
+
+class TestStaging:
+    """Test staging images and streaming their volumes."""
+
+    def serve_repo(self, root):
+        RangeHandler.files = {
+            path.relative_to(root).as_posix(): path.read_bytes()
+            for path in root.rglob("*")
+            if path.is_file()
+        }
+        manifest = remote_repo.write_manifest(root)
+        RangeHandler.files[manifest.name] = manifest.read_bytes()
+
+    def test_stage_clonezilla_image(self, http_server, tmp_path):
+        self.serve_repo(make_repo(tmp_path / "server"))
+        repo = RemoteRepo(http_server)
+        laptop = next(i for i in repo.list_images() if i.name == "laptop")
+
+        with remote_repo.staged_image(repo, laptop) as staged:
+            volumes = sorted(staged.path.glob("*-ptcl-img*"))
+            assert staged.image_type == ImageType.CLONEZILLA_DIR
+            assert (staged.path / "parts").read_text() == "sda1\n"
+            assert [path.stat().st_size for path in volumes] == [0, 0]
+            assert remote_repo.file_size(volumes[0]) == 700_000
+
+            feeder = remote_repo.open_volumes(volumes)
+            data = feeder.stdout.read()
+            feeder.stdout.close()
+            assert feeder.wait(5) == 0
+            assert data == VOLUME
+
+        assert remote_repo.staged_file(volumes[0]) is None
+        assert not staged.path.exists()
+
+    def test_local_volumes_read_by_cat(self, tmp_path):
+        make_repo(tmp_path)
+        volumes = sorted((tmp_path / "clonezilla" / "laptop").glob("*.gz.a[ab]"))
+
+        proc = remote_repo.open_volumes(volumes)
+        data = proc.stdout.read()
+        proc.stdout.close()
+
+        assert proc.wait() == 0
+        assert data == VOLUME
+
+    def test_restore_pipeline_streams_staged_volumes(self, http_server, tmp_path):
+        self.serve_repo(make_repo(tmp_path / "server"))
+        repo = RemoteRepo(http_server)
+        laptop = next(i for i in repo.list_images() if i.name == "laptop")
+        received = []
+
+        def fake_restore(command, *, stdin_source, **kwargs):
+            received.append(stdin_source.read())
+
+        with remote_repo.staged_image(repo, laptop) as staged, patch.object(
+            restore.clone, "run_checked_with_streaming_progress", fake_restore
+        ), patch.object(restore, "get_compression_type", return_value=None):
+            restore.run_restore_pipeline(
+                list(staged.path.glob("*-ptcl-img*")),
+                ["partclone.ext4", "-r"],
+                title="Restoring sda1",
+            )
+
+        assert received == [VOLUME]
+
+    def test_iso_streamed_into_dd(self, http_server, tmp_path):
+        self.serve_repo(make_repo(tmp_path / "server"))
+        repo = RemoteRepo(http_server)
+        live = next(i for i in repo.list_images() if i.name == "live.iso")
+        calls = []
+
+        def fake_dd(command, *, stdin_source, **kwargs):
+            calls.append((command, stdin_source.read(), kwargs["total_bytes"]))
+
+        with remote_repo.staged_image(repo, live) as staged, patch(
+            "os.geteuid", return_value=0
+        ), patch.object(iso.devices, "get_device_by_name", return_value=None), patch(
+            "rpi_usb_cloner.storage.iso.resolve_device_node", return_value="/dev/sdz"
+        ), patch.object(
+            iso, "_get_device_size_bytes", return_value=None
+        ), patch.object(
+            iso.clone, "run_checked_with_streaming_progress", fake_dd
+        ), patch.object(
+            iso.image_digest, "start_background_digest"
+        ) as digest:
+            iso.restore_iso_image(staged.path, "sdz")
+
+        command, data, total = calls[0]
+        assert not any(arg.startswith("if=") for arg in command)
+        assert "iflag=fullblock" in command
+        assert data == VOLUME[:300_000]
+        assert total == 300_000
+        digest.assert_not_called()
+
+    def test_stage_rejects_escaping_paths(self, tmp_path):
+        image = remote_repo.RemoteImage(
+            name="evil",
+            image_type=ImageType.CLONEZILLA_DIR,
+            path="evil",
+            size_bytes=1,
+            files=(("../../etc/passwd", 1),),
+        )
+
+        with pytest.raises(RemoteRepoError, match="Invalid file name"):
+            RemoteRepo("http://127.0.0.1:1").stage(image, tmp_path)
+
+
+@pytest.fixture
+def peer_server(tmp_path, aiohttp_client):
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=make_repo(tmp_path), drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time() - 300,
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+
+    async def start():
+        session, base_url = await aiohttp_client(server._build_app())
+        return session, base_url, token
+
+    yield start
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+class TestRepoEndpoints:
+    """Test the transfer server's /repo endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_require_session(self, peer_server):
+        session, base_url, _token = await peer_server()
+
+        async with session.get(f"{base_url}/repo/index.json") as resp:
+            assert resp.status == 401
+
+    @pytest.mark.asyncio
+    async def test_range_and_session_refresh(self, peer_server):
+        session, base_url, token = await peer_server()
+        headers = {"Authorization": f"Bearer {token}", "Range": "bytes=1000-"}
+
+        async with session.get(f"{base_url}/repo/live.iso", headers=headers) as resp:
+            assert resp.status == 206
+            assert await resp.read() == VOLUME[1000:300_000]
+
+        last_used = peer_transfer_server._active_sessions[token]["last_used"]
+        assert time.time() - last_used < 5
+
+    @pytest.mark.asyncio
+    async def test_resume_after_long_read(self, peer_server, monkeypatch):
+        session, base_url, token = await peer_server()
+        headers = {"Authorization": f"Bearer {token}", "Range": "bytes=1000-"}
+        monkeypatch.setattr(peer_transfer_server, "SESSION_TIMEOUT", 1)
+        peer_transfer_server._active_sessions[token]["last_used"] = time.time()
+        published_path = remote_repo.published_path
+
+        def slow_read(*args):
+            # A read that outlasts the session timeout
+            time.sleep(1.5)
+            return published_path(*args)
+
+        monkeypatch.setattr(remote_repo, "published_path", slow_read)
+        async with session.get(f"{base_url}/repo/live.iso", headers=headers) as resp:
+            assert resp.status == 206
+        monkeypatch.setattr(remote_repo, "published_path", published_path)
+
+        headers["Range"] = "bytes=2000-"
+        async with session.get(f"{base_url}/repo/live.iso", headers=headers) as resp:
+            assert resp.status == 206
+            assert await resp.read() == VOLUME[2000:300_000]
+
+    @pytest.mark.asyncio
+    async def test_idle_session_expires(self, peer_server):
+        session, base_url, token = await peer_server()
+        peer_transfer_server._active_sessions[token]["last_used"] = time.time() - (
+            peer_transfer_server.SESSION_TIMEOUT + 1
+        )
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async with session.get(f"{base_url}/repo/index.json", headers=headers) as resp:
+            assert resp.status == 401
+        assert token not in peer_transfer_server._active_sessions
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        ("name", "status"),
+        [
+            ("clonezilla/laptop/.hidden", 404),
+            ("clonezilla/laptop/sda1.ext4-ptcl-img.gz.ac.part", 404),
+            ("missing.iso", 404),
+            ("clonezilla/laptop", 404),
+        ],
+    )
+    async def test_unpublished_files(self, peer_server, name, status):
+        session, base_url, token = await peer_server()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async with session.get(f"{base_url}/repo/{name}", headers=headers) as resp:
+            assert resp.status == status
+
+    @pytest.mark.asyncio
+    async def test_remote_repo_against_server(self, peer_server):
+        _session, base_url, token = await peer_server()
+        repo = RemoteRepo(f"{base_url}/repo", token)
+        loop = asyncio.get_running_loop()
+
+        images = await loop.run_in_executor(None, repo.list_images)
+        live = next(image for image in images if image.name == "live.iso")
+
+        def read_live():
+            remote = repo.remote_file(live, "", live.size_bytes)
+            with RemoteStream([remote]) as stream:
+                return stream.read()
+
+        assert await loop.run_in_executor(None, read_live) == VOLUME[:300_000]
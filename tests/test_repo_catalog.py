@@ -0,0 +1,215 @@
+"""Tests for the inotify-driven image repo catalog.
+
+Covers:
+- single-entry classification matching list_clonezilla_images
+- initial scan and versioned snapshots
+- incremental updates from inotify events
+- repo rediscovery on topology and flag file changes
+- timed rescans without inotify
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from rpi_usb_cloner.domain import ImageRepo, ImageType
+from rpi_usb_cloner.storage import image_repo, repo_catalog
+from rpi_usb_cloner.storage.repo_catalog import RepoCatalog
+
+
+def make_clonezilla_image(parent, name):
+    image_dir = parent / name
+    image_dir.mkdir(parents=True)
+    (image_dir / "parts").write_text("sda1\n")
+    (image_dir / "sda1.ext4-ptcl-img.gz.aa").write_bytes(b"data")
+    return image_dir
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / image_repo.REPO_FLAG_FILENAME).touch()
+    make_clonezilla_image(root / "clonezilla", "backup-a")
+    make_clonezilla_image(root / "images", "backup-b")
+    (root / "clonezilla" / "scratch").mkdir()
+    (root / "debian.iso").write_bytes(b"x" * 2048)
+    (root / "notes.txt").write_text("not an image")
+    return ImageRepo(path=root, drive_name="sdb")
+
+
+@pytest.fixture
+def topology(repo, monkeypatch):
+    """Control the repos found and the topology key the catalog sees."""
+
+    class Topology:
+        repos = [repo]
+        key = (1, 1)
+        discoveries = 0
+
+    def find_image_repos(*args, **kwargs):
+        Topology.discoveries += 1
+        return list(Topology.repos)
+
+    monkeypatch.setattr(image_repo, "find_image_repos", find_image_repos)
+    monkeypatch.setattr(RepoCatalog, "_topology_key", lambda self: Topology.key)
+    return Topology
+
+
+@pytest.fixture
+def catalog(topology):
+    catalog = RepoCatalog()
+    if not catalog.watching:
+        catalog.close()
+        pytest.skip("inotify not available")
+    yield catalog
+    catalog.close()
+
+
+def image_names(snapshot, repo):
+    return [image.name for image in snapshot.images_for(repo.path)]
+
+
+class TestClassifyRepoEntry:
+    """Test single-entry classification."""
+
+    def test_matches_full_listing(self, repo):
+        root = repo.path
+        entries = [
+            child
+            for candidate in image_repo.repo_candidate_dirs(root)
+            if candidate.is_dir()
+            for child in candidate.iterdir()
+        ]
+        classified = [
+            image
+            for image in (
+                image_repo.classify_repo_entry(root, path) for path in entries
+            )
+            if image is not None
+        ]
+        assert sorted(classified, key=lambda image: image.name) == (
+            image_repo.list_clonezilla_images(root)
+        )
+
+    def test_outside_repo_layout(self, repo, tmp_path):
+        nested = make_clonezilla_image(repo.path / "clonezilla" / "scratch", "deep")
+        assert image_repo.classify_repo_entry(repo.path, nested) is None
+        assert image_repo.classify_repo_entry(repo.path, repo.path / "gone") is None
+
+
+class TestSnapshots:
+    """Test the initial scan and snapshot versions."""
+
+    def test_initial_scan(self, catalog, repo):
+        snapshot = catalog.snapshot()
+        assert snapshot.repos == (repo,)
+        assert snapshot.images_for(repo.path) == image_repo.list_clonezilla_images(
+            repo.path
+        )
+        types = {image.name: image.image_type for image in snapshot.all_images()}
+        assert types == {
+            "backup-a": ImageType.CLONEZILLA_DIR,
+            "backup-b": ImageType.CLONEZILLA_DIR,
+            "debian.iso": ImageType.ISO,
+        }
+
+    def test_version_stable_without_changes(self, catalog, topology, mocker):
+        first = catalog.snapshot()
+        classify = mocker.spy(image_repo, "classify_repo_entry")
+        second = catalog.snapshot()
+        assert second is first
+        assert topology.discoveries == 1
+        classify.assert_not_called()
+
+    def test_module_helpers(self, topology, repo):
+        assert repo_catalog.list_image_repos() == [repo]
+        assert [image.name for image in repo_catalog.list_repo_images(repo.path)] == [
+            "backup-a",
+            "backup-b",
+            "debian.iso",
+        ]
+        assert repo_catalog.get_repo_catalog() is repo_catalog.get_repo_catalog()
+
+
+class TestIncrementalUpdates:
+    """Test inotify-driven updates."""
+
+    def test_new_image_reclassifies_only_changed_entry(self, catalog, repo, mocker):
+        first = catalog.snapshot()
+        classify = mocker.spy(image_repo, "classify_repo_entry")
+
+        make_clonezilla_image(repo.path / "clonezilla", "backup-c")
+        second = catalog.snapshot()
+
+        assert second.version == first.version + 1
+        assert "backup-c" in image_names(second, repo)
+        checked = {call.args[1].name for call in classify.call_args_list}
+        assert checked == {"backup-c"}
+
+    def test_image_completed_after_directory_created(self, catalog, repo):
+        catalog.snapshot()
+        pending = repo.path / "images" / "in-progress"
+        pending.mkdir()
+        assert "in-progress" not in image_names(catalog.snapshot(), repo)
+
+        (pending / "parts").write_text("sda1\n")
+        (pending / "sda1.vfat-ptcl-img.gz.aa").write_bytes(b"data")
+        assert "in-progress" in image_names(catalog.snapshot(), repo)
+
+    def test_removed_and_renamed_entries(self, catalog, repo):
+        catalog.snapshot()
+        (repo.path / "debian.iso").rename(repo.path / "debian-12.iso")
+        (repo.path / "clonezilla" / "backup-a" / "parts").unlink()
+
+        assert image_names(catalog.snapshot(), repo) == ["backup-b", "debian-12.iso"]
+
+    def test_unrelated_files_do_not_bump_version(self, catalog, repo):
+        first = catalog.snapshot()
+        (repo.path / "notes.txt").write_text("still not an image")
+        assert catalog.snapshot().version == first.version
+
+
+class TestRediscovery:
+    """Test repo list rediscovery."""
+
+    def test_topology_change(self, catalog, topology, repo, tmp_path):
+        catalog.snapshot()
+        other = tmp_path / "other"
+        make_clonezilla_image(other, "backup-z")
+        topology.repos = [repo, ImageRepo(path=other, drive_name="sdc")]
+        topology.key = (2, 1)
+
+        snapshot = catalog.snapshot()
+
+        assert topology.discoveries == 2
+        assert [found.path for found in snapshot.repos] == [repo.path, other]
+        assert image_names(snapshot, snapshot.repos[1]) == ["backup-z"]
+
+    def test_flag_file_removed(self, catalog, topology, repo):
+        catalog.snapshot()
+        topology.repos = []
+        (repo.path / image_repo.REPO_FLAG_FILENAME).unlink()
+
+        snapshot = catalog.snapshot()
+
+        assert topology.discoveries == 2
+        assert snapshot.repos == ()
+        assert snapshot.all_images() == []
+
+
+class TestWithoutInotify:
+    """Test timed rescans when inotify is unavailable."""
+
+    def test_rescans_after_interval(self, topology, repo, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(repo_catalog.time, "monotonic", lambda: clock[0])
+        catalog = RepoCatalog(watch=False)
+        assert not catalog.watching
+        first = catalog.snapshot()
+
+        (repo.path / "ubuntu.iso").write_bytes(b"x")
+        assert catalog.snapshot() is first
+
+        clock[0] += repo_catalog.FALLBACK_RESCAN_SECONDS
+        assert "ubuntu.iso" in image_names(catalog.snapshot(), repo)
@@ -0,0 +1,459 @@
+"""Tests for resumable, verified image transfers.
+
+Covers:
+- partial files and their block journal across restarts
+- resumable USB copies with read-back verification
+- resumable peer uploads with end-to-end digest checks
+- reporting the receiver's free space after uploads
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+import time
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import (
+    peer_transfer_client,
+    peer_transfer_server,
+    resumable_transfer,
+    transfer_engine,
+)
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.services.resumable_transfer import PartialFile
+from rpi_usb_cloner.storage import image_repo
+
+
+BLOCK = 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(resumable_transfer, "BLOCK_BYTES", BLOCK)
+    monkeypatch.setattr(resumable_transfer, "SYNC_EVERY_BLOCKS", 2)
+    monkeypatch.setattr(transfer_engine, "CHUNK_BYTES", 256)
+
+
+@pytest.fixture
+def source(tmp_path):
+    src = tmp_path / "src" / "debian.iso"
+    src.parent.mkdir()
+    src.write_bytes(os.urandom(5 * BLOCK + 100))
+    return src
+
+
+class TestPartialFile:
+    """Test partial files and their journal."""
+
+    def test_resume_after_restart(self, tmp_path, source):
+        data = source.read_bytes()
+        dest = tmp_path / "dest.iso"
+        partial = PartialFile.open(dest, len(data), "id-1")
+        writer = partial.writer()
+        writer.write(data[: 2 * BLOCK + 500])
+        writer.close()
+        partial.close()
+
+        resumed = PartialFile.open(dest, len(data), "id-1")
+        assert resumed.received == 2 * BLOCK
+        writer = resumed.writer()
+        writer.write(data[2 * BLOCK :])
+        writer.close()
+
+        assert resumed.complete
+        expected = resumable_transfer.block_digests(source, len(data), BLOCK)
+        assert resumed.digest() == resumable_transfer.digest_of_blocks(expected)
+        resumed.commit()
+        assert dest.read_bytes() == data
+        assert not resumed.part_path.exists()
+        assert not resumed.journal_path.exists()
+
+    def test_torn_journal_line_ignored(self, tmp_path, source):
+        data = source.read_bytes()
+        dest = tmp_path / "dest.iso"
+        partial = PartialFile.open(dest, len(data), "id-1")
+        writer = partial.writer()
+        writer.write(data[: 3 * BLOCK])
+        writer.close()
+        partial.close()
+        with partial.journal_path.open("a") as journal:
+            journal.write("abc")
+
+        assert PartialFile.open(dest, len(data), "id-1").received == 3 * BLOCK
+
+    def test_block_journaled_only_after_data_sync(self, tmp_path, source, mocker):
+        data = source.read_bytes()
+        dest = tmp_path / "dest.iso"
+        partial = PartialFile.open(dest, len(data), "id-1")
+        header = partial.journal_path.read_text()
+        fdatasync = mocker.spy(resumable_transfer.os, "fdatasync")
+        writer = partial.writer()
+        writer.write(data[:BLOCK])
+
+        # Recorded, but its data was never synced: not in the journal
+        assert partial.received == BLOCK
+        assert partial.journal_path.read_text() == header
+
+        writer.write(data[BLOCK : 2 * BLOCK])
+        assert fdatasync.call_count == 1
+        assert len(partial.journal_path.read_text().splitlines()) == 3
+
+        writer.write(data[2 * BLOCK : 3 * BLOCK])
+        # Power cut: the third block was never synced
+        os.close(writer._fd)
+        partial.close()
+
+        assert PartialFile.open(dest, len(data), "id-1").received == 2 * BLOCK
+
+    def test_forget_keeps_other_writers_blocks(self, tmp_path, source):
+        data = source.read_bytes()
+        dest = tmp_path / "dest.iso"
+        partial = PartialFile.open(dest, len(data), "id-1")
+        first = partial.writer(0, 2)
+        second = partial.writer(3, 4)
+        first.write(data[: 2 * BLOCK])
+        # Recorded by the second writer but not synced yet
+        second.write(data[3 * BLOCK : 4 * BLOCK])
+
+        partial.forget([1])
+
+        assert sorted(partial.received_blocks()) == [0, 3]
+        assert len(partial.journal_path.read_text().splitlines()) == 2
+        second.close()
+        first.close()
+        partial.close()
+        resumed = PartialFile.open(dest, len(data), "id-1")
+        assert sorted(resumed.received_blocks()) == [0, 3]
+
+    def test_changed_source_starts_over(self, tmp_path, source):
+        data = source.read_bytes()
+        dest = tmp_path / "dest.iso"
+        partial = PartialFile.open(dest, len(data), "id-1")
+        writer = partial.writer()
+        writer.write(data[: 2 * BLOCK])
+        writer.close()
+        partial.close()
+
+        assert PartialFile.open(dest, len(data), "id-2").received == 0
+
+    def test_rejects_data_past_end(self, tmp_path):
+        partial = PartialFile.open(tmp_path / "dest", 10, "id")
+        writer = partial.writer()
+        try:
+            with pytest.raises(ValueError):
+                writer.write(b"x" * 11)
+        finally:
+            writer.close()
+            partial.close()
+
+
+class TestCopyResumable:
+    """Test resumable USB copies."""
+
+    def test_interrupted_copy_resumes(self, tmp_path, source, monkeypatch):
+        dest = tmp_path / "repo" / "debian.iso"
+        dest.parent.mkdir()
+        real_copy_range = transfer_engine.copy_range
+        starts = []
+
+        def pulled_cable(src_fd, dest_fd, offset, size, on_bytes=None):
+            if len(starts) == 2:
+                raise OSError(5, "Input/output error")
+            starts.append(offset)
+            return real_copy_range(src_fd, dest_fd, offset, size, on_bytes)
+
+        monkeypatch.setattr(transfer_engine, "copy_range", pulled_cable)
+        with pytest.raises(OSError):
+            resumable_transfer.copy_resumable(source, dest)
+        assert not dest.exists()
+
+        spy = []
+
+        def recorded(src_fd, dest_fd, offset, size, on_bytes=None):
+            spy.append(offset)
+            return real_copy_range(src_fd, dest_fd, offset, size, on_bytes)
+
+        monkeypatch.setattr(transfer_engine, "copy_range", recorded)
+        reported = []
+        copied = resumable_transfer.copy_resumable(source, dest, reported.append)
+
+        assert dest.read_bytes() == source.read_bytes()
+        assert spy[0] == 2 * BLOCK
+        assert copied == source.stat().st_size - 2 * BLOCK
+        assert sum(reported) == source.stat().st_size
+        assert dest.stat().st_mtime == source.stat().st_mtime
+        assert sorted(path.name for path in dest.parent.iterdir()) == ["debian.iso"]
+
+    def test_bad_block_recopied(self, tmp_path, source, mocker):
+        dest = tmp_path / "debian.iso"
+        verify = mocker.patch.object(
+            PartialFile, "verify_written", autospec=True, side_effect=[[1], []]
+        )
+        copy_range = mocker.spy(transfer_engine, "copy_range")
+
+        resumable_transfer.copy_resumable(source, dest)
+
+        assert verify.call_count == 2
+        assert copy_range.call_args_list[-1].args[2:4] == (BLOCK, 2 * BLOCK)
+        assert dest.read_bytes() == source.read_bytes()
+
+    def test_verification_failure_keeps_good_blocks(self, tmp_path, source, mocker):
+        dest = tmp_path / "debian.iso"
+        mocker.patch.object(
+            PartialFile, "verify_written", autospec=True, return_value=[3]
+        )
+
+        with pytest.raises(OSError, match="Verification failed"):
+            resumable_transfer.copy_resumable(source, dest)
+
+        partial = PartialFile.open(
+            dest, source.stat().st_size, resumable_transfer.source_id(source)
+        )
+        assert partial.received == 3 * BLOCK
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    repo_path = tmp_path / "receiver"
+    repo_path.mkdir()
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+    yield server, token
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+async def start_peer(aiohttp_client, server, token):
+    _session, base_url = await aiohttp_client(server._build_app())
+    client = peer_transfer_client.TransferClient(
+        PeerDevice(
+            hostname="peer",
+            address="127.0.0.1",
+            port=0,
+            device_id="test",
+            txt_records={},
+        )
+    )
+    client.base_url = base_url
+    client.session_token = token
+    return client
+
+
+class TestPeerUploads:
+    """Test resumable uploads between a client and server."""
+
+    @pytest.mark.asyncio
+    async def test_file_and_directory(self, aiohttp_client, receiver, source):
+        server, token = receiver
+        client = await start_peer(aiohttp_client, server, token)
+        image_dir = source.parent / "backup"
+        (image_dir / "sub").mkdir(parents=True)
+        (image_dir / "parts").write_text("sda1\n")
+        (image_dir / "sub" / "sda1.ext4-ptcl-img.gz.aa").write_bytes(
+            os.urandom(2 * BLOCK + 1)
+        )
+        images = [
+            DiskImage(name="debian.iso", path=source, image_type=ImageType.ISO),
+            DiskImage(
+                name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR
+            ),
+        ]
+        progress = []
+
+        result = await client.send_images(
+            images, lambda name, ratio: progress.append((name, ratio))
+        )
+
+        repo = server.destination_repo.path
+        assert result == (2, 0)
+        assert (repo / "debian.iso").read_bytes() == source.read_bytes()
+        received_dir = repo / "clonezilla" / "backup"
+        assert (received_dir / "parts").read_text() == "sda1\n"
+        assert (received_dir / "sub" / "sda1.ext4-ptcl-img.gz.aa").read_bytes() == (
+            image_dir / "sub" / "sda1.ext4-ptcl-img.gz.aa"
+        ).read_bytes()
+        assert progress[-1] == ("backup", 1.0)
+        assert not list(repo.rglob("*.part*"))
+
+    @pytest.mark.asyncio
+    async def test_free_space_reported_once(
+        self, aiohttp_client, receiver, source, monkeypatch
+    ):
+        server, token = receiver
+        client = await start_peer(aiohttp_client, server, token)
+        monkeypatch.setattr(peer_transfer_server, "FREE_SPACE_REPORT_DELAY", 0.05)
+        reported = []
+        server._on_free_space_callback = reported.append
+        image_dir = source.parent / "backup"
+        image_dir.mkdir()
+        (image_dir / "parts").write_text("sda1\n")
+        (image_dir / "sda1.img").write_bytes(os.urandom(BLOCK))
+        images = [
+            DiskImage(name="debian.iso", path=source, image_type=ImageType.ISO),
+            DiskImage(
+                name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR
+            ),
+        ]
+
+        assert await client.send_images(images) == (2, 0)
+        await asyncio.sleep(0.3)
+
+        # Three commits in a row, one report
+        assert reported == [image_repo.get_repo_free_bytes(server.destination_repo)]
+
+    @pytest.mark.asyncio
+    async def test_resumes_after_session_timeout(
+        self, aiohttp_client, receiver, source, monkeypatch
+    ):
+        server, token = receiver
+        monkeypatch.setattr(peer_transfer_server, "SESSION_TIMEOUT", 1)
+        client = await start_peer(aiohttp_client, server, token)
+        monkeypatch.setattr(peer_transfer_client, "RETRY_DELAY_SECONDS", 0)
+        iter_blocks = peer_transfer_client._iter_blocks
+        drops = []
+
+        async def slow_wifi(*args):
+            async for block in iter_blocks(*args):
+                if not drops:
+                    # Longer than the session timeout since authenticating
+                    await asyncio.sleep(0.7)
+                    drops.append(block)
+                    await asyncio.sleep(0.7)
+                    raise ConnectionResetError("Wi-Fi dropped")
+                yield block
+
+        monkeypatch.setattr(peer_transfer_client, "_iter_blocks", slow_wifi)
+
+        result = await client.send_images(
+            [DiskImage(name="debian.iso", path=source, image_type=ImageType.ISO)]
+        )
+
+        assert result == (1, 0)
+        received = server.destination_repo.path / "debian.iso"
+        assert received.read_bytes() == source.read_bytes()
+
+    @pytest.mark.asyncio
+    async def test_dropped_connection_resumes(
+        self, aiohttp_client, receiver, source, monkeypatch
+    ):
+        server, token = receiver
+        offsets = []
+        handle_upload = server._handle_resumable_upload
+
+        async def record_offset(request, image_name):
+            offsets.append(int(request.headers["X-Upload-Offset"]))
+            return await handle_upload(request, image_name)
+
+        server._handle_resumable_upload = record_offset
+        client = await start_peer(aiohttp_client, server, token)
+        monkeypatch.setattr(peer_transfer_client, "RETRY_DELAY_SECONDS", 0)
+        iter_blocks = peer_transfer_client._iter_blocks
+
+        async def wifi_drop(*args):
+            sent = 0
+            async for block in iter_blocks(*args):
+                if not offsets[1:] and sent == 3:
+                    raise ConnectionResetError("Wi-Fi dropped")
+                sent += 1
+                yield block
+
+        monkeypatch.setattr(peer_transfer_client, "_iter_blocks", wifi_drop)
+
+        result = await client.send_images(
+            [DiskImage(name="debian.iso", path=source, image_type=ImageType.ISO)]
+        )
+
+        assert result == (1, 0)
+        assert offsets[0] == 0
+        assert offsets[-1] > 0
+        received = server.destination_repo.path / "debian.iso"
+        assert received.read_bytes() == source.read_bytes()
+
+    @pytest.mark.asyncio
+    async def test_digest_mismatch_rejected(self, aiohttp_client, receiver, source):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {"Authorization": f"Bearer {token}", "X-Image-Type": "iso"}
+        data = source.read_bytes()
+        params = {"file": "", "size": str(len(data)), "source": "s1"}
+        upload_headers = dict(
+            headers,
+            **{
+                "X-Upload-Size": params["size"],
+                "X-Upload-Source": "s1",
+                "X-Upload-Offset": "0",
+            },
+        )
+        url = f"{base_url}/upload/debian.iso"
+
+        async with session.post(url, data=data, headers=upload_headers) as resp:
+            assert (await resp.json())["status"] == "received"
+        async with session.post(
+            f"{url}/commit", json=dict(params, digest="00" * 32), headers=headers
+        ) as resp:
+            assert resp.status == 422
+
+        assert not (server.destination_repo.path / "debian.iso").exists()
+        async with session.get(f"{url}/state", params=params, headers=headers) as resp:
+            assert (await resp.json())["received"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unwritten_blocks_asked_again(self, aiohttp_client, receiver, source):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {"Authorization": f"Bearer {token}", "X-Image-Type": "iso"}
+        data = source.read_bytes()
+        params = {"file": "", "size": str(len(data)), "source": "s1"}
+        upload_headers = dict(
+            headers,
+            **{
+                "X-Upload-Size": params["size"],
+                "X-Upload-Source": "s1",
+                "X-Upload-Offset": "0",
+            },
+        )
+        url = f"{base_url}/upload/debian.iso"
+        digest = resumable_transfer.digest_of_blocks(
+            resumable_transfer.block_digests(source, len(data), BLOCK)
+        )
+
+        async with session.post(url, data=data, headers=upload_headers) as resp:
+            assert (await resp.json())["status"] == "received"
+        # The drive lost a block the journal lists, as after a power cut
+        part_path = server.destination_repo.path / "debian.iso.part"
+        with part_path.open("r+b") as part:
+            part.seek(BLOCK)
+            part.write(bytes(BLOCK))
+        async with session.post(
+            f"{url}/commit", json=dict(params, digest=digest), headers=headers
+        ) as resp:
+            assert resp.status == 409
+
+        assert not (server.destination_repo.path / "debian.iso").exists()
+        async with session.get(f"{url}/state", params=params, headers=headers) as resp:
+            assert (await resp.json())["received"] == len(data) - BLOCK
+
+    @pytest.mark.asyncio
+    async def test_rejects_escaping_paths(self, aiohttp_client, receiver):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "X-Image-Type": "clonezilla_dir",
+        }
+        params = {"file": "../../evil", "size": "1", "source": "s"}
+
+        async with session.get(
+            f"{base_url}/upload/backup/state", params=params, headers=headers
+        ) as resp:
+            assert resp.status == 400
@@ -0,0 +1,162 @@
+"""Tests for the in-process secure erase engine.
+
+Covers:
+- PatternGenerator determinism and per-block variation
+- sample_count sizing
+- secure_erase_device pattern/zero passes and read-back verification
+- verify_discarded_device after BLKSECDISCARD
+"""
+
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from rpi_usb_cloner.storage.clone import secure_erase
+from rpi_usb_cloner.storage.clone.secure_erase import (
+    PatternGenerator,
+    sample_count,
+    secure_erase_device,
+    verify_discarded_device,
+)
+
+
+BLOCK = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(secure_erase, "ERASE_BLOCK_SIZE", BLOCK)
+
+
+@pytest.fixture
+def device(tmp_path):
+    path = tmp_path / "device.img"
+    path.write_bytes(b"\xa5" * (3 * BLOCK + 8192))
+    return path
+
+
+class TestPatternGenerator:
+    """Test PatternGenerator class."""
+
+    def test_deterministic_for_seed(self):
+        first = PatternGenerator(42, BLOCK)
+        second = PatternGenerator(42, BLOCK)
+        assert bytes(first.block(3)) == bytes(second.block(3))
+        assert bytes(first.block(3)) != bytes(PatternGenerator(43, BLOCK).block(3))
+
+    def test_blocks_differ(self):
+        pattern = PatternGenerator(7, BLOCK)
+        assert len(pattern.block(0)) == BLOCK
+        assert bytes(pattern.block(0)) != bytes(pattern.block(1))
+
+    def test_expected_spans_blocks(self):
+        pattern = PatternGenerator(7, BLOCK)
+        joined = bytes(pattern.block(0)) + bytes(pattern.block(1))
+        assert pattern.expected(BLOCK - 100, 200) == joined[BLOCK - 100 : BLOCK + 100]
+
+
+class TestSampleCount:
+    """Test sample_count function."""
+
+    def test_confidence_bound(self):
+        # ln(0.01) / ln(0.999) rounds up to 4603
+        assert sample_count(1 << 40) == 4603
+
+    def test_capped_by_region_count(self):
+        assert sample_count(10 * 4096) == 10
+
+
+class TestSecureEraseDevice:
+    """Test secure_erase_device function."""
+
+    def test_pattern_pass_overwrites_and_verifies(self, device):
+        updates = []
+
+        result = secure_erase_device(
+            str(device),
+            seed=1234,
+            progress_callback=lambda lines, ratio: updates.append(lines[0]),
+        )
+
+        data = device.read_bytes()
+        assert data == PatternGenerator(1234, BLOCK).expected(0, len(data))
+        assert result.verified
+        assert result.passes == ("pattern",)
+        assert result.samples_checked == len(data) // 4096
+        assert result.to_dict()["verified"] is True
+        assert "VERIFYING" in updates
+
+    def test_zero_pass_leaves_zeros(self, device, mocker):
+        mocker.patch.object(
+            secure_erase,
+            "probe_offload_capabilities",
+            return_value=mocker.Mock(can_zero_out=False),
+        )
+
+        result = secure_erase_device(str(device), zero_pass=True, verify="full")
+
+        assert device.read_bytes() == bytes(device.stat().st_size)
+        assert result.passes == ("pattern", "zero")
+        assert result.bytes_checked == device.stat().st_size
+        assert result.verified
+
+    def test_mismatch_detected(self, device, mocker):
+        real_pwrite = os.pwrite
+
+        def skip_second_block(fd, data, offset):
+            if offset == BLOCK:
+                return len(data)
+            return real_pwrite(fd, data, offset)
+
+        mocker.patch.object(secure_erase.os, "pwrite", side_effect=skip_second_block)
+
+        result = secure_erase_device(str(device), verify="full")
+
+        assert not result.verified
+        assert result.mismatches == 1
+        assert result.first_mismatch_offset == BLOCK
+
+    def test_verify_none_is_not_verified(self, device):
+        result = secure_erase_device(str(device), verify="none")
+        assert result.samples_checked == 0
+        assert not result.verified
+
+    def test_missing_device_raises(self, tmp_path):
+        with pytest.raises(RuntimeError, match="Cannot open"):
+            secure_erase_device(str(tmp_path / "missing"))
+
+    def test_unknown_verify_mode_raises(self, device):
+        with pytest.raises(ValueError, match="Unknown verify mode"):
+            secure_erase_device(str(device), verify="maybe")
+
+
+class TestVerifyDiscardedDevice:
+    """Test verify_discarded_device function."""
+
+    @pytest.mark.parametrize("fill", [b"\x00", b"\xff"])
+    def test_cleared_device_verified(self, tmp_path, fill):
+        device = tmp_path / "device.img"
+        device.write_bytes(fill * (3 * BLOCK))
+
+        result = verify_discarded_device(str(device), verify="full")
+
+        assert result.verified
+        assert result.passes == ("secdiscard",)
+        assert result.bytes_checked == 3 * BLOCK
+
+    def test_surviving_data_detected(self, device):
+        with device.open("r+b") as handle:
+            handle.write(bytes(BLOCK))
+
+        result = verify_discarded_device(str(device), verify="full")
+
+        assert not result.verified
+        assert result.samples_checked == 4
+        assert result.mismatches == 3
+        assert result.first_mismatch_offset == BLOCK
+
+    def test_verify_none_rejected(self, device):
+        with pytest.raises(ValueError, match="Unknown verify mode"):
+            verify_discarded_device(str(device), verify="none")
@@ -112,7 +112,7 @@ class TestIsRepoOnMount:
 class TestGetRepoDeviceNames:
     """Tests for _get_repo_device_names function."""
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     @patch("rpi_usb_cloner.services.drives.list_usb_disks")
     @patch("rpi_usb_cloner.services.drives._collect_mountpoints")
     def test_no_repos(self, mock_collect, mock_list_usb, mock_find_repos):
@@ -125,7 +125,7 @@ class TestGetRepoDeviceNames:
         assert result == set()
         mock_list_usb.assert_not_called()
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     @patch("rpi_usb_cloner.services.drives.list_usb_disks")
     @patch("rpi_usb_cloner.services.drives._collect_mountpoints")
     def test_repo_on_device(self, mock_collect, mock_list_usb, mock_find_repos):
@@ -149,7 +149,7 @@ class TestGetRepoDeviceNames:
 
         assert result == {"sda"}
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     @patch("rpi_usb_cloner.services.drives.list_usb_disks")
     @patch("rpi_usb_cloner.services.drives._collect_mountpoints")
     def test_multiple_repo_devices(self, mock_collect, mock_list_usb, mock_find_repos):
@@ -176,7 +176,7 @@ class TestGetRepoDeviceNames:
 
         assert result == {"sda", "sdb"}
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     @patch("rpi_usb_cloner.services.drives.list_usb_disks")
     @patch("rpi_usb_cloner.services.drives._collect_mountpoints")
     def test_device_without_name(self, mock_collect, mock_list_usb, mock_find_repos):
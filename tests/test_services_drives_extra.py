@@ -385,7 +385,7 @@ class TestListUSBDisksFiltered:
 class TestRepoCacheGracePeriod:
     """Test cache grace period behavior in _get_repo_device_names."""
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     def test_grace_period_no_cache_empty_result(self, mock_find_repos):
         """Test that empty results are not cached during grace period."""
         import time
@@ -418,10 +418,10 @@ class TestRepoCacheGracePeriod:
             # Second call - should rescan since first wasn't cached
             _get_repo_device_names()
 
-        # find_image_repos should have been called twice since cache was invalidated
+        # list_image_repos should have been called twice since cache was invalidated
         assert mock_find_repos.call_count == 2
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     def test_after_grace_period_cache_empty(self, mock_find_repos):
         """Test that empty results are cached after grace period."""
         import time
@@ -447,7 +447,7 @@ class TestRepoCacheGracePeriod:
         # The function should cache after first call (once past grace period)
         # Note: The exact call count depends on internal state management
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     def test_caching_with_repos(self, mock_find_repos):
         """Test that non-empty results are always cached."""
         invalidate_repo_cache()
@@ -471,11 +471,11 @@ class TestRepoCacheGracePeriod:
             # Second call - should use cache
             result2 = _get_repo_device_names()
 
-            # find_image_repos should only be called once
+            # list_image_repos should only be called once
             assert mock_find_repos.call_count == 1
             assert result1 == result2
 
-    @patch("rpi_usb_cloner.services.drives.find_image_repos")
+    @patch("rpi_usb_cloner.services.drives.list_image_repos")
     def test_invalidate_cache_clears_cache(self, mock_find_repos):
         """Test that invalidate_repo_cache clears the cache."""
         from rpi_usb_cloner.domain import ImageRepo
@@ -0,0 +1,148 @@
+"""Tests for the in-process block stream writer.
+
+Covers:
+- write_stream_to_device byte-exact output
+- Zero-block offload via BLKZEROOUT (and fallback when refused)
+- Progress callback reporting
+- get_write_zeroes_max_bytes sysfs parsing
+"""
+
+from __future__ import annotations
+
+import io
+
+import pytest
+
+from rpi_usb_cloner.storage.clone import stream_writer
+from rpi_usb_cloner.storage.clone.stream_writer import (
+    get_write_zeroes_max_bytes,
+    write_stream_to_device,
+)
+
+
+BLOCK = 4096
+
+
+@pytest.fixture
+def target_file(tmp_path):
+    target = tmp_path / "target.img"
+    target.write_bytes(b"\xff" * (BLOCK * 8))
+    return target
+
+
+def _payload() -> bytes:
+    return b"A" * BLOCK + bytes(BLOCK * 3) + b"B" * BLOCK + b"tail"
+
+
+class TestWriteStreamToDevice:
+    """Test write_stream_to_device function."""
+
+    def test_writes_exact_bytes_without_offload(self, target_file, mocker):
+        mocker.patch.object(stream_writer, "get_write_zeroes_max_bytes", return_value=0)
+        payload = _payload()
+
+        written = write_stream_to_device(
+            io.BytesIO(payload),
+            str(target_file),
+            progress_callback=lambda lines, ratio: None,
+            block_size=BLOCK,
+        )
+
+        assert written == len(payload)
+        data = target_file.read_bytes()
+        assert data[: len(payload)] == payload
+        # Bytes beyond the stream are left untouched
+        assert data[len(payload) :] == b"\xff" * (BLOCK * 8 - len(payload))
+
+    def test_zero_runs_are_offloaded(self, target_file, mocker):
+        mocker.patch.object(
+            stream_writer, "get_write_zeroes_max_bytes", return_value=1 << 30
+        )
+        calls = []
+
+        def fake_zero_out(fd, offset, length):
+            calls.append((offset, length))
+            # Emulate the kernel zeroing the range
+            import os
+
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, bytes(length))
+            return True
+
+        mocker.patch.object(stream_writer, "zero_out_range", side_effect=fake_zero_out)
+        payload = _payload()
+
+        write_stream_to_device(
+            io.BytesIO(payload),
+            str(target_file),
+            progress_callback=lambda lines, ratio: None,
+            block_size=BLOCK,
+        )
+
+        # Three consecutive zero blocks coalesce into one request
+        assert calls == [(BLOCK, BLOCK * 3)]
+        assert target_file.read_bytes()[: len(payload)] == payload
+
+    def test_refused_offload_falls_back_to_writing_zeros(self, target_file, mocker):
+        mocker.patch.object(
+            stream_writer, "get_write_zeroes_max_bytes", return_value=1 << 30
+        )
+        mocker.patch.object(stream_writer, "zero_out_range", return_value=False)
+        payload = _payload()
+
+        write_stream_to_device(
+            io.BytesIO(payload),
+            str(target_file),
+            progress_callback=lambda lines, ratio: None,
+            block_size=BLOCK,
+        )
+
+        assert target_file.read_bytes()[: len(payload)] == payload
+
+    def test_progress_reports_ratio_against_total(self, target_file, mocker):
+        mocker.patch.object(stream_writer, "get_write_zeroes_max_bytes", return_value=0)
+        updates = []
+        payload = _payload()
+
+        write_stream_to_device(
+            io.BytesIO(payload),
+            str(target_file),
+            total_bytes=len(payload),
+            title="WRITE",
+            progress_callback=lambda lines, ratio: updates.append((lines, ratio)),
+            block_size=BLOCK,
+        )
+
+        assert updates[0][1] == 0.0
+        assert updates[-1] == (["WRITE", "Complete"], 1.0)
+
+    def test_unopenable_target_raises(self, tmp_path):
+        with pytest.raises(RuntimeError, match="Cannot open"):
+            write_stream_to_device(
+                io.BytesIO(b"data"),
+                str(tmp_path / "missing" / "target"),
+                progress_callback=lambda lines, ratio: None,
+            )
+
+    def test_block_size_must_be_sector_multiple(self, target_file):
+        with pytest.raises(ValueError):
+            write_stream_to_device(
+                io.BytesIO(b"data"), str(target_file), block_size=1000
+            )
+
+
+class TestWriteZeroesMaxBytes:
+    """Test get_write_zeroes_max_bytes helper."""
+
+    def test_missing_device_returns_zero(self):
+        assert get_write_zeroes_max_bytes("/dev/does-not-exist-xyz") == 0
+
+    def test_parses_queue_attribute(self, mocker):
+        mocker.patch.object(
+            stream_writer, "read_queue_attribute", return_value="33553920"
+        )
+        assert get_write_zeroes_max_bytes("/dev/sda") == 33553920
+
+    def test_invalid_value_returns_zero(self, mocker):
+        mocker.patch.object(stream_writer, "read_queue_attribute", return_value="n/a")
+        assert get_write_zeroes_max_bytes("/dev/sda") == 0
@@ -0,0 +1,298 @@
+"""Tests for native sysfs block device enumeration.
+
+Covers:
+- udev database parsing
+- blkid-compatible filesystem and partition table probes
+- lsblk-shaped device dicts built from a fake sysfs tree
+- sysfs-first enumeration with lsblk fallback in storage.devices
+"""
+
+from __future__ import annotations
+
+import struct
+import uuid
+
+import pytest
+
+from rpi_usb_cloner.storage import devices as storage_devices
+from rpi_usb_cloner.storage import mount_table, sysfs_devices
+from rpi_usb_cloner.storage.mount_table import MountTable
+from rpi_usb_cloner.storage.sysfs_devices import (
+    enumerate_block_devices,
+    probe_filesystem,
+    probe_partition_table,
+    read_block_device,
+    read_udev_properties,
+)
+
+
+def reader(image: bytes):
+    def read(offset: int, length: int) -> bytes:
+        return image[offset : offset + length]
+
+    return read
+
+
+def fat32_image(label: bytes = b"BACKUP     ") -> bytes:
+    image = bytearray(sysfs_devices.PROBE_READ_BYTES)
+    image[71:82] = label
+    image[82:90] = b"FAT32   "
+    image[510:512] = b"\x55\xaa"
+    return bytes(image)
+
+
+def ext4_image(label: bytes = b"rootfs") -> bytes:
+    image = bytearray(sysfs_devices.PROBE_READ_BYTES)
+    image[1080:1082] = b"\x53\xef"
+    struct.pack_into("<II", image, 1024 + 0x5C, 0x4, 0x40)
+    image[1024 + 0x78 : 1024 + 0x78 + len(label)] = label
+    return bytes(image)
+
+
+def exfat_image(label: str = "Photos") -> bytes:
+    image = bytearray(256 * 1024)
+    image[3:11] = b"EXFAT   "
+    # 512-byte sectors, 8 sectors per cluster, heap at sector 128, root cluster 4
+    struct.pack_into("<I4xI", image, 88, 128, 4)
+    image[108] = 9
+    image[109] = 3
+    root = 128 * 512 + 2 * 4096
+    image[root] = 0x81
+    entry = root + 32
+    image[entry] = 0x83
+    image[entry + 1] = len(label)
+    encoded = label.encode("utf-16-le")
+    image[entry + 2 : entry + 2 + len(encoded)] = encoded
+    return bytes(image)
+
+
+def ntfs_image(label: str = "Windows") -> bytes:
+    image = bytearray(sysfs_devices.PROBE_READ_BYTES + 8 * 1024)
+    image[3:11] = b"NTFS    "
+    struct.pack_into("<H", image, 11, 512)
+    image[13] = 8
+    struct.pack_into("<Q", image, 0x30, 4)
+    struct.pack_into("<b", image, 0x40, -10)
+    record_offset = 4 * 4096 + 3 * 1024
+    record = bytearray(1024)
+    record[:4] = b"FILE"
+    # Update sequence: number 0x0101, stashed sector tails 0x0000
+    struct.pack_into("<HH", record, 4, 0x30, 3)
+    struct.pack_into("<HHH", record, 0x30, 0x0101, 0, 0)
+    struct.pack_into("<H", record, 0x14, 0x38)
+    encoded = label.encode("utf-16-le")
+    struct.pack_into("<IIB", record, 0x38, 0x60, 0x18 + len(encoded) + 8, 0)
+    struct.pack_into("<IH", record, 0x38 + 0x10, len(encoded), 0x18)
+    record[0x38 + 0x18 : 0x38 + 0x18 + len(encoded)] = encoded
+    end = 0x38 + 0x18 + len(encoded) + 8
+    struct.pack_into("<I", record, end, 0xFFFFFFFF)
+    record[510:512] = b"\x01\x01"
+    record[1022:1024] = b"\x01\x01"
+    image[record_offset : record_offset + 1024] = record
+    return bytes(image)
+
+
+def mbr_image(signature: int = 0x3A2B1C0D) -> bytes:
+    image = bytearray(8192)
+    struct.pack_into("<I", image, 440, signature)
+    image[446] = 0x80
+    image[446 + 4] = 0x0C
+    image[510:512] = b"\x55\xaa"
+    return bytes(image)
+
+
+class TestUdevDatabase:
+    """Test udev database parsing."""
+
+    def test_read_udev_properties(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sysfs_devices, "UDEV_DATA_DIR", tmp_path)
+        (tmp_path / "b8:16").write_text(
+            "S:disk/by-id/usb-x\nE:ID_FS_TYPE=vfat\nE:ID_SERIAL_SHORT=AA01\n"
+        )
+        assert read_udev_properties("8:16") == {
+            "ID_FS_TYPE": "vfat",
+            "ID_SERIAL_SHORT": "AA01",
+        }
+        assert read_udev_properties("8:32") is None
+
+
+class TestProbes:
+    """Test the blkid-compatible probes."""
+
+    def test_fat32(self):
+        assert probe_filesystem(reader(fat32_image())) == ("vfat", "BACKUP")
+        assert probe_filesystem(reader(fat32_image(b"NO NAME    "))) == (
+            "vfat",
+            None,
+        )
+
+    def test_ext4(self):
+        assert probe_filesystem(reader(ext4_image())) == ("ext4", "rootfs")
+
+    def test_exfat_label_from_root_directory(self):
+        assert probe_filesystem(reader(exfat_image())) == ("exfat", "Photos")
+
+    def test_ntfs_label_from_volume_record(self):
+        assert probe_filesystem(reader(ntfs_image())) == ("ntfs", "Windows")
+
+    def test_unknown(self):
+        assert probe_filesystem(reader(bytes(70000))) is None
+
+    def test_dos_partition_table(self):
+        assert probe_partition_table(reader(mbr_image())) == ("dos", "3a2b1c0d")
+
+    def test_gpt_partition_table(self):
+        image = bytearray(mbr_image())
+        disk_guid = uuid.uuid4()
+        image[512:520] = b"EFI PART"
+        image[512 + 56 : 512 + 72] = disk_guid.bytes_le
+        assert probe_partition_table(reader(bytes(image))) == ("gpt", str(disk_guid))
+
+    def test_no_partition_table(self):
+        assert probe_partition_table(reader(bytes(1024))) is None
+
+
+@pytest.fixture
+def fake_sysfs(tmp_path, monkeypatch):
+    """Fake /sys/block, /dev, mountinfo and udev database under tmp_path."""
+    sys_block = tmp_path / "sys" / "block"
+    sys_block.mkdir(parents=True)
+    dev_dir = tmp_path / "dev"
+    dev_dir.mkdir()
+    udev_dir = tmp_path / "udev"
+    udev_dir.mkdir()
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text("")
+    monkeypatch.setattr(sysfs_devices, "SYS_BLOCK_DIR", sys_block)
+    monkeypatch.setattr(sysfs_devices, "DEV_DIR", dev_dir)
+    monkeypatch.setattr(sysfs_devices, "UDEV_DATA_DIR", udev_dir)
+    mounts = MountTable(mountinfo)
+    monkeypatch.setattr(mount_table, "_mount_table", mounts)
+    sysfs_devices.clear_probe_cache()
+
+    class FakeSysfs:
+        root = tmp_path
+
+        def add_disk(self, name, devno, sectors, bus="usb1/1-1", **attributes):
+            device_dir = tmp_path / "sys" / "devices" / bus / "host0" / "block" / name
+            device_dir.mkdir(parents=True)
+            (sys_block / name).symlink_to(device_dir)
+            files = {"dev": devno, "size": sectors, "removable": 0, **attributes}
+            for relative, value in files.items():
+                path = device_dir / relative
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(f"{value}\n")
+            return device_dir
+
+        def add_partition(self, disk_dir, name, number, devno, sectors):
+            part_dir = disk_dir / name
+            part_dir.mkdir()
+            (part_dir / "partition").write_text(f"{number}\n")
+            (part_dir / "dev").write_text(f"{devno}\n")
+            (part_dir / "size").write_text(f"{sectors}\n")
+
+    yield FakeSysfs()
+    mounts.close()
+
+
+class TestEnumeration:
+    """Test lsblk-shaped dicts built from sysfs."""
+
+    def test_usb_disk_with_partition(self, fake_sysfs):
+        disk_dir = fake_sysfs.add_disk(
+            "sdb",
+            "8:16",
+            31116288,
+            removable=1,
+            **{
+                "device/model": "Ultra Fit       ",
+                "device/vendor": "SanDisk ",
+                "queue/rotational": 0,
+            },
+        )
+        fake_sysfs.add_partition(disk_dir, "sdb1", 1, "8:17", 31114240)
+        (fake_sysfs.root / "dev" / "sdb").write_bytes(mbr_image())
+        (fake_sysfs.root / "dev" / "sdb1").write_bytes(fat32_image())
+        (fake_sysfs.root / "mountinfo").write_text(
+            "30 28 8:17 / /media/usb rw - vfat /dev/sdb1 rw\n"
+        )
+
+        device = read_block_device("sdb")
+
+        assert device["name"] == "sdb"
+        assert device["type"] == "disk"
+        assert device["size"] == 31116288 * 512
+        assert device["tran"] == "usb"
+        assert device["rm"] is True
+        assert device["rota"] is False
+        assert device["model"] == "Ultra Fit"
+        assert device["vendor"] == "SanDisk"
+        assert (device["pttype"], device["ptuuid"]) == ("dos", "3a2b1c0d")
+        assert device["fstype"] is None
+        (child,) = device["children"]
+        assert child["name"] == "sdb1"
+        assert child["type"] == "part"
+        assert child["mountpoint"] == "/media/usb"
+        assert (child["fstype"], child["label"]) == ("vfat", "BACKUP")
+        assert set(child) == set(device) - {"children"}
+
+    def test_udev_database_preferred_over_probe(self, fake_sysfs):
+        fake_sysfs.add_disk("sdc", "8:32", 2048, bus="usb1/1-2")
+        (fake_sysfs.root / "udev" / "b8:32").write_text(
+            "E:ID_FS_TYPE=exfat\n"
+            "E:ID_FS_LABEL=My_Stick\n"
+            "E:ID_FS_LABEL_ENC=My\\x20Stick\n"
+            "E:ID_SERIAL_SHORT=4C530001\n"
+        )
+        device = read_block_device("sdc")
+        assert device["fstype"] == "exfat"
+        assert device["label"] == "My Stick"
+        assert device["serial"] == "4C530001"
+
+    def test_enumeration_skips_empty_and_ram_disks(self, fake_sysfs):
+        fake_sysfs.add_disk("loop0", "7:0", 0, bus="virtual")
+        fake_sysfs.add_disk("ram0", "1:0", 8192, bus="virtual/ram")
+        fake_sysfs.add_disk("mmcblk0", "179:0", 4096, bus="mmc_host/mmc0")
+        fake_sysfs.add_disk("sda", "8:0", 4096, bus="platform/ata1")
+        fake_sysfs.add_disk("sda10", "8:160", 4096, bus="virtual/x")
+        fake_sysfs.add_disk("sda2", "8:2", 4096, bus="virtual/y")
+
+        found = enumerate_block_devices()
+
+        assert [device["name"] for device in found] == [
+            "mmcblk0",
+            "sda",
+            "sda2",
+            "sda10",
+        ]
+        assert found[0]["tran"] == "mmc"
+        assert found[1]["tran"] == "sata"
+
+    def test_missing_disk(self, fake_sysfs):
+        assert read_block_device("sdz") is None
+
+
+class TestDevicesIntegration:
+    """Test sysfs-first enumeration in storage.devices."""
+
+    def test_get_block_devices_uses_sysfs(self, fake_sysfs, monkeypatch):
+        fake_sysfs.add_disk("sdb", "8:16", 2048, removable=1)
+        monkeypatch.setattr(storage_devices, "_lsblk_cache", None)
+        monkeypatch.setattr(
+            storage_devices,
+            "run_command",
+            lambda *args, **kwargs: pytest.fail("lsblk should not run"),
+        )
+        found = storage_devices.get_block_devices(force_refresh=True)
+        assert [device["name"] for device in found] == ["sdb"]
+        assert storage_devices.list_usb_disks()[0]["name"] == "sdb"
+        assert storage_devices.query_block_device("sdb")["size"] == 2048 * 512
+        assert storage_devices.query_block_device("sdq") is None
+
+    def test_falls_back_to_lsblk(self, tmp_path, monkeypatch, mocker):
+        monkeypatch.setattr(sysfs_devices, "SYS_BLOCK_DIR", tmp_path / "missing")
+        run_lsblk = mocker.patch.object(
+            storage_devices, "run_lsblk", return_value=[{"name": "sda"}]
+        )
+        assert storage_devices.read_block_devices() == [{"name": "sda"}]
+        run_lsblk.assert_called_once_with()
@@ -0,0 +1,181 @@
+"""Tests for the zero-copy transfer engine.
+
+Covers:
+- kernel copy with copy_file_range, sendfile and read/write fallbacks
+- preallocation and metadata preservation
+- throttled byte-level progress
+- concurrent volume copies
+"""
+
+from __future__ import annotations
+
+import errno
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from rpi_usb_cloner.services import transfer, transfer_engine
+from rpi_usb_cloner.services.transfer_engine import ProgressThrottle
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(transfer_engine, "CHUNK_BYTES", 1024)
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    src = tmp_path / "sda1.ext4-ptcl-img.gz.aa"
+    src.write_bytes(os.urandom(10 * 1024 + 7))
+    os.utime(src, (1_000_000_000, 1_000_000_000))
+    return src
+
+
+def unsupported(*args, **kwargs):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+class TestCopyFile:
+    """Test single file copies."""
+
+    def test_copies_data_and_metadata(self, tmp_path, source_file, small_chunks):
+        dest = tmp_path / "copy"
+        counts = []
+
+        copied = transfer_engine.copy_file(source_file, dest, counts.append)
+
+        assert copied == source_file.stat().st_size
+        assert dest.read_bytes() == source_file.read_bytes()
+        assert dest.stat().st_mtime == source_file.stat().st_mtime
+        assert sum(counts) == copied
+        assert len(counts) == 11
+
+    def test_falls_back_to_sendfile(
+        self, tmp_path, source_file, small_chunks, monkeypatch
+    ):
+        monkeypatch.setattr(transfer_engine.os, "copy_file_range", unsupported)
+        sendfile = Mock(side_effect=os.sendfile)
+        monkeypatch.setattr(transfer_engine.os, "sendfile", sendfile)
+        dest = tmp_path / "copy"
+
+        transfer_engine.copy_file(source_file, dest)
+
+        assert dest.read_bytes() == source_file.read_bytes()
+        assert sendfile.called
+
+    def test_falls_back_to_read_write(
+        self, tmp_path, source_file, small_chunks, monkeypatch
+    ):
+        monkeypatch.setattr(transfer_engine.os, "copy_file_range", unsupported)
+        monkeypatch.setattr(transfer_engine.os, "sendfile", unsupported)
+        dest = tmp_path / "copy"
+
+        transfer_engine.copy_file(source_file, dest)
+
+        assert dest.read_bytes() == source_file.read_bytes()
+
+    def test_real_errors_propagate(self, tmp_path, source_file, monkeypatch):
+        def failing(*args, **kwargs):
+            raise OSError(errno.EIO, "I/O error")
+
+        monkeypatch.setattr(transfer_engine.os, "copy_file_range", failing)
+
+        with pytest.raises(OSError, match="I/O error"):
+            transfer_engine.copy_file(source_file, tmp_path / "copy")
+
+    def test_truncates_existing_destination(self, tmp_path, source_file):
+        dest = tmp_path / "copy"
+        dest.write_bytes(b"z" * 50000)
+
+        transfer_engine.copy_file(source_file, dest)
+
+        assert dest.read_bytes() == source_file.read_bytes()
+
+    def test_preallocate_without_fallocate(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(transfer_engine, "_load_fallocate", lambda: None)
+        with (tmp_path / "file").open("wb") as handle:
+            assert transfer_engine.preallocate(handle.fileno(), 4096) is False
+
+
+class TestProgressThrottle:
+    """Test throttled progress reporting."""
+
+    def test_reports_at_most_once_per_interval(self, monkeypatch):
+        clock = [10.0]
+        monkeypatch.setattr(transfer_engine.time, "monotonic", lambda: clock[0])
+        callback = Mock()
+        throttle = ProgressThrottle(1000, callback, interval=1.0)
+
+        throttle.add(100)
+        throttle.add(100)
+        clock[0] += 1.0
+        throttle.add(300)
+        throttle.finish()
+
+        ratios = [call.args[0] for call in callback.call_args_list]
+        assert ratios == [0.1, 0.5, 1.0]
+
+
+class TestCopyFiles:
+    """Test multi-file copies."""
+
+    def make_pairs(self, tmp_path, count):
+        src_dir = tmp_path / "src"
+        dest_dir = tmp_path / "dest"
+        src_dir.mkdir()
+        dest_dir.mkdir()
+        pairs = []
+        for index in range(count):
+            src = src_dir / f"vol.a{index}"
+            src.write_bytes(bytes([index]) * 4096)
+            pairs.append((src, dest_dir / src.name))
+        return pairs
+
+    def test_parallel_copy(self, tmp_path):
+        pairs = self.make_pairs(tmp_path, 5)
+        throttle = ProgressThrottle(5 * 4096, None)
+
+        transfer_engine.copy_files(pairs, throttle.add, workers=3)
+
+        assert throttle.copied_bytes == 5 * 4096
+        for src, dest in pairs:
+            assert dest.read_bytes() == src.read_bytes()
+
+    def test_parallel_failure_raises(self, tmp_path):
+        pairs = self.make_pairs(tmp_path, 3)
+        pairs[1][0].unlink()
+
+        with pytest.raises(FileNotFoundError):
+            transfer_engine.copy_files(pairs, workers=3)
+
+    def test_volume_workers(self, tmp_path, monkeypatch):
+        assert transfer_engine.volume_workers(tmp_path, tmp_path) == 1
+        monkeypatch.setattr(transfer_engine, "on_same_device", lambda src, dest: False)
+        assert (
+            transfer_engine.volume_workers(tmp_path, tmp_path)
+            == transfer_engine.PARALLEL_VOLUME_WORKERS
+        )
+
+
+class TestDirectoryTransfer:
+    """Test Clonezilla directory copies through the engine."""
+
+    def test_progress_within_single_volume(self, tmp_path, small_chunks, monkeypatch):
+        monkeypatch.setattr(transfer_engine, "PROGRESS_INTERVAL_SECONDS", 0.0)
+        monkeypatch.setattr(transfer_engine, "on_same_device", lambda src, dest: False)
+        src = tmp_path / "backup"
+        src.mkdir()
+        (src / "parts").write_text("sda1\n")
+        (src / "sda1.ext4-ptcl-img.gz.aa").write_bytes(b"v" * 8192)
+        dest = tmp_path / "repo" / "clonezilla" / "backup"
+        progress = []
+
+        transfer._copy_directory_with_progress(
+            src, dest, "backup", lambda name, ratio: progress.append(ratio)
+        )
+
+        assert (dest / "sda1.ext4-ptcl-img.gz.aa").read_bytes() == b"v" * 8192
+        assert (dest / "parts").read_text() == "sda1\n"
+        assert len([ratio for ratio in progress if 0.0 < ratio < 1.0]) >= 4
+        assert progress[-1] == 1.0
@@ -0,0 +1,261 @@
+"""Tests for the transfer scheduler.
+
+Covers:
+- fair, weighted sharing of capped drives, links and USB buses
+- preemption of background jobs
+- pacing with Job.consume()
+- registration by repo copies and peer uploads
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import peer_transfer_client, transfer
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.storage import transfer_scheduler
+from rpi_usb_cloner.storage.transfer_scheduler import (
+    MB,
+    PREEMPTED_BYTES_PER_SECOND,
+    Priority,
+    TransferScheduler,
+)
+
+
+BUSES = {"sda": ("1", 480), "sdb": ("1", 480), "sdc": ("2", 5000)}
+
+
+@pytest.fixture
+def scheduler():
+    return TransferScheduler(bus_lookup=BUSES.get)
+
+
+class TestSharing:
+    """Test how capacity is split between jobs."""
+
+    def test_solo_job_is_unlimited(self, scheduler):
+        with scheduler.job("copy", Priority.TRANSFER, devices=["sda"]) as job:
+            assert job.resources == {"device:sda", "bus:1"}
+            assert scheduler.rate_for(job) is None
+
+    def test_shared_bus_split_fairly(self, scheduler):
+        with scheduler.job("a", Priority.TRANSFER, devices=["sda"]) as a:
+            with scheduler.job("b", Priority.TRANSFER, devices=["sdb"]) as b:
+                assert scheduler.rate_for(a) == 20 * MB
+                assert scheduler.rate_for(b) == 20 * MB
+            assert scheduler.rate_for(a) is None
+
+    def test_interactive_job_gets_larger_share(self, scheduler):
+        with scheduler.job(
+            "restore", Priority.INTERACTIVE, devices=["sda"]
+        ) as restore, scheduler.job("copy", Priority.TRANSFER, devices=["sdb"]) as copy:
+            assert scheduler.rate_for(restore) == 32 * MB
+            assert scheduler.rate_for(copy) == 8 * MB
+
+    def test_jobs_on_other_buses_do_not_share(self, scheduler):
+        with scheduler.job("a", Priority.TRANSFER, devices=["sda"]) as a, scheduler.job(
+            "c", Priority.TRANSFER, devices=["sdc"]
+        ):
+            assert scheduler.rate_for(a) is None
+
+    def test_link_cap_shared(self, scheduler):
+        scheduler.set_cap("link:pi2", 10 * MB)
+        with scheduler.job("a", Priority.TRANSFER, links=["pi2"]) as a:
+            assert scheduler.rate_for(a) == 10 * MB
+            with scheduler.job("b", Priority.TRANSFER, links=["pi2"]):
+                assert scheduler.rate_for(a) == 5 * MB
+        scheduler.set_cap("link:pi2", None)
+        with scheduler.job("a", Priority.TRANSFER, links=["pi2"]) as a:
+            assert scheduler.rate_for(a) is None
+
+    def test_device_cap_from_settings(self, scheduler, monkeypatch):
+        values = {"transfer_device_cap_mbps": 25}
+        monkeypatch.setattr(
+            transfer_scheduler.settings,
+            "get_setting",
+            lambda key, default=None: values.get(key, default),
+        )
+        with scheduler.job("a", Priority.TRANSFER, devices=["sdc"]) as a:
+            assert scheduler.rate_for(a) == 25 * MB
+
+    def test_slowest_resource_wins(self, scheduler):
+        scheduler.set_cap("link:pi2", 100 * MB)
+        with scheduler.job(
+            "send", Priority.TRANSFER, devices=["sda"], links=["pi2"]
+        ) as send, scheduler.job("copy", Priority.TRANSFER, devices=["sdb"]):
+            assert scheduler.rate_for(send) == 20 * MB
+
+
+class TestPreemption:
+    """Test background jobs yielding to other jobs."""
+
+    def test_background_preempted_on_shared_resource(self, scheduler):
+        with scheduler.job("sync", Priority.BACKGROUND, devices=["sda"]) as sync:
+            assert scheduler.rate_for(sync) is None
+            with scheduler.job("restore", Priority.INTERACTIVE, devices=["sdb"]) as r:
+                assert scheduler.rate_for(sync) == PREEMPTED_BYTES_PER_SECOND
+                # The preempted job does not take a share
+                assert scheduler.rate_for(r) == 40 * MB
+                statuses = {status.name: status for status in scheduler.jobs()}
+                assert statuses["sync"].preempted
+                assert not statuses["restore"].preempted
+                assert [status.name for status in scheduler.jobs()] == [
+                    "restore",
+                    "sync",
+                ]
+            assert scheduler.rate_for(sync) is None
+
+    def test_background_runs_beside_unrelated_jobs(self, scheduler):
+        with scheduler.job(
+            "sync", Priority.BACKGROUND, devices=["sda"]
+        ) as sync, scheduler.job("restore", Priority.INTERACTIVE, devices=["sdc"]):
+            assert scheduler.rate_for(sync) is None
+
+    def test_background_jobs_share_with_each_other(self, scheduler):
+        with scheduler.job(
+            "a", Priority.BACKGROUND, devices=["sda"]
+        ) as a, scheduler.job("b", Priority.BACKGROUND, devices=["sdb"]):
+            assert scheduler.rate_for(a) == 20 * MB
+
+
+class TestConsume:
+    """Test pacing with Job.consume()."""
+
+    def test_counts_bytes(self, scheduler):
+        with scheduler.job("copy", Priority.TRANSFER) as job:
+            job.consume(100)
+            job.consume(50)
+            assert scheduler.jobs()[0].moved_bytes == 150
+
+    def test_waits_while_over_share(self, scheduler):
+        scheduler.set_cap("link:pi2", 2 * MB)
+        with scheduler.job("send", Priority.TRANSFER, links=["pi2"]) as job:
+            started = time.monotonic()
+            # The first second's worth runs ahead; the rest is paced
+            job.consume(MB)
+            assert time.monotonic() - started < 0.2
+            job.consume(MB)
+            assert time.monotonic() - started >= 0.4
+
+    def test_release_wakes_waiting_job(self, scheduler):
+        scheduler.set_cap("link:pi2", MB)
+        job = scheduler.register("send", Priority.TRANSFER, links=["pi2"])
+        thread = threading.Thread(target=job.consume, args=(50 * MB,))
+        thread.start()
+        time.sleep(0.1)
+        assert thread.is_alive()
+
+        scheduler.release(job)
+        thread.join(timeout=2)
+
+        assert not thread.is_alive()
+        assert scheduler.jobs() == []
+
+
+class TestHelpers:
+    """Test device and bus lookups."""
+
+    @pytest.mark.parametrize(
+        ("speed", "expected"),
+        [(0, None), (12, 40 * MB), (480, 40 * MB), (5000, 400 * MB), (10000, 800 * MB)],
+    )
+    def test_bus_capacity(self, speed, expected):
+        assert transfer_scheduler.bus_capacity(speed) == expected
+
+    def test_device_of_missing_path(self, tmp_path):
+        assert transfer_scheduler.device_of(tmp_path / "missing") is None
+
+    def test_paths_resolve_to_devices(self, monkeypatch, scheduler):
+        monkeypatch.setattr(transfer_scheduler, "device_of", lambda path: path.name)
+        with scheduler.job("copy", Priority.TRANSFER, paths=[Path("/x/sda")]) as job:
+            assert "device:sda" in job.resources
+
+
+class TestRegistration:
+    """Test data movers registering with the shared scheduler."""
+
+    @pytest.fixture
+    def shared(self, monkeypatch):
+        scheduler = TransferScheduler(bus_lookup=lambda device: None)
+        monkeypatch.setattr(transfer_scheduler, "_scheduler", scheduler)
+        return scheduler
+
+    def test_repo_copy_paced(self, shared, tmp_path):
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "image.iso").write_bytes(b"x" * 300_000)
+        dest = tmp_path / "dest"
+        dest.mkdir()
+        image = DiskImage(
+            name="image.iso", path=src / "image.iso", image_type=ImageType.ISO
+        )
+        seen = []
+
+        def progress(name, ratio):
+            if ratio == 1.0:
+                seen[:] = shared.jobs()
+
+        success, failure = transfer.copy_images_to_repo(
+            [image],
+            ImageRepo(path=dest, drive_name="sdb"),
+            progress,
+            priority=Priority.BACKGROUND,
+        )
+
+        assert (success, failure) == (1, 0)
+        assert [(job.name, job.priority) for job in seen] == [
+            ("copy image.iso", Priority.BACKGROUND)
+        ]
+        assert seen[0].moved_bytes == 300_000
+        assert shared.jobs() == []
+
+    @pytest.mark.asyncio
+    async def test_peer_upload_registered(self, shared, monkeypatch, tmp_path):
+        client = peer_transfer_client.TransferClient(
+            PeerDevice(
+                hostname="pi2",
+                address="127.0.0.1",
+                port=0,
+                device_id="id-pi2",
+                txt_records={},
+            ),
+            priority=Priority.BACKGROUND,
+        )
+        client.session_token = "token"
+        seen = []
+
+        async def fake_images_meta(images):
+            return []
+
+        async def fake_send(images, headers, images_meta, progress, relay):
+            seen.extend(shared.jobs())
+            client._pace(10)
+            return 0, 0
+
+        monkeypatch.setattr(client, "_images_meta", fake_images_meta)
+        monkeypatch.setattr(client, "_send_images", fake_send)
+
+        await client.send_images([])
+
+        assert [(job.name, job.resources) for job in seen] == [
+            ("send to pi2", ("link:pi2",))
+        ]
+        assert client._pace is None
+        assert shared.jobs() == []
+
+    def test_read_block_paced(self, tmp_path):
+        path = tmp_path / "file.bin"
+        path.write_bytes(b"y" * 100)
+        paced = []
+
+        data, _digest, payload = peer_transfer_client._read_block(
+            path, 0, 64, pace=paced.append
+        )
+
+        assert data == payload == b"y" * 64
+        assert paced == [64]
@@ -1,9 +1,10 @@
 """Tests for storage validation functions."""
 
-from unittest.mock import mock_open, patch
+from unittest.mock import patch
 
 import pytest
 
+from rpi_usb_cloner.storage import mount_table
 from rpi_usb_cloner.storage.exceptions import (
     DeviceNotFoundError,
     DeviceValidationError,
@@ -22,19 +23,29 @@ from rpi_usb_cloner.storage.validation import (
 )
 
 
+def _install_mount_table(tmp_path, monkeypatch, mountinfo: str):
+    path = tmp_path / "mountinfo"
+    path.write_text(mountinfo)
+    table = mount_table.MountTable(path)
+    monkeypatch.setattr(mount_table, "_mount_table", table)
+    return table
+
+
 @pytest.fixture
-def mock_proc_mounts_empty():
-    """Mock /proc/mounts with no mounts."""
-    with patch("builtins.open", mock_open(read_data="")):
-        yield
+def mock_proc_mounts_empty(tmp_path, monkeypatch):
+    """Mount table with no mounts."""
+    table = _install_mount_table(tmp_path, monkeypatch, "")
+    yield
+    table.close()
 
 
 @pytest.fixture
-def mock_proc_mounts_with_mount():
-    """Mock /proc/mounts with a mount at /mnt/usb."""
-    mount_data = "/dev/sda1 /mnt/usb vfat rw,relatime 0 0\n"
-    with patch("builtins.open", mock_open(read_data=mount_data)):
-        yield
+def mock_proc_mounts_with_mount(tmp_path, monkeypatch):
+    """Mount table with a mount at /mnt/usb."""
+    mountinfo = "40 28 8:1 / /mnt/usb rw,relatime - vfat /dev/sda1 rw\n"
+    table = _install_mount_table(tmp_path, monkeypatch, mountinfo)
+    yield
+    table.close()
 
 
 class TestDeviceNameExtraction:
@@ -177,7 +188,7 @@ class TestValidateDeviceUnmounted:
         validate_device_unmounted("nonexistent")  # Should not raise
 
     @patch("rpi_usb_cloner.storage.validation.get_device_by_name")
-    @patch("rpi_usb_cloner.storage.validation._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.validation.is_mountpoint_active")
     def test_device_with_active_mountpoint_raises(
         self, mock_is_active, mock_get_device
     ):
@@ -195,7 +206,7 @@ class TestValidateDeviceUnmounted:
         assert exc_info.value.mountpoint == "/mnt/usb"
 
     @patch("rpi_usb_cloner.storage.validation.get_device_by_name")
-    @patch("rpi_usb_cloner.storage.validation._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.validation.is_mountpoint_active")
     def test_device_with_inactive_mountpoint_passes(
         self, mock_is_active, mock_get_device
     ):
@@ -209,7 +220,7 @@ class TestValidateDeviceUnmounted:
         validate_device_unmounted("sda")  # Should not raise
 
     @patch("rpi_usb_cloner.storage.validation.get_device_by_name")
-    @patch("rpi_usb_cloner.storage.validation._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.validation.is_mountpoint_active")
     @patch("rpi_usb_cloner.storage.validation.get_children")
     def test_partition_with_active_mountpoint_raises(
         self, mock_get_children, mock_is_active, mock_get_device
@@ -227,7 +238,7 @@ class TestValidateDeviceUnmounted:
         assert exc_info.value.mountpoint == "/mnt/usb1"
 
     @patch("rpi_usb_cloner.storage.validation.get_device_by_name")
-    @patch("rpi_usb_cloner.storage.validation._is_mountpoint_active")
+    @patch("rpi_usb_cloner.storage.validation.is_mountpoint_active")
     @patch("rpi_usb_cloner.storage.validation.get_children")
     def test_device_with_no_mountpoints_passes(
         self, mock_get_children, mock_is_active, mock_get_device
@@ -402,25 +413,27 @@ class TestValidateEraseOperation:
 
 
 class TestIsMountpointActive:
-    """Test _is_mountpoint_active helper function."""
+    """Test is_mountpoint_active against the shared mount table."""
 
     def test_mountpoint_active_in_proc_mounts(self, mock_proc_mounts_with_mount):
-        """Test detecting active mountpoint from /proc/mounts."""
-        from rpi_usb_cloner.storage.validation import _is_mountpoint_active
+        """Test detecting active mountpoint from mountinfo."""
+        from rpi_usb_cloner.storage.validation import is_mountpoint_active
 
-        assert _is_mountpoint_active("/mnt/usb") is True
+        assert is_mountpoint_active("/mnt/usb") is True
 
     def test_mountpoint_not_active(self, mock_proc_mounts_empty):
         """Test detecting inactive mountpoint."""
-        from rpi_usb_cloner.storage.validation import _is_mountpoint_active
+        from rpi_usb_cloner.storage.validation import is_mountpoint_active
 
-        assert _is_mountpoint_active("/mnt/usb") is False
+        assert is_mountpoint_active("/mnt/usb") is False
 
-    @patch("rpi_usb_cloner.storage.validation.Path.is_mount")
-    def test_fallback_to_ismount(self, mock_ismount):
-        """Test fallback to os.path.ismount when /proc/mounts unavailable."""
-        from rpi_usb_cloner.storage.validation import _is_mountpoint_active
+    @patch("rpi_usb_cloner.storage.mount_table.os.path.ismount")
+    def test_fallback_to_ismount(self, mock_ismount, tmp_path, monkeypatch):
+        """Test fallback to os.path.ismount when mountinfo is unavailable."""
+        from rpi_usb_cloner.storage.validation import is_mountpoint_active
 
-        with patch("builtins.open", side_effect=FileNotFoundError):
-            mock_ismount.return_value = True
-            assert _is_mountpoint_active("/mnt/usb") is True
+        monkeypatch.setattr(
+            mount_table, "_mount_table", mount_table.MountTable(tmp_path / "missing")
+        )
+        mock_ismount.return_value = True
+        assert is_mountpoint_active("/mnt/usb") is True
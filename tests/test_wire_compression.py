@@ -0,0 +1,242 @@
+"""Tests for negotiated wire compression of peer uploads.
+
+Covers:
+- codec negotiation and detection of compressed files
+- choosing a compression level from link speed and CPU speed
+- bounded decompression on the receiver
+- compressed uploads end to end
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import time
+import zlib
+
+import pytest
+
+from rpi_usb_cloner.domain import DiskImage, ImageRepo, ImageType
+from rpi_usb_cloner.services import (
+    peer_transfer_client,
+    peer_transfer_server,
+    resumable_transfer,
+    wire_compression,
+)
+from rpi_usb_cloner.services.discovery import PeerDevice
+from rpi_usb_cloner.services.wire_compression import DecodingWriter, LinkMeter
+
+
+SLOW_LINK = 1024 * 1024
+FAST_LINK = 1e12
+
+
+class TestNegotiation:
+    """Test codec negotiation and compressed file detection."""
+
+    def test_negotiate(self):
+        assert wire_compression.negotiate(["zstd", "deflate"]) == "deflate"
+        assert wire_compression.negotiate(["zstd"]) is None
+        assert wire_compression.negotiate([]) is None
+
+    @pytest.mark.parametrize(
+        ("name", "expected"),
+        [
+            ("sda1.ext4-ptcl-img.gz.aa", True),
+            ("sda2.ntfs-ptcl-img.zst.ab", True),
+            ("backup.zip", True),
+            ("sda1.dd-ptcl-img.uncomp.aa", False),
+            ("debian-12.iso", False),
+            ("stick.bin", False),
+            ("parts", False),
+        ],
+    )
+    def test_is_precompressed(self, name, expected):
+        assert wire_compression.is_precompressed(name) is expected
+
+
+class TestChooseLevel:
+    """Test adaptive compression level selection."""
+
+    def test_compressible_data_on_slow_link(self):
+        sample = bytes(512 * 1024)
+        assert wire_compression.choose_level("deflate", sample, SLOW_LINK) in (
+            wire_compression.LEVELS
+        )
+
+    def test_fast_link_sends_raw(self):
+        sample = bytes(512 * 1024)
+        assert wire_compression.choose_level("deflate", sample, FAST_LINK) is None
+
+    def test_incompressible_data_sends_raw(self):
+        sample = os.urandom(256 * 1024)
+        assert wire_compression.choose_level("deflate", sample, SLOW_LINK) is None
+
+    def test_unknown_codec(self):
+        assert wire_compression.choose_level("zstd", bytes(1024), SLOW_LINK) is None
+
+
+class TestLinkMeter:
+    """Test link throughput measurement."""
+
+    def test_initial_rate_until_measured(self, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(wire_compression.time, "monotonic", lambda: clock[0])
+        meter = LinkMeter(initial=123.0)
+
+        assert meter.bytes_per_second == 123.0
+        meter.add(1000)
+        clock[0] += 0.5
+        assert meter.bytes_per_second == 123.0
+        meter.add(3000)
+        clock[0] += 1.5
+        assert meter.bytes_per_second == 2000.0
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def close(self):
+        self.closed = True
+
+
+class TestDecodingWriter:
+    """Test decompression on the receiver."""
+
+    def test_output_produced_in_bounded_steps(self, monkeypatch):
+        monkeypatch.setattr(wire_compression, "DECODE_CHUNK_BYTES", 4096)
+        data = bytes(100_000) + os.urandom(1000)
+        compressed = zlib.compress(data)
+        target = RecordingWriter()
+        writer = DecodingWriter(target, "deflate")
+
+        for start in range(0, len(compressed), 333):
+            writer.write(compressed[start : start + 333])
+        writer.close()
+
+        assert b"".join(target.chunks) == data
+        assert max(len(chunk) for chunk in target.chunks) <= 4096
+        assert target.closed
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    repo_path = tmp_path / "receiver"
+    repo_path.mkdir()
+    server = peer_transfer_server.TransferServer(
+        ImageRepo(path=repo_path, drive_name="sdb")
+    )
+    token = secrets.token_urlsafe(8)
+    peer_transfer_server._active_sessions[token] = {
+        "created_at": time.time(),
+        "pin": "0000",
+        "peer_ip": "127.0.0.1",
+    }
+    yield server, token
+    peer_transfer_server._active_sessions.pop(token, None)
+
+
+class TestCompressedUploads:
+    """Test compressed uploads between a client and server."""
+
+    @pytest.mark.asyncio
+    async def test_uncompressed_files_sent_compressed(
+        self, aiohttp_client, receiver, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(resumable_transfer, "BLOCK_BYTES", 64 * 1024)
+        monkeypatch.setattr(
+            wire_compression, "DEFAULT_LINK_BYTES_PER_SECOND", SLOW_LINK
+        )
+        server, token = receiver
+        encodings = {}
+        handle_upload = server._handle_resumable_upload
+
+        async def record_encoding(request, image_name):
+            name = request.headers["X-Upload-File"] or image_name
+            encodings[name] = request.headers.get("X-Upload-Encoding")
+            return await handle_upload(request, image_name)
+
+        server._handle_resumable_upload = record_encoding
+        _session, base_url = await aiohttp_client(server._build_app())
+        client = peer_transfer_client.TransferClient(
+            PeerDevice(
+                hostname="peer",
+                address="127.0.0.1",
+                port=0,
+                device_id="test",
+                txt_records={},
+            )
+        )
+        client.base_url = base_url
+        client.session_token = token
+
+        # Mostly empty, like a freshly built ISO
+        iso = tmp_path / "debian.iso"
+        iso.write_bytes(os.urandom(4096) + bytes(300 * 1024))
+        image_dir = tmp_path / "backup"
+        image_dir.mkdir()
+        (image_dir / "sda1.dd-ptcl-img.uncomp.aa").write_bytes(bytes(200 * 1024))
+        (image_dir / "sda2.ext4-ptcl-img.gz.aa").write_bytes(bytes(200 * 1024))
+
+        result = await client.send_images(
+            [
+                DiskImage(name="debian.iso", path=iso, image_type=ImageType.ISO),
+                DiskImage(
+                    name="backup", path=image_dir, image_type=ImageType.CLONEZILLA_DIR
+                ),
+            ]
+        )
+
+        assert result == (2, 0)
+        assert client.codec == "deflate"
+        assert encodings == {
+            "debian.iso": "deflate",
+            "sda1.dd-ptcl-img.uncomp.aa": "deflate",
+            "sda2.ext4-ptcl-img.gz.aa": None,
+        }
+        repo = server.destination_repo.path
+        assert (repo / "debian.iso").read_bytes() == iso.read_bytes()
+        for name in ("sda1.dd-ptcl-img.uncomp.aa", "sda2.ext4-ptcl-img.gz.aa"):
+            assert (repo / "clonezilla" / "backup" / name).read_bytes() == (
+                image_dir / name
+            ).read_bytes()
+
+    @pytest.mark.asyncio
+    async def test_transfer_init_negotiates(self, aiohttp_client, receiver):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {"Authorization": f"Bearer {token}"}
+        images = [{"name": "a.iso", "type": "iso", "size_bytes": 1}]
+
+        async with session.post(
+            f"{base_url}/transfer",
+            json={"images": images, "compression": ["zstd", "deflate"]},
+            headers=headers,
+        ) as resp:
+            assert (await resp.json())["compression"] == "deflate"
+        async with session.post(
+            f"{base_url}/transfer", json={"images": images}, headers=headers
+        ) as resp:
+            assert (await resp.json())["compression"] is None
+
+    @pytest.mark.asyncio
+    async def test_unknown_encoding_rejected(self, aiohttp_client, receiver):
+        server, token = receiver
+        session, base_url = await aiohttp_client(server._build_app())
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "X-Image-Type": "iso",
+            "X-Upload-Size": "10",
+            "X-Upload-Source": "s",
+            "X-Upload-Encoding": "brotli",
+        }
+
+        async with session.post(
+            f"{base_url}/upload/a.iso", data=b"x" * 10, headers=headers
+        ) as resp:
+            assert resp.status == 415